@@ -2,6 +2,7 @@ import math
 import numpy as np
 from OpenGL.GL import glGetFloatv, GL_MODELVIEW_MATRIX, GL_PROJECTION_MATRIX
 from ctypes import c_float
+import scene_diagnostics
 
 class Frustum:
     def __init__(self):
@@ -52,11 +53,11 @@ class Frustum:
             try:
                 inv_M = np.linalg.inv(M)
                 cam_pos = inv_M[:3, 3]
-                print(f"DEBUG: Frustum Camera Pos: {cam_pos}")
+                scene_diagnostics.debug(f"Frustum Camera Pos: {cam_pos}")
                 # Print Left Plane for sanity check
-                print(f"DEBUG: Left Plane: {self.planes[0]}")
+                scene_diagnostics.debug(f"Left Plane: {self.planes[0]}")
             except:
-                print("DEBUG: Matrix Inversion Failed")
+                scene_diagnostics.debug("Matrix Inversion Failed")
 
     def is_sphere_visible(self, x, y, z, radius):
         """
@@ -86,3 +87,23 @@ class Frustum:
 
 
 
+
+    def spheres_visible(self, centers, radii):
+        """
+        Vectorized is_sphere_visible: centers is (N, 3), radii is (N,).
+        Returns a boolean mask of length N.
+        """
+        margin = 2.0 # Same margin as is_sphere_visible
+        dists = np.asarray(centers) @ self.planes[:, :3].T.astype(np.float64) + self.planes[:, 3]
+        return np.all(dists >= -(np.asarray(radii)[:, None] + margin), axis=1)
+
+    def is_aabb_visible(self, mins, maxs):
+        """
+        Checks if an axis-aligned box (mins / maxs are (x, y, z)) may be inside the frustum.
+        Uses the box corner furthest along each plane normal (conservative, like is_sphere_visible).
+        """
+        margin = 2.0
+        normals = self.planes[:, :3].astype(np.float64)
+        corners = np.where(normals >= 0, np.asarray(maxs, dtype=np.float64), np.asarray(mins, dtype=np.float64))
+        dists = np.einsum("ij,ij->i", corners, normals) + self.planes[:, 3]
+        return bool(np.all(dists >= -margin))
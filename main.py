@@ -4,6 +4,7 @@ from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import time
+import itertools
 import sys
 import os # Keep for checking file modification time and path handling
 import numpy as np
@@ -12,6 +13,9 @@ import numpy as math # Keep consistent
 
 # --- Project Modules ---
 import scene_parser
+import scene_diagnostics
+import scene_objects
+import scene_bundle
 import texture_loader
 import renderer           # Keep for 3D rendering functions
 import minimap_renderer # *** NEW: Import the minimap module ***
@@ -32,7 +36,15 @@ from tkinter import filedialog
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 400
 TARGET_FPS = 60
-SCENE_CHECK_INTERVAL = 2.0 # Seconds for checking scene.txt updates
+SCENE_CHECK_INTERVAL = 0.25 # Seconds between scene change checks (scene_watcher 監看根檔與所有導入檔,檢查成本很低)
+# 解析/載入的診斷訊息印到主控台的最低嚴重度 (scene_diagnostics);以 --quiet 啟動時完全不印
+DIAGNOSTICS_LOG_LEVEL = scene_diagnostics.INFO
+# 遠裁切面取攝影機到「場景包圍盒 + 地面」最遠點的距離,但不超過 FAR_CLIP_MAX (原本固定的可視距離)
+FAR_CLIP_MAX = renderer.GROUND_SIZE * 4
+FAR_CLIP_MARGIN = 10.0
+# 軌道網格只在電車附近生成與上傳 (範圍見 track.TRACK_STREAM_AHEAD/BEHIND),電車前進時分幀補上前方、釋放遠處的段;
+# 關閉時沿用一次建立整條軌道的做法
+TRACK_STREAMING = True
 
 # --- Global Font (Keep) ---
 hud_font = None
@@ -41,6 +53,23 @@ hud_font = None
 active_background_info = None
 
 
+def show_load_progress(bytes_done, bytes_total):
+    """場景串流解析的進度回呼:顯示在視窗標題,並處理事件讓視窗保持回應。"""
+    percent = int(bytes_done * 100 / bytes_total) if bytes_total else 100
+    pygame.display.set_caption(f"簡易 3D 電車模擬器 - 載入場景中 {percent}%")
+    pygame.event.pump()
+
+
+def compute_far_clip(scene, eye_position):
+    """依 scene.stats 的包圍盒決定遠裁切面;小場景得到較近的遠裁切面 (深度精度較好)。"""
+    ground = renderer.GROUND_SIZE
+    extent = scene_objects.Bounds(np.array([-ground, 0.0, -ground]), np.array([ground, 0.0, ground]))
+    stats = getattr(scene, "stats", None) if scene else None
+    if stats is not None and stats.bounds is not None:
+        extent = extent.union(stats.bounds)
+    return min(FAR_CLIP_MAX, extent.farthest_distance(eye_position) + FAR_CLIP_MARGIN)
+
+
 def show_context_menu(current_scene_filepath):
     root = tk.Tk()
     root.withdraw() # 隱藏主窗口
@@ -153,28 +182,48 @@ _BUFFER_SPECS = [
 
 def create_scene_buffers(scene):
     """為場景中所有支援 VBO 的物件類型建立渲染緩衝區。"""
+    for _ in iter_scene_buffer_steps(scene):
+        pass
+
+def iter_scene_buffer_steps(scene):
+    """
+    create_scene_buffers 的分段版本:每建立一個物件的緩衝區 yield 一次。
+    已經有 VAO 的物件 (背景重載時沿用舊場景的緩衝區) 直接保留。
+    """
     if not scene: return
     for attr, shader_attr, create_name, _cleanup_name, label in _BUFFER_SPECS:
         entries = getattr(scene, attr, None)
         if not entries: continue
         if getattr(renderer, shader_attr, None) is None:
-            print(f"警告: {label} 著色器未就緒，跳過建立緩衝區。")
+            scene_diagnostics.warning(f"{label} 著色器未就緒，跳過建立緩衝區。")
             continue
         create_fn = getattr(renderer, create_name, None)
         if create_fn is None:
-            print(f"警告: renderer 模塊中未找到 {create_name}。")
+            scene_diagnostics.warning(f"renderer 模塊中未找到 {create_name}。")
             continue
+        vao_index = scene_objects.FIELD_INDEX[scene_objects.OBJECT_LIST_TYPES[attr]]["vao"]
         new_list = []
         for entry in entries:
-            line_id, _ = entry
+            line_id, obj_data = entry
+            if len(obj_data) > vao_index and obj_data[vao_index] is not None:
+                new_list.append(entry)
+                continue
             modified_data, success = create_fn(entry)
             if success:
                 new_list.append((line_id, modified_data))
             else:
-                print(f"警告: 為 {label} (行: {line_id}) 創建緩衝區失敗。")
+                scene_diagnostics.warning(f"為 {label} 創建緩衝區失敗。", *scene_diagnostics.split_line_id(line_id))
                 new_list.append(entry)
+            yield
         setattr(scene, attr, new_list)
-        print(f"{label} 渲染緩衝區建立完成（{len(new_list)} 個）。")
+        scene_diagnostics.debug(f"{label} 渲染緩衝區建立完成（{len(new_list)} 個）。")
+    # 實例陣列 (array 指令):每組一份網格 + 位移緩衝區
+    for line_id, instance_array in getattr(scene, 'instance_arrays', []):
+        if instance_array.vao is not None:
+            continue
+        if not renderer.create_instance_array_buffers(instance_array):
+            scene_diagnostics.warning("為實例陣列創建緩衝區失敗。", *scene_diagnostics.split_line_id(line_id))
+        yield
 
 def cleanup_scene_buffers(scene):
     """釋放場景中所有物件類型的 VAO/VBO。"""
@@ -183,11 +232,95 @@ def cleanup_scene_buffers(scene):
         entries = getattr(scene, attr, None)
         if entries and hasattr(renderer, cleanup_name):
             getattr(renderer, cleanup_name)(entries)
+    renderer.cleanup_all_instance_array_buffers(getattr(scene, 'instance_arrays', []))
+
+# --- 背景重載 ---
+# R 鍵、選單載入與自動重載都不阻塞主迴圈:scene_parser.start_scene_load 在工作執行緒解析場景,
+# 主迴圈每幀最多花 RELOAD_FRAME_BUDGET 秒做 GL 上傳 (紋理、軌道與物件緩衝區),
+# 新場景全部備妥後才在同一幀換上 (雙緩衝),舊場景的緩衝區之後再分幀釋放。
+RELOAD_FRAME_BUDGET = 0.004 # 秒;約為 TARGET_FPS 一幀時間的四分之一
+RELOAD_CLEANUP_CHUNK = 256  # 釋放舊場景緩衝區時每一步處理的物件數
+RELOAD_PARSE_SHARE = 0.5    # 標題列進度中背景解析所占的比例,其餘為主執行緒的 GL 上傳
+
+def iter_scene_load_steps(job, track_distance=0.0, track_looping=True):
+    """
+    背景載入在主執行緒的部分:等工作執行緒完成,再把新場景的 GL 上傳拆成小步驟。
+    完成的步驟數記在 job.gl_progress,總數依 scene.stats 估計 (每張紋理、每段軌道、每個物件各一步)。
+    TRACK_STREAMING 時軌道只生成電車在 track_distance 附近的段。
+    """
+    while not job.done():
+        yield
+    if job.scene is None:
+        return
+    stats = job.scene.stats
+    total = 0
+    if stats is not None:
+        total = stats.texture_count + stats.segment_count + sum(
+            stats.object_counts.get(attr, 0) for attr, *_ in _BUFFER_SPECS) + stats.instance_array_count
+        if job.diff is not None: # 沿用舊場景緩衝區的物件與軌道段不必建立
+            total -= len(job.diff.reused_segments) + sum(
+                len(job.diff.objects[attr].reusable_pairs()) for attr, *_ in _BUFFER_SPECS)
+    steps = [job.iter_gl_steps(), iter_scene_buffer_steps(job.scene)]
+    if job.scene.track and TRACK_STREAMING:
+        steps.insert(1, job.scene.track.iter_stream_segment_buffers(track_distance, track_looping))
+    elif job.scene.track:
+        steps.insert(1, iter_missing_segment_buffer_steps(job.scene.track))
+    done = 0
+    for step in itertools.chain.from_iterable(steps):
+        done += 1
+        job.gl_progress = (min(done, total), total)
+        yield step
+
+def iter_missing_segment_buffer_steps(track):
+    """為還沒有頂點的軌道段生成頂點 (要在 iter_gl_steps 沿用舊段之後才決定),每段 yield 一次;最後上傳合併網格。"""
+    for segment in track.segments:
+        if not segment.is_buffer_ready:
+            segment.create_gl_buffers()
+            yield
+    track.ensure_mesh()
+    yield
+
+def iter_scene_cleanup_steps(scene):
+    """分段釋放已換下的場景的物件與軌道緩衝區 (場景之後不再使用)。"""
+    if not scene: return
+    for attr, _shader_attr, _create_name, cleanup_name, _label in _BUFFER_SPECS:
+        entries = getattr(scene, attr, None)
+        cleanup_fn = getattr(renderer, cleanup_name, None)
+        if not entries or cleanup_fn is None: continue
+        for start in range(0, len(entries), RELOAD_CLEANUP_CHUNK):
+            cleanup_fn(entries[start:start + RELOAD_CLEANUP_CHUNK])
+            yield
+    renderer.cleanup_all_instance_array_buffers(getattr(scene, 'instance_arrays', []))
+    if scene.track:
+        for segment in scene.track.segments:
+            segment.cleanup_buffers()
+            yield
+        scene.track.clear()
+
+def reload_progress_percent(job):
+    """背景載入的整體進度:解析 (依讀取位元組) 與 GL 上傳 (依 job.gl_progress) 各占 RELOAD_PARSE_SHARE / 其餘。"""
+    bytes_done, bytes_total = job.progress
+    parse_fraction = bytes_done / bytes_total if bytes_total else float(job.done())
+    gl_done, gl_total = job.gl_progress
+    gl_fraction = gl_done / gl_total if gl_total else 0.0
+    return int(100 * (RELOAD_PARSE_SHARE * parse_fraction + (1.0 - RELOAD_PARSE_SHARE) * gl_fraction))
+
+def run_steps_within_budget(steps, budget_seconds=RELOAD_FRAME_BUDGET):
+    """推進 steps 直到用完這一幀的時間預算;全部做完時回傳 True。"""
+    deadline = time.perf_counter() + budget_seconds
+    for _ in steps:
+        if time.perf_counter() >= deadline:
+            return False
+    return True
 
 
 def main():
     global hud_font, active_background_info # <--- Add active_background_info
 
+    scene_diagnostics.set_log_level(DIAGNOSTICS_LOG_LEVEL)
+    if "--quiet" in sys.argv[1:]:
+        scene_diagnostics.set_quiet() # 正式執行:不印解析/載入訊息,省下主控台 I/O
+
     # --- Pygame Initialization (Keep) ---
     pygame.init()
     pygame.font.init() # Initialize font module
@@ -199,9 +332,9 @@ def main():
     # --- Load Font (Keep) ---
     try:
         hud_font = pygame.font.SysFont(None, 24)
-        print("HUD 字體已載入。")
+        scene_diagnostics.debug("HUD 字體已載入。")
     except Exception as e:
-        print(f"警告：無法載入系統預設字體，HUD 將無法顯示文字: {e}")
+        scene_diagnostics.warning(f"無法載入系統預設字體，HUD 將無法顯示文字: {e}")
         hud_font = None
 
     # --- Initialize Dependencies (Keep) ---
@@ -210,12 +343,12 @@ def main():
 
     ### --- START OF MODIFICATION: Initialize Hill Shader ---
     if hasattr(renderer, 'init_hill_shader'):
-        print("正在初始化山丘著色器...")
+        scene_diagnostics.debug("正在初始化山丘著色器...")
         renderer.init_hill_shader()
         if renderer._hill_shader_program_id is None: # 檢查是否成功
-            print("警告: 山丘著色器初始化失敗！山丘可能無法正常渲染。")
+            scene_diagnostics.warning("山丘著色器初始化失敗！山丘可能無法正常渲染。")
     else:
-        print("警告: renderer 模塊中未找到 init_hill_shader 函數。")
+        scene_diagnostics.warning("renderer 模塊中未找到 init_hill_shader 函數。")
     ### --- END OF MODIFICATION ---
 
     # Pass font to main renderer and minimap renderer
@@ -227,31 +360,47 @@ def main():
         if renderer.coord_label_font:
             minimap_renderer.set_coord_label_font(renderer.coord_label_font)
     else:
-        print("警告: HUD 字體未載入，部分 UI 顯示將不可用。")
+        scene_diagnostics.warning("HUD 字體未載入，部分 UI 顯示將不可用。")
 
     # --- Load Initial Scene and Perform Post-Load Steps ---
     scene = None
-    if scene_parser.load_scene(force_reload=True): # Initial load
+    # 命令列給了場景包 (python main.py scene.bundle) 時直接載入預先編譯好的緩衝區/紋理/小地圖
+    bundle_path = next((arg for arg in sys.argv[1:] if scene_bundle.is_bundle_path(arg)), None)
+    if bundle_path:
+        scene = scene_bundle.load_scene_bundle(bundle_path)
+        if scene:
+            active_background_info = scene.initial_background_info
+            if scene.track and TRACK_STREAMING: # 先釋放起點附近以外的段,合併網格只上傳視窗內的頂點
+                scene.track.stream_around(0.0, looping=True)
+        else:
+            bundle_path = None
+            scene = scene_parser.get_current_scene() # 空場景
+            active_background_info = None
+            minimap_renderer.bake_static_map_elements(scene)
+    elif scene_parser.load_scene(force_reload=True, progress_callback=show_load_progress): # Initial load
         scene = scene_parser.get_current_scene()
         if scene:
             # --- NEW: Set initial background ---
             active_background_info = scene.initial_background_info
-            print(f"初始背景設定為: {active_background_info}")
+            scene_diagnostics.debug(f"初始背景設定為: {active_background_info}")
 
-            if scene.track:
-                print("初始場景載入成功，創建軌道緩衝區...")
+            if scene.track and TRACK_STREAMING:
+                scene_diagnostics.debug("初始場景載入成功，創建起點附近的軌道緩衝區...")
+                scene.track.stream_around(0.0, looping=True)
+            elif scene.track:
+                scene_diagnostics.debug("初始場景載入成功，創建軌道緩衝區...")
                 scene.track.create_all_segment_buffers() # Create VBOs for the loaded track
 
             # 為初始場景的所有物件（山丘/建築/樹木/圓柱）建立渲染緩衝區
-            print("正在為初始場景的物件創建渲染緩衝區...")
+            scene_diagnostics.debug("正在為初始場景的物件創建渲染緩衝區...")
             create_scene_buffers(scene)
 
 
             # Bake minimap AFTER successful scene load and track buffer creation
             minimap_renderer.bake_static_map_elements(scene)
-            print("初始小地圖已烘焙。")
+            scene_diagnostics.debug("初始小地圖已烘焙。")
     else:
-        print("初始場景載入失敗，請檢查 scene.txt。場景將為空。")
+        scene_diagnostics.error("初始場景載入失敗，請檢查 scene.txt。場景將為空。")
         scene = scene_parser.get_current_scene() # Get the (likely empty) scene
         active_background_info = None # No background if scene failed
         minimap_renderer.bake_static_map_elements(scene) # Bake with empty scene data
@@ -264,7 +413,7 @@ def main():
         start_angle_rad = math.radians(scene.start_angle_deg)
         tram_instance.forward_vector_xz = (math.cos(start_angle_rad), math.sin(start_angle_rad))
         tram_instance.distance_on_track = 0.0 # Reset distance explicitly
-        print(f"Tram initial pos: {tram_instance.position}, angle: {scene.start_angle_deg} deg, forward: {tram_instance.forward_vector_xz}")
+        scene_diagnostics.debug(f"Tram initial pos: {tram_instance.position}, angle: {scene.start_angle_deg} deg, forward: {tram_instance.forward_vector_xz}")
     else:
         tram_instance.position = np.array([0.0, 0.0, 0.0])
         tram_instance.forward_vector_xz = (1.0, 0.0) # Default forward +X
@@ -282,7 +431,12 @@ def main():
     show_cab = True
 
     # --- Global variable to store current scene file path for the menu ---
-    current_loaded_scene_file = "scene.txt" # Initialize with default
+    current_loaded_scene_file = bundle_path or "scene.txt" # Initialize with default
+
+    # --- 背景重載狀態 ---
+    pending_reload = None    # (SceneLoadJob, 主執行緒步驟, "manual"/"menu"/"auto")
+    old_scene_cleanup = None # 已換下的舊場景尚未做完的緩衝區釋放步驟
+    track_stream_steps = None # 進行中的軌道串流 (Track.iter_stream_segment_buffers),與重載共用每幀時間預算
 
     # --- Main Loop ---
     while running:
@@ -293,6 +447,8 @@ def main():
         fps = clock.get_fps()
         if pygame.time.get_ticks() % 500 < 50: # Update caption every ~0.5s
             caption = f"簡易 3D 電車模擬器 - {os.path.basename(current_loaded_scene_file)} - FPS: {fps:.1f}"
+            if pending_reload is not None:
+                caption += f" - 背景載入中 {reload_progress_percent(pending_reload[0])}%"
             pygame.display.set_caption(caption)
 
         # --- Event Handling (Minor Modifications) ---
@@ -317,54 +473,23 @@ def main():
                     pygame.mouse.set_visible(not lock_state)
                     pygame.event.set_grab(lock_state)
                 elif event.key == pygame.K_r:
-                    print("手動觸發場景重新載入...")
-
-                    # 重新加載前，清理舊場景的所有物件緩衝區（山丘/建築/樹木/圓柱）
-                    if scene: # 確保舊的 scene 對象存在
-                        print("重新加載前，清理舊場景的物件緩衝區...")
-                        cleanup_scene_buffers(scene)
-                        if scene.track: scene.track.clear() # 清理軌道緩衝區
-
-                    if scene_parser.load_scene(force_reload=True): # 現在 load_scene 會創建一個全新的 scene
-                        scene = scene_parser.get_current_scene() # scene 現在是新加載的對象
-                        
-                        active_background_info = scene.initial_background_info if scene else None
-                        print(f"手動重載後背景設定為: {active_background_info}")
-
-                        if scene and scene.track:
-                            print("手動重載成功，為新軌道創建緩衝區...")
-                            scene.track.create_all_segment_buffers() # 為新軌道創建
-
-                        # 為重新載入的場景建立所有物件的渲染緩衝區
-                        print("正在為重新載入的場景創建物件渲染緩衝區...")
-                        create_scene_buffers(scene)
-
-                        minimap_renderer.bake_static_map_elements(scene)
-                        print("手動重載後小地圖已烘焙。")
-
-                        # Reset tram based on NEW scene data
-                        tram_instance.track = scene.track if scene else None
-                        if scene:
-                            tram_instance.current_speed = 0.0 # Reset speed
-                        else: 
-                            tram_instance.position = np.array([0.0, 0.0, 0.0])
-                            tram_instance.forward_vector_xz = (1.0, 0.0)
-                            tram_instance.distance_on_track = 0.0
-                            tram_instance.current_speed = 0.0
-                        print("場景已手動重新載入並重設電車。")
+                    scene_diagnostics.info("手動觸發場景重新載入...")
+                    if pending_reload is not None:
+                        scene_diagnostics.info("場景正在背景載入中，略過這次重新載入。")
+                    elif bundle_path:
+                        scene_diagnostics.info("場景包沒有來源檔可重新載入；請重新建立場景包，或由選單載入場景檔。")
                     else:
-                        print("手動重新載入失敗。")
-                        # scene 變量可能仍然指向舊的場景，或者 load_scene 內部可能將其設為空
-                        # 為了安全，如果 load_scene 失敗，最好也 clear 一下舊的 scene （如果還存在）
-                        cleanup_scene_buffers(scene)
-                        scene = scene_parser.get_current_scene() # 獲取 load_scene 失敗後可能的空場景
-                        active_background_info = scene.initial_background_info if scene else None
-                        tram_instance.track = scene.track if scene else None
-                        minimap_renderer.bake_static_map_elements(scene)
+                        # 在背景解析與上傳新場景，舊場景照常繪製，備妥後才換上 (見主迴圈的背景重載)
+                        reload_job = scene_parser.start_scene_load(force_reload=True)
+                        if reload_job:
+                            pending_reload = (reload_job, iter_scene_load_steps(
+                                reload_job, tram_instance.distance_on_track, tram_instance.looping), "manual")
+                        else:
+                            scene_diagnostics.error("手動重新載入失敗。")
 
                 elif event.key == pygame.K_c: show_cab = not show_cab
-                elif event.key == pygame.K_m: show_minimap = not show_minimap; print(f"小地圖: {'開啟' if show_minimap else '關閉'}")
-                elif event.key == pygame.K_i: show_hud_info = not show_hud_info; print(f"資訊顯示: {'開啟' if show_hud_info else '關閉'}")
+                elif event.key == pygame.K_m: show_minimap = not show_minimap; scene_diagnostics.info(f"小地圖: {'開啟' if show_minimap else '關閉'}")
+                elif event.key == pygame.K_i: show_hud_info = not show_hud_info; scene_diagnostics.info(f"資訊顯示: {'開啟' if show_hud_info else '關閉'}")
                 elif event.key == pygame.K_PAGEUP: minimap_renderer.zoom_simulator_minimap(1 / minimap_renderer.MINIMAP_ZOOM_FACTOR)
                 elif event.key == pygame.K_PAGEDOWN: minimap_renderer.zoom_simulator_minimap(minimap_renderer.MINIMAP_ZOOM_FACTOR)
 
@@ -390,86 +515,20 @@ def main():
                             pygame.event.set_grab(True)
                     
                     if action == "load_scene" and filepath_from_menu:
-                        print(f"選單選擇：載入場景檔案 '{filepath_from_menu}'")
+                        scene_diagnostics.info(f"選單選擇：載入場景檔案 '{filepath_from_menu}'")
                         
-                        # --- 1. 清理舊場景的 OpenGL 資源 ---
-                        if scene: # 確保舊的 scene 對象存在
-                            print(f"清理舊場景 '{current_loaded_scene_file}' 的資源...")
-
-                            # --- a. 清理舊場景所有物件緩衝區（山丘/建築/樹木/圓柱） ---
-                            cleanup_scene_buffers(scene)
-
-                            # --- b. 清理舊軌道緩衝區 (如果 scene.cleanup_resources 不做這個，或者做得不夠徹底) ---
-                            if scene.track: # 確保舊軌道存在
-                                print("清理舊場景的軌道緩衝區...")
-                                scene.track.clear() # Track.clear() 應處理其內部VBOs
-
-                            # --- c. (可選)調用通用的場景清理 (如果它還做其他事情) ---
-                            # 如果 scene.cleanup_resources() 只是簡單的 scene.track.clear()，上面已經做了
-                            # if hasattr(scene, 'cleanup_resources'):
-                            #     scene.cleanup_resources() 
-                            
-                            # d. 清理紋理緩存 (load_scene 內部通常會做，但這裡再做一次也無妨，確保徹底)
-                            if texture_loader:
-                                print("清理紋理緩存...")
-                                texture_loader.clear_texture_cache()
-                            # 清理天空盒緩存
-                            if hasattr(renderer, 'skybox_texture_cache'):
-                                for tex_id in renderer.skybox_texture_cache.values():
-                                    try:
-                                        if glIsTexture(tex_id): glDeleteTextures(1, [tex_id])
-                                    except: pass
-                                renderer.skybox_texture_cache.clear()
-
-                        # --- 2. 使用 scene_parser 載入新場景數據 ---
-                        if scene_parser.load_scene(specific_filepath=filepath_from_menu, force_reload=True):
-                            scene = scene_parser.get_current_scene() # 獲取新載入的 scene
-                            current_loaded_scene_file = filepath_from_menu
-                            
-                            active_background_info = scene.initial_background_info if scene else None
-                            
-                            # --- 3. 為新載入的場景創建軌道緩衝區 ---
-                            if scene and scene.track:
-                                print(f"場景 '{filepath_from_menu}' 數據已載入，正在創建新軌道緩衝區...")
-                                scene.track.create_all_segment_buffers()
-                                print("新軌道緩衝區創建完成。")
-                            
-                            # 為選單載入的新場景建立所有物件的渲染緩衝區
-                            print("正在為選單載入的場景創建物件渲染緩衝區...")
-                            create_scene_buffers(scene)
-                            
-                            minimap_renderer.bake_static_map_elements(scene)
-                            print("新場景的小地圖已烘焙。")
-                            
-                            tram_instance.track = scene.track if scene else None
-                            
-                            if scene: # 確保 scene 成功加載
-                                tram_instance.position = np.copy(scene.start_position)
-                                start_angle_rad_main = math.radians(scene.start_angle_deg)
-                                tram_instance.forward_vector_xz = (math.cos(start_angle_rad_main), math.sin(start_angle_rad_main))
-                                tram_instance.distance_on_track = 0.0
-                                tram_instance.current_speed = 0.0
-                                pygame.display.set_caption(f"簡易 3D 電車模擬器 - {os.path.basename(filepath_from_menu)}")
-                                print(f"場景 '{filepath_from_menu}' 已成功載入並準備就緒。電車已重置。")
-                            else: # scene is None after load_scene returned True (異常)
-                                print(f"錯誤: scene_parser.load_scene 聲稱成功，但 scene 為 None。")
-                                # Fallback to default state
-                                tram_instance.position = np.array([0.0, 0.0, 0.0])
-                                tram_instance.forward_vector_xz = (1.0, 0.0)
-                                tram_instance.distance_on_track = 0.0
-                                tram_instance.current_speed = 0.0
-                                active_background_info = None
-                                minimap_renderer.bake_static_map_elements(scene_parser.get_current_scene()) # 傳遞空場景
-                                pygame.display.set_caption("簡易 3D 電車模擬器 - 載入錯誤")
-                        else: # scene_parser.load_scene 返回 False
-                            print(f"通過選單載入場景 '{filepath_from_menu}' 失敗。模擬器將保留原場景（如果存在）。")
-                            # 恢復舊的視窗標題
-                            if current_loaded_scene_file and os.path.exists(current_loaded_scene_file): # 確保路徑有效
-                                pygame.display.set_caption(f"簡易 3D 電車模擬器 - {os.path.basename(current_loaded_scene_file)}")
-                            else: # 如果之前的路徑也無效了，回到預設
-                                pygame.display.set_caption("簡易 3D 電車模擬器") 
+                        if pending_reload is not None:
+                            scene_diagnostics.info("場景正在背景載入中，請稍後再試。")
+                        else:
+                            # 舊場景的資源 (緩衝區、紋理、天空盒) 等新場景在背景備妥、換上之後才釋放
+                            reload_job = scene_parser.start_scene_load(specific_filepath=filepath_from_menu)
+                            if reload_job:
+                                pending_reload = (reload_job, iter_scene_load_steps(
+                                    reload_job, 0.0, tram_instance.looping), "menu")
+                            else:
+                                scene_diagnostics.error(f"通過選單載入場景 '{filepath_from_menu}' 失敗。模擬器將保留原場景（如果存在）。")
                     elif action == "exit":
-                        print("選單選擇：離開")
+                        scene_diagnostics.info("選單選擇：離開")
                         running = False
                         
             elif event.type == pygame.MOUSEWHEEL: tram_instance.adjust_speed(event.y)
@@ -498,39 +557,69 @@ def main():
                     break # No need to check further triggers
             # Only update if the found info is different from the active one
             if found_info != active_background_info:
-                 print(f"里程 {current_dist:.2f} 觸發背景變更為: {found_info}")
+                 scene_diagnostics.debug(f"里程 {current_dist:.2f} 觸發背景變更為: {found_info}")
                  active_background_info = found_info
 
 
         # --- Periodic Scene File Check ---
         current_time = time.time()
-        if current_time - last_scene_check_time > SCENE_CHECK_INTERVAL:
-            # 記住舊場景的引用，重載成功後清理其物件緩衝區
-            old_scene_for_cleanup_auto = scene
-            if scene_parser.load_scene(): # load_scene returns True if reloaded
-                # 清理被替換掉的舊場景的所有物件緩衝區（山丘/建築/樹木/圓柱）
-                cleanup_scene_buffers(old_scene_for_cleanup_auto)
-
-                scene = scene_parser.get_current_scene()
-                # --- NEW: Update active background on auto-reload ---
-                active_background_info = scene.initial_background_info if scene else None
-                print(f"自動重載後背景設定為: {active_background_info}")
-
-                if scene and scene.track:
-                    print("自動重載成功，創建軌道緩衝區...")
-                    scene.track.create_all_segment_buffers()
-
-                # 為自動重載的場景建立所有物件的渲染緩衝區
-                print("正在為自動重載的場景創建物件渲染緩衝區...")
-                create_scene_buffers(scene)
-
-                minimap_renderer.bake_static_map_elements(scene)
-                print("自動重載後小地圖已烘焙。")
-                tram_instance.track = scene.track if scene else None # Update tram's track reference
-                # Optionally reset tram position? Current code doesn't.
-                print("場景自動重新載入完成。")
+        if pending_reload is None and not bundle_path and current_time - last_scene_check_time > SCENE_CHECK_INTERVAL:
+            reload_job = scene_parser.start_scene_load() # 沒有變動時回傳 None
+            if reload_job:
+                pending_reload = (reload_job, iter_scene_load_steps(
+                    reload_job, tram_instance.distance_on_track, tram_instance.looping), "auto")
             last_scene_check_time = current_time
 
+        # --- 背景重載:每幀在時間預算內推進，新場景備妥後在這一幀換上 ---
+        if old_scene_cleanup is not None and run_steps_within_budget(old_scene_cleanup):
+            old_scene_cleanup = None
+        if pending_reload is not None:
+            reload_job, reload_steps, reload_kind = pending_reload
+            if run_steps_within_budget(reload_steps):
+                pending_reload = None
+                new_scene = reload_job.commit()
+                if new_scene is None:
+                    if reload_kind == "menu":
+                        scene_diagnostics.error(f"通過選單載入場景 '{reload_job.filepath}' 失敗。模擬器將保留原場景（如果存在）。")
+                    else:
+                        scene_diagnostics.error("場景重新載入失敗，保留原場景。")
+                else:
+                    if old_scene_cleanup is not None: # 上一次換下的場景還沒釋放完
+                        for _ in old_scene_cleanup: pass
+                    old_scene_cleanup = iter_scene_cleanup_steps(scene)
+                    scene = new_scene
+                    active_background_info = scene.initial_background_info
+                    scene_diagnostics.debug(f"重載後背景設定為: {active_background_info}")
+
+                    minimap_renderer.bake_static_map_elements(scene)
+                    scene_diagnostics.debug("重載後小地圖已烘焙。")
+
+                    tram_instance.track = scene.track
+                    track_stream_steps = None # 進行中的串流屬於舊場景的軌道
+                    if reload_kind == "menu":
+                        current_loaded_scene_file = reload_job.filepath
+                        bundle_path = None # 改用場景檔後恢復重新載入與自動重載
+                        tram_instance.position = np.copy(scene.start_position)
+                        start_angle_rad_main = math.radians(scene.start_angle_deg)
+                        tram_instance.forward_vector_xz = (math.cos(start_angle_rad_main), math.sin(start_angle_rad_main))
+                        tram_instance.distance_on_track = 0.0
+                        tram_instance.current_speed = 0.0
+                        pygame.display.set_caption(f"簡易 3D 電車模擬器 - {os.path.basename(current_loaded_scene_file)}")
+                        scene_diagnostics.info(f"場景 '{current_loaded_scene_file}' 已成功載入並準備就緒。電車已重置。")
+                    elif reload_kind == "manual":
+                        tram_instance.current_speed = 0.0 # Reset speed
+                        scene_diagnostics.info("場景已手動重新載入並重設電車。")
+                    else:
+                        scene_diagnostics.info("場景自動重新載入完成。")
+
+
+        # --- 軌道串流:電車離開已串流的範圍時,分幀生成前方的段並釋放遠處的段 ---
+        if TRACK_STREAMING and scene and scene.track:
+            if track_stream_steps is None and scene.track.needs_stream(tram_instance.distance_on_track, tram_instance.looping):
+                track_stream_steps = scene.track.iter_stream_segment_buffers(
+                    tram_instance.distance_on_track, tram_instance.looping)
+            if track_stream_steps is not None and run_steps_within_budget(track_stream_steps):
+                track_stream_steps = None
 
         # --- OpenGL Rendering ---
         # Clear buffers (Set clear color *before* drawing background)
@@ -540,7 +629,7 @@ def main():
         # Set 3D Projection
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
-        far_clip = renderer.GROUND_SIZE * 4 if hasattr(renderer, 'GROUND_SIZE') else 1000.0 # Use larger far clip for background
+        far_clip = compute_far_clip(scene, camera_instance.base_position)
         gluPerspective(45, (SCREEN_WIDTH / SCREEN_HEIGHT), 0.1, far_clip)
 
         # Set ModelView Matrix
@@ -581,13 +670,15 @@ def main():
         pygame.display.flip()
 
     # --- Cleanup ---
-    print("正在退出...")
+    scene_diagnostics.info("正在退出...")
+    if old_scene_cleanup is not None:
+        for _ in old_scene_cleanup: pass
     if scene:
         if scene.track:
          scene.track.clear()
 
         # 程序退出前，清理所有物件緩衝區（山丘/建築/樹木/圓柱）
-        print("程序退出前，清理場景物件緩衝區...")
+        scene_diagnostics.debug("程序退出前，清理場景物件緩衝區...")
         cleanup_scene_buffers(scene)
 
     minimap_renderer.cleanup_minimap_renderer()
@@ -602,7 +693,7 @@ def main():
                      if glIsTexture(tex_id): glDeleteTextures(1, [tex_id])
                  except: pass # Ignore errors during cleanup
              renderer.skybox_texture_cache.clear()
-             print("Skybox 紋理快取已清除。")
+             scene_diagnostics.debug("Skybox 紋理快取已清除。")
 
     # --- 退出前清理所有著色器程序 ---
     for _shader_attr in ('_hill_shader_program_id', '_building_shader_program_id',
@@ -612,9 +703,9 @@ def main():
             try:
                 glDeleteProgram(_prog_id)
                 setattr(renderer, _shader_attr, None) # 標記為已清理
-                print(f"著色器程序 {_shader_attr} 已清理。")
+                scene_diagnostics.debug(f"著色器程序 {_shader_attr} 已清理。")
             except Exception as e_shader_del:
-                print(f"清理著色器程序 {_shader_attr} 時出錯: {e_shader_del}")
+                scene_diagnostics.warning(f"清理著色器程序 {_shader_attr} 時出錯: {e_shader_del}")
 
     ## Keep profiler cleanup if used
     # print("profiler,disable()")
@@ -622,6 +713,7 @@ def main():
     # stats = pstats.Stats(profiler).sort_stats('cumulative')
     # stats.print_stats(20); stats.dump_stats('profile_results.prof')
 
+    scene_parser.stop_scene_watcher()
     pygame.font.quit()
     pygame.quit()
     sys.exit()
@@ -630,7 +722,7 @@ if __name__ == '__main__':
     # Keep working directory setup
     try:
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
-        print(f"工作目錄設定為: {os.getcwd()}")
+        scene_diagnostics.debug(f"工作目錄設定為: {os.getcwd()}")
     except Exception as e:
-        print(f"無法更改工作目錄: {e}")
+        scene_diagnostics.warning(f"無法更改工作目錄: {e}")
     main()
\ No newline at end of file
@@ -13,10 +13,12 @@ Image.MAX_IMAGE_PIXELS = None # 移除限制
 
 # --- Import shared modules/constants ---
 from scene_parser import Scene
+import scene_objects
 from tram import Tram
 import renderer # Needed for colors, sizes, grid constants, _draw_text_texture, 
 # Import texture loader directly for editor preview background loading
 import texture_loader
+import scene_diagnostics
 from track import TRACK_WIDTH, TrackSegment # --- MODIFICATION: Import TrackSegment for type hinting if needed ---
 
 from numba import jit, njit # Keep numba imports
@@ -64,6 +66,9 @@ MINIMAP_HIGHLIGHT_HILL_LABEL_COLOR = (255, 255, 0, 255) # 高亮標籤顏色
 # Constants for FBO Baking
 MINIMAP_BG_FALLBACK_COLOR = (0.2, 0.2, 0.2, 0.7) # Simulator fallback BG
 MINIMAP_BAKE_GRID_COLOR = MINIMAP_DYNAMIC_GRID_COLOR # Use same color for baked grid
+# 烘焙範圍 = 底圖範圍 ∪ 場景包圍盒 (scene.stats) 外加邊距;超過最大尺寸時退回只用底圖範圍
+MINIMAP_BAKE_MARGIN = 20.0
+MINIMAP_BAKE_MAX_SIZE = 4096 # 1:1 烘焙,像素數即世界單位
 MINIMAP_BAKE_BUILDING_COLOR = (*MINIMAP_DYNAMIC_BUILDING_COLOR[:3], 0.5) # Use alpha for bake
 MINIMAP_BAKE_CYLINDER_COLOR = (*MINIMAP_DYNAMIC_CYLINDER_COLOR[:3], 0.5)
 MINIMAP_BAKE_TREE_COLOR = (*MINIMAP_DYNAMIC_TREE_COLOR[:3], 1.0)
@@ -151,25 +156,34 @@ def bake_static_map_elements(scene: Scene):
     global composite_map_world_cx, composite_map_world_cz, composite_map_world_width, composite_map_world_height, composite_map_world_scale
     global original_bg_texture_id_bake, original_bg_width_px_bake, original_bg_height_px_bake
 
-    print("開始烘焙靜態小地圖元素 (供模擬器使用, 強制 1:1 比例)...")
+    scene_diagnostics.debug("開始烘焙靜態小地圖元素 (供模擬器使用, 強制 1:1 比例)...")
     # --- Cleanup previous bake ---
     _cleanup_bake_resources()
 
-    if not scene or not scene.map_filename: print("警告: 無法烘焙，場景或地圖檔未定義。"); return
-    # Check scene scale validity, as it's used for initial background scaling
-    if scene.map_world_scale <= 1e-6: print(f"警告: 場景中的地圖縮放比例無效 ({scene.map_world_scale})，無法用於校準背景。"); return
+    stats = getattr(scene, "stats", None) if scene else None
+    scene_bounds = stats.bounds if stats is not None else None
+    if not scene or (not scene.map_filename and scene_bounds is None): scene_diagnostics.warning("無法烘焙小地圖，場景沒有地圖檔也沒有任何物件。"); return
 
     # --- 1. Load Original Background Texture (for bake) ---
-    filepath = os.path.join("textures", scene.map_filename)
-    if not os.path.exists(filepath): print(f"錯誤: 找不到背景圖 '{filepath}'，無法烘焙。"); return
-    else:
+    # 沒有地圖檔 (或地圖無法使用) 時仍以場景包圍盒烘焙物件與軌道,只是沒有底圖
+    filepath = None
+    if scene.map_filename:
+        # Check scene scale validity, as it's used for initial background scaling
+        if scene.map_world_scale <= 1e-6:
+            scene_diagnostics.warning(f"場景中的地圖縮放比例無效 ({scene.map_world_scale})，無法用於校準背景。", command="map")
+        elif not os.path.exists(os.path.join("textures", scene.map_filename)):
+            scene_diagnostics.error(f"找不到背景圖 '{os.path.join('textures', scene.map_filename)}'，只烘焙場景物件。", command="map")
+        else:
+            filepath = os.path.join("textures", scene.map_filename)
+    if filepath is not None:
         try:
             # Using Pillow for broader format support might be better here, but stick to Pygame for now
             surface = pygame.image.load(filepath).convert_alpha()
             texture_data = pygame.image.tostring(surface, "RGBA", True)
             original_bg_width_px_bake = surface.get_width()
             original_bg_height_px_bake = surface.get_height()
-            if original_bg_width_px_bake <= 0 or original_bg_height_px_bake <= 0: print(f"錯誤: 背景圖 '{filepath}' 尺寸無效。"); return
+            if original_bg_width_px_bake <= 0 or original_bg_height_px_bake <= 0:
+                raise ValueError(f"背景圖尺寸無效 ({original_bg_width_px_bake}x{original_bg_height_px_bake})")
 
             original_bg_texture_id_bake = glGenTextures(1)
             glBindTexture(GL_TEXTURE_2D, original_bg_texture_id_bake)
@@ -179,17 +193,44 @@ def bake_static_map_elements(scene: Scene):
             glPixelStorei(GL_UNPACK_ALIGNMENT, 1) # Safety for non-multiple-of-4 widths
             glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, original_bg_width_px_bake, original_bg_height_px_bake, 0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
             glBindTexture(GL_TEXTURE_2D, 0)
-            print(f"烘焙用背景紋理已載入: ID={original_bg_texture_id_bake}, 原始尺寸={original_bg_width_px_bake}x{original_bg_height_px_bake}")
+            scene_diagnostics.debug(f"烘焙用背景紋理已載入: ID={original_bg_texture_id_bake}, 原始尺寸={original_bg_width_px_bake}x{original_bg_height_px_bake}")
         except Exception as e:
-            print(f"載入烘焙用背景紋理 '{filepath}' 時出錯: {e}")
+            scene_diagnostics.error(f"載入烘焙用背景紋理 '{filepath}' 時出錯: {e}")
             if original_bg_texture_id_bake: glDeleteTextures(1, [original_bg_texture_id_bake]); original_bg_texture_id_bake = None
             original_bg_width_px_bake = 0; original_bg_height_px_bake = 0
-            return
 
     # --- 2. Determine Composite Texture Properties (CRITICAL CHANGE) ---
-    # Calculate the target world dimensions covered by the scaled background
-    target_world_width = original_bg_width_px_bake * scene.map_world_scale
-    target_world_height = original_bg_height_px_bake * scene.map_world_scale
+    # 底圖範圍 (世界 min_x, min_z, max_x, max_z):依 scene scale 校準後的底圖大小,中心在地圖中心
+    image_rect = None
+    if original_bg_texture_id_bake is not None:
+        half_w = original_bg_width_px_bake * scene.map_world_scale / 2.0
+        half_h = original_bg_height_px_bake * scene.map_world_scale / 2.0
+        image_rect = (scene.map_world_center_x - half_w, scene.map_world_center_z - half_h,
+                      scene.map_world_center_x + half_w, scene.map_world_center_z + half_h)
+    target_rect = image_rect
+    if scene_bounds is not None:
+        bounds_rect = (float(scene_bounds.min[0]) - MINIMAP_BAKE_MARGIN, float(scene_bounds.min[2]) - MINIMAP_BAKE_MARGIN,
+                       float(scene_bounds.max[0]) + MINIMAP_BAKE_MARGIN, float(scene_bounds.max[2]) + MINIMAP_BAKE_MARGIN)
+        if image_rect is not None:
+            bounds_rect = (min(image_rect[0], bounds_rect[0]), min(image_rect[1], bounds_rect[1]),
+                           max(image_rect[2], bounds_rect[2]), max(image_rect[3], bounds_rect[3]))
+        max_size = min(MINIMAP_BAKE_MAX_SIZE, int(glGetIntegerv(GL_MAX_TEXTURE_SIZE)))
+        too_large = max(bounds_rect[2] - bounds_rect[0], bounds_rect[3] - bounds_rect[1]) > max_size
+        if too_large and image_rect is None:
+            # 沒有底圖可退回:以包圍盒中心裁成最大尺寸
+            cx = (bounds_rect[0] + bounds_rect[2]) / 2.0; cz = (bounds_rect[1] + bounds_rect[3]) / 2.0
+            half_x = min(bounds_rect[2] - bounds_rect[0], max_size) / 2.0
+            half_z = min(bounds_rect[3] - bounds_rect[1], max_size) / 2.0
+            bounds_rect = (cx - half_x, cz - half_z, cx + half_x, cz + half_z)
+            scene_diagnostics.warning(f"場景範圍超過小地圖烘焙上限 {max_size}，只烘焙中央部分。")
+            too_large = False
+        if not too_large:
+            target_rect = bounds_rect
+    if target_rect is None: scene_diagnostics.warning("無法烘焙小地圖，沒有可用的底圖也沒有場景範圍。"); return
+
+    # Calculate the target world dimensions covered by the bake
+    target_world_width = target_rect[2] - target_rect[0]
+    target_world_height = target_rect[3] - target_rect[1]
 
     # The composite texture's pixel dimensions will match these world dimensions (1:1)
     composite_texture_width_px = int(round(target_world_width))
@@ -197,7 +238,7 @@ def bake_static_map_elements(scene: Scene):
 
     # Ensure dimensions are at least 1 pixel
     if composite_texture_width_px <= 0 or composite_texture_height_px <= 0:
-        print(f"錯誤: 計算出的合成紋理尺寸無效 ({composite_texture_width_px}x{composite_texture_height_px})，請檢查原始圖片尺寸和 scene.map_world_scale。")
+        scene_diagnostics.error(f"計算出的合成紋理尺寸無效 ({composite_texture_width_px}x{composite_texture_height_px})，請檢查原始圖片尺寸和 scene.map_world_scale。")
         if original_bg_texture_id_bake: glDeleteTextures(1, [original_bg_texture_id_bake]); original_bg_texture_id_bake = None
         return
 
@@ -205,17 +246,22 @@ def bake_static_map_elements(scene: Scene):
     composite_map_world_width = float(composite_texture_width_px)
     composite_map_world_height = float(composite_texture_height_px)
 
-    # Store the world center from the scene
-    composite_map_world_cx = scene.map_world_center_x
-    composite_map_world_cz = scene.map_world_center_z
+    # Store the world center of the baked rect (範圍就是底圖時直接用地圖中心)
+    if target_rect == image_rect:
+        composite_map_world_cx = scene.map_world_center_x
+        composite_map_world_cz = scene.map_world_center_z
+    else:
+        composite_map_world_cx = (target_rect[0] + target_rect[2]) / 2.0
+        composite_map_world_cz = (target_rect[1] + target_rect[3]) / 2.0
 
     # The effective scale of THIS composite texture is always 1.0
     composite_map_world_scale = 1.0 # Store for potential future reference/debugging
 
-    print(f"烘焙紋理設定 (1:1 比例): 目標像素尺寸={composite_texture_width_px}x{composite_texture_height_px}")
-    print(f"  對應世界範圍: 寬={composite_map_world_width:.1f}, 高={composite_map_world_height:.1f}")
-    print(f"  世界中心=({composite_map_world_cx:.1f},{composite_map_world_cz:.1f})")
-    print(f"  (原始背景圖經 scene scale {scene.map_world_scale:.3f} 校準)")
+    scene_diagnostics.debug(f"烘焙紋理設定 (1:1 比例): 目標像素尺寸={composite_texture_width_px}x{composite_texture_height_px}")
+    scene_diagnostics.debug(f"  對應世界範圍: 寬={composite_map_world_width:.1f}, 高={composite_map_world_height:.1f}")
+    scene_diagnostics.debug(f"  世界中心=({composite_map_world_cx:.1f},{composite_map_world_cz:.1f})")
+    if image_rect is not None:
+        scene_diagnostics.debug(f"  (原始背景圖經 scene scale {scene.map_world_scale:.3f} 校準)")
 
 
     # --- 3. Create FBO and Composite Texture ---
@@ -234,10 +280,10 @@ def bake_static_map_elements(scene: Scene):
         glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, composite_map_texture_id, 0)
         status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
         if status != GL_FRAMEBUFFER_COMPLETE:
-            print(f"錯誤: FBO 不完整! 狀態碼: {status}")
+            scene_diagnostics.error(f"FBO 不完整! 狀態碼: {status}")
             glBindFramebuffer(GL_FRAMEBUFFER, 0); _cleanup_bake_resources(); return
-        print(f"FBO 已創建 (ID={composite_fbo}) 並綁定 1:1 紋理 (ID={composite_map_texture_id})")
-    except Exception as e: print(f"創建 FBO 或烘焙紋理時出錯: {e}"); _cleanup_bake_resources(); return
+        scene_diagnostics.debug(f"FBO 已創建 (ID={composite_fbo}) 並綁定 1:1 紋理 (ID={composite_map_texture_id})")
+    except Exception as e: scene_diagnostics.error(f"創建 FBO 或烘焙紋理時出錯: {e}"); _cleanup_bake_resources(); return
 
     # --- 4. Render to FBO ---
     glPushAttrib(GL_VIEWPORT_BIT | GL_TRANSFORM_BIT | GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT | GL_CURRENT_BIT | GL_LINE_BIT | GL_POINT_BIT | GL_TEXTURE_BIT)
@@ -258,30 +304,64 @@ def bake_static_map_elements(scene: Scene):
         # --- A. Render Original Background (Scaled to fit FBO) ---
         if original_bg_texture_id_bake is not None:
             glEnable(GL_TEXTURE_2D); glBindTexture(GL_TEXTURE_2D, original_bg_texture_id_bake); glColor4f(1.0, 1.0, 1.0, 1.0)
-            # Draw quad covering the entire FBO using standard UVs. OpenGL handles the scaling.
+            # 底圖畫在它在烘焙範圍中所占的比例位置 (範圍就是底圖時即整個 FBO);X 軸翻轉,u=0 對應底圖的 max_x
+            target_w = target_rect[2] - target_rect[0]; target_h = target_rect[3] - target_rect[1]
+            bg_left = composite_texture_width_px * (target_rect[2] - image_rect[2]) / target_w
+            bg_right = composite_texture_width_px * (target_rect[2] - image_rect[0]) / target_w
+            bg_bottom = composite_texture_height_px * (image_rect[1] - target_rect[1]) / target_h
+            bg_top = composite_texture_height_px * (image_rect[3] - target_rect[1]) / target_h
             glBegin(GL_QUADS)
-            glTexCoord2f(0, 0); glVertex2f(0, 0) # Bottom-Left FBO pixel
-            glTexCoord2f(1, 0); glVertex2f(composite_texture_width_px, 0) # Bottom-Right
-            glTexCoord2f(1, 1); glVertex2f(composite_texture_width_px, composite_texture_height_px) # Top-Right
-            glTexCoord2f(0, 1); glVertex2f(0, composite_texture_height_px) # Top-Left
+            glTexCoord2f(0, 0); glVertex2f(bg_left, bg_bottom) # Bottom-Left
+            glTexCoord2f(1, 0); glVertex2f(bg_right, bg_bottom) # Bottom-Right
+            glTexCoord2f(1, 1); glVertex2f(bg_right, bg_top) # Top-Right
+            glTexCoord2f(0, 1); glVertex2f(bg_left, bg_top) # Top-Left
             glEnd()
             glBindTexture(GL_TEXTURE_2D, 0); glDisable(GL_TEXTURE_2D);
-            print("原始背景圖已(經校準縮放)繪製到 FBO。")
+            scene_diagnostics.debug("原始背景圖已(經校準縮放)繪製到 FBO。")
 
         # --- B. Render Static Elements (Now onto the 1:1 FBO) ---
         # _render_static_elements_to_fbo uses the global composite_* variables,
         # which now correctly reflect the 1:1 scale. _world_to_fbo_coords will work correctly.
         _render_static_elements_to_fbo(scene)
 
-    except Exception as e: print(f"在 FBO 渲染過程中發生錯誤: {e}")
+    except Exception as e: scene_diagnostics.error(f"在 FBO 渲染過程中發生錯誤: {e}")
     finally:
         glBindFramebuffer(GL_FRAMEBUFFER, 0); glMatrixMode(GL_PROJECTION); glPopMatrix(); glMatrixMode(GL_MODELVIEW); glPopMatrix(); glPopAttrib()
 
     # --- 5. Cleanup temporary bake resources ---
     if original_bg_texture_id_bake is not None:
-        glDeleteTextures(1, [original_bg_texture_id_bake]); original_bg_texture_id_bake = None; print("烘焙用背景紋理已釋放。")
+        glDeleteTextures(1, [original_bg_texture_id_bake]); original_bg_texture_id_bake = None; scene_diagnostics.debug("烘焙用背景紋理已釋放。")
 
-    print(f"靜態小地圖元素已成功烘焙到 1:1 紋理 ID={composite_map_texture_id} (供模擬器使用)")
+    scene_diagnostics.debug(f"靜態小地圖元素已成功烘焙到 1:1 紋理 ID={composite_map_texture_id} (供模擬器使用)")
+
+def read_baked_map():
+    """
+    讀回目前烘焙好的小地圖 (供場景包儲存):回傳 dict (width, height, center_x, center_z, pixels 為 RGBA 位元組),
+    沒有烘焙結果時回傳 None。
+    """
+    if composite_map_texture_id is None: return None
+    glBindTexture(GL_TEXTURE_2D, composite_map_texture_id)
+    pixels = glGetTexImage(GL_TEXTURE_2D, 0, GL_RGBA, GL_UNSIGNED_BYTE)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return {"width": composite_texture_width_px, "height": composite_texture_height_px,
+            "center_x": composite_map_world_cx, "center_z": composite_map_world_cz, "pixels": pixels}
+
+def load_baked_map(width, height, center_x, center_z, pixels):
+    """以 read_baked_map 存下的像素直接建立烘焙小地圖紋理 (1:1 比例),不重新烘焙。"""
+    global composite_map_texture_id, composite_texture_width_px, composite_texture_height_px
+    global composite_map_world_cx, composite_map_world_cz, composite_map_world_width, composite_map_world_height, composite_map_world_scale
+    _cleanup_bake_resources()
+    composite_map_texture_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, composite_map_texture_id)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE); glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR); glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    composite_texture_width_px, composite_texture_height_px = width, height
+    composite_map_world_width, composite_map_world_height = float(width), float(height)
+    composite_map_world_cx, composite_map_world_cz = center_x, center_z
+    composite_map_world_scale = 1.0
+    scene_diagnostics.debug(f"已載入預先烘焙的小地圖紋理 ID={composite_map_texture_id} ({width}x{height})")
 
 # --- Keep _rotate_point_3d (Needed by minimap_renderer bake) ---
 # Make sure it's accessible (not private `__`)
@@ -382,8 +462,8 @@ def calculate_2d_convex_hull(points_xz: list) -> list:
         return convex_hull_vertex_list
             
     except Exception as e: # 通常是 scipy.spatial.qhull.QhullError
-        print(f"警告: 使用 SciPy 計算凸包時出錯: {e}")
-        print(f"DEBUG: ConvexHull - Failed for input points: {points_xz}")
+        scene_diagnostics.warning(f"使用 SciPy 計算凸包時出錯: {e}")
+        scene_diagnostics.debug(f"ConvexHull - Failed for input points: {points_xz}")
         # Fallback 策略：返回這些點的軸對齊外包框 (AABB)
         if points_xz: 
             min_x = min(p[0] for p in points_xz)
@@ -588,7 +668,7 @@ def get_convex_hull_projection_for_flexroof(
 def _render_static_elements_to_fbo(scene: Scene):
     """ Renders grid, buildings, cylinders, trees into the currently bound FBO. """
     # --- KEEPING LOGIC IDENTICAL (using your tested _world_to_fbo_coords) ---
-    print("正在向 FBO 繪製靜態元素 (網格/建築/圓柱/樹)...")
+    scene_diagnostics.debug("正在向 FBO 繪製靜態元素 (網格/建築/圓柱/樹)...")
     fbo_w=composite_texture_width_px;
     fbo_h=composite_texture_height_px;
     world_cx=composite_map_world_cx;
@@ -596,7 +676,7 @@ def _render_static_elements_to_fbo(scene: Scene):
     world_w=composite_map_world_width;
     world_h=composite_map_world_height
     if fbo_w<=0 or fbo_h<=0 or world_w<=1e-6 or world_h<=1e-6:
-        print("警告: FBO/世界尺寸無效。");
+        scene_diagnostics.warning("FBO/世界尺寸無效。");
         return
     world_min_x = world_cx - world_w/2.0;
     world_max_x = world_cx + world_w/2.0;
@@ -622,7 +702,7 @@ def _render_static_elements_to_fbo(scene: Scene):
     # Buildings (Filled Quads)
     glColor4fv(MINIMAP_BAKE_BUILDING_COLOR)
     if hasattr(scene, 'buildings'): # 檢查是否存在 buildings 列表
-        for item in scene.buildings:
+        for item in scene.iter_objects('buildings'):
             # 假設 item 的結構是 (line_identifier, bldg_data_tuple)
             # bldg_data_tuple 的結構是 (obj_type, wx, wy, wz, rx_d, ry_d, rz_d, ww, wd, wh, ...)
             # 你需要根據你 scene_parser.py 中 building 的 obj_data_tuple 結構來正確解包
@@ -634,8 +714,8 @@ def _render_static_elements_to_fbo(scene: Scene):
                 rx_d, ry_d, rz_d = bldg_data_tuple[4:7] # 世界旋轉角度
                 ww, wd, wh = bldg_data_tuple[7:10]   # 總尺寸
             except (IndexError, TypeError, ValueError) as e_unpack:
-                print(f"警告 FBO: 解包 building 數據 (行: {line_identifier}) 失敗: {e_unpack}")
-                print(f"DEBUG FBO: Building data tuple was: {bldg_data_tuple}")
+                scene_diagnostics.warning(f"小地圖烘焙: 解包 building 數據失敗: {e_unpack}", *scene_diagnostics.split_line_id(line_identifier))
+                scene_diagnostics.debug(f"小地圖烘焙: Building data tuple was: {bldg_data_tuple}")
                 continue
 
             # 使用新的輔助函數獲取凸包的XZ投影頂點 (世界座標)
@@ -678,7 +758,7 @@ def _render_static_elements_to_fbo(scene: Scene):
 
     # Cylinders (Filled Circles or Boxes)
     glColor4fv(MINIMAP_BAKE_CYLINDER_COLOR); num_circle_segments = 16
-    for item in scene.cylinders:
+    for item in scene.iter_objects('cylinders'):
         line_num, cyl = item
         # 注意來自scene_parser那邊的剖析結果的變數排列
         c_type, wx, wy, wz, rx, ry, rz, cr, ch, tid, *_ = cyl;
@@ -746,7 +826,7 @@ def _render_static_elements_to_fbo(scene: Scene):
                 glVertex2f(proj_len_px/2,-proj_wid_px/2);
                 glEnd()
                 glPopMatrix()
-            except Exception as e: print(f"Error baking tilted cylinder: {e}")
+            except Exception as e: scene_diagnostics.error(f"Error baking tilted cylinder: {e}")
         else:
             center_fbo_x, center_fbo_y = _world_to_fbo_coords(wx, wz, world_cx, world_cz, world_w, world_h, fbo_w, fbo_h)
             radius_px_x = cr*(fbo_w/world_w);
@@ -767,7 +847,7 @@ def _render_static_elements_to_fbo(scene: Scene):
     # Trees (Points or Small Circles)
     glColor4fv(MINIMAP_BAKE_TREE_COLOR); tree_radius_px = 2; glPointSize(tree_radius_px*3)
     glBegin(GL_POINTS) # Using points for simplicity in bake
-    for item in scene.trees:
+    for item in scene.iter_objects('trees'):
         line_num, tree = item
         obj_type, tx, ty, tz, th, _tex_id, _tex_file, *rest= tree; fbo_x, fbo_y = _world_to_fbo_coords(tx, tz, world_cx, world_cz, world_w, world_h, fbo_w, fbo_h)
         if 0 <= fbo_x <= fbo_w and 0 <= fbo_y <= fbo_h: glVertex2f(fbo_x, fbo_y)
@@ -776,12 +856,12 @@ def _render_static_elements_to_fbo(scene: Scene):
     # --- Bake Spheres (Filled Circles) ---
     glColor4fv(MINIMAP_BAKE_SPHERE_COLOR) # 使用烘焙顏色
     num_circle_segments_bake = 16 # 烘焙時可以用更高精度
-    for item in scene.spheres:
+    for item in scene.iter_objects('spheres'):
         line_num, sphere_data = item
         try:
             s_type, wx, wy, wz, srx, sabs_ry, srz, cr, *rest = sphere_data
         except ValueError:
-             print(f"警告: 解包 sphere 數據 (FBO烘焙) 時出錯 (來源行: {line_num})")
+             scene_diagnostics.warning("解包 sphere 數據 (FBO烘焙) 時出錯。", *scene_diagnostics.split_line_id(line_num))
              continue
 
         # 轉換到 FBO 像素座標
@@ -915,7 +995,7 @@ def _render_static_elements_to_fbo(scene: Scene):
                 if obj_type_str != "flexroof": continue
 
             except (IndexError, ValueError) as e_unpack_fbo:
-                print(f"警告 FBO: 解包 flexroof 數據 (行: {line_identifier}) 失敗: {e_unpack_fbo}")
+                scene_diagnostics.warning(f"小地圖烘焙: 解包 flexroof 數據失敗: {e_unpack_fbo}", *scene_diagnostics.split_line_id(line_identifier))
                 continue
 
             # 使用輔助函數獲取凸包的XZ投影頂點 (世界座標)
@@ -955,7 +1035,7 @@ def _render_static_elements_to_fbo(scene: Scene):
 
         for segment in scene.track.segments:
             # Draw main segment points
-            if segment.points and len(segment.points) >= 2:
+            if len(segment.points) >= 2:
                 glColor3fv(MINIMAP_TRACK_COLOR) # Use the defined track color
                 glBegin(GL_LINE_STRIP)
                 for point_world in segment.points:
@@ -967,14 +1047,14 @@ def _render_static_elements_to_fbo(scene: Scene):
             if hasattr(segment, 'visual_branches') and segment.visual_branches:
                 glColor3fv(MINIMAP_BRANCH_TRACK_COLOR) # Use the defined track color
                 for branch_def in segment.visual_branches:
-                    if branch_def.get('points') and len(branch_def['points']) >= 2:
+                    if len(branch_def.get('points', ())) >= 2:
                         glBegin(GL_LINE_STRIP)
                         for point_world_branch in branch_def['points']:
                             map_x_b, map_y_b = _world_to_fbo_coords(point_world_branch[0], point_world_branch[2], world_cx, world_cz, world_w, world_h, fbo_w, fbo_h)
                             glVertex2f(map_x_b, map_y_b)
                         glEnd()
 
-    print("靜態元素 FBO 繪製完成。")
+    scene_diagnostics.debug("靜態元素 FBO 繪製完成。")
 
 
 # --- Simulator Runtime Drawing (Keep as before) ---
@@ -1153,12 +1233,12 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
 
         # 包含所有可能包含可定位物件的列表的列表
         all_object_lists = []
-        if hasattr(scene, 'buildings'): all_object_lists.append(scene.buildings)
+        if hasattr(scene, 'buildings'): all_object_lists.append(scene.iter_objects('buildings'))
         if hasattr(scene, 'gableroofs'): all_object_lists.append(scene.gableroofs)
-        if hasattr(scene, 'cylinders'): all_object_lists.append(scene.cylinders)
-        if hasattr(scene, 'spheres'): all_object_lists.append(scene.spheres)
+        if hasattr(scene, 'cylinders'): all_object_lists.append(scene.iter_objects('cylinders'))
+        if hasattr(scene, 'spheres'): all_object_lists.append(scene.iter_objects('spheres'))
         if hasattr(scene, 'hills'): all_object_lists.append(scene.hills)
-        if hasattr(scene, 'trees'): all_object_lists.append(scene.trees)
+        if hasattr(scene, 'trees'): all_object_lists.append(scene.iter_objects('trees'))
         # 如果軌道段 TrackSegment 的 source_line_number 也是你 line_to_focus_on 的目標，
         # 則也需要遍歷 scene.track.segments
 
@@ -1183,10 +1263,10 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
 #                         print(f"DEBUG Focus Scan: Object for line {line_to_focus_on} FOUND at ({obj_wx:.1f}, {obj_wz:.1f}). Type: {data_tuple[0] if data_tuple else 'Unknown'}")
                         break # 跳出內層循環 (遍歷當前物件列表)
                     else:
-                        print(f"DEBUG Focus Scan: Matched line {line_to_focus_on} but could not extract wx, wz from data: {data_tuple}")
+                        scene_diagnostics.debug(f"Focus Scan: Matched line {line_to_focus_on} but could not extract wx, wz from data: {data_tuple}")
         
         if not target_found_in_scan:
-            print(f"DEBUG Focus Scan: No object found for line_to_focus_on = {line_to_focus_on}")
+            scene_diagnostics.debug(f"Focus Scan: No object found for line_to_focus_on = {line_to_focus_on}")
     # --- 結束步驟1 ---
     
     widget_center_x_screen = widget_width / 2.0
@@ -1205,7 +1285,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
     if scene and scene.map_filename:
         # Check if editor needs to load/reload its background texture
         if scene.map_filename != editor_current_map_filename:
-            print(f"編輯器偵測到地圖變更: {scene.map_filename}")
+            scene_diagnostics.debug(f"編輯器偵測到地圖變更: {scene.map_filename}")
             # Cleanup old editor texture if exists
             if editor_bg_texture_id and glIsTexture(editor_bg_texture_id):
                 glDeleteTextures(1, [editor_bg_texture_id])
@@ -1219,16 +1299,16 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
             if os.path.exists(filepath):
                 try:
                     # --- 使用 Pillow 載入圖像 ---
-                    print(f"嘗試使用 Pillow 載入圖像: {filepath}") # Debug
+                    scene_diagnostics.debug(f"嘗試使用 Pillow 載入圖像: {filepath}")
                     img = Image.open(filepath)
                     # 確保圖像為 RGBA 格式 (如果不是，轉換它)
                     if img.mode != 'RGBA':
-                        print(f"圖像模式為 {img.mode}，轉換為 RGBA...") # Debug
+                        scene_diagnostics.debug(f"圖像模式為 {img.mode}，轉換為 RGBA...")
                         img = img.convert('RGBA')
                     # 獲取圖像數據
                     texture_data = img.tobytes("raw", "RGBA", 0, -1) # OpenGL 通常需要 Y 軸倒置的數據
                     editor_bg_width_px, editor_bg_height_px = img.size
-                    print(f"Pillow 載入成功: 尺寸={img.size}, 模式={img.mode}") # Debug
+                    scene_diagnostics.debug(f"Pillow 載入成功: 尺寸={img.size}, 模式={img.mode}")
                     # -----------------------------
 #                     print(f"嘗試載入 Pygame Surface: {filepath}") # Debug
 #                     surface = pygame.image.load(filepath).convert_alpha()
@@ -1250,7 +1330,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                          # --- 新增：檢查載入前的錯誤 ---
                          error_before = glGetError()
                          if error_before != GL_NO_ERROR:
-                             print(f"警告: glTexImage2D 之前存在 OpenGL 錯誤: {gluErrorString(error_before)}")
+                             scene_diagnostics.warning(f"glTexImage2D 之前存在 OpenGL 錯誤: {gluErrorString(error_before)}")
                          # ---------------------------
 
                          # --- 新增：設定像素解包對齊方式 ---
@@ -1263,19 +1343,19 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                          # --- 新增：檢查載入後的錯誤 ---
                          error_after = glGetError()
                          if error_after != GL_NO_ERROR:
-                             print(f"錯誤: glTexImage2D 執行時發生 OpenGL 錯誤: {gluErrorString(error_after)}")
+                             scene_diagnostics.error(f"glTexImage2D 執行時發生 OpenGL 錯誤: {gluErrorString(error_after)}")
                              # 如果出錯，嘗試刪除無效的紋理 ID
                              glDeleteTextures(1, [editor_bg_texture_id])
                              editor_bg_texture_id = None # 標記為無效
                          else:
-                             print(f"編輯器背景紋理 glTexImage2D 成功: ID={editor_bg_texture_id}")
+                             scene_diagnostics.debug(f"編輯器背景紋理 glTexImage2D 成功: ID={editor_bg_texture_id}")
                          # ---------------------------
 
                          glBindTexture(GL_TEXTURE_2D, 0)
-                         print(f"編輯器背景紋理已載入: ID={editor_bg_texture_id}, 尺寸={editor_bg_width_px}x{editor_bg_height_px}")
-                    else: print("錯誤: 編輯器背景圖尺寸無效。")
-                except Exception as e: print(f"載入編輯器背景紋理 '{filepath}' 時出錯: {e}"); editor_bg_texture_id = None
-            else: print(f"警告: 找不到編輯器背景圖 '{filepath}'。")
+                         scene_diagnostics.debug(f"編輯器背景紋理已載入: ID={editor_bg_texture_id}, 尺寸={editor_bg_width_px}x{editor_bg_height_px}")
+                    else: scene_diagnostics.error("編輯器背景圖尺寸無效。")
+                except Exception as e: scene_diagnostics.error(f"載入編輯器背景紋理 '{filepath}' 時出錯: {e}"); editor_bg_texture_id = None
+            else: scene_diagnostics.warning(f"找不到編輯器背景圖 '{filepath}'。")
 
         # If texture is loaded, draw it
         if editor_bg_texture_id and editor_bg_width_px > 0 and editor_bg_height_px > 0 and abs(scene.map_world_scale) > 1e-6:
@@ -1390,7 +1470,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
     if scene:
         # Buildings (Line Loop of Convex Hull)
         if hasattr(scene, 'buildings'):
-            for item in scene.buildings:
+            for item in scene.iter_objects('buildings'):
                 line_identifier, bldg_data_tuple = item
                 try:
                     # 與FBO中解包方式保持一致
@@ -1403,10 +1483,10 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                     wx, wy, wz = bldg_data_tuple[1:4]
                     rx_d, ry_d, rz_d = bldg_data_tuple[4:7]
                     ww, wd, wh = bldg_data_tuple[7:10]
-                    parent_origin_ry_deg = bldg_data_tuple[19] # 假設這是我們需要的最後一個參數
+                    parent_origin_ry_deg = bldg_data_tuple[scene_objects.BUILDING_FIELDS["parent_ry"]]
                 except (IndexError, TypeError, ValueError) as e_unpack_preview:
-                    print(f"警告 Preview: 解包 building 數據 (行: {line_identifier}) 失敗: {e_unpack_preview}")
-                    print(f"DEBUG Preview: Building data tuple was: {bldg_data_tuple}")
+                    scene_diagnostics.warning(f"編輯器預覽: 解包 building 數據失敗: {e_unpack_preview}", *scene_diagnostics.split_line_id(line_identifier))
+                    scene_diagnostics.debug(f"編輯器預覽: Building data tuple was: {bldg_data_tuple}")
                     continue
 
                 # --- 計算 building 的包圍圓半徑 (新方法) ---
@@ -1597,7 +1677,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
         # Cylinders (Circles/Boxes)
 #         glColor3fv(MINIMAP_DYNAMIC_CYLINDER_COLOR); num_circle_segments = 12
         if hasattr(scene, 'cylinders'): # 檢查列表是否存在
-            for item in scene.cylinders:
+            for item in scene.iter_objects('cylinders'):
                 line_identifier, cyl = item # 解包行號和數據元組
                 # 注意來自scene_parser那邊的剖析結果的變數排列
                 try:
@@ -1769,7 +1849,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
         point_size = min_pt+(max_pt-min_pt)*zoom_ratio
         glPointSize(max(1.0, point_size))
         
-        for item in scene.trees:
+        for item in scene.iter_objects('trees'):
             line_num, tree = item # 解包行號和數據元組
             if line_num not in highlight_line_nums: # 只處理非高亮的
                 # [:8]：編輯器預覽建立 VBO 後元組會擴充到 11 元素，只取前 8 個
@@ -1798,7 +1878,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
         # --- 繪製高亮的樹 ---
         if highlight_line_nums: # 只有當有需要高亮的行時才執行
 
-            for item in scene.trees:
+            for item in scene.iter_objects('trees'):
                 line_identifier, tree_data = item
                 is_highlighted = line_identifier in highlight_line_nums
                 if is_highlighted: # 只處理高亮的
@@ -1864,7 +1944,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
         # --- Draw Spheres (Circles) Dynamically ---
         if hasattr(scene, 'spheres'):
 #         num_circle_segments_sphere = 12 # 圓的邊數 (可以根據縮放調整)
-            for item in scene.spheres:
+            for item in scene.iter_objects('spheres'):
                 line_identifier, sphere_data = item
                 # 解包獲取必要資訊 (世界座標 wx, wy, wz 和半徑 cr)
                 try:
@@ -1874,7 +1954,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                     uv_mode, uscale, vscale, tex_file, \
                     parent_origin_ry_deg = sphere_data[:17]
                 except ValueError:
-                     print(f"警告: 解包 sphere 數據 (動態小地圖) 時出錯 (來源行: {line_identifier})")
+                     scene_diagnostics.warning("解包 sphere 數據 (動態小地圖) 時出錯。", *scene_diagnostics.split_line_id(line_identifier))
                      continue
 
                 # Spheres 的包圍圓半徑就是其 cr (球體旋轉不改變其投影包圍圓)
@@ -1973,7 +2053,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                  tex_id, tex_alpha,
                  parent_origin_ry_deg) = hill_data[:14]
             except ValueError:
-                print(f"警告: 解包 hill 數據 (編輯器預覽) 時出錯 (來源行: {line_identifier})") # 可選警告
+                scene_diagnostics.warning("解包 hill 數據 (編輯器預覽) 時出錯。", *scene_diagnostics.split_line_id(line_identifier)) # 可選警告
                 continue
 
             # --- 計算 Widget 座標 ---
@@ -2081,7 +2161,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                     ridge_x_pos_offset = roof_data[10]
                     eave_overhang_x = roof_data[11]
                     eave_overhang_z = roof_data[12]
-                    parent_origin_ry_deg = roof_data[16]
+                    parent_origin_ry_deg = roof_data[scene_objects.GABLEROOF_FIELDS["parent_ry"]]
                 except (IndexError, ValueError):
                     # print(f"警告: 解包 gableroof 數據 (編輯器預覽) 時出錯 (行: {line_identifier})")
                     continue
@@ -2205,7 +2285,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
                     if obj_type_str != "flexroof": continue
                 
                 except (IndexError, ValueError) as e_unpack_preview_dyn:
-                    print(f"警告 Preview Dynamic: 解包 flexroof 數據 (行: {line_identifier}) 失敗: {e_unpack_preview_dyn}")
+                    scene_diagnostics.warning(f"編輯器預覽: 解包 flexroof 數據失敗: {e_unpack_preview_dyn}", *scene_diagnostics.split_line_id(line_identifier))
                     continue
 
                 # --- 包圍圓裁剪 (與 gableroof 類似，使用整體估算) ---
@@ -2325,7 +2405,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
 
         for segment in scene.track.segments:
             # --- Draw Main Segment ---
-            if segment.points and len(segment.points) >= 2:
+            if len(segment.points) >= 2:
                 glPushAttrib(GL_CURRENT_BIT | GL_LINE_BIT | GL_POINT_BIT)
                 is_highlighted_main = False
                 try:
@@ -2385,7 +2465,7 @@ def draw_editor_preview(scene: Scene, view_center_x, view_center_z, view_range,
             # --- Draw Visual Branches ---
             if hasattr(segment, 'visual_branches') and segment.visual_branches:
                 for idx, branch_def in enumerate(segment.visual_branches):
-                    if branch_def.get('points') and len(branch_def['points']) >= 2:
+                    if len(branch_def.get('points', ())) >= 2:
                         glPushAttrib(GL_CURRENT_BIT | GL_LINE_BIT | GL_POINT_BIT)
                         # For vbranch, highlighting could be based on the parent segment's line number
                         # or if vbranch itself had a source_line_number (if it were a separate command in table)
@@ -2479,7 +2559,7 @@ def zoom_simulator_minimap(factor):
     global current_simulator_minimap_range
     new_range = current_simulator_minimap_range * factor
     current_simulator_minimap_range = max(MINIMAP_MIN_RANGE, min(MINIMAP_MAX_RANGE, new_range))
-    print(f"Simulator minimap range set to: {current_simulator_minimap_range:.1f}")
+    scene_diagnostics.debug(f"Simulator minimap range set to: {current_simulator_minimap_range:.1f}")
 
 # --- Cleanup Functions ---
 def _cleanup_bake_resources():
@@ -2487,33 +2567,33 @@ def _cleanup_bake_resources():
     global composite_fbo, composite_map_texture_id, original_bg_texture_id_bake
     if composite_fbo:
         try: glBindFramebuffer(GL_FRAMEBUFFER, 0); glDeleteFramebuffers(1, [composite_fbo]);
-        except Exception as e: print(f"Warn: Error deleting FBO: {e}")
+        except Exception as e: scene_diagnostics.warning(f"Error deleting FBO: {e}")
         composite_fbo = None
     if composite_map_texture_id:
         try:
             if glIsTexture(composite_map_texture_id): glDeleteTextures(1, [composite_map_texture_id])
-        except Exception as e: print(f"Warn: Error deleting baked texture: {e}")
+        except Exception as e: scene_diagnostics.warning(f"Error deleting baked texture: {e}")
         composite_map_texture_id = None
     if original_bg_texture_id_bake: # Should be cleaned in bake, but safety check
          try:
              if glIsTexture(original_bg_texture_id_bake): glDeleteTextures(1, [original_bg_texture_id_bake])
-         except Exception as e: print(f"Warn: Error deleting bake BG texture in cleanup: {e}")
+         except Exception as e: scene_diagnostics.warning(f"Error deleting bake BG texture in cleanup: {e}")
          original_bg_texture_id_bake = None
 
 def cleanup_minimap_renderer():
     """Cleans up ALL resources (baked FBO/tex + editor dynamic tex)."""
     global editor_bg_texture_id, editor_current_map_filename
-    print("清理小地圖渲染器資源 (Baked + Editor)...")
+    scene_diagnostics.debug("清理小地圖渲染器資源 (Baked + Editor)...")
     _cleanup_bake_resources() # Clean up baked stuff
 
     # Clean up editor's dynamic background texture
     if editor_bg_texture_id:
         try:
             if glIsTexture(editor_bg_texture_id): glDeleteTextures(1, [editor_bg_texture_id])
-        except Exception as e: print(f"Warn: Error deleting editor BG texture: {e}")
+        except Exception as e: scene_diagnostics.warning(f"Error deleting editor BG texture: {e}")
         editor_bg_texture_id = None
     editor_current_map_filename = None
-    print("小地圖渲染器資源已清理。")
+    scene_diagnostics.debug("小地圖渲染器資源已清理。")
 
 # --- Initialization (Keep placeholder) ---
 def init_minimap_renderer():
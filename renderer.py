@@ -13,6 +13,8 @@ from numba import jit, njit # Keep numba imports
 
 import shaders_inline 
 from frustum_culling import Frustum 
+import scene_objects
+import scene_diagnostics
 
 # --- Drawing Parameters (General) ---
 # (保持不變)
@@ -21,6 +23,7 @@ TREE_TRUNK_RADIUS = 0.2
 TREE_LEAVES_RADIUS = 1.5
 RAIL_COLOR = (0.4, 0.4, 0.5) # Keep
 BALLAST_COLOR = (0.6, 0.55, 0.5) # Keep
+SLEEPER_COLOR = (0.45, 0.42, 0.38) # 混凝土枕木
 CAB_COLOR = (0.2, 0.3, 0.7) # Keep
 DASHBOARD_COLOR = (0.8, 0.8, 0.85) # Keep
 LEVER_COLOR = (0.8, 0.1, 0.1) # Keep
@@ -196,17 +199,17 @@ def set_hud_font(font):
     if hud_display_font:
         try:
             grid_label_font = pygame.font.SysFont(None, MINIMAP_GRID_LABEL_FONT_SIZE)
-            print(f"網格標籤字體已創建 (大小: {MINIMAP_GRID_LABEL_FONT_SIZE}).")
+            scene_diagnostics.debug(f"網格標籤字體已創建 (大小: {MINIMAP_GRID_LABEL_FONT_SIZE}).")
             import minimap_renderer # Try importing here to avoid circular dependency issues at top level
             minimap_renderer.set_grid_label_font(grid_label_font)
-        except Exception as e: print(f"警告: 無法加載網格標籤字體 (大小: {MINIMAP_GRID_LABEL_FONT_SIZE}): {e}"); grid_label_font = None
+        except Exception as e: scene_diagnostics.warning(f"無法加載網格標籤字體 (大小: {MINIMAP_GRID_LABEL_FONT_SIZE}): {e}"); grid_label_font = None
         try:
             coord_label_font = pygame.font.SysFont(None, MINIMAP_COORD_LABEL_FONT_SIZE)
-            print(f"座標標籤字體已創建 (大小: {MINIMAP_COORD_LABEL_FONT_SIZE}).")
+            scene_diagnostics.debug(f"座標標籤字體已創建 (大小: {MINIMAP_COORD_LABEL_FONT_SIZE}).")
             import minimap_renderer
             minimap_renderer.set_coord_label_font(coord_label_font)
-        except Exception as e: print(f"警告: 無法加載座標標籤字體 (大小: {MINIMAP_COORD_LABEL_FONT_SIZE}): {e}"); coord_label_font = None
-    else: print("警告: 主 HUD 字體未設置，標籤字體無法創建。")
+        except Exception as e: scene_diagnostics.warning(f"無法加載座標標籤字體 (大小: {MINIMAP_COORD_LABEL_FONT_SIZE}): {e}"); coord_label_font = None
+    else: scene_diagnostics.warning("主 HUD 字體未設置，標籤字體無法創建。")
 
 
 # --- REMOVED: Minimap Texture Loading Functions ---
@@ -215,7 +218,7 @@ def set_hud_font(font):
 def compile_shader_from_source(shader_source, shader_type): # 這個函數用於從字符串編譯
     """編譯單個著色器源碼字符串"""
     if not shader_source:
-        print(f"錯誤: 著色器源碼為空 (類型: {shader_type})")
+        scene_diagnostics.error(f"著色器源碼為空 (類型: {shader_type})")
         return None
     shader_id = glCreateShader(shader_type)
     glShaderSource(shader_id, shader_source)
@@ -223,7 +226,7 @@ def compile_shader_from_source(shader_source, shader_type): # 這個函數用於
     if glGetShaderiv(shader_id, GL_COMPILE_STATUS) != GL_TRUE:
         info_log = glGetShaderInfoLog(shader_id)
         shader_type_str = "Vertex" if shader_type == GL_VERTEX_SHADER else "Fragment" if shader_type == GL_FRAGMENT_SHADER else "Unknown"
-        print(f"{shader_type_str} 著色器源碼編譯錯誤:\n{info_log.decode()}")
+        scene_diagnostics.error(f"{shader_type_str} 著色器源碼編譯錯誤:\n{info_log.decode()}")
         glDeleteShader(shader_id)
         return None
     return shader_id
@@ -247,7 +250,7 @@ def create_shader_program_from_sources(vertex_source, fragment_source): # 這個
 
     if glGetProgramiv(program_id, GL_LINK_STATUS) != GL_TRUE:
         info_log = glGetProgramInfoLog(program_id)
-        print(f"著色器程序鏈接錯誤 (源碼):\n{info_log.decode()}")
+        scene_diagnostics.error(f"著色器程序鏈接錯誤 (源碼):\n{info_log.decode()}")
         glDeleteProgram(program_id) # 清理程序對象
         # 單個shader對象也需要清理
         glDeleteShader(vertex_shader)
@@ -257,15 +260,20 @@ def create_shader_program_from_sources(vertex_source, fragment_source): # 這個
     glDeleteShader(vertex_shader) # 鏈接後即可刪除
     glDeleteShader(fragment_shader)
     
-    print(f"著色器程序已從源碼創建並鏈接: ID={program_id}")
+    scene_diagnostics.debug(f"著色器程序已從源碼創建並鏈接: ID={program_id}")
     return program_id
 
 _hill_shader_program_id = None # 全局變量
 _building_shader_program_id = None # <--- 新增全局變量
 _tree_shader_program_id = None
 _cylinder_shader_program_id = None
+_track_shader_program_id = None
 frustum_culler = Frustum() # 初始化視錐體剔除器
 
+# Building tuple 的欄位索引 (見 scene_objects.OBJECT_SCHEMAS)
+_BF = scene_objects.BUILDING_FIELDS
+_BUILDING_TUPLE_LENGTH = len(_BF)
+
 # uniform location 在 shader link 後即固定，快取避免每幀每物件重複查詢
 _uniform_location_cache = {}
 
@@ -280,28 +288,28 @@ def _get_uniform_loc(program_id, name):
 def init_hill_shader(): # 可以在 init_renderer 中調用
     global _hill_shader_program_id
     if _hill_shader_program_id is None:
-        print("正在從 shaders_inline 初始化山丘著色器...") # 添加日誌
+        scene_diagnostics.debug("正在從 shaders_inline 初始化山丘著色器...") # 添加日誌
         _hill_shader_program_id = create_shader_program_from_sources(
             shaders_inline.HILL_VERTEX_SHADER_SOURCE, 
             shaders_inline.HILL_FRAGMENT_SHADER_SOURCE
         )
         if _hill_shader_program_id is None:
-            print("致命錯誤: 無法從源碼初始化山丘著色器程序！")
+            scene_diagnostics.error("無法從源碼初始化山丘著色器程序！")
         else:
-            print(f"山丘著色器程序已從源碼成功初始化: ID={_hill_shader_program_id}")
+            scene_diagnostics.debug(f"山丘著色器程序已從源碼成功初始化: ID={_hill_shader_program_id}")
              
 def init_building_shader():
     global _building_shader_program_id
     if _building_shader_program_id is None:
-        print("正在從 shaders_inline 初始化 Building 著色器...")
+        scene_diagnostics.debug("正在從 shaders_inline 初始化 Building 著色器...")
         _building_shader_program_id = create_shader_program_from_sources(
             shaders_inline.BUILDING_VERTEX_SHADER_SOURCE,
             shaders_inline.BUILDING_FRAGMENT_SHADER_SOURCE
         )
         if _building_shader_program_id is None:
-            print("致命錯誤: 無法從源碼初始化 Building 著色器程序！")
+            scene_diagnostics.error("無法從源碼初始化 Building 著色器程序！")
         else:
-            print(f"Building 著色器程序已從源碼成功初始化: ID={_building_shader_program_id}")
+            scene_diagnostics.debug(f"Building 著色器程序已從源碼成功初始化: ID={_building_shader_program_id}")
 
 def init_tree_shader():
     global _tree_shader_program_id
@@ -311,9 +319,9 @@ def init_tree_shader():
             shaders_inline.TREE_FRAGMENT_SHADER_SOURCE
         )
         if _tree_shader_program_id is None:
-            print("致命錯誤: 無法從源碼初始化樹木著色器程序！")
+            scene_diagnostics.error("無法從源碼初始化樹木著色器程序！")
         else:
-            print(f"樹木著色器程序已從源碼成功初始化: ID={_tree_shader_program_id}")
+            scene_diagnostics.debug(f"樹木著色器程序已從源碼成功初始化: ID={_tree_shader_program_id}")
 
 def init_cylinder_shader():
     global _cylinder_shader_program_id
@@ -323,9 +331,21 @@ def init_cylinder_shader():
             shaders_inline.CYLINDER_FRAGMENT_SHADER_SOURCE
         )
         if _cylinder_shader_program_id is None:
-            print("致命錯誤: 無法從源碼初始化圓柱著色器程序！")
+            scene_diagnostics.error("無法從源碼初始化圓柱著色器程序！")
+        else:
+            scene_diagnostics.debug(f"圓柱著色器程序已從源碼成功初始化: ID={_cylinder_shader_program_id}")
+
+def init_track_shader():
+    global _track_shader_program_id
+    if _track_shader_program_id is None:
+        _track_shader_program_id = create_shader_program_from_sources(
+            shaders_inline.TRACK_VERTEX_SHADER_SOURCE,
+            shaders_inline.TRACK_FRAGMENT_SHADER_SOURCE
+        )
+        if _track_shader_program_id is None:
+            scene_diagnostics.error("無法從源碼初始化軌道著色器程序！")
         else:
-            print(f"圓柱著色器程序已從源碼成功初始化: ID={_cylinder_shader_program_id}")
+            scene_diagnostics.debug(f"軌道著色器程序已從源碼成功初始化: ID={_track_shader_program_id}")
 
 # --- init_renderer (Update) ---
 def init_renderer():
@@ -361,6 +381,7 @@ def init_renderer():
     init_building_shader() # <--- 新增: 初始化 Building 著色器
     init_tree_shader() # 樹木 VBO 著色器
     init_cylinder_shader() # 圓柱 VBO 著色器
+    init_track_shader() # 軌道 (道碴、鋼軌、枕木) 著色器
 
 # --- draw_ground (unchanged) ---
 def draw_ground(show_ground):
@@ -381,120 +402,67 @@ def draw_ground(show_ground):
     glEnable(GL_TEXTURE_2D)
 
 
-# --- draw_track (unchanged) ---
-def draw_track(track_obj):
-    # (Logic unchanged)
+# --- draw_track ---
+def draw_track(track_obj, segment_indices=None, ballast_color=BALLAST_COLOR, rail_color=RAIL_COLOR,
+               sleeper_color=SLEEPER_COLOR):
+    """
+    以軌道的合併網格繪製道碴、鋼軌 (擠出的斷面網格) 與枕木 (一次 instanced 繪製),繪製呼叫數與路線長度無關。
+    segment_indices 指定只畫哪些段 (剔除或以其他顏色高亮),相鄰段的範圍合併後各畫一次。
+    """
     if not track_obj or not track_obj.segments: return
+    mesh = track_obj.ensure_mesh()
+    if mesh is None: return
+    if segment_indices is None:
+        ballast_runs = ((0,), (mesh.ballast_vertex_count,))
+        rail_runs = ((0,), (mesh.rail_vertex_count,))
+        sleeper_runs = ((0,), (mesh.sleeper_count,))
+    else:
+        ballast_runs = mesh.ballast_ranges_for(segment_indices)
+        rail_runs = mesh.rail_ranges_for(segment_indices)
+        sleeper_runs = mesh.sleeper_ranges_for(segment_indices)
+    program_id = _track_shader_program_id
     glDisable(GL_TEXTURE_2D)
-    for segment in track_obj.segments:
-        # --- 修改：檢查 is_buffer_ready 標誌 ---
-        if not segment.is_buffer_ready:
-            # 可選：打印一個日誌，說明跳過了這個段的繪製
-            # print(f"TrackSegment (line {segment.source_line_number}): Buffers not ready, skipping draw.")
-            continue # 跳過繪製此段
-        # ------------------------------------
-        # 繪製主軌道段的道碴
-        if segment.ballast_vao and segment.ballast_vertices:
-            glColor3fv(BALLAST_COLOR)
-            
-            error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-            if error_before_bind != GL_NO_ERROR:
-                print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (ballast) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-                
-            glBindVertexArray(segment.ballast_vao)
-            
-            error_after_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR # PyOpenGL 通常在操作後檢查，但我們也可以手動加
-            if error_after_bind != GL_NO_ERROR:
-                print(f"OpenGL Error {error_after_bind} AFTER glBindVertexArray (ballast) for segment line {segment.source_line_number}, VAO ID bound: {segment.ballast_vao}")
-                
-            # --- MODIFICATION: Ensure vertex_count is calculated correctly ---
-            # ballast_vertices stores x,y,z per vertex, so len gives total floats. Divide by 3 for vertex count.
-            vertex_count = len(segment.ballast_vertices) // 3
-            if vertex_count > 0:
-                 glDrawArrays(GL_TRIANGLES, 0, vertex_count)
-            # --- END OF MODIFICATION ---
-            glBindVertexArray(0)
-        
-        glLineWidth(2.0); # Set line width for rails
-        glColor3fv(RAIL_COLOR) # Set color before drawing
-        # Main Left Rail
-        if segment.rail_left_vao and segment.rail_left_vertices:
-
-            error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-            if error_before_bind != GL_NO_ERROR:
-                print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (rail_left_vao) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-
-            glBindVertexArray(segment.rail_left_vao)
-            
-            vertex_count = len(segment.rail_left_vertices) // 3
-            if vertex_count > 0:
-                glDrawArrays(GL_LINE_STRIP, 0, vertex_count)
-            glBindVertexArray(0)
-        # Main Right Rail
-        if segment.rail_right_vao and segment.rail_right_vertices:
-
-            error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-            if error_before_bind != GL_NO_ERROR:
-                print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (rail_right_vao) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-
-            glBindVertexArray(segment.rail_right_vao)
-            
-            vertex_count = len(segment.rail_right_vertices) // 3
-            if vertex_count > 0:
-                glDrawArrays(GL_LINE_STRIP, 0, vertex_count)
-            glBindVertexArray(0)
-#    glEnable(GL_TEXTURE_2D)
-
-        # --- START OF MODIFICATION ---
-        # --- Draw Visual Branches for this segment ---
-        if hasattr(segment, 'visual_branches') and segment.visual_branches:
-            for branch_def in segment.visual_branches:
-                # Draw Ballast for the branch
-                if branch_def.get('ballast_vao') and branch_def.get('ballast_vertices'):
-                    glColor3fv(BALLAST_COLOR) # Use same ballast color, or could be different
-                    
-                    error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-                    if error_before_bind != GL_NO_ERROR:
-                        print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (branch_def ballast_vao) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-                    
-                    glBindVertexArray(branch_def['ballast_vao'])
-                    
-                    vertex_count_b_ballast = len(branch_def['ballast_vertices']) // 3
-                    if vertex_count_b_ballast > 0:
-                        glDrawArrays(GL_TRIANGLES, 0, vertex_count_b_ballast)
-                    glBindVertexArray(0)
-
-                # Draw Left Rail for the branch
-                if branch_def.get('rail_left_vao') and branch_def.get('rail_left_vertices'):
-                    glColor3fv(RAIL_COLOR) # Use same rail color
-                    
-                    error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-                    if error_before_bind != GL_NO_ERROR:
-                        print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (branch_def rail_left_vao) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-                        
-                    glBindVertexArray(branch_def['rail_left_vao'])
-                    
-                    vertex_count_b_rail_l = len(branch_def['rail_left_vertices']) // 3
-                    if vertex_count_b_rail_l > 0:
-                        glDrawArrays(GL_LINE_STRIP, 0, vertex_count_b_rail_l)
-                    glBindVertexArray(0)
-
-                # Draw Right Rail for the branch
-                if branch_def.get('rail_right_vao') and branch_def.get('rail_right_vertices'):
-                    glColor3fv(RAIL_COLOR) # Use same rail color
-                    
-                    error_before_bind = glGetError() if DEBUG_TRACK_GL_CHECKS else GL_NO_ERROR
-                    if error_before_bind != GL_NO_ERROR:
-                        print(f"OpenGL Error {error_before_bind} BEFORE glBindVertexArray (branch_def rail_right_vao) for segment line {segment.source_line_number}, VAO ID to bind: {segment.ballast_vao}")
-                        
-                    glBindVertexArray(branch_def['rail_right_vao'])
-                    
-                    vertex_count_b_rail_r = len(branch_def['rail_right_vertices']) // 3
-                    if vertex_count_b_rail_r > 0:
-                        glDrawArrays(GL_LINE_STRIP, 0, vertex_count_b_rail_r)
-                    glBindVertexArray(0)
-        # --- END OF MODIFICATION ---
-
+    if program_id:
+        glUseProgram(program_id)
+        _set_lit_object_uniforms(program_id, glGetFloatv(GL_MODELVIEW_MATRIX))
+        glUniform1i(_get_uniform_loc(program_id, "u_instanced"), 0)
+
+    def set_color(color, specular_strength):
+        if program_id:
+            glUniform3f(_get_uniform_loc(program_id, "u_color"), *color)
+            glUniform1f(_get_uniform_loc(program_id, "u_specular_strength"), specular_strength)
+        else:
+            glColor3fv(color)
+
+    if mesh.ballast_vao:
+        set_color(ballast_color, 0.0)
+        glBindVertexArray(mesh.ballast_vao)
+        glVertexAttrib3f(1, 0.0, 1.0, 0.0) # 道碴頂面朝上 (沒有法向量陣列)
+        for first, count in zip(*ballast_runs):
+            glDrawArrays(GL_TRIANGLES, int(first), int(count))
+    if mesh.rail_vao:
+        set_color(rail_color, 0.3)
+        glBindVertexArray(mesh.rail_vao)
+        for first, count in zip(*rail_runs):
+            glDrawArrays(GL_TRIANGLES, int(first), int(count))
+    if program_id and mesh.sleeper_instance_vbo:
+        set_color(sleeper_color, 0.0)
+        glUniform1i(_get_uniform_loc(program_id, "u_instanced"), 1)
+        glBindVertexArray(mesh.sleeper_vao)
+        for first, count in zip(*sleeper_runs):
+            if first:
+                mesh.bind_sleeper_instances(int(first))
+            glDrawArraysInstanced(GL_TRIANGLES, 0, mesh.sleeper_vertex_count, int(count))
+            if first:
+                mesh.bind_sleeper_instances(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+    glBindVertexArray(0)
+    if program_id:
+        glUseProgram(0)
+    if DEBUG_TRACK_GL_CHECKS:
+        error = glGetError()
+        if error != GL_NO_ERROR:
+            scene_diagnostics.error(f"OpenGL Error {error} after draw_track ({len(track_obj.segments)} segments)")
     glEnable(GL_TEXTURE_2D) # Re-enable textures if they were disabled for track drawing
 
 # --- _calculate_uv (unchanged) ---
@@ -602,7 +570,7 @@ def generate_cube_mesh_data(width, depth, height, object_uv_layout_key="cube"):
     # 獲取 Atlas 佈局
     uv_layout = DEFAULT_UV_LAYOUTS.get(object_uv_layout_key)
     if not uv_layout:
-        print(f"警告: generate_cube_mesh_data - 未找到 UV 佈局 '{object_uv_layout_key}'。將使用 (0,0) 作為所有 UV。")
+        scene_diagnostics.warning(f"generate_cube_mesh_data - 未找到 UV 佈局 '{object_uv_layout_key}'。將使用 (0,0) 作為所有 UV。")
         # 創建一個空的 fallback 佈局，或者為每個面使用 (0,0,0,0)
         uv_layout = {face: (0,0,0,0) for face in ["front", "back", "left", "right", "top", "bottom"]}
 
@@ -646,10 +614,10 @@ def create_building_buffers(building_entry_with_line_id): # <--- 參數名更改
     """
     line_id, obj_data_tuple_original = building_entry_with_line_id # <--- 首先解包行號和元組
     
-    EXPECTED_TUPLE_LENGTH = 23
-    VAO_ID_INDEX = 20
-    VBO_ID_INDEX = 21
-    VERTEX_COUNT_INDEX = 22
+    EXPECTED_TUPLE_LENGTH = _BUILDING_TUPLE_LENGTH
+    VAO_ID_INDEX = _BF["vao"]
+    VBO_ID_INDEX = _BF["vbo"]
+    VERTEX_COUNT_INDEX = _BF["vertex_count"]
 
     current_data_list = list(obj_data_tuple_original) # 操作副本
     while len(current_data_list) < EXPECTED_TUPLE_LENGTH:
@@ -659,31 +627,31 @@ def create_building_buffers(building_entry_with_line_id): # <--- 參數名更改
 
     try:
         if len(obj_data_tuple_original) < 10: # 檢查原始元組長度
-            print(f"警告: create_building_buffers - Building (行: {line_id}) 原始 obj_data_tuple 太短，無法獲取尺寸。Tuple: {obj_data_tuple_original}")
+            scene_diagnostics.warning(f"create_building_buffers - Building 原始 obj_data_tuple 太短，無法獲取尺寸。Tuple: {obj_data_tuple_original}", *scene_diagnostics.split_line_id(line_id))
             current_data_list[VAO_ID_INDEX] = None
             current_data_list[VBO_ID_INDEX] = None
             current_data_list[VERTEX_COUNT_INDEX] = 0
             return tuple(current_data_list), False
 
-        width = obj_data_tuple_original[7]
-        depth = obj_data_tuple_original[8]
-        height = obj_data_tuple_original[9]
+        width = obj_data_tuple_original[_BF["w"]]
+        depth = obj_data_tuple_original[_BF["d"]]
+        height = obj_data_tuple_original[_BF["h"]]
 
     except IndexError:
-        print(f"警告: create_building_buffers - Building (行: {line_id}) obj_data_tuple 索引錯誤。Tuple: {obj_data_tuple_original}")
+        scene_diagnostics.warning(f"create_building_buffers - Building obj_data_tuple 索引錯誤。Tuple: {obj_data_tuple_original}", *scene_diagnostics.split_line_id(line_id))
         current_data_list[VAO_ID_INDEX] = None
         current_data_list[VBO_ID_INDEX] = None
         current_data_list[VERTEX_COUNT_INDEX] = 0
         return tuple(current_data_list), False
     except TypeError as e: 
-        print(f"警告: create_building_buffers - Building (行: {line_id}) 尺寸參數類型錯誤: {e}. Tuple: {obj_data_tuple_original}")
+        scene_diagnostics.warning(f"create_building_buffers - Building 尺寸參數類型錯誤: {e}. Tuple: {obj_data_tuple_original}", *scene_diagnostics.split_line_id(line_id))
         current_data_list[VAO_ID_INDEX] = None
         current_data_list[VBO_ID_INDEX] = None
         current_data_list[VERTEX_COUNT_INDEX] = 0
         return tuple(current_data_list), False
 
     if not all(isinstance(dim, (int, float)) and dim > 0 for dim in [width, depth, height]):
-        print(f"警告: create_building_buffers - Building (行: {line_id}) 尺寸參數無效 (w={width}, d={depth}, h={height})。")
+        scene_diagnostics.warning(f"create_building_buffers - Building 尺寸參數無效 (w={width}, d={depth}, h={height})。", *scene_diagnostics.split_line_id(line_id))
         current_data_list[VAO_ID_INDEX] = None
         current_data_list[VBO_ID_INDEX] = None
         current_data_list[VERTEX_COUNT_INDEX] = 0
@@ -704,7 +672,7 @@ def create_building_buffers(building_entry_with_line_id): # <--- 參數名更改
     vertex_data, vertex_count = generate_cube_mesh_data(width, depth, height, object_uv_layout_key="cube") 
 
     if vertex_count == 0:
-        print(f"警告: Building (行: {line_id}) 调用 generate_cube_mesh_data 未生成頂點數據。")
+        scene_diagnostics.warning("Building 调用 generate_cube_mesh_data 未生成頂點數據。", *scene_diagnostics.split_line_id(line_id))
         return tuple(current_data_list), False
 
     vbo_id = None
@@ -735,7 +703,7 @@ def create_building_buffers(building_entry_with_line_id): # <--- 參數名更改
         return tuple(current_data_list), True
 
     except Exception as e_gl:
-        print(f"錯誤: Building (行: {line_id}) 創建 OpenGL 緩衝區時失敗: {e_gl}")
+        scene_diagnostics.error(f"Building 創建 OpenGL 緩衝區時失敗: {e_gl}", *scene_diagnostics.split_line_id(line_id))
         if vao_id is not None and glIsVertexArray(vao_id): glDeleteVertexArrays(1, [vao_id])
         if vbo_id is not None and glIsBuffer(vbo_id): glDeleteBuffers(1, [vbo_id])
         current_data_list[VAO_ID_INDEX] = None
@@ -747,10 +715,10 @@ def create_building_buffers(building_entry_with_line_id): # <--- 參數名更改
 def cleanup_building_buffers_for_entry(building_entry_with_line_id):
     line_id, obj_data_tuple = building_entry_with_line_id # <--- 解包
     
-    EXPECTED_TUPLE_LENGTH = 23
-    VAO_ID_INDEX = 20
-    VBO_ID_INDEX = 21
-    VERTEX_COUNT_INDEX = 22
+    EXPECTED_TUPLE_LENGTH = _BUILDING_TUPLE_LENGTH
+    VAO_ID_INDEX = _BF["vao"]
+    VBO_ID_INDEX = _BF["vbo"]
+    VERTEX_COUNT_INDEX = _BF["vertex_count"]
 
     if len(obj_data_tuple) < EXPECTED_TUPLE_LENGTH:
         # print(f"DEBUG: cleanup_building_buffers_for_entry - Tuple for line {line_id} too short, nothing to clean.")
@@ -761,10 +729,10 @@ def cleanup_building_buffers_for_entry(building_entry_with_line_id):
     
     if vao_id is not None:
         try: glDeleteVertexArrays(1, [vao_id])
-        except Exception as e: print(f"清理 Building VAO {vao_id} (行: {line_id}) 錯誤: {e}")
+        except Exception as e: scene_diagnostics.warning(f"清理 Building VAO {vao_id} (行: {line_id}) 錯誤: {e}")
     if vbo_id is not None:
         try: glDeleteBuffers(1, [vbo_id])
-        except Exception as e: print(f"清理 Building VBO {vbo_id} (行: {line_id}) 錯誤: {e}")
+        except Exception as e: scene_diagnostics.warning(f"清理 Building VBO {vbo_id} (行: {line_id}) 錯誤: {e}")
     
     new_list = list(obj_data_tuple)
     new_list[VAO_ID_INDEX] = None
@@ -812,7 +780,7 @@ def draw_cube(width, depth, height,
             else:
                 glDisable(GL_TEXTURE_2D)
         except Exception as e_tex_check: # glIsTexture 在某些情況下可能出錯
-            print(f"DEBUG: draw_cube - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
+            scene_diagnostics.debug(f"draw_cube - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
             glDisable(GL_TEXTURE_2D)
     else: # texture_id_from_scene is None
         glDisable(GL_TEXTURE_2D)
@@ -840,7 +808,7 @@ def draw_cube(width, depth, height,
     if uv_mode == 2: # --- 新的佈局式紋理方案 ---
         uv_layout = DEFAULT_UV_LAYOUTS.get(object_uv_layout_key)
         if not uv_layout:
-            print(f"警告: uv_mode=2 但未找到物件 '{object_uv_layout_key}' 的UV佈局。紋理可能不正確。")
+            scene_diagnostics.warning(f"uv_mode=2 但未找到物件 '{object_uv_layout_key}' 的UV佈局。紋理可能不正確。")
             # 在這種情況下，可以選擇不繪製紋理，或者使用(0,0)作為所有UV
             # 為了避免崩潰，我們先讓它繼續，但紋理會是錯的
         
@@ -1011,7 +979,7 @@ def draw_cylinder(radius, height, texture_id_from_scene=None,
                 # 或者對於 GLU cylinder，紋理旋轉效果有限。暫時不加入 glRotatef(tex_angle_deg, ...)。
                 glMatrixMode(GL_MODELVIEW) # 切回
         except Exception as e_tex_check: # glIsTexture 在某些情況下可能出錯
-            print(f"DEBUG: draw_cylinder - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
+            scene_diagnostics.debug(f"draw_cylinder - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
             glDisable(GL_TEXTURE_2D)
     else:
         glDisable(GL_TEXTURE_2D)
@@ -1151,7 +1119,7 @@ def draw_cylinder(radius, height, texture_id_from_scene=None,
 
         
     else:
-        print("Error creating GLU quadric object for cylinder.")
+        scene_diagnostics.error("Error creating GLU quadric object for cylinder.")
 #     glBindTexture(GL_TEXTURE_2D, 0)
 #     glEnable(GL_TEXTURE_2D)
     if alpha_testing_was_actually_enabled_this_call:
@@ -1223,7 +1191,7 @@ def draw_sphere(radius, texture_id=None, slices=16, stacks=16,
 
         gluDeleteQuadric(quadric) # 釋放物件
     else:
-        print("Error: 無法創建 GLU quadric 物件繪製球體。")
+        scene_diagnostics.error("無法創建 GLU quadric 物件繪製球體。")
 
     # 恢復紋理狀態
     glBindTexture(GL_TEXTURE_2D, 0)
@@ -1268,7 +1236,7 @@ def draw_gableroof(
     # 1. 獲取此屋頂的UV佈局
     uv_layout = DEFAULT_UV_LAYOUTS.get("gableroof")
     if not uv_layout:
-        print("警告: 未找到 gableroof 的UV佈局！紋理可能無法正確顯示。")
+        scene_diagnostics.warning("未找到 gableroof 的UV佈局！紋理可能無法正確顯示。")
         # 可以設計一個回退的UV方案，或者直接返回
 
     # 2. 計算頂點 (在屋頂的局部座標系中)
@@ -1442,7 +1410,7 @@ def draw_flexroof(
             else:
                 glDisable(GL_TEXTURE_2D)
         except Exception as e_tex_check:
-            print(f"DEBUG: draw_flexroof - Error checking texture ID {texture_id}: {e_tex_check}")
+            scene_diagnostics.debug(f"draw_flexroof - Error checking texture ID {texture_id}: {e_tex_check}")
             glDisable(GL_TEXTURE_2D)
     else:
         glDisable(GL_TEXTURE_2D)
@@ -1458,7 +1426,7 @@ def draw_flexroof(
     # 1. 獲取此屋頂的UV佈局 (使用內部固定的鍵名)
     uv_layout_map = DEFAULT_UV_LAYOUTS.get(uv_layout_key_internal)
     if not uv_layout_map:
-        print(f"警告: 未找到 flexroof 的UV佈局 (鍵: '{uv_layout_key_internal}')！紋理可能無法正確顯示。")
+        scene_diagnostics.warning(f"未找到 flexroof 的UV佈局 (鍵: '{uv_layout_key_internal}')！紋理可能無法正確顯示。")
         # Fallback: 創建一個空的 uv_layout_map，這樣 get 不會失敗，但紋理會是 (0,0)
         uv_layout_map = {} 
 
@@ -1774,7 +1742,7 @@ def create_hill_buffers(hill_entry):
     )
 
     if vertex_count == 0:
-        print(f"警告: 山丘 (行: {line_id}) 未生成頂點數據，無法創建緩衝區。")
+        scene_diagnostics.warning("山丘未生成頂點數據，無法創建緩衝區。", *scene_diagnostics.split_line_id(line_id))
         # Ensure any old buffers are cleared and IDs are None
         new_hill_data = list(hill_data)
         if len(new_hill_data) > 14 and new_hill_data[14] is not None: cleanup_hill_buffers(hill_entry) # VAO ID
@@ -1830,11 +1798,11 @@ def cleanup_hill_buffers_for_entry(hill_entry):
     if vao_id is not None:
         try:
             glDeleteVertexArrays(1, [vao_id])
-        except Exception as e: print(f"清理山丘 VAO {vao_id} 錯誤: {e}")
+        except Exception as e: scene_diagnostics.warning(f"清理山丘 VAO {vao_id} 錯誤: {e}")
     if vbo_id is not None:
         try:
             glDeleteBuffers(1, [vbo_id])
-        except Exception as e: print(f"清理山丘 VBO {vbo_id} 錯誤: {e}")
+        except Exception as e: scene_diagnostics.warning(f"清理山丘 VBO {vbo_id} 錯誤: {e}")
     
     # Return a new tuple with None for IDs, useful for updating the scene list
     new_hill_data_list = list(hill_data)
@@ -1845,7 +1813,7 @@ def cleanup_hill_buffers_for_entry(hill_entry):
 
 def cleanup_all_hill_buffers(scene_hills_list):
     """Cleans up VBOs and VAOs for all hills in the provided list."""
-    print("正在清理所有山丘的緩衝區...")
+    scene_diagnostics.debug("正在清理所有山丘的緩衝區...")
     for i in range(len(scene_hills_list)):
         # cleanup_hill_buffers_for_entry returns the modified entry
         scene_hills_list[i] = cleanup_hill_buffers_for_entry(scene_hills_list[i])
@@ -2096,6 +2064,122 @@ def cleanup_all_sphere_buffers(scene_spheres_list):
     for i in range(len(scene_spheres_list)):
         scene_spheres_list[i] = cleanup_sphere_buffers_for_entry(scene_spheres_list[i])
 
+# --- 預先產生的物件網格 (場景包) ---
+# 各類 VBO 物件的頂點屬性 (每個屬性的 float 數),與上面各 create_*_buffers 的 glVertexAttribPointer 一致
+OBJECT_VERTEX_LAYOUTS = {
+    "buildings": (3, 3, 2), # 位置、法線、UV
+    "cylinders": (3, 3, 2),
+    "spheres":   (3, 3, 2),
+    "hills":     (3, 3, 2),
+    "trees":     (3, 2),    # 位置、UV
+}
+
+def generate_object_mesh_data(list_name, obj_data):
+    """產生與 create_*_buffers 相同的網格 (vertex_data, vertex_count),不需要 OpenGL;無法建立網格時頂點數為 0。"""
+    fields = scene_objects.FIELD_INDEX[scene_objects.OBJECT_LIST_TYPES[list_name]]
+    if list_name == "buildings":
+        dims = [obj_data[fields[name]] for name in ("w", "d", "h")]
+        if not all(isinstance(dim, (int, float)) and dim > 0 for dim in dims):
+            return np.zeros(0, dtype=np.float32), 0
+        return generate_cube_mesh_data(*dims, object_uv_layout_key="cube")
+    if list_name == "cylinders":
+        return generate_cylinder_mesh_data(obj_data[fields["radius"]], obj_data[fields["h"]])
+    if list_name == "spheres":
+        return generate_sphere_mesh_data(obj_data[fields["radius"]])
+    if list_name == "trees":
+        return generate_tree_mesh_data(obj_data[fields["h"]])
+    if list_name == "hills":
+        return generate_hill_mesh_data(*[obj_data[fields[name]] for name in scene_objects.MESH_FIELDS["hill"]],
+                                       resolution=20)
+    raise ValueError(f"{list_name} 沒有 VBO 網格")
+
+def create_object_buffers_from_vertex_data(list_name, entry, vertex_data, vertex_count):
+    """
+    以現成的頂點資料 (例如場景包 mmap 出來的 float32 陣列) 建立物件的 VBO/VAO,不重新產生網格。
+    回傳 (填入 VAO/VBO/頂點數的新 tuple, 成功與否),與 create_*_buffers 相同。
+    """
+    line_id, obj_data = entry
+    fields = scene_objects.FIELD_INDEX[scene_objects.OBJECT_LIST_TYPES[list_name]]
+    new_data = list(obj_data)
+    while len(new_data) <= fields["vertex_count"]: new_data.append(None)
+    new_data[fields["vao"]], new_data[fields["vbo"]], new_data[fields["vertex_count"]] = None, None, 0
+    if vertex_count == 0:
+        return tuple(new_data), False
+
+    vbo_id = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+    glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
+
+    vao_id = glGenVertexArrays(1)
+    glBindVertexArray(vao_id)
+    layout = OBJECT_VERTEX_LAYOUTS[list_name]
+    stride = sum(layout) * sizeof(GLfloat)
+    offset = 0
+    for location, size in enumerate(layout):
+        glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * sizeof(GLfloat)))
+        glEnableVertexAttribArray(location)
+        offset += size
+    glBindVertexArray(0)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    new_data[fields["vao"]], new_data[fields["vbo"]], new_data[fields["vertex_count"]] = vao_id, vbo_id, vertex_count
+    return tuple(new_data), True
+
+# --- 實例陣列 (array 指令):一份網格 + 每份位移的 instance VBO,一次 instanced draw ---
+def create_instance_array_buffers(instance_array):
+    """
+    為 scene_objects.InstanceArray 建立共用網格的 VBO/VAO 與每份位移的 instance VBO (直接填入該物件)。
+    位移屬性接在網格屬性之後 (著色器的 aInstanceOffset),每個實例前進一次。回傳成功與否。
+    """
+    cleanup_instance_array_buffers(instance_array)
+    vertex_data, vertex_count = generate_object_mesh_data(instance_array.list_name, instance_array.template)
+    if vertex_count == 0 or len(instance_array) == 0:
+        return False
+    vertex_data = np.ascontiguousarray(vertex_data, dtype=np.float32)
+    offset_data = np.ascontiguousarray(instance_array.offsets, dtype=np.float32)
+
+    vao_id = glGenVertexArrays(1)
+    glBindVertexArray(vao_id)
+    vbo_id = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+    glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
+    layout = OBJECT_VERTEX_LAYOUTS[instance_array.list_name]
+    stride = sum(layout) * sizeof(GLfloat)
+    offset = 0
+    for location, size in enumerate(layout):
+        glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * sizeof(GLfloat)))
+        glEnableVertexAttribArray(location)
+        offset += size
+
+    instance_vbo_id = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, instance_vbo_id)
+    glBufferData(GL_ARRAY_BUFFER, offset_data.nbytes, offset_data, GL_STATIC_DRAW)
+    offset_location = len(layout)
+    glVertexAttribPointer(offset_location, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
+    glEnableVertexAttribArray(offset_location)
+    glVertexAttribDivisor(offset_location, 1)
+    glBindVertexArray(0)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    instance_array.vao, instance_array.vbo = vao_id, vbo_id
+    instance_array.instance_vbo, instance_array.vertex_count = instance_vbo_id, vertex_count
+    return True
+
+def cleanup_instance_array_buffers(instance_array):
+    if instance_array.vao is not None:
+        try: glDeleteVertexArrays(1, [instance_array.vao])
+        except Exception: pass
+    for buffer_id in (instance_array.vbo, instance_array.instance_vbo):
+        if buffer_id is not None:
+            try: glDeleteBuffers(1, [buffer_id])
+            except Exception: pass
+    instance_array.vao = instance_array.vbo = instance_array.instance_vbo = None
+    instance_array.vertex_count = 0
+
+def cleanup_all_instance_array_buffers(scene_instance_arrays):
+    for _line_id, instance_array in scene_instance_arrays:
+        cleanup_instance_array_buffers(instance_array)
+
 def draw_hill(center_x, base_y, center_z,
               base_radius, peak_height_offset,
               resolution=20,
@@ -2135,7 +2219,7 @@ def draw_hill(center_x, base_y, center_z,
                 glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
                 glColor4f(1.0, 1.0, 1.0, 1.0) # 確保紋理顏色不受glColor影響
         except Exception as e_tex_check: # glIsTexture 在某些情況下可能出錯
-            print(f"DEBUG: draw_hill - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
+            scene_diagnostics.debug(f"draw_hill - Error checking texture ID {texture_id_from_scene}: {e_tex_check}")
             glDisable(GL_TEXTURE_2D)
     else:
         glDisable(GL_TEXTURE_2D)
@@ -2226,6 +2310,117 @@ def draw_hill(center_x, base_y, center_z,
         glBindTexture(GL_TEXTURE_2D, 0) # 完成後解綁
     # 繪製結束後不需要禁用 GL_TEXTURE_2D，交給調用者管理
     
+def _object_type_visible(scene, list_name):
+    """整類物件的包圍盒 (scene.stats) 完全在視錐體外時回傳 False,省掉逐一剔除;沒有統計時視為可見。"""
+    stats = getattr(scene, 'stats', None)
+    if stats is None:
+        return True
+    bounds = stats.type_bounds.get(list_name)
+    return bounds is None or frustum_culler.is_aabb_visible(bounds.min, bounds.max)
+
+def _set_lit_object_uniforms(program_id, view_matrix, with_specular=True):
+    """物件著色器共用的視圖/投影與光照 uniform (數值與 draw_scene_objects 各類物件相同)。"""
+    glUniformMatrix4fv(_get_uniform_loc(program_id, "view"), 1, GL_FALSE, view_matrix)
+    glUniformMatrix4fv(_get_uniform_loc(program_id, "projection"), 1, GL_FALSE, glGetFloatv(GL_PROJECTION_MATRIX))
+    glUniform3f(_get_uniform_loc(program_id, "lightPos_worldspace"), 100.0, 150.0, 100.0)
+    glUniform3f(_get_uniform_loc(program_id, "lightColor"), 0.8, 0.8, 0.8)
+    glUniform1f(_get_uniform_loc(program_id, "u_ambient_strength"), 0.5)
+    if with_specular:
+        glUniform1f(_get_uniform_loc(program_id, "u_specular_strength"), 0.3)
+        glUniform1f(_get_uniform_loc(program_id, "u_shininess"), 16.0)
+        glUniform3fv(_get_uniform_loc(program_id, "viewPos_worldspace"), 1, np.linalg.inv(view_matrix)[3, :3])
+    glUniform1i(_get_uniform_loc(program_id, "texture_diffuse1"), 0)
+    glUniform1f(_get_uniform_loc(program_id, "u_alpha_test_threshold"), ALPHA_TEST_THRESHOLD)
+
+def _draw_instance_arrays(scene):
+    """
+    畫 scene.instance_arrays:每組設定一次 model/紋理 uniform (同該類物件第 0 份),
+    再以 glDrawArraysInstanced 一次畫完全部份數;整組包圍盒在視錐體外時略過。
+    """
+    instance_arrays = getattr(scene, 'instance_arrays', None)
+    if not instance_arrays:
+        return
+    shader_programs = {
+        "buildings": _building_shader_program_id,
+        "cylinders": _cylinder_shader_program_id,
+        "spheres": _cylinder_shader_program_id,
+        "trees": _tree_shader_program_id,
+    }
+    view_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
+    current_program = None
+    for _line_id, instance_array in instance_arrays:
+        list_name = instance_array.list_name
+        program_id = shader_programs.get(list_name)
+        if not program_id or instance_array.vao is None or instance_array.vertex_count == 0:
+            continue
+        if not _object_type_visible(scene, list_name):
+            continue
+        array_bounds = instance_array.bounds()
+        if not frustum_culler.is_aabb_visible(array_bounds.min, array_bounds.max):
+            continue
+        if program_id != current_program:
+            if current_program is not None:
+                glUniform1i(_get_uniform_loc(current_program, "u_instanced"), 0)
+            glUseProgram(program_id)
+            _set_lit_object_uniforms(program_id, view_matrix, with_specular=(list_name != "trees"))
+            glUniform1i(_get_uniform_loc(program_id, "u_instanced"), 1)
+            current_program = program_id
+
+        field = instance_array.field
+        x, y, z = instance_array.origin
+        trans_mat = np.array([[1,0,0,x], [0,1,0,y], [0,0,1,z], [0,0,0,1]], dtype=np.float32)
+        fallback_color = (0.7, 0.7, 0.7)
+        if list_name == "buildings":
+            model_matrix_row_major = trans_mat @ get_yxz_intrinsic_composite_rotation_4x4(field("rx"), field("ry"), field("rz"))
+            glUniform2f(_get_uniform_loc(program_id, "u_tex_offset"), field("u_offset"), field("v_offset"))
+            glUniform1f(_get_uniform_loc(program_id, "u_tex_angle_rad"), math.radians(field("tex_angle")))
+            glUniform2f(_get_uniform_loc(program_id, "u_tex_scale"), field("uscale"), field("vscale"))
+        elif list_name in ("cylinders", "spheres"):
+            if list_name == "cylinders":
+                model_matrix_row_major = trans_mat @ get_yzx_intrinsic_composite_rotation_4x4(field("rx"), field("ry"), field("rz"))
+                fallback_color = (0.5, 0.5, 0.5)
+            else:
+                model_matrix_row_major = trans_mat @ get_yxz_intrinsic_composite_rotation_4x4(field("rx"), field("ry"), field("rz"))
+                fallback_color = (1.0, 1.0, 1.0)
+            uscale, vscale = field("uscale"), field("vscale")
+            glUniform2f(_get_uniform_loc(program_id, "u_tex_offset"), field("u_offset"), field("v_offset"))
+            if field("uv_mode") == 0:
+                safe_u = uscale if abs(uscale)>1e-6 else 1e-6
+                safe_v = vscale if abs(vscale)>1e-6 else 1e-6
+                glUniform2f(_get_uniform_loc(program_id, "u_tex_scale"), 1.0/safe_u, 1.0/safe_v)
+            elif list_name == "cylinders":
+                glUniform2f(_get_uniform_loc(program_id, "u_tex_scale"), uscale, vscale)
+            else:
+                glUniform2f(_get_uniform_loc(program_id, "u_tex_scale"), 1.0, 1.0)
+        else:
+            model_matrix_row_major = trans_mat
+            fallback_color = TREE_FALLBACK_COLOR
+        glUniformMatrix4fv(_get_uniform_loc(program_id, "model"), 1, GL_TRUE, model_matrix_row_major)
+
+        gl_tex_id = field("gl_tex")
+        if gl_tex_id is not None and glIsTexture(gl_tex_id):
+            glUniform1i(_get_uniform_loc(program_id, "u_use_texture"), 1)
+            glActiveTexture(GL_TEXTURE0)
+            glBindTexture(GL_TEXTURE_2D, gl_tex_id)
+        else:
+            glUniform1i(_get_uniform_loc(program_id, "u_use_texture"), 0)
+            glUniform3f(_get_uniform_loc(program_id, "u_fallback_color"), *fallback_color)
+        if list_name == "trees":
+            texture_has_alpha = True
+        else:
+            texture_has_alpha = instance_array.has_field("has_alpha") and field("has_alpha")
+        glUniform1i(_get_uniform_loc(program_id, "u_texture_has_alpha"), 1 if texture_has_alpha else 0)
+
+        glBindVertexArray(instance_array.vao)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, instance_array.vertex_count, len(instance_array))
+
+    if current_program is not None:
+        glUniform1i(_get_uniform_loc(current_program, "u_instanced"), 0) # 一般繪製不讀位移屬性
+        glBindVertexArray(0)
+        glUseProgram(0)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
 # --- draw_scene_objects ---
 def draw_scene_objects(scene):
     global _hill_shader_program_id
@@ -2240,7 +2435,7 @@ def draw_scene_objects(scene):
     # Buildings
     
     # --- 處理 Buildings (VBO 版本) ---
-    if hasattr(scene, 'buildings') and scene.buildings:
+    if hasattr(scene, 'buildings') and scene.buildings and _object_type_visible(scene, 'buildings'):
         if _building_shader_program_id:
             glUseProgram(_building_shader_program_id)
             # --- 設置一次性的 Uniforms (光照, 視圖, 投影) ---
@@ -2258,14 +2453,14 @@ def draw_scene_objects(scene):
             if view_loc_bldg != -1:
                 glUniformMatrix4fv(view_loc_bldg, 1, GL_FALSE, current_view_matrix_for_building)
             else:
-                print("警告: Building shader - 'view' uniform location not found.")
+                scene_diagnostics.warning("Building shader - 'view' uniform location not found.")
 
             current_proj_matrix_for_building = glGetFloatv(GL_PROJECTION_MATRIX)
             proj_loc_bldg = _get_uniform_loc(_building_shader_program_id, "projection")
             if proj_loc_bldg != -1:
                 glUniformMatrix4fv(proj_loc_bldg, 1, GL_FALSE, current_proj_matrix_for_building)
             else:
-                print("警告: Building shader - 'projection' uniform location not found.")
+                scene_diagnostics.warning("Building shader - 'projection' uniform location not found.")
 
             # --- 新增: 為 Building 著色器設置光照相關的 Uniforms (可以參考 hill 的部分) ---
             # 這些 uniforms 通常對於使用相同光照模型的著色器是共享的
@@ -2312,45 +2507,34 @@ def draw_scene_objects(scene):
 #                     0      # 22: vertex_count (placeholder)                                        
 #                     )
 
-            for item in scene.buildings:
+            # 視錐體剔除直接用欄位陣列一次算完 (包圍球中心在 (x, y + h/2, z))
+            building_store = scene.buildings
+            b_dims = building_store.columns("w", "d", "h")
+            b_centers = building_store.positions.copy()
+            b_centers[:, 1] += b_dims[:, 2] / 2
+            # 半徑: 底部中心到頂角的距離 sqrt((w/2)^2 + (d/2)^2 + h^2)
+            b_radii = np.sqrt((b_dims[:, 0] / 2)**2 + (b_dims[:, 1] / 2)**2 + b_dims[:, 2]**2)
+            b_visible = frustum_culler.spheres_visible(b_centers, b_radii).tolist()
+
+            for item, is_visible in zip(building_store, b_visible):
+                if not is_visible:
+                    continue
                 line_num, obj_data_tuple = item
-#                 print(f"obj_data_tuple: {obj_data_tuple}")
-                EXPECTED_TUPLE_LENGTH = 23
-                VAO_ID_INDEX = 20
-                VERTEX_COUNT_INDEX = 22
-                GL_TEXTURE_ID_INDEX = 17
-                TEXTURE_HAS_ALPHA_INDEX = 18
                 
-                if len(obj_data_tuple) < EXPECTED_TUPLE_LENGTH: 
-                    print(f"警告: Building (行: {line_num}) obj_data_tuple 結構不完整，跳過渲染。Got {len(obj_data_tuple)}, expected {EXPECTED_TUPLE_LENGTH}")
+                if len(obj_data_tuple) < _BUILDING_TUPLE_LENGTH: 
+                    scene_diagnostics.warning(f"Building obj_data_tuple 結構不完整，跳過渲染。Got {len(obj_data_tuple)}, expected {_BUILDING_TUPLE_LENGTH}", *scene_diagnostics.split_line_id(line_num))
                     continue 
                 
                 try:
                     # 解包用於模型變換和紋理的參數
-                    # obj_type = obj_data_tuple[0] # "building"
-                    world_x, world_y, world_z = obj_data_tuple[1:4]
-                    rx_deg, absolute_ry_deg, rz_deg = obj_data_tuple[4:7]
-                    
-                    gl_texture_id = obj_data_tuple[GL_TEXTURE_ID_INDEX]
-                    texture_has_alpha = obj_data_tuple[TEXTURE_HAS_ALPHA_INDEX]
+                    world_x, world_y, world_z = obj_data_tuple[_BF["x"]:_BF["z"] + 1]
+                    rx_deg, absolute_ry_deg, rz_deg = obj_data_tuple[_BF["rx"]:_BF["rz"] + 1]
                     
-                    vao_id = obj_data_tuple[VAO_ID_INDEX]
-                    vertex_count = obj_data_tuple[VERTEX_COUNT_INDEX]
+                    gl_texture_id = obj_data_tuple[_BF["gl_tex"]]
+                    texture_has_alpha = obj_data_tuple[_BF["has_alpha"]]
                     
-                    # --- Frustum Culling for Buildings ---
-                    # Calculate bounding radius (approximate)
-                    # w, d, h are at indices 7, 8, 9
-                    b_w, b_d, b_h = obj_data_tuple[7], obj_data_tuple[8], obj_data_tuple[9]
-                    # Radius: distance from center to corner. Center is roughly (x, y+h/2, z) if pivot is bottom-center?
-                    # Actually pivot is usually bottom-center.
-                    # Max dimension from pivot: sqrt((w/2)^2 + (d/2)^2 + h^2)
-                    b_radius = math.sqrt((b_w/2)**2 + (b_d/2)**2 + b_h**2)
-                    
-                    # Check visibility (using pivot point + radius is conservative enough)
-                    # Better: Center at (x, y + h/2, z)
-                    if not frustum_culler.is_sphere_visible(world_x, world_y + b_h/2, world_z, b_radius):
-                        continue
-                    # -------------------------------------
+                    vao_id = obj_data_tuple[_BF["vao"]]
+                    vertex_count = obj_data_tuple[_BF["vertex_count"]]
                 
 #                 try:
 #                     _obj_type, world_x, world_y, world_z, \
@@ -2360,7 +2544,7 @@ def draw_scene_objects(scene):
 #                     _parent_origin_ry_deg, \
 #                     vao_id, _vbo_id, vertex_count = obj_data_tuple
                 except ValueError:
-                    print(f"警告: Building (行: {line_num}) obj_data_tuple 解包失敗，跳過渲染。")
+                    scene_diagnostics.warning("Building obj_data_tuple 解包失敗，跳過渲染。", *scene_diagnostics.split_line_id(line_num))
                     continue
 
 
@@ -2404,7 +2588,7 @@ def draw_scene_objects(scene):
                     glUniformMatrix4fv(model_loc, 1, GL_TRUE, model_matrix_row_major) 
                                                     # ^^^^^^^^ 注意這裡改成了 GL_TRUE
                 else:
-                    print(f"警告: Building (行: {line_num}) 無法找到 'model' uniform location。")
+                    scene_diagnostics.warning("Building 無法找到 'model' uniform location。", *scene_diagnostics.split_line_id(line_num))
                     # continue
                     
                     
@@ -2429,14 +2613,13 @@ def draw_scene_objects(scene):
 
 
                 # *** 新增/修改：傳遞紋理變換 Uniforms ***
-                # 從 obj_data_tuple 解包 (索引可能需要根據您的元組結構調整)
-                # obj_data_tuple[10:16] 包含: u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale
-                u_offset_val = obj_data_tuple[10]
-                v_offset_val = obj_data_tuple[11]
-                tex_angle_deg_val = obj_data_tuple[12]
-                # uv_mode_val = obj_data_tuple[13] # 這個不再需要傳給著色器
-                uscale_val = obj_data_tuple[14]
-                vscale_val = obj_data_tuple[15]
+                # 欄位索引見 scene_objects.BUILDING_FIELDS
+                u_offset_val = obj_data_tuple[_BF["u_offset"]]
+                v_offset_val = obj_data_tuple[_BF["v_offset"]]
+                tex_angle_deg_val = obj_data_tuple[_BF["tex_angle"]]
+                # uv_mode 不再需要傳給著色器
+                uscale_val = obj_data_tuple[_BF["uscale"]]
+                vscale_val = obj_data_tuple[_BF["vscale"]]
 
                 u_tex_offset_loc = _get_uniform_loc(_building_shader_program_id, "u_tex_offset")
                 if u_tex_offset_loc != -1: glUniform2f(u_tex_offset_loc, u_offset_val, v_offset_val)
@@ -2459,7 +2642,7 @@ def draw_scene_objects(scene):
             glBindTexture(GL_TEXTURE_2D, 0) # Unbind texture
         else:
             if not _building_shader_program_id:
-                print("警告: Building 著色器未初始化，無法渲染 Buildings。")
+                scene_diagnostics.warning("Building 著色器未初始化，無法渲染 Buildings。")
             # 可以選擇在這裡調用舊的立即模式繪製作為 fallback (如果還保留了 draw_cube)
             # for item in scene.buildings: ... glTranslate/glRotate/draw_cube ...
     
@@ -2496,7 +2679,7 @@ def draw_scene_objects(scene):
 #         glPopMatrix()
         
     # Cylinders (VBO & Shader)
-    if hasattr(scene, 'cylinders') and scene.cylinders:
+    if hasattr(scene, 'cylinders') and scene.cylinders and _object_type_visible(scene, 'cylinders'):
         if _cylinder_shader_program_id is not None:
             glUseProgram(_cylinder_shader_program_id)
             current_mv_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
@@ -2569,10 +2752,10 @@ def draw_scene_objects(scene):
             glActiveTexture(GL_TEXTURE0)
             glBindTexture(GL_TEXTURE_2D, 0)
         else:
-            print("警告: 圓柱著色器未初始化，無法渲染 Cylinders。")
+            scene_diagnostics.warning("圓柱著色器未初始化，無法渲染 Cylinders。")
 
     # Trees (VBO & Shader)
-    if hasattr(scene, 'trees') and scene.trees:
+    if hasattr(scene, 'trees') and scene.trees and _object_type_visible(scene, 'trees'):
         if _tree_shader_program_id is not None:
             glUseProgram(_tree_shader_program_id)
             current_mv_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
@@ -2623,11 +2806,11 @@ def draw_scene_objects(scene):
             glActiveTexture(GL_TEXTURE0)
             glBindTexture(GL_TEXTURE_2D, 0)
         else:
-            print("警告: 樹木著色器未初始化，無法渲染 Trees。")
+            scene_diagnostics.warning("樹木著色器未初始化，無法渲染 Trees。")
 
     # Spheres (VBO & Shader，與圓柱共用著色器；無 VBO 的條目退回立即模式)
     spheres_fallback_items = []
-    if hasattr(scene, 'spheres') and scene.spheres:
+    if hasattr(scene, 'spheres') and scene.spheres and _object_type_visible(scene, 'spheres'):
         if _cylinder_shader_program_id is not None:
             glUseProgram(_cylinder_shader_program_id)
             current_mv_matrix = glGetFloatv(GL_MODELVIEW_MATRIX)
@@ -2711,7 +2894,7 @@ def draw_scene_objects(scene):
                  u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale,
                  tex_file, parent_origin_ry_deg) = obj_data_tuple[:17]
             except ValueError:
-                 print(f"警告: 解包 sphere 數據時出錯 (來源行: {line_num})")
+                 scene_diagnostics.warning("解包 sphere 數據時出錯。", *scene_diagnostics.split_line_id(line_num))
                  continue
 
             glPushMatrix()
@@ -2723,8 +2906,11 @@ def draw_scene_objects(scene):
                         u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale)
             glPopMatrix()
 
+    # 實例陣列 (array 指令)
+    _draw_instance_arrays(scene)
+
     # --- Draw Hills (Using VBO and Shaders) ---
-    if hasattr(scene, 'hills') and scene.hills:
+    if hasattr(scene, 'hills') and scene.hills and _object_type_visible(scene, 'hills'):
         if _hill_shader_program_id is not None: # 確保著色器已成功加載和鏈接
             glUseProgram(_hill_shader_program_id)
 
@@ -2792,7 +2978,7 @@ def draw_scene_objects(scene):
                         continue
 
                 except (ValueError, TypeError, IndexError) as e_unpack_render:
-                    print(f"警告: 解包 hill 數據 (renderer) 時出錯 (行: {line_identifier}): {e_unpack_render}")
+                    scene_diagnostics.warning(f"解包 hill 數據 (renderer) 時出錯: {e_unpack_render}", *scene_diagnostics.split_line_id(line_identifier))
                     continue 
 
                 # Model 矩陣 (山丘頂點是世界座標，所以是單位矩陣)
@@ -2837,7 +3023,7 @@ def draw_scene_objects(scene):
             glBindTexture(GL_TEXTURE_2D, 0) # 解綁2D紋理
 
         elif _hill_shader_program_id is None and hasattr(scene, 'hills') and scene.hills:
-             print(f"警告: 山丘著色器程序未初始化，無法使用VBO渲染山丘。")
+             scene_diagnostics.warning("山丘著色器程序未初始化，無法使用VBO渲染山丘。")
              # 此處可以選擇是否調用舊的立即模式 draw_hill 作為回退
              # for item in scene.hills:
              #    ... (解包舊的 hill_data 參數) ...
@@ -2856,7 +3042,7 @@ def draw_scene_objects(scene):
 #                   )
 
     # --- Draw Gableroofs ---
-    if hasattr(scene, 'gableroofs'):
+    if hasattr(scene, 'gableroofs') and _object_type_visible(scene, 'gableroofs'):
         for item in scene.gableroofs:
             line_identifier, roof_data_tuple = item
             try:
@@ -2889,8 +3075,8 @@ def draw_scene_objects(scene):
                 # --------------------------------------
 
             except (IndexError, ValueError) as e:
-                print(f"警告: 解包 gableroof 數據時出錯 (行標識: {line_identifier})。錯誤: {e}")
-                print(f"DEBUG: Gableroof data tuple was: {roof_data_tuple}")
+                scene_diagnostics.warning(f"解包 gableroof 數據時出錯: {e}", *scene_diagnostics.split_line_id(line_identifier))
+                scene_diagnostics.debug(f"Gableroof data tuple was: {roof_data_tuple}")
                 continue
 
             glPushMatrix()
@@ -2926,7 +3112,7 @@ def draw_scene_objects(scene):
 
 
     # --- Draw flexroofs ---
-    if hasattr(scene, 'flexroofs'):
+    if hasattr(scene, 'flexroofs') and _object_type_visible(scene, 'flexroofs'):
         for item in scene.flexroofs:
             line_identifier, flexroof_data = item
             try:
@@ -2953,12 +3139,12 @@ def draw_scene_objects(scene):
                 # -------------------------------------
 
                 if obj_type_str != "flexroof": # 安全檢查
-                    print(f"警告: 在 flexroofs 列表中發現非 flexroof 物件: {obj_type_str}")
+                    scene_diagnostics.warning(f"在 flexroofs 列表中發現非 flexroof 物件: {obj_type_str}")
                     continue
 
             except (IndexError, ValueError) as e_unpack:
-                print(f"警告: 解包 flexroof 數據時出錯 (行標識: {line_identifier})。錯誤: {e_unpack}")
-                print(f"DEBUG: Flexroof data tuple was: {flexroof_data}")
+                scene_diagnostics.warning(f"解包 flexroof 數據時出錯: {e_unpack}", *scene_diagnostics.split_line_id(line_identifier))
+                scene_diagnostics.debug(f"Flexroof data tuple was: {flexroof_data}")
                 continue
 
             glPushMatrix()
@@ -3086,7 +3272,7 @@ def _get_cached_text_texture(font, text, color):
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, text_width, text_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
         glBindTexture(GL_TEXTURE_2D, 0)
     except Exception as e:
-        print(f"Error creating cached text texture: {e}")
+        scene_diagnostics.error(f"Error creating cached text texture: {e}")
         return None
     if len(_text_texture_cache) >= _TEXT_TEXTURE_CACHE_MAX:
         oldest_key = next(iter(_text_texture_cache))  # dict 保序，最早插入者先淘汰
@@ -3143,7 +3329,7 @@ def _draw_text_texture(text_surface, x, y):
         glBindTexture(GL_TEXTURE_2D, 0)
         glDeleteTextures(1, [tex_id])
     except Exception as e:
-        print(f"Error drawing text texture: {e}")
+        scene_diagnostics.error(f"Error drawing text texture: {e}")
         if 'tex_id' in locals() and tex_id and glIsTexture(tex_id): glDeleteTextures(1, [tex_id])
 
 
@@ -3206,6 +3392,16 @@ def test_draw_cylinder_y_up_centered(radius, height, texture_id=None, slices=CYL
 # --- NEW: Skybox/Skydome loading and drawing ---
 TEXTURE_LOAD_FAILED_MARKER = "LOAD_FAILED"
 
+def clear_skybox_texture_cache():
+    """釋放所有已載入的天空盒 cubemap 紋理 (需要 OpenGL 上下文)。"""
+    for tex_id in skybox_texture_cache.values():
+        if tex_id == TEXTURE_LOAD_FAILED_MARKER: continue
+        try:
+            if glIsTexture(tex_id): glDeleteTextures(1, [tex_id])
+        except Exception as e:
+            scene_diagnostics.warning(f"清理天空盒紋理 {tex_id} 時出錯：{e}")
+    skybox_texture_cache.clear()
+
 def load_skybox(base_name):
     """
     Loads a skybox (cubemap) texture from 6 individual files.
@@ -3215,7 +3411,7 @@ def load_skybox(base_name):
     global skybox_texture_cache, texture_loader, TEXTURE_LOAD_FAILED_MARKER # 確保能訪問全域變數
 
     if not texture_loader:
-        print("警告: 無法載入 Skybox，texture_loader 未設定。")
+        scene_diagnostics.warning("無法載入 Skybox，texture_loader 未設定。")
         skybox_texture_cache[base_name] = TEXTURE_LOAD_FAILED_MARKER
         return None
 
@@ -3235,11 +3431,11 @@ def load_skybox(base_name):
                  return cached_value
         except Exception as e:
             # 如果 glIsTexture 出錯 (例如上下文問題)，則當作快取無效，繼續嘗試載入
-            print(f"檢查 Skybox 快取中 ID {cached_value} 時出錯: {e}，將嘗試重新載入 '{base_name}'。")
+            scene_diagnostics.warning(f"檢查 Skybox 快取中 ID {cached_value} 時出錯: {e}，將嘗試重新載入 '{base_name}'。")
             pass # 繼續執行下面的載入邏輯
 
     # 首次嘗試載入此 base_name，或者之前的快取條目無效
-    print(f"Skybox '{base_name}': 首次嘗試或重新嘗試載入...")
+    scene_diagnostics.debug(f"Skybox '{base_name}': 首次嘗試或重新嘗試載入...")
 
     texture_id = glGenTextures(1)
     glBindTexture(GL_TEXTURE_CUBE_MAP, texture_id)
@@ -3258,10 +3454,10 @@ def load_skybox(base_name):
         
         # 減少重複的 "載入 Skybox 面" 打印，只在首次嘗試載入這個 base_name 時打印一次每個面
         # (這個首次嘗試是在這個函數被完整執行一次的意義上)
-        print(f"  嘗試載入 Skybox 面: {filepath}")
+        scene_diagnostics.debug(f"嘗試載入 Skybox 面: {filepath}")
 
         if not os.path.exists(filepath):
-            print(f"  警告: Skybox 紋理檔案 '{filepath}' (屬於 '{base_name}') 不存在。")
+            scene_diagnostics.warning(f"Skybox 紋理檔案 '{filepath}' (屬於 '{base_name}') 不存在。")
             all_loaded_successfully = False
             break
 
@@ -3271,7 +3467,7 @@ def load_skybox(base_name):
             glTexImage2D(targets[i], 0, GL_RGBA, surface.get_width(), surface.get_height(),
                          0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
         except Exception as e:
-            print(f"  載入 Skybox 紋理 '{filepath}' (屬於 '{base_name}') 時發生錯誤: {e}")
+            scene_diagnostics.warning(f"載入 Skybox 紋理 '{filepath}' (屬於 '{base_name}') 時發生錯誤: {e}")
             all_loaded_successfully = False
             break
 
@@ -3283,7 +3479,7 @@ def load_skybox(base_name):
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_R, GL_CLAMP_TO_EDGE)
         glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
         skybox_texture_cache[base_name] = texture_id
-        print(f"Skybox '{base_name}' 已成功載入並快取 (ID: {texture_id}).")
+        scene_diagnostics.debug(f"Skybox '{base_name}' 已成功載入並快取 (ID: {texture_id}).")
         return texture_id
     else:
         glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
@@ -3293,10 +3489,10 @@ def load_skybox(base_name):
             if glIsTexture(texture_id):
                  glDeleteTextures(1, [texture_id])
         except Exception as e_del: # 捕獲 glIsTexture 或 glDeleteTextures 可能的錯誤
-            print(f"  警告: 嘗試清理部分載入的 Skybox 紋理 (ID: {texture_id}) 時出錯: {e_del}")
+            scene_diagnostics.warning(f"嘗試清理部分載入的 Skybox 紋理 (ID: {texture_id}) 時出錯: {e_del}")
             pass # 即使清理失敗，也要繼續標記為失敗
 
-        print(f"Skybox '{base_name}' 載入失敗。在快取中標記為失敗。")
+        scene_diagnostics.warning(f"Skybox '{base_name}' 載入失敗。在快取中標記為失敗。")
         skybox_texture_cache[base_name] = TEXTURE_LOAD_FAILED_MARKER
         return None
 
@@ -3330,20 +3526,20 @@ def draw_skybox(base_name, size=1.0):
             if isinstance(skybox_id_or_marker, int) and glIsTexture(skybox_id_or_marker):
                 skybox_id_to_use = skybox_id_or_marker
             else: # 快取中的 ID 無效了
-                print(f"Skybox '{base_name}': 快取中的 ID {skybox_id_or_marker} 無效，嘗試重新載入...")
+                scene_diagnostics.warning(f"Skybox '{base_name}': 快取中的 ID {skybox_id_or_marker} 無效，嘗試重新載入...")
                 loaded_id = load_skybox(base_name) # 重新載入 (load_skybox 會更新快取)
                 if loaded_id is None:
                     return
                 skybox_id_to_use = loaded_id
         except Exception as e_check:
-            print(f"Skybox '{base_name}': 檢查快取 ID {skybox_id_or_marker} 時出錯 ({e_check})，嘗試重新載入...")
+            scene_diagnostics.warning(f"Skybox '{base_name}': 檢查快取 ID {skybox_id_or_marker} 時出錯 ({e_check})，嘗試重新載入...")
             loaded_id = load_skybox(base_name)
             if loaded_id is None:
                 return
             skybox_id_to_use = loaded_id
             
     if skybox_id_to_use is None: # 雙重保險，如果經歷上述邏輯後仍然沒有有效ID
-        print(f"嚴重警告: Skybox '{base_name}' 在所有檢查後仍無有效 ID 可用，無法繪製。")
+        scene_diagnostics.warning(f"Skybox '{base_name}' 在所有檢查後仍無有效 ID 可用，無法繪製。")
         return
 
     # --- 實際的繪製邏輯 ---
@@ -3404,7 +3600,7 @@ def draw_skydome(texture_id, radius=1.0, slices=32, stacks=16):
     Radius is mostly cosmetic, real 'distance' handled by depth settings.
     """
     if texture_id is None or not glIsTexture(texture_id):
-        print("警告: Skydome 紋理無效，無法繪製。")
+        scene_diagnostics.warning("Skydome 紋理無效，無法繪製。")
         return
 
     glPushAttrib(GL_ENABLE_BIT | GL_DEPTH_BUFFER_BIT | GL_POLYGON_BIT | GL_TEXTURE_BIT | GL_LIGHTING_BIT | GL_CURRENT_BIT)
@@ -3436,7 +3632,7 @@ def draw_skydome(texture_id, radius=1.0, slices=32, stacks=16):
 
         gluDeleteQuadric(quadric)
     else:
-        print("Error creating GLU quadric for skydome.")
+        scene_diagnostics.error("Error creating GLU quadric for skydome.")
 
     glBindTexture(GL_TEXTURE_2D, 0)
     # Restore states
@@ -3455,7 +3651,7 @@ def draw_background(background_info, camera, tram=None): # <--- tram 設為可
     """
     if background_info is None: return
     bg_type = background_info.get('type')
-    if not bg_type: print("警告: 背景資訊缺少 'type'。"); return
+    if not bg_type: scene_diagnostics.warning("背景資訊缺少 'type'。"); return
 
     glMatrixMode(GL_PROJECTION); glPushMatrix()
     glMatrixMode(GL_MODELVIEW); glPushMatrix()
@@ -3492,7 +3688,7 @@ def draw_background(background_info, camera, tram=None): # <--- tram 設為可
         if bg_type == 'skybox':
             base_name = background_info.get('base_name')
             if base_name: draw_skybox(base_name, size=100)
-            else: print("警告: Skybox 背景資訊缺少 'base_name'。")
+            else: scene_diagnostics.warning("Skybox 背景資訊缺少 'base_name'。")
         elif bg_type == 'skydome':
             texture_id = background_info.get('id')
             # ... (繪製和動態載入邏輯) ...
@@ -3505,7 +3701,7 @@ def draw_background(background_info, camera, tram=None): # <--- tram 設為可
                         background_info['id'] = loaded_id
                         draw_skydome(loaded_id, radius=100)
         else:
-             print(f"警告: 無法識別的背景類型 '{bg_type}'。")
+             scene_diagnostics.warning(f"無法識別的背景類型 '{bg_type}'。")
 
     finally:
         glDepthMask(original_depth_mask) # 恢復
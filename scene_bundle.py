@@ -0,0 +1,295 @@
+# scene_bundle.py
+"""
+編譯場景包:把場景檔 (含所有 import) 編成單一檔案,模擬器不需要 .txt 來源檔與圖檔就能幾乎立即啟動。
+
+場景包內容:
+  - 場景本體 (軌道、觸發器、起點、背景等,pickle)
+  - 每類物件的欄位陣列 (ObjectStore 的實例資料)
+  - 預先產生的交錯頂點陣列:建築/圓柱/球體/山丘/樹木依網格鍵去重後的網格,每段軌道 (含視覺分岔) 的道碴與鋼軌
+  - 解碼好、含完整 mipmap 鏈的 RGBA 紋理
+  - 烘焙好的小地圖
+
+檔案格式: BUNDLE_MAGIC | 版本 (uint32) | 清單長度 (uint64) | 清單 (pickle) | 對齊 BUNDLE_ALIGNMENT 的資料區。
+清單裡的陣列記成 (資料區位移, dtype, shape);載入時整個檔案以 mmap 映射,陣列都是映射上的 view,
+直接交給 glBufferData / glTexImage2D,不在 Python 端重新產生網格或解碼圖片。
+實例陣列 (array 指令) 隨場景本體存 template 與位移,載入時才產生那一份網格。
+屋頂 (gableroof/flexroof) 每幀即時繪製,只存欄位;天空盒 (skybox) 六面圖仍由 renderer 從 textures/ 讀取。
+
+用法:
+  python scene_bundle.py scene.txt [輸出檔.bundle]   (需要 OpenGL 視窗以烘焙小地圖,會開一個隱藏視窗)
+  python main.py scene.bundle
+"""
+import copy
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+
+import numpy as np
+
+import minimap_renderer
+import renderer
+import scene_diagnostics
+import scene_parser
+import texture_loader
+from scene_objects import ObjectStore, OBJECT_LIST_TYPES, mesh_key_getter
+
+BUNDLE_EXTENSION = ".bundle"
+BUNDLE_MAGIC = b"TRAMBNDL"
+BUNDLE_FORMAT_VERSION = 6
+BUNDLE_ALIGNMENT = 64 # 每個陣列的起點對齊 (位元組)
+_HEADER = struct.Struct("<8sIQ")
+
+# 軌道段 (與每個視覺分岔) 存進場景包的頂點與枕木實例屬性
+_TRACK_VERTEX_KEYS = ('ballast_vertices', 'rail_left_vertices', 'rail_right_vertices', 'sleeper_instances')
+
+def default_bundle_path(scene_filepath):
+    return os.path.splitext(scene_filepath)[0] + BUNDLE_EXTENSION
+
+def is_bundle_path(filepath):
+    return bool(filepath) and filepath.lower().endswith(BUNDLE_EXTENSION)
+
+class _BundleWriter:
+    """收集要寫進資料區的陣列,回傳 (位移, dtype, shape) 參照。"""
+
+    def __init__(self):
+        self._arrays = []
+        self._size = 0
+
+    def add(self, array):
+        array = np.ascontiguousarray(array)
+        offset = -self._size % BUNDLE_ALIGNMENT + self._size
+        self._arrays.append((offset, array))
+        self._size = offset + array.nbytes
+        return (offset, array.dtype.str, array.shape)
+
+    def write(self, bundle_path, manifest):
+        manifest_bytes = pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)
+        data_start = _HEADER.size + len(manifest_bytes)
+        data_start += -data_start % BUNDLE_ALIGNMENT
+        tmp_path = bundle_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, len(manifest_bytes)))
+            f.write(manifest_bytes)
+            for offset, array in self._arrays:
+                f.seek(data_start + offset)
+                f.write(array.data)
+            f.truncate(data_start + self._size)
+        os.replace(tmp_path, bundle_path)
+        return data_start + self._size
+
+def _bundle_object_meshes(writer, scene):
+    """每類 VBO 物件:去重後的網格串成一個 float32 陣列,記下每個網格的範圍與每個物件用的網格 (-1 表示沒有)。"""
+    meshes = {}
+    for list_name in renderer.OBJECT_VERTEX_LAYOUTS:
+        entries = getattr(scene, list_name)
+        if not entries:
+            continue
+        mesh_key = mesh_key_getter(OBJECT_LIST_TYPES[list_name])
+        mesh_indices = {}
+        chunks, ranges, object_meshes = [], [], []
+        offset = 0
+        for _line_id, obj_data in entries:
+            key = mesh_key(obj_data)
+            if key not in mesh_indices:
+                vertex_data, vertex_count = renderer.generate_object_mesh_data(list_name, obj_data)
+                vertex_data = np.asarray(vertex_data, dtype=np.float32).ravel()
+                mesh_indices[key] = len(ranges) if vertex_count else -1
+                if vertex_count:
+                    chunks.append(vertex_data)
+                    ranges.append((offset, offset + len(vertex_data), vertex_count))
+                    offset += len(vertex_data)
+            object_meshes.append(mesh_indices[key])
+        meshes[list_name] = {
+            "vertices": writer.add(np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)),
+            "ranges": writer.add(np.array(ranges, dtype=np.int64).reshape(-1, 3)),
+            "object_meshes": writer.add(np.array(object_meshes, dtype=np.int32)),
+        }
+    return meshes
+
+def _bundle_track(writer, track):
+    """產生所有軌道段的渲染頂點並串成一個 float32 陣列;每段記下主線與各分岔每個頂點屬性的範圍。"""
+    chunks, segment_ranges = [], []
+    offset = 0
+    for segment in track.segments:
+        segment._generate_render_vertices()
+        parts = []
+        for holder in [vars(segment)] + segment.visual_branches:
+            part = []
+            for key in _TRACK_VERTEX_KEYS:
+                values = np.asarray(holder.get(key, ()), dtype=np.float32).ravel()
+                chunks.append(values)
+                part.append((offset, offset + len(values)))
+                offset += len(values)
+                holder[key] = [] # 骨架只留空列表,頂點只存在資料區
+            parts.append(part)
+        segment_ranges.append(parts)
+    vertices = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    return {"vertices": writer.add(vertices), "segments": segment_ranges}
+
+def _bundle_textures(writer, scene):
+    """解碼場景用到的所有紋理並產生 mipmap 鏈 (判斷 Alpha 需要已設定顯示模式)。"""
+    textures = {}
+    for filename, (decoded, error) in texture_loader.decode_textures(scene_parser._scene_texture_files(scene),
+                                                                    skip_cached=False).items():
+        if error is not None:
+            scene_diagnostics.warning(f"場景包略過無法解碼的紋理 '{filename}': {error}")
+            continue
+        surface, texture_data = decoded
+        width, height = surface.get_size()
+        levels = texture_loader.build_mipmap_levels(width, height, texture_data)
+        textures[filename] = {
+            "has_alpha": texture_loader.surface_has_alpha(surface),
+            "levels": [(level_width, level_height, writer.add(pixels)) for level_width, level_height, pixels in levels],
+        }
+    return textures
+
+def _bundle_minimap(writer, scene):
+    minimap_renderer.bake_static_map_elements(scene)
+    baked = minimap_renderer.read_baked_map()
+    if baked is None:
+        return None
+    pixels = np.frombuffer(baked.pop("pixels"), dtype=np.uint8).reshape(baked["height"], baked["width"], 4)
+    baked["pixels"] = writer.add(pixels)
+    return baked
+
+def build_scene_bundle(scene_filepath, bundle_path=None):
+    """
+    解析 scene_filepath 並寫出場景包 (預設與場景檔同名、副檔名 BUNDLE_EXTENSION),回傳場景包路徑;失敗時回傳 None。
+    需要目前有 OpenGL 上下文 (烘焙小地圖、判斷紋理 Alpha)。
+    """
+    bundle_path = bundle_path or default_bundle_path(scene_filepath)
+    start_time = time.perf_counter()
+    scene = scene_parser.parse_scene_file(scene_filepath, initial_scene=scene_parser._new_scene_for_parsing(),
+                                          load_textures=False)
+    if scene is None:
+        scene_diagnostics.error(f"無法解析 '{scene_filepath}',未建立場景包。")
+        return None
+
+    writer = _BundleWriter()
+    stores = {}
+    for list_name, obj_type in OBJECT_LIST_TYPES.items():
+        floats, ints, row_lengths, line_ids, tex_names = getattr(scene, list_name).raw_columns()
+        stores[list_name] = (writer.add(floats), writer.add(ints), writer.add(row_lengths), line_ids, tex_names)
+    meshes = _bundle_object_meshes(writer, scene)
+    textures = _bundle_textures(writer, scene)
+    minimap = _bundle_minimap(writer, scene)
+    track = _bundle_track(writer, scene.track) # 會把段的頂點列表清空,所以放在烘焙小地圖之後
+
+    skeleton = copy.copy(scene)
+    for list_name, obj_type in OBJECT_LIST_TYPES.items():
+        setattr(skeleton, list_name, ObjectStore(obj_type))
+    manifest = {
+        "source": os.path.basename(scene_filepath),
+        "scene": skeleton,
+        "stores": stores,
+        "meshes": meshes,
+        "track": track,
+        "textures": textures,
+        "minimap": minimap,
+    }
+    total_bytes = writer.write(bundle_path, manifest)
+    scene_diagnostics.info(f"已寫入場景包 '{bundle_path}' ({total_bytes / 1e6:.1f} MB, "
+                           f"{len(textures)} 個紋理, 用時 {time.perf_counter() - start_time:.2f} 秒)。")
+    return bundle_path
+
+def _open_bundle(bundle_path):
+    """以 copy-on-write 映射場景包,回傳 (清單, 參照 -> 陣列 view 的函數)。"""
+    with open(bundle_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) # 陣列可寫 (例如編輯欄位),不會寫回檔案
+    magic, version, manifest_length = _HEADER.unpack_from(mapped, 0)
+    if magic != BUNDLE_MAGIC:
+        raise ValueError("不是場景包檔案")
+    if version != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"場景包格式版本 {version} 不相容 (需要 {BUNDLE_FORMAT_VERSION}),請重新建立")
+    manifest = pickle.loads(mapped[_HEADER.size:_HEADER.size + manifest_length])
+    data_start = _HEADER.size + manifest_length
+    data_start += -data_start % BUNDLE_ALIGNMENT
+
+    def array_at(ref):
+        offset, dtype, shape = ref
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        return np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+    return manifest, array_at
+
+def _load_object_buffers(scene, meshes, array_at):
+    """以場景包的網格為每個物件建立 VAO/VBO (做法同 main.iter_scene_buffer_steps,結果換成一般列表)。"""
+    for list_name, mesh_refs in meshes.items():
+        vertices = array_at(mesh_refs["vertices"])
+        ranges = array_at(mesh_refs["ranges"])
+        object_meshes = array_at(mesh_refs["object_meshes"])
+        new_list = []
+        for entry, mesh_index in zip(getattr(scene, list_name), object_meshes):
+            if mesh_index < 0:
+                new_list.append(entry)
+                continue
+            start, stop, vertex_count = ranges[mesh_index]
+            modified_data, success = renderer.create_object_buffers_from_vertex_data(
+                list_name, entry, vertices[start:stop], int(vertex_count))
+            new_list.append((entry[0], modified_data) if success else entry)
+        setattr(scene, list_name, new_list)
+
+def _load_track_buffers(track, track_refs, array_at):
+    vertices = array_at(track_refs["vertices"])
+    for segment, parts in zip(track.segments, track_refs["segments"]):
+        for holder, part in zip([vars(segment)] + segment.visual_branches, parts):
+            for key, (start, stop) in zip(_TRACK_VERTEX_KEYS, part):
+                holder[key] = vertices[start:stop]
+        segment.setup_buffers()
+    # 合併網格留到第一次繪製 (或 main 的軌道串流釋放視窗外的段之後) 才由 Track.ensure_mesh 上傳
+
+def load_scene_bundle(bundle_path):
+    """
+    (GL 執行緒) 載入場景包:上傳紋理、物件與軌道緩衝區、烘焙好的小地圖,並設為 current_scene。
+    回傳可直接繪製的 Scene;失敗時回傳 None,目前的場景保持不變。
+    """
+    start_time = time.perf_counter()
+    try:
+        manifest, array_at = _open_bundle(bundle_path)
+    except (OSError, ValueError, pickle.UnpicklingError, struct.error) as e:
+        scene_diagnostics.error(f"無法讀取場景包 '{bundle_path}': {e}")
+        return None
+
+    for filename, texture in manifest["textures"].items():
+        levels = [(width, height, array_at(ref)) for width, height, ref in texture["levels"]]
+        texture_loader.upload_texture_levels(filename, levels, texture["has_alpha"])
+
+    scene = manifest["scene"]
+    for list_name, obj_type in OBJECT_LIST_TYPES.items():
+        floats_ref, ints_ref, row_lengths_ref, line_ids, tex_names = manifest["stores"][list_name]
+        setattr(scene, list_name, ObjectStore.from_columns(obj_type, array_at(floats_ref), array_at(ints_ref),
+                                                           array_at(row_lengths_ref), line_ids, tex_names))
+    scene_parser._assign_object_textures(scene, scene_parser._texture_resolver(texture_loader.texture_cache))
+    _load_object_buffers(scene, manifest["meshes"], array_at)
+    for _line_id, instance_array in scene.instance_arrays: # 每組只有一份小網格,載入時直接產生
+        renderer.create_instance_array_buffers(instance_array)
+    _load_track_buffers(scene.track, manifest["track"], array_at)
+
+    minimap = manifest.get("minimap")
+    if minimap:
+        minimap_renderer.load_baked_map(minimap["width"], minimap["height"], minimap["center_x"], minimap["center_z"],
+                                        array_at(minimap["pixels"]))
+    scene_parser.set_current_scene(scene, bundle_path)
+    scene_diagnostics.info(f"已載入場景包 '{bundle_path}' (來源 {manifest.get('source')}, "
+                           f"用時 {time.perf_counter() - start_time:.2f} 秒)。")
+    return scene
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print("用法: python scene_bundle.py 場景檔.txt [輸出檔.bundle]")
+        return 0 if argv else 2
+    import pygame
+    from pygame.locals import DOUBLEBUF, OPENGL, HIDDEN
+    pygame.init()
+    pygame.display.set_mode((64, 64), DOUBLEBUF | OPENGL | HIDDEN)
+    try:
+        bundle_path = build_scene_bundle(argv[0], argv[1] if len(argv) > 1 else None)
+    finally:
+        pygame.quit()
+    return 0 if bundle_path else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
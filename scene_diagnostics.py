@@ -0,0 +1,167 @@
+# scene_diagnostics.py
+"""
+場景解析與載入的診斷訊息。
+
+scene_parser / texture_loader / track / renderer 不直接 print,而是呼叫 debug/info/warning/error,
+每則訊息帶有嚴重度、來源檔、行號與指令。訊息依 LOG_LEVEL 決定是否印到主控台
+(QUIET 時完全不印),嚴重度達 COLLECT_LEVEL 的則存進 collector,供編輯器的診斷面板顯示。
+低於兩個門檻的訊息只做一次比較就丟棄,不會格式化輸出。
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+SEVERITY_LABELS = {DEBUG: "除錯", INFO: "資訊", WARNING: "警告", ERROR: "錯誤"}
+
+LOG_LEVEL = INFO        # 嚴重度低於此的訊息不印到主控台
+COLLECT_LEVEL = WARNING # 嚴重度低於此的訊息不存進 collector
+QUIET = False           # 安靜模式:不印任何訊息 (仍會收集)
+MAX_RECORDS = 10000     # collector 最多保留的筆數,超過的只計數
+
+_min_level = min(LOG_LEVEL, COLLECT_LEVEL)
+
+
+class Diagnostic(namedtuple("Diagnostic", "severity message file line command")):
+    """一則診斷訊息;file/line/command 不適用時為 None (line 為該檔案內的行號)。"""
+    __slots__ = ()
+
+    @property
+    def label(self):
+        return SEVERITY_LABELS.get(self.severity, str(self.severity))
+
+    def format(self):
+        if self.file and self.line is not None:
+            return f"{self.label}: ({self.file} 行 {self.line}) {self.message}"
+        if self.file:
+            return f"{self.label}: ({self.file}) {self.message}"
+        return f"{self.label}: {self.message}"
+
+
+class DiagnosticsCollector:
+    """收集診斷訊息;呼叫端 (例如編輯器) 在解析前 clear(),解析後讀 records。"""
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.max_records = max_records
+        self.records = []
+        self.dropped = 0 # 超過 max_records 而沒保留的筆數
+        self._counts = {}
+
+    def add(self, record):
+        self._counts[record.severity] = self._counts.get(record.severity, 0) + 1
+        if len(self.records) < self.max_records:
+            self.records.append(record)
+        else:
+            self.dropped += 1
+
+    def clear(self):
+        self.records = []
+        self.dropped = 0
+        self._counts = {}
+
+    def count(self, severity):
+        """嚴重度恰為 severity 的訊息數 (含超過上限沒保留的)。"""
+        return self._counts.get(severity, 0)
+
+
+collector = DiagnosticsCollector()
+_capture_state = threading.local()
+
+
+def set_log_level(level):
+    """設定印到主控台的最低嚴重度。"""
+    global LOG_LEVEL
+    LOG_LEVEL = level
+    _update_min_level()
+
+
+def set_collect_level(level):
+    """設定存進 collector 的最低嚴重度。"""
+    global COLLECT_LEVEL
+    COLLECT_LEVEL = level
+    _update_min_level()
+
+
+def set_quiet(quiet=True):
+    """安靜模式:不再印出任何訊息,只收集。"""
+    global QUIET
+    QUIET = quiet
+    _update_min_level()
+
+
+def _update_min_level():
+    global _min_level
+    _min_level = COLLECT_LEVEL if QUIET else min(LOG_LEVEL, COLLECT_LEVEL)
+
+
+def is_enabled(severity):
+    """severity 的訊息會不會被印出或收集;格式化成本高的訊息可先檢查。"""
+    return severity >= _min_level or bool(getattr(_capture_state, "stack", None))
+
+
+def report(severity, message, file=None, line=None, command=None):
+    stack = getattr(_capture_state, "stack", None)
+    if stack:
+        stack[-1].append(Diagnostic(severity, message, file, line, command))
+        return
+    if severity < _min_level:
+        return
+    record = Diagnostic(severity, message, file, line, command)
+    if severity >= COLLECT_LEVEL:
+        collector.add(record)
+    if not QUIET and severity >= LOG_LEVEL:
+        print(record.format())
+
+
+def split_line_id(line_id):
+    """物件的行識別碼 (根檔為整數,導入檔為 "檔名:行號") 轉成 (file, line);file 不明時為 None。"""
+    if isinstance(line_id, str):
+        filename, _, line = line_id.rpartition(":")
+        if line.isdigit():
+            return filename or None, int(line)
+        return line_id, None
+    return None, line_id
+
+
+def debug(message, file=None, line=None, command=None):
+    report(DEBUG, message, file, line, command)
+
+
+def info(message, file=None, line=None, command=None):
+    report(INFO, message, file, line, command)
+
+
+def warning(message, file=None, line=None, command=None):
+    report(WARNING, message, file, line, command)
+
+
+def error(message, file=None, line=None, command=None):
+    report(ERROR, message, file, line, command)
+
+
+@contextmanager
+def capture():
+    """
+    在這個區塊內 (同一執行緒) 報告的訊息不印出也不收集,而是放進 yield 的列表
+    (所有嚴重度都保留);之後可用 replay() 照常送出。用於可快取的解析結果
+    (prefab、編輯器的逐行記錄),以及在子行程中解析、由主行程送出的訊息。
+    """
+    stack = getattr(_capture_state, "stack", None)
+    if stack is None:
+        stack = _capture_state.stack = []
+    records = []
+    stack.append(records)
+    try:
+        yield records
+    finally:
+        stack.pop()
+
+
+def replay(records):
+    """把 capture() 取得的訊息依目前的設定送出。"""
+    for record in records:
+        report(*record)
@@ -28,6 +28,7 @@ import scene_parser
 import renderer
 import minimap_renderer
 import texture_loader
+import scene_diagnostics
 from scene_parser import Scene
 from camera import Camera # 用於 3D 預覽攝影機
 
@@ -68,6 +69,7 @@ EDITOR_COORD_COLOR = (205, 205, 20, 200)
 EDITOR_COORD_FONT_SIZE = 18
 EDITOR_LABEL_OFFSET_X = 5
 EDITOR_LABEL_OFFSET_Y = 3
+EDITOR_TRACK_HOVER_RANGE = 50.0 # 指標離軌道多近 (公尺) 時在座標列顯示沿線距離與橫向偏移
 
 # --- 3D 預覽視窗常數 ---
 PREVIEW_UPDATE_INTERVAL = 80 # ms 
@@ -75,6 +77,16 @@ PREVIEW_MOVE_SPEED = 3.0 # units per second
 PREVIEW_MOUSE_SENSITIVITY = 0.1
 PREVIEW_ACCEL_FACTOR = 12.0 # Shift 加速倍率
 
+# 預覽中使用 VBO 的物件類型:
+# (scene 屬性, renderer 著色器 ID 屬性, 建立函數名, 清理函數名)
+_PREVIEW_BUFFER_SPECS = [
+    ('hills',     '_hill_shader_program_id',     'create_hill_buffers',     'cleanup_all_hill_buffers'),
+    ('buildings', '_building_shader_program_id', 'create_building_buffers', 'cleanup_all_building_buffers'),
+    ('trees',     '_tree_shader_program_id',     'create_tree_buffers',     'cleanup_all_tree_buffers'),
+    ('cylinders', '_cylinder_shader_program_id', 'create_cylinder_buffers', 'cleanup_all_cylinder_buffers'),
+    ('spheres',   '_cylinder_shader_program_id', 'create_sphere_buffers',   'cleanup_all_sphere_buffers'),
+]
+
 # --- Minimap OpenGL Widget ---
 class MinimapGLWidget(QGLWidget):
     """Custom OpenGL Widget for rendering the scene preview."""
@@ -283,6 +295,10 @@ class MinimapGLWidget(QGLWidget):
                         ll = self._scene_data.world_to_latlon(mx, mz)
                         if ll:
                             mouse_text += f"  {ll[0]:.6f}, {ll[1]:.6f}"
+                    if self._scene_data is not None and self._scene_data.track and self._scene_data.track.segments:
+                        distance, _segment, lateral, separation = self._scene_data.track.nearest_point(mx, mz)
+                        if separation <= EDITOR_TRACK_HOVER_RANGE:
+                            mouse_text += f"  Track: {distance:.1f} m, offset {lateral:+.1f} m"
                     mouse_surface = self._coord_font.render(mouse_text, True, EDITOR_COORD_COLOR)
                     renderer._draw_text_texture(
                         mouse_surface,
@@ -510,6 +526,10 @@ class PreviewGLWidget(QGLWidget):
             renderer.init_hill_shader()
             if renderer._hill_shader_program_id is None:
                 print("警告 (編輯器預覽): 山丘著色器初始化失敗！")
+        if renderer._track_shader_program_id is None and hasattr(renderer, 'init_track_shader'):
+            renderer.init_track_shader()
+            if renderer._track_shader_program_id is None:
+                scene_diagnostics.error("編輯器預覽: 軌道著色器初始化失敗！")
 
         self._timer.timeout.connect(self.update_preview)
         self._timer.start(PREVIEW_UPDATE_INTERVAL)
@@ -1822,6 +1842,54 @@ class OsmImportDialog(QtWidgets.QDialog):
         }
 
 
+class DiagnosticsPanel(QTableWidget):
+    """
+    列出增量解析器收集的診斷訊息 (嚴重度 / 檔案 / 行 / 指令 / 訊息)。
+    雙擊根檔的訊息時發出 lineActivated(表格行索引)。
+    """
+    lineActivated = pyqtSignal(int)
+
+    HEADERS = ["嚴重度", "檔案", "行", "指令", "訊息"]
+
+    def __init__(self, parent=None):
+        super().__init__(0, len(self.HEADERS), parent)
+        self.setHorizontalHeaderLabels(self.HEADERS)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.verticalHeader().setVisible(False)
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.horizontalHeader().setStretchLastSection(True)
+        self._records = []
+        self._root_filename = None
+        self.cellDoubleClicked.connect(self._on_cell_double_clicked)
+
+    def set_records(self, records, root_filename):
+        """records: scene_diagnostics.Diagnostic 列表;root_filename 為目前編輯中檔案的顯示名稱。"""
+        records = list(records)
+        if records == self._records and root_filename == self._root_filename:
+            return # 沒有變化,不重建表格
+        self._records = records
+        self._root_filename = root_filename
+        self.setUpdatesEnabled(False)
+        try:
+            self.setRowCount(len(records))
+            for row, record in enumerate(records):
+                values = (record.label, record.file or "",
+                          "" if record.line is None else str(record.line),
+                          record.command or "", record.message)
+                for col, value in enumerate(values):
+                    self.setItem(row, col, QTableWidgetItem(value))
+        finally:
+            self.setUpdatesEnabled(True)
+
+    def _on_cell_double_clicked(self, row, column):
+        if not (0 <= row < len(self._records)):
+            return
+        record = self._records[row]
+        if record.line is not None and record.file == self._root_filename:
+            self.lineActivated.emit(record.line - 1)
+
+
 class SceneEditorWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -1831,6 +1899,8 @@ class SceneEditorWindow(QMainWindow):
         self._current_scene_filepath = None
 
         self._force_texture_reload_on_next_preview_update = True # 初始載入時強制重載
+        # 預覽用增量解析器:每次編輯只重新解析變動的行
+        self._incremental_parser = scene_parser.IncrementalSceneParser()
 
         # >>> 新增：用於存儲從全局設定檔載入的“預設”視角參數 <<<
         self._default_minimap_settings = {
@@ -2114,6 +2184,14 @@ class SceneEditorWindow(QMainWindow):
         # Stack preview below minimap initially
         self.splitDockWidget(self.minimap_dock, self.preview_dock, Qt.Vertical)
 
+        # Diagnostics Dock (解析警告/錯誤,雙擊跳到該行)
+        self.diagnostics_dock = QDockWidget("Diagnostics", self)
+        self.diagnostics_panel = DiagnosticsPanel(self.diagnostics_dock)
+        self.diagnostics_dock.setWidget(self.diagnostics_panel)
+        self.diagnostics_dock.setAllowedAreas(Qt.AllDockWidgetAreas)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.diagnostics_dock)
+        self.diagnostics_panel.lineActivated.connect(self._go_to_table_row)
+
         # Set initial sizes (adjust ratios as needed)
         self.resizeDocks([self.table_dock], [int(self.width() * 0.4)], Qt.Horizontal)
         self.resizeDocks([self.minimap_dock, self.preview_dock], [int(self.height() * 0.5), int(self.height() * 0.5)], Qt.Vertical)
@@ -2223,6 +2301,7 @@ class SceneEditorWindow(QMainWindow):
         view_menu.addAction(self.table_dock.toggleViewAction())
         view_menu.addAction(self.minimap_dock.toggleViewAction())
         view_menu.addAction(self.preview_dock.toggleViewAction())
+        view_menu.addAction(self.diagnostics_dock.toggleViewAction())
 
     # --- OSM 自動生成沿線建物（Tools 選單） ---
     def open_osm_import_dialog(self):
@@ -2551,6 +2630,15 @@ class SceneEditorWindow(QMainWindow):
 #         print("DEBUG: SceneEditorWindow.update_previews() CALLED, scheduling _perform_preview_update_logic.")
         QTimer.singleShot(0, self._perform_preview_update_logic) # 延遲 0ms 執行
         
+    def _show_parse_progress(self, lines_done, lines_total):
+        """增量解析的進度回呼:只有大量行需要重新解析時才在狀態列顯示。"""
+        if lines_total < scene_parser.INCREMENTAL_PROGRESS_LINES:
+            return
+        self.statusBar.showMessage(f"解析場景中... {lines_done}/{lines_total} 行", 0)
+        self.statusBar.repaint()
+        if lines_done >= lines_total:
+            self.statusBar.clearMessage()
+
     def _perform_preview_update_logic(self):
         # print("Updating editor previews...") #減少訊息
 
@@ -2585,6 +2673,7 @@ class SceneEditorWindow(QMainWindow):
                             print(f"警告 (編輯器預覽更新): 清理天空盒紋理 {tex_id} 時出錯: {cleanup_error}")
                     renderer.skybox_texture_cache.clear()
                 self._force_texture_reload_on_next_preview_update = False # 重置標記
+                self._incremental_parser.reset() # 紋理 ID 全部失效,下次完整解析
             # else:
                 # print("編輯器預覽更新：未檢測到強制重載紋理標記，保留現有快取。") # Debug
             # >>> 結束修改 <<<
@@ -2592,14 +2681,16 @@ class SceneEditorWindow(QMainWindow):
             if scene_parser.texture_loader is None:
                 scene_parser.set_texture_loader(texture_loader)
 
-            # --- 1. 解析場景數據，這會填充 parsed_scene.embedded_editor_settings_str ---
-            parsed_scene = scene_parser.parse_scene_from_lines(
+            # --- 1. 增量解析:只重新解析有變動的行 ---
+            parse_result = self._incremental_parser.update(
                 current_table_lines, 
                 base_directory_for_imports,
                 current_filename_for_display,
-                initial_scene=None, 
-                load_textures=True # 紋理載入會發生在這裡
+                load_textures=True, # 紋理載入會發生在這裡
+                progress_callback=self._show_parse_progress
             )
+            parsed_scene = parse_result.scene
+            self._update_diagnostics_panel(current_filename_for_display)
             # >>> 新增：如果 parsed_scene 成功創建，將我們之前提取的設定字串賦值給它 <<<
             # 這樣，如果 scene_parser 內部或 Scene 物件將來需要訪問這個原始的內嵌字串，它仍然可用。
             # 但對於視角設定，我們主要使用 self._current_scene_specific_settings_str。
@@ -2607,75 +2698,8 @@ class SceneEditorWindow(QMainWindow):
                 parsed_scene.embedded_editor_settings_str = self._current_scene_specific_settings_str
             # >>> 結束新增 <<<
 
-            # --- 2. 清理舊的預覽資源 ---
-            if self.preview_widget._scene_data:
-                # ... (清理軌道、山丘、建築物等 VBO/VAO 的程式碼) ...
-                old_scene_to_cleanup = self.preview_widget._scene_data
-                if hasattr(old_scene_to_cleanup, 'cylinders') and old_scene_to_cleanup.cylinders:
-                    if hasattr(renderer, 'cleanup_all_cylinder_buffers'):
-                        renderer.cleanup_all_cylinder_buffers(old_scene_to_cleanup.cylinders)
-                if hasattr(old_scene_to_cleanup, 'spheres') and old_scene_to_cleanup.spheres:
-                    if hasattr(renderer, 'cleanup_all_sphere_buffers'):
-                        renderer.cleanup_all_sphere_buffers(old_scene_to_cleanup.spheres)
-                if hasattr(old_scene_to_cleanup, 'trees') and old_scene_to_cleanup.trees:
-                    if hasattr(renderer, 'cleanup_all_tree_buffers'):
-                        renderer.cleanup_all_tree_buffers(old_scene_to_cleanup.trees)
-                if hasattr(old_scene_to_cleanup, 'hills') and old_scene_to_cleanup.hills:
-                    if hasattr(renderer, 'cleanup_all_hill_buffers'):
-                        renderer.cleanup_all_hill_buffers(old_scene_to_cleanup.hills)
-                if hasattr(old_scene_to_cleanup, 'track') and old_scene_to_cleanup.track:
-                    old_scene_to_cleanup.track.clear()
-                if hasattr(old_scene_to_cleanup, 'buildings') and old_scene_to_cleanup.buildings and hasattr(renderer, 'cleanup_all_building_buffers'):
-                    renderer.cleanup_all_building_buffers(old_scene_to_cleanup.buildings)
-            
-            # --- 3. 為新解析的 parsed_scene 創建資源 ---
-            if parsed_scene:
-                # ... (為軌道、山丘、建築物等創建 VBO/VAO 的程式碼) ...
-                if parsed_scene.track:
-                    try:
-                        parsed_scene.track.create_all_segment_buffers()
-                    except Exception as e_track_buf:
-                        print(f"  Error creating track buffers for preview in _perform_preview_update_logic: {e_track_buf}")
-                if hasattr(parsed_scene, 'cylinders') and parsed_scene.cylinders and renderer._cylinder_shader_program_id:
-                    new_cylinders_list_editor = [] 
-                    for i, cylinder_entry_editor in enumerate(parsed_scene.cylinders):
-                        original_line_id_editor, _ = cylinder_entry_editor
-                        modified_cylinder_data_editor, success_editor = renderer.create_cylinder_buffers(cylinder_entry_editor)
-                        if success_editor: new_cylinders_list_editor.append((original_line_id_editor, modified_cylinder_data_editor))
-                        else: new_cylinders_list_editor.append(cylinder_entry_editor)
-                    parsed_scene.cylinders = new_cylinders_list_editor
-                if hasattr(parsed_scene, 'spheres') and parsed_scene.spheres and renderer._cylinder_shader_program_id:
-                    new_spheres_list_editor = []
-                    for i, sphere_entry_editor in enumerate(parsed_scene.spheres):
-                        original_line_id_editor, _ = sphere_entry_editor
-                        modified_sphere_data_editor, success_editor = renderer.create_sphere_buffers(sphere_entry_editor)
-                        if success_editor: new_spheres_list_editor.append((original_line_id_editor, modified_sphere_data_editor))
-                        else: new_spheres_list_editor.append(sphere_entry_editor)
-                    parsed_scene.spheres = new_spheres_list_editor
-                if hasattr(parsed_scene, 'buildings') and parsed_scene.buildings and renderer._building_shader_program_id:
-                    new_buildings_list_editor = []
-                    for i, bldg_entry_editor in enumerate(parsed_scene.buildings):
-                        line_id_editor, _ = bldg_entry_editor
-                        modified_bldg_data_editor, success_editor = renderer.create_building_buffers(bldg_entry_editor)
-                        if success_editor: new_buildings_list_editor.append((line_id_editor, modified_bldg_data_editor))
-                        else: new_buildings_list_editor.append(bldg_entry_editor)
-                    parsed_scene.buildings = new_buildings_list_editor
-                if hasattr(parsed_scene, 'trees') and parsed_scene.trees and renderer._tree_shader_program_id:
-                    new_trees_list_editor = []
-                    for i, tree_entry_editor in enumerate(parsed_scene.trees):
-                        original_line_id_editor, _ = tree_entry_editor
-                        modified_tree_data_editor, success_editor = renderer.create_tree_buffers(tree_entry_editor)
-                        if success_editor: new_trees_list_editor.append((original_line_id_editor, modified_tree_data_editor))
-                        else: new_trees_list_editor.append(tree_entry_editor)
-                    parsed_scene.trees = new_trees_list_editor
-                if hasattr(parsed_scene, 'hills') and parsed_scene.hills and renderer._hill_shader_program_id:
-                    new_hills_list_editor = []
-                    for i, hill_entry_editor in enumerate(parsed_scene.hills):
-                        original_line_id_editor, _ = hill_entry_editor
-                        modified_hill_data_editor, success_editor = renderer.create_hill_buffers(hill_entry_editor)
-                        if success_editor: new_hills_list_editor.append((original_line_id_editor, modified_hill_data_editor))
-                        else: new_hills_list_editor.append(hill_entry_editor)
-                    parsed_scene.hills = new_hills_list_editor
+            # --- 2./3. 只釋放被換掉的舊資源、只為新條目建立資源 ---
+            self._sync_preview_gl_resources(parse_result)
 
         finally:
             self.preview_widget.doneCurrent() # << --- 在所有GL相關操作完成後才釋放上下文
@@ -2733,6 +2757,7 @@ class SceneEditorWindow(QMainWindow):
             # PreviewGLWidget.update_scene 現在只負責更新其內部數據指針和觸發重繪
             # 它不再負責清理舊資源或創建新資源，這些已在上面完成。
             self.preview_widget.update_scene(parsed_scene, background_info_for_preview)
+            self.preview_widget.update() # 增量解析時場景物件不變,仍需重繪
         except Exception as e:
             print(f"Error updating 3D preview widget: {e}")
             import traceback
@@ -2741,6 +2766,72 @@ class SceneEditorWindow(QMainWindow):
         # print("編輯器預覽已更新。") #減少訊息
 
 
+    def _update_diagnostics_panel(self, current_filename_for_display):
+        """以增量解析器保留的逐行診斷訊息 (嚴重度達 COLLECT_LEVEL 的) 更新診斷面板,並在面板標題顯示錯誤/警告數量。"""
+        records = [record for record in self._incremental_parser.diagnostics
+                   if record.severity >= scene_diagnostics.COLLECT_LEVEL]
+        self.diagnostics_panel.set_records(records, current_filename_for_display)
+        errors = sum(1 for record in records if record.severity >= scene_diagnostics.ERROR)
+        warnings = sum(1 for record in records if record.severity == scene_diagnostics.WARNING)
+        self.diagnostics_dock.setWindowTitle(f"Diagnostics ({errors} 錯誤, {warnings} 警告)")
+
+    def _go_to_table_row(self, row):
+        """診斷面板雙擊:選取並捲動到場景表格的該行。"""
+        if 0 <= row < self.table_widget.rowCount():
+            self.table_widget.setCurrentCell(row, 0)
+            item = self.table_widget.item(row, 0)
+            if item is not None:
+                self.table_widget.scrollToItem(item, QAbstractItemView.PositionAtCenter)
+            self.table_dock.raise_()
+            self.table_widget.setFocus()
+
+    def _sync_preview_gl_resources(self, parse_result):
+        """
+        依增量解析結果更新預覽的 GL 資源 (呼叫前需已 makeCurrent):
+        新條目與被換掉的舊條目以 scene_parser.diff_object_lists 配對,內容相同或只有位置/旋轉/紋理參數
+        不同的 (例如插入行後被重新解析的下方各行、拖曳移動的物件) 直接沿用舊緩衝區,
+        其餘新條目建立緩衝區,沒被沿用的舊條目釋放緩衝區。
+        """
+        scene = parse_result.scene
+        for attr, shader_attr, create_name, cleanup_name in _PREVIEW_BUFFER_SPECS:
+            entries = getattr(scene, attr)
+            added_indices = parse_result.added_objects.get(attr, [])
+            removed_entries = parse_result.removed_objects.get(attr, [])
+            object_diff = scene_parser.diff_object_lists(removed_entries, [entries[i] for i in added_indices], attr)
+            leftovers = [removed_entries[old_index] for old_index in object_diff.removed]
+            to_create = object_diff.added
+            for old_index, new_index in object_diff.changed:
+                leftovers.append(removed_entries[old_index])
+                to_create.append(new_index)
+            for old_index, new_index in object_diff.reusable_pairs():
+                shared_entry = scene_parser.entry_with_buffers_from(
+                    entries[added_indices[new_index]], removed_entries[old_index], attr)
+                if shared_entry is None:
+                    to_create.append(new_index)
+                else:
+                    entries[added_indices[new_index]] = shared_entry
+            create_fn = getattr(renderer, create_name, None)
+            if create_fn is not None and getattr(renderer, shader_attr, None) is not None:
+                for new_index in to_create:
+                    i = added_indices[new_index]
+                    modified_data, success = create_fn(entries[i])
+                    if success: entries[i] = (entries[i][0], modified_data)
+            if leftovers and hasattr(renderer, cleanup_name):
+                getattr(renderer, cleanup_name)(leftovers)
+
+        # 實例陣列每組只有一份網格,被換掉的直接釋放、新的重建
+        renderer.cleanup_all_instance_array_buffers(parse_result.removed_objects.get('instance_arrays', []))
+        for i in parse_result.added_objects.get('instance_arrays', []):
+            renderer.create_instance_array_buffers(scene.instance_arrays[i][1])
+
+        for segment in parse_result.removed_segments:
+            segment.cleanup_buffers()
+        for segment in parse_result.changed_segments:
+            try:
+                segment.create_gl_buffers()
+            except Exception as e_track_buf:
+                scene_diagnostics.warning(f"編輯器預覽: 建立軌道緩衝區失敗: {e_track_buf}", line=segment.source_line_number)
+
     def ask_reload_current_scene(self):
         """Asks to reload the current scene file from disk."""
         if not self._current_scene_filepath or not os.path.exists(self._current_scene_filepath):
@@ -2833,6 +2924,7 @@ class SceneEditorWindow(QMainWindow):
                             renderer.cleanup_all_cylinder_buffers(self.preview_widget._scene_data.cylinders)
                         if hasattr(renderer, 'cleanup_all_sphere_buffers'):
                             renderer.cleanup_all_sphere_buffers(self.preview_widget._scene_data.spheres)
+                            renderer.cleanup_all_instance_array_buffers(self.preview_widget._scene_data.instance_arrays)
                         else:
                             print("警告 (編輯器關閉): renderer 模塊中未找到 cleanup_all_hill_buffers。")
                     ### --- END OF MODIFICATION ---
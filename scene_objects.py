@@ -0,0 +1,779 @@
+# scene_objects.py
+"""
+場景物件的欄式 (structure-of-arrays) 儲存。
+
+每種物件類型一個 ObjectStore:數值欄位 (位置/旋轉/尺寸/UV 參數/父原點角度) 存在一個
+float64 二維陣列,整數欄位 (uv_mode、GL 紋理/VAO/VBO ID、頂點數、alpha 旗標) 存在一個
+int64 二維陣列 (None 以 -1 表示),紋理檔名以整數代號內嵌 (intern),行號識別碼另存一個列表。
+
+ObjectStore 同時是 (line_identifier, obj_data_tuple) 的可變序列:舊呼叫端照樣用
+for / 索引 / append / 切片存取,tuple 依 OBJECT_SCHEMAS 的欄位順序由欄位陣列組回,
+長度也與存入時相同 (解析器產生的 19 欄圓柱、renderer 補齊後的 22 欄圓柱都原樣保留)。
+需要批次運算的地方改用 column() / positions / rotations 直接取 NumPy 陣列。
+"""
+from collections import namedtuple
+from collections.abc import MutableSequence
+import operator
+import numpy as np
+
+# 欄位種類:
+#   "type"  物件類型字串 (不儲存,由 schema 提供)
+#   "f"     浮點數
+#   "i"     整數
+#   "id"    可為 None 的整數 (GL 物件 ID、頂點數),None 存成 -1
+#   "bool"  布林
+#   "tex"   紋理檔名,內嵌成整數代號,None 存成 -1
+OBJECT_SCHEMAS = {
+    "building": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("rx", "f"), ("ry", "f"), ("rz", "f"),
+        ("w", "f"), ("d", "f"), ("h", "f"),
+        ("u_offset", "f"), ("v_offset", "f"), ("tex_angle", "f"),
+        ("uv_mode", "i"), ("uscale", "f"), ("vscale", "f"),
+        ("tex_file", "tex"), ("gl_tex", "id"), ("has_alpha", "bool"),
+        ("parent_ry", "f"),
+        ("vao", "id"), ("vbo", "id"), ("vertex_count", "id"),
+    ),
+    "cylinder": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("rx", "f"), ("ry", "f"), ("rz", "f"),
+        ("radius", "f"), ("h", "f"),
+        ("u_offset", "f"), ("v_offset", "f"), ("tex_angle", "f"),
+        ("uv_mode", "i"), ("uscale", "f"), ("vscale", "f"),
+        ("tex_file", "tex"), ("gl_tex", "id"), ("has_alpha", "bool"),
+        ("parent_ry", "f"),
+        ("vao", "id"), ("vbo", "id"), ("vertex_count", "id"),
+    ),
+    "tree": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("h", "f"), ("gl_tex", "id"), ("tex_file", "tex"),
+        ("parent_ry", "f"),
+        ("vao", "id"), ("vbo", "id"), ("vertex_count", "id"),
+    ),
+    "sphere": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("rx", "f"), ("ry", "f"), ("rz", "f"),
+        ("radius", "f"), ("gl_tex", "id"),
+        ("u_offset", "f"), ("v_offset", "f"), ("tex_angle", "f"),
+        ("uv_mode", "i"), ("uscale", "f"), ("vscale", "f"),
+        ("tex_file", "tex"),
+        ("parent_ry", "f"),
+        ("vao", "id"), ("vbo", "id"), ("vertex_count", "id"),
+    ),
+    "hill": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"), # 中心 x、底部 y、中心 z
+        ("radius", "f"), ("h", "f"),
+        ("uscale", "f"), ("vscale", "f"),
+        ("u_offset", "f"), ("v_offset", "f"),
+        ("tex_file", "tex"), ("gl_tex", "id"), ("has_alpha", "bool"),
+        ("parent_ry", "f"),
+        ("vao", "id"), ("vbo", "id"), ("vertex_count", "id"),
+    ),
+    "gableroof": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("rx", "f"), ("ry", "f"), ("rz", "f"),
+        ("w", "f"), ("d", "f"), ("ridge_h", "f"),
+        ("ridge_x_offset", "f"), ("eave_x", "f"), ("eave_z", "f"),
+        ("gl_tex", "id"), ("has_alpha", "bool"), ("tex_file", "tex"),
+        ("parent_ry", "f"),
+    ),
+    "flexroof": (
+        ("type", "type"),
+        ("x", "f"), ("y", "f"), ("z", "f"),
+        ("rx", "f"), ("ry", "f"), ("rz", "f"),
+        ("w", "f"), ("d", "f"), ("top_w", "f"), ("top_d", "f"), ("h", "f"),
+        ("top_offset_x", "f"), ("top_offset_z", "f"),
+        ("gl_tex", "id"), ("has_alpha", "bool"), ("tex_file", "tex"),
+        ("parent_ry", "f"),
+    ),
+}
+
+# Scene 的列表屬性名 → 物件類型
+OBJECT_LIST_TYPES = {
+    "buildings": "building",
+    "cylinders": "cylinder",
+    "trees": "tree",
+    "spheres": "sphere",
+    "hills": "hill",
+    "gableroofs": "gableroof",
+    "flexroofs": "flexroof",
+}
+
+# 欄位名 → tuple 索引,取代散落各處的魔術數字 (如 BUILDING_FIELDS["vao"] == 20)
+FIELD_INDEX = {obj_type: {name: index for index, (name, _kind) in enumerate(fields)}
+               for obj_type, fields in OBJECT_SCHEMAS.items()}
+BUILDING_FIELDS = FIELD_INDEX["building"]
+CYLINDER_FIELDS = FIELD_INDEX["cylinder"]
+TREE_FIELDS = FIELD_INDEX["tree"]
+SPHERE_FIELDS = FIELD_INDEX["sphere"]
+HILL_FIELDS = FIELD_INDEX["hill"]
+GABLEROOF_FIELDS = FIELD_INDEX["gableroof"]
+FLEXROOF_FIELDS = FIELD_INDEX["flexroof"]
+
+# renderer 產生 VBO 網格時用到的欄位:這些欄位相同的物件網格也相同,
+# 位置/旋轉/紋理參數在繪製時才套用。山丘網格直接以世界座標產生,位置與 UV 都算在內。
+# 不在表中的類型 (屋頂) 每幀即時繪製,沒有網格可沿用。
+MESH_FIELDS = {
+    "building": ("w", "d", "h"),
+    "cylinder": ("radius", "h"),
+    "tree": ("h",),
+    "sphere": ("radius",),
+    "hill": ("x", "y", "z", "radius", "h", "uscale", "vscale", "u_offset", "v_offset"),
+}
+
+# GL 物件 ID 欄位 (gl_tex 以外),物件換到新場景時可原樣搬過去
+GL_BUFFER_FIELDS = ("vao", "vbo", "vertex_count")
+
+
+def content_key_getter(obj_type):
+    """
+    回傳 f(tuple) -> 物件內容鍵:解析出的參數欄位,不含 GL 物件 ID (紋理 ID、VAO/VBO)
+    與載入紋理後才知道的 alpha 旗標。兩個物件內容鍵相同,代表場景檔中的參數完全相同。
+    """
+    indices = [index for index, (_name, kind) in enumerate(OBJECT_SCHEMAS[obj_type])
+               if kind not in ("type", "id", "bool")]
+    return operator.itemgetter(*indices)
+
+
+def mesh_key_getter(obj_type):
+    """回傳 f(tuple) -> 網格鍵 (MESH_FIELDS 的欄位);沒有 VBO 網格的類型回傳 None。"""
+    names = MESH_FIELDS.get(obj_type)
+    if names is None:
+        return None
+    field_index = FIELD_INDEX[obj_type]
+    return operator.itemgetter(*[field_index[name] for name in names])
+
+
+# append 的列先暫存,累積到這個數量才整批轉進欄位陣列
+_PENDING_FLUSH_SIZE = 4096
+
+
+class _StoreLayout:
+    """單一物件類型的欄位配置 (欄位落在哪個陣列的第幾欄)。"""
+    def __init__(self, obj_type):
+        self.obj_type = obj_type
+        self.fields = OBJECT_SCHEMAS[obj_type]
+        self.full_length = len(self.fields)
+        self.float_columns = {}
+        self.int_columns = {}
+        # (tuple 索引, 種類, 欄) ;type 欄的 column 為 None
+        self.slots = []
+        for name, kind in self.fields:
+            if kind == "type":
+                column = None
+            elif kind == "f":
+                column = self.float_columns.setdefault(name, len(self.float_columns))
+            else:
+                column = self.int_columns.setdefault(name, len(self.int_columns))
+            self.slots.append((kind, column))
+        # tuple 長度不足時補上的預設值 (GL 欄位為 None,頂點數為 0)
+        self.padding = tuple(0 if name == "vertex_count" else None for name, _kind in self.fields)
+
+_layouts = {obj_type: _StoreLayout(obj_type) for obj_type in OBJECT_SCHEMAS}
+
+
+class ObjectStore(MutableSequence):
+    """單一物件類型的欄式儲存,同時可當 (line_identifier, obj_data_tuple) 列表使用。"""
+
+    def __init__(self, obj_type, entries=()):
+        self._layout = _layouts[obj_type]
+        self.obj_type = obj_type
+        self._count = 0
+        self._floats = np.zeros((0, len(self._layout.float_columns)), dtype=np.float64)
+        self._ints = np.zeros((0, len(self._layout.int_columns)), dtype=np.int64)
+        self._row_lengths = np.zeros(0, dtype=np.int8)
+        self._line_ids = []
+        self._tex_names = []
+        self._tex_lookup = {}
+        self._pending = []
+        self._rows = None # 組回的 (line_id, tuple) 快取;欄位變動時作廢
+        if entries:
+            self.extend(entries)
+
+    # --- 序列介面 (相容舊的列表用法) ---
+    def __len__(self):
+        return self._count + len(self._pending)
+
+    def __bool__(self):
+        return self._count > 0 or bool(self._pending)
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._flush()
+            if self._rows is not None:
+                return self._rows[index]
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                return self._materialize()[index]
+            return self._rows_from_columns(start, stop) # 只組回切到的列
+        if self._rows is not None:
+            return self._rows[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ObjectStore index out of range")
+        if index >= self._count:
+            return self._pending[index - self._count]
+        return self._row(index)
+
+    def __setitem__(self, index, entry):
+        if isinstance(index, slice):
+            self._flush()
+            start, stop, step = index.indices(self._count)
+            if step != 1: # 跨步切片少用,整批重建
+                entries = list(self._materialize())
+                entries[index] = entry
+                self._reset(entries)
+                return
+            self._splice(start, max(start, stop), list(entry))
+            return
+        self._flush()
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("ObjectStore assignment index out of range")
+        line_id, obj_data = entry
+        self._line_ids[index] = line_id
+        self._write_rows(index, [obj_data])
+        if self._rows is not None:
+            self._rows[index] = self._row(index)
+
+    def __delitem__(self, index):
+        self._flush()
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                entries = list(self._materialize())
+                del entries[index]
+                self._reset(entries)
+                return
+            if stop > start:
+                self._splice(start, stop, [])
+            return
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("ObjectStore index out of range")
+        self._splice(index, index + 1, [])
+
+    def insert(self, index, entry):
+        self._flush()
+        if index < 0:
+            index = max(0, index + self._count)
+        self._splice(min(index, self._count), min(index, self._count), [entry])
+
+    def append(self, entry):
+        self._pending.append(entry)
+        self._rows = None
+        if len(self._pending) >= _PENDING_FLUSH_SIZE:
+            self._flush()
+
+    def extend(self, entries):
+        if isinstance(entries, ObjectStore) and entries.obj_type == self.obj_type:
+            self.extend_store(entries)
+            return
+        self._pending.extend(entries)
+        self._rows = None
+        if len(self._pending) >= _PENDING_FLUSH_SIZE:
+            self._flush()
+
+    def clear(self):
+        self._reset([])
+
+    def __eq__(self, other):
+        if isinstance(other, (ObjectStore, list, tuple)):
+            return list(self._materialize()) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ObjectStore({self.obj_type!r}, {len(self)} 個)"
+
+    def __getstate__(self):
+        self._flush()
+        state = self.__dict__.copy()
+        state["_floats"] = self._floats[:self._count].copy()
+        state["_ints"] = self._ints[:self._count].copy()
+        state["_row_lengths"] = self._row_lengths[:self._count].copy()
+        state["_rows"] = None
+        state["_layout"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._layout = _layouts[self.obj_type]
+
+    # --- 欄式存取 ---
+    @property
+    def line_ids(self):
+        self._flush()
+        return self._line_ids
+
+    @property
+    def texture_names(self):
+        """內嵌的紋理檔名表;tex_file 欄存的是這個表的索引。"""
+        self._flush()
+        return self._tex_names
+
+    def column(self, name):
+        """取單一欄位的陣列 (可寫入的 view;寫入後需呼叫 mark_modified)。
+        整數類欄位中 None 以 -1 表示,tex_file 為 texture_names 的索引。"""
+        self._flush()
+        layout = self._layout
+        if name in layout.float_columns:
+            return self._floats[:self._count, layout.float_columns[name]]
+        return self._ints[:self._count, layout.int_columns[name]]
+
+    def columns(self, *names):
+        """多個浮點欄位組成 (N, k) 陣列;欄位相鄰時回傳 view。"""
+        self._flush()
+        indices = [self._layout.float_columns[name] for name in names]
+        first = indices[0]
+        if indices == list(range(first, first + len(indices))):
+            return self._floats[:self._count, first:first + len(indices)]
+        return self._floats[:self._count][:, indices]
+
+    @property
+    def positions(self):
+        return self.columns("x", "y", "z")
+
+    @property
+    def rotations(self):
+        return self.columns("rx", "ry", "rz")
+
+    def has_field(self, name):
+        return name in FIELD_INDEX[self.obj_type]
+
+    def object_bounds(self):
+        """
+        每個物件的世界座標軸對齊包圍盒 (保守估計,任何 Y 旋轉都包得住):
+        回傳 (mins, maxs),各為 (N, 3) 陣列。有 X/Z 傾斜的物件改用以錨點為中心的包圍球。
+        """
+        positions = self.positions
+        half_xz, height = _object_extents(self)
+        mins = positions.copy()
+        maxs = positions.copy()
+        if self.obj_type == "sphere": # 錨點在球心
+            mins -= half_xz[:, None]
+            maxs += half_xz[:, None]
+            return mins, maxs
+        mins[:, 0] -= half_xz; maxs[:, 0] += half_xz
+        mins[:, 2] -= half_xz; maxs[:, 2] += half_xz
+        mins[:, 1] += np.minimum(height, 0.0)
+        maxs[:, 1] += np.maximum(height, 0.0)
+        if self.has_field("rx"):
+            tilted = (self.column("rx") != 0) | (self.column("rz") != 0)
+            if tilted.any():
+                radius = np.hypot(half_xz[tilted], height[tilted])[:, None]
+                mins[tilted] = positions[tilted] - radius
+                maxs[tilted] = positions[tilted] + radius
+        return mins, maxs
+
+    def used_texture_names(self):
+        """目前有物件引用的紋理檔名 (texture_names 可能還留著已刪除物件的檔名)。"""
+        codes = np.unique(self.column("tex_file"))
+        return [self._tex_names[code] for code in codes if code >= 0]
+
+    def mark_modified(self):
+        """直接改寫 column() 取得的陣列後呼叫,讓組回的 tuple 快取作廢。"""
+        self._rows = None
+
+    def set_fields(self, rows, **values):
+        """把 rows (索引陣列或切片) 這些列的欄位改成 values (欄位陣列的編碼,見 column());
+        只重建受影響列的 tuple 快取。"""
+        for name, column_values in values.items():
+            self.column(name)[rows] = column_values
+        if self._rows is not None:
+            indices = range(self._count)[rows] if isinstance(rows, slice) else np.asarray(rows).tolist()
+            if len(indices) * 4 > self._count:
+                self._rows = None
+            else:
+                for index in indices:
+                    self._rows[index] = self._row(index)
+
+    def intern_texture(self, tex_file):
+        if tex_file is None:
+            return -1
+        code = self._tex_lookup.get(tex_file)
+        if code is None:
+            code = len(self._tex_names)
+            self._tex_names.append(tex_file)
+            self._tex_lookup[tex_file] = code
+        return code
+
+    def copy(self):
+        self._flush()
+        duplicate = ObjectStore(self.obj_type)
+        duplicate._count = self._count
+        duplicate._floats = self._floats[:self._count].copy()
+        duplicate._ints = self._ints[:self._count].copy()
+        duplicate._row_lengths = self._row_lengths[:self._count].copy()
+        duplicate._line_ids = list(self._line_ids)
+        duplicate._tex_names = list(self._tex_names)
+        duplicate._tex_lookup = dict(self._tex_lookup)
+        return duplicate
+
+    def raw_columns(self):
+        """匯出原始欄位:(floats, ints, row_lengths, line_ids, tex_names);陣列不複製。"""
+        self._flush()
+        return (self._floats[:self._count], self._ints[:self._count], self._row_lengths[:self._count],
+                list(self._line_ids), list(self._tex_names))
+
+    @classmethod
+    def from_columns(cls, obj_type, floats, ints, row_lengths, line_ids, tex_names):
+        """由 raw_columns() 的內容直接組回 ObjectStore (陣列直接採用,不複製)。"""
+        store = cls(obj_type)
+        store._count = len(row_lengths)
+        store._floats = floats
+        store._ints = ints
+        store._row_lengths = row_lengths
+        store._line_ids = list(line_ids)
+        store._tex_names = list(tex_names)
+        store._tex_lookup = {name: code for code, name in enumerate(store._tex_names)}
+        return store
+
+    def extend_store(self, other):
+        """整批接上另一個同類型 ObjectStore 的欄位 (紋理代號會重新對應)。"""
+        other._flush()
+        self._flush()
+        if other._count == 0:
+            return
+        other_ints = other._ints[:other._count].copy()
+        tex_columns = [column for (kind, column) in self._layout.slots if kind == "tex"]
+        if tex_columns and other._tex_names:
+            remap = np.array([self.intern_texture(name) for name in other._tex_names] + [-1], dtype=np.int64)
+            for column in tex_columns:
+                other_ints[:, column] = remap[other_ints[:, column]]
+        start = self._reserve(other._count)
+        self._floats[start:self._count] = other._floats[:other._count]
+        self._ints[start:self._count] = other_ints
+        self._row_lengths[start:self._count] = other._row_lengths[:other._count]
+        self._line_ids.extend(other._line_ids)
+        self._rows = None
+
+    def append_columns(self, line_ids, row_length=None, **values):
+        """整批附加 len(line_ids) 列,values 為 {欄位名: 陣列或單一值}:浮點/整數欄給數值,
+        tex 欄給檔名,id 欄給整數或 None。未給的欄位為 None / 0 / False;
+        row_length 為組回 tuple 的長度 (預設完整長度)。"""
+        count = len(line_ids)
+        if count == 0:
+            return
+        self._flush()
+        layout = self._layout
+        start = self._reserve(count)
+        end = self._count
+        for (name, _kind), (kind, column) in zip(layout.fields, layout.slots):
+            if kind == "type":
+                continue
+            value = values.pop(name, None)
+            if kind == "f":
+                self._floats[start:end, column] = 0.0 if value is None else value
+            elif kind == "tex":
+                if value is None or isinstance(value, str):
+                    self._ints[start:end, column] = self.intern_texture(value)
+                else:
+                    intern = self.intern_texture
+                    self._ints[start:end, column] = [intern(tex_name) for tex_name in value]
+            elif value is None:
+                self._ints[start:end, column] = -1 if kind == "id" else 0
+            elif kind == "bool":
+                self._ints[start:end, column] = np.asarray(value, dtype=bool)
+            else:
+                self._ints[start:end, column] = value
+        if values:
+            raise KeyError(f"{self.obj_type} 沒有欄位 {sorted(values)}")
+        self._row_lengths[start:end] = row_length or layout.full_length
+        self._line_ids.extend(line_ids)
+        self._rows = None
+
+    # --- 內部 ---
+    def _reserve(self, extra):
+        """多保留 extra 列,回傳新列的起始索引。"""
+        start = self._count
+        needed = start + extra
+        capacity = len(self._row_lengths)
+        if needed > capacity:
+            new_capacity = max(needed, capacity * 2, 16)
+            floats = np.zeros((new_capacity, self._floats.shape[1]), dtype=np.float64)
+            ints = np.full((new_capacity, self._ints.shape[1]), -1, dtype=np.int64)
+            row_lengths = np.zeros(new_capacity, dtype=np.int8)
+            floats[:start] = self._floats[:start]
+            ints[:start] = self._ints[:start]
+            row_lengths[:start] = self._row_lengths[:start]
+            self._floats, self._ints, self._row_lengths = floats, ints, row_lengths
+        self._count = needed
+        return start
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = []
+        start = self._reserve(len(pending))
+        self._line_ids.extend(line_id for line_id, _obj_data in pending)
+        self._write_rows(start, [obj_data for _line_id, obj_data in pending])
+
+    def _splice(self, start, stop, entries):
+        """把 [start, stop) 這幾列換成 entries:只搬動 stop 之後的欄位,其餘列不重新編碼;
+        尾端 (stop == 列數) 不需搬動。tuple 快取只重建新列。"""
+        removed = stop - start
+        added = len(entries)
+        tail = self._count - stop
+        if added > removed:
+            self._reserve(added - removed)
+        else:
+            self._count -= removed - added
+        if tail and added != removed:
+            new_stop = start + added
+            for array in (self._floats, self._ints, self._row_lengths):
+                array[new_stop:new_stop + tail] = array[stop:stop + tail] # numpy 會處理重疊
+        self._line_ids[start:stop] = [line_id for line_id, _obj_data in entries]
+        if added:
+            self._write_rows(start, [obj_data for _line_id, obj_data in entries])
+        if self._rows is not None:
+            self._rows[start:stop] = self._rows_from_columns(start, start + added)
+
+    def _write_rows(self, start, rows):
+        layout = self._layout
+        full_length = layout.full_length
+        end = start + len(rows)
+        lengths = [len(row) for row in rows]
+        if max(lengths) > full_length:
+            raise ValueError(f"{self.obj_type} 資料欄位過多 (最多 {full_length} 欄)")
+        padding = layout.padding
+        padded = [row if len(row) == full_length else tuple(row) + padding[len(row):] for row in rows]
+        values_by_field = list(zip(*padded))
+        for index, (kind, column) in enumerate(layout.slots):
+            values = values_by_field[index]
+            if kind == "type":
+                continue
+            if kind == "f":
+                self._floats[start:end, column] = values
+            elif kind == "i":
+                self._ints[start:end, column] = values
+            elif kind == "bool":
+                self._ints[start:end, column] = [1 if value else 0 for value in values]
+            elif kind == "id":
+                self._ints[start:end, column] = [-1 if value is None else int(value) for value in values]
+            else: # tex
+                self._ints[start:end, column] = [self.intern_texture(value) for value in values]
+        self._row_lengths[start:end] = lengths
+
+    def _column_values(self, kind, column, start, end):
+        if kind == "f":
+            return self._floats[start:end, column].tolist()
+        values = self._ints[start:end, column].tolist()
+        if kind == "i":
+            return values
+        if kind == "bool":
+            return [value != 0 for value in values]
+        if kind == "id":
+            return [None if value < 0 else value for value in values]
+        names = self._tex_names
+        return [None if value < 0 else names[value] for value in values]
+
+    def _rows_from_columns(self, start, end):
+        layout = self._layout
+        count = end - start
+        if count <= 0:
+            return []
+        columns = []
+        for kind, column in layout.slots:
+            if kind == "type":
+                columns.append((self.obj_type,) * count)
+            else:
+                columns.append(self._column_values(kind, column, start, end))
+        rows = list(zip(*columns))
+        full_length = layout.full_length
+        for k, length in enumerate(self._row_lengths[start:end].tolist()):
+            if length != full_length:
+                rows[k] = rows[k][:length]
+        return list(zip(self._line_ids[start:end], rows))
+
+    def _row(self, index):
+        return self._rows_from_columns(index, index + 1)[0]
+
+    def _materialize(self):
+        self._flush()
+        if self._rows is None:
+            self._rows = self._rows_from_columns(0, self._count)
+        return self._rows
+
+    def _reset(self, entries):
+        self._count = 0
+        self._line_ids = []
+        self._pending = list(entries)
+        self._rows = None
+        self._flush()
+
+
+def _object_extents(store):
+    """依物件類型回傳 (錨點到水平邊界的最大距離, 錨點往上的高度),各為 (N,) 陣列;球體的高度不使用。"""
+    obj_type = store.obj_type
+    col = store.column
+    if obj_type == "building": # 錨點在底部中心
+        return np.hypot(col("w"), col("d")) / 2, col("h")
+    if obj_type == "cylinder":
+        return col("radius").copy(), col("h")
+    if obj_type == "tree": # 十字交叉的看板,寬度為高度的 0.6 倍
+        return col("h") * 0.3, col("h")
+    if obj_type == "sphere":
+        return col("radius").copy(), np.zeros(len(store))
+    if obj_type == "hill": # 錨點在底部中心
+        return col("radius").copy(), col("h")
+    if obj_type == "gableroof": # 錨點在屋簷高度的基底中心,含懸挑
+        return (np.hypot(col("w") / 2 + np.abs(col("eave_x")), col("d") / 2 + np.abs(col("eave_z"))),
+                col("ridge_h"))
+    if obj_type == "flexroof":
+        half_w = np.maximum(col("w"), col("top_w") + 2 * np.abs(col("top_offset_x"))) / 2
+        half_d = np.maximum(col("d"), col("top_d") + 2 * np.abs(col("top_offset_z"))) / 2
+        return np.hypot(half_w, half_d), col("h")
+    raise ValueError(f"未知的物件類型: {obj_type}")
+
+
+class Bounds(namedtuple("Bounds", "min max")):
+    """軸對齊包圍盒;min / max 為 (x, y, z) 的 NumPy 陣列。空集合以 None 表示,不建立 Bounds。"""
+    __slots__ = ()
+
+    @classmethod
+    def from_boxes(cls, mins, maxs):
+        """一組 (N, 3) 包圍盒的聯集;N 為 0 時回傳 None。"""
+        if len(mins) == 0:
+            return None
+        return cls(mins.min(axis=0), maxs.max(axis=0))
+
+    @property
+    def size(self):
+        return self.max - self.min
+
+    @property
+    def center(self):
+        return (self.min + self.max) / 2
+
+    @property
+    def diagonal(self):
+        return float(np.linalg.norm(self.max - self.min))
+
+    def union(self, other):
+        if other is None:
+            return self
+        return Bounds(np.minimum(self.min, other.min), np.maximum(self.max, other.max))
+
+    def expanded(self, margin):
+        return Bounds(self.min - margin, self.max + margin)
+
+    def farthest_distance(self, point):
+        """point 到包圍盒內最遠一點的距離 (用來決定遠裁切面)。"""
+        point = np.asarray(point, dtype=float)
+        return float(np.linalg.norm(np.maximum(np.abs(self.min - point), np.abs(self.max - point))))
+
+
+def union_bounds(bounds_iterable):
+    """多個 Bounds (可含 None) 的聯集;全部為空時回傳 None。"""
+    result = None
+    for bounds in bounds_iterable:
+        if bounds is not None:
+            result = bounds if result is None else result.union(bounds)
+    return result
+
+
+def object_list_property(list_name):
+    """Scene 的物件列表屬性:讀取得到 ObjectStore,指定列表時轉成 ObjectStore。"""
+    obj_type = OBJECT_LIST_TYPES[list_name]
+    storage_attr = "_" + list_name
+
+    def getter(scene):
+        return scene.__dict__[storage_attr]
+
+    def setter(scene, entries):
+        if not (isinstance(entries, ObjectStore) and entries.obj_type == obj_type):
+            entries = ObjectStore(obj_type, entries)
+        scene.__dict__[storage_attr] = entries
+
+    return property(getter, setter, doc=f"{obj_type} 物件的欄式儲存 (ObjectStore)")
+
+
+# array 指令可以重複放置的物件類型 → Scene 列表名;這些類型都有 VBO 網格,可以 instanced 繪製
+INSTANCE_ARRAY_TYPES = {
+    "building": "buildings",
+    "cylinder": "cylinders",
+    "sphere": "spheres",
+    "tree": "trees",
+}
+
+
+class InstanceArray:
+    """
+    array 指令產生的實例陣列:同一個物件放 N 份,只存一份物件 tuple 與每份的位移。
+      template  第 0 份的物件 tuple (世界座標,欄位同 OBJECT_SCHEMAS)
+      offsets   (N, 3) 每份相對 template 位置的世界座標位移 (第 0 列為 0)
+    GL 緩衝區 (共用網格的 vao/vbo、每份位移的 instance_vbo) 由 renderer.create_instance_array_buffers 建立,
+    一次 instanced draw 畫完全部 N 份。Scene.instance_arrays 存 (line_identifier, InstanceArray)。
+    """
+
+    def __init__(self, list_name, template, offsets):
+        self.list_name = list_name
+        self.obj_type = OBJECT_LIST_TYPES[list_name]
+        self.template = tuple(template)
+        self.offsets = np.asarray(offsets, dtype=np.float64).reshape(-1, 3)
+        self.vao = None
+        self.vbo = None
+        self.instance_vbo = None
+        self.vertex_count = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return f"InstanceArray({self.obj_type!r}, {len(self)} 份)"
+
+    def field(self, name):
+        return self.template[FIELD_INDEX[self.obj_type][name]]
+
+    def has_field(self, name):
+        return name in FIELD_INDEX[self.obj_type]
+
+    @property
+    def origin(self):
+        """第 0 份的世界座標位置。"""
+        return np.array([self.field("x"), self.field("y"), self.field("z")], dtype=np.float64)
+
+    @property
+    def positions(self):
+        """每一份的世界座標位置,(N, 3) 陣列。"""
+        return self.origin + self.offsets
+
+    def with_fields(self, **values):
+        """回傳換掉部分 template 欄位的複本 (位移共用,GL 緩衝區一併帶過去)。"""
+        new_template = list(self.template)
+        for name, value in values.items():
+            new_template[FIELD_INDEX[self.obj_type][name]] = value
+        duplicate = InstanceArray(self.list_name, new_template, self.offsets)
+        duplicate.vao, duplicate.vbo = self.vao, self.vbo
+        duplicate.instance_vbo, duplicate.vertex_count = self.instance_vbo, self.vertex_count
+        return duplicate
+
+    def without_buffers(self):
+        return InstanceArray(self.list_name, self.template, self.offsets)
+
+    def entries(self, line_id):
+        """展開成 N 個 (line_id, tuple),每份只有 x/y/z 不同 (供小地圖等逐物件處理的地方使用)。"""
+        field_index = FIELD_INDEX[self.obj_type]
+        x_index, z_index = field_index["x"], field_index["z"]
+        head, tail = self.template[:x_index], self.template[z_index + 1:]
+        return [(line_id, head + tuple(position) + tail) for position in self.positions.tolist()]
+
+    def bounds(self):
+        """全部 N 份的軸對齊包圍盒 (Bounds)。"""
+        mins, maxs = ObjectStore(self.obj_type, [(None, self.template)]).object_bounds()
+        return Bounds(mins[0] + self.offsets.min(axis=0), maxs[0] + self.offsets.max(axis=0))
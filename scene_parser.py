@@ -1,10 +1,20 @@
 # scene_parser.py
 import os
 import sys
+import copy
+import hashlib
+import pickle
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import numpy as math # Keep consistent
 # import math # Original import removed
-from track import StraightTrack, CurveTrack, Track, TrackSegment, INTERPOLATION_STEPS 
+from track import StraightTrack, CurveTrack, Track, TrackSegment
+import scene_objects
+import scene_watcher
+import scene_diagnostics
 import renderer
 
 # --- Texture loading dependency ---
@@ -16,52 +26,185 @@ def set_texture_loader(loader):
     global texture_loader
     texture_loader = loader
 
+# --- 延後的紋理載入 ---
+# 解析時只記錄用到的紋理檔名 (scene.pending_texture_files);頂層解析結束後由
+# _load_pending_textures 去重、交給 texture_loader.preload_textures 平行解碼並一次上傳,
+# 再把 GL 紋理 ID 填回物件與 skydome。
+def _request_texture(scene_to_populate, tex_file, load_textures):
+    if load_textures and texture_loader and tex_file:
+        scene_to_populate.pending_texture_files[tex_file] = None
+
+def _resolve_track_placements(scene, load_textures):
+    """
+    解析 scene.track_placements (along 指令):全部的軌道距離一次交給 Track.positions_orientations_at
+    算出位置與朝向,再以該處 (加上橫向偏移) 為相對原點解析各自的物件指令;物件接在各物件列表最後。
+    """
+    scene.placed_object_starts = {name: len(getattr(scene, name)) for name in _PLACED_LIST_NAMES}
+    placements = scene.track_placements
+    if not placements:
+        return
+    distances = np.array([placement[1] for placement in placements], dtype=float)
+    lateral_offsets = np.array([placement[2] for placement in placements], dtype=float)
+    positions, forwards = scene.track.positions_orientations_at(distances)
+    angles = np.arctan2(forwards[:, 1], forwards[:, 0])
+    # 橫向偏移與物件的 rel_x 同向:世界位移 (sin a, 0, -cos a)
+    positions[:, 0] += lateral_offsets * np.sin(angles)
+    positions[:, 2] -= lateral_offsets * np.cos(angles)
+
+    saved_origin = (scene.current_relative_origin_pos, scene.current_relative_origin_angle_rad)
+    try:
+        for placement, position, angle in zip(placements, positions, angles.tolist()):
+            _line_id, _distance, _lateral, object_line, file_directory, display_name, is_imported, line_num = placement
+            scene.current_relative_origin_pos = position
+            scene.current_relative_origin_angle_rad = angle
+            _parse_scene_content([object_line], scene, file_directory, display_name, set(),
+                                 is_imported, load_textures=load_textures, first_line_number=line_num)
+    finally:
+        scene.current_relative_origin_pos, scene.current_relative_origin_angle_rad = saved_origin
+
+def _load_pending_textures(scene):
+    """載入解析期間記錄的紋理,並填入還沒有紋理 ID 的物件與 skydome。"""
+    requested = scene.pending_texture_files
+    if not requested:
+        return
+    scene.pending_texture_files = {}
+    if texture_loader is None:
+        return
+    texture_loader.preload_textures(requested)
+    resolve = _texture_resolver()
+    for list_name in _OBJECT_LIST_NAMES:
+        store = getattr(scene, list_name)
+        if store:
+            _assign_store_textures(store, resolve, only_files=requested)
+    _assign_array_textures(scene, resolve, only_files=requested)
+    for info in _background_infos(scene):
+        if info.get('type') == 'skydome' and info.get('id') is None and info.get('file') in requested:
+            info['id'] = resolve(info.get('file'))[0]
+
 # --- REMOVED: set_renderer_module function ---
 
-# --- Command Hints Dictionary (Update) ---
-# Used by the editor to display parameter names
-COMMAND_HINTS = {
-    "map": ["    cmd    ", "file", "cx", "cz", "scale"],
-    "latlon": ["    cmd    ", "lat°", "lon°"],
-    "start": ["    cmd    ", "x", "y", "z", "angle°"],
-    "skybox": ["    cmd    ", "base_name"], 
-    "skydome": ["    cmd    ", "texture_file"], 
-    "straight": ["    cmd    ", "length", "grad‰"],
-    "curve": ["    cmd    ", "radius", "angle°", "grad‰"],
-    "vbranch": ["    cmd    ", "type(straight/curve)", "p1(angle°/radius)", "p2(length/angle°)", "grad‰?", "dir(fwd/bwd)?"], 
-    "building": ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "w", "d", "h", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
-    "cylinder": ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "rad", "h", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
-    "tree": ["    cmd    ", "rel_x", "rel_y", "rel_z", "height", "tex?"],
-    "sphere": ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "radius", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
-    "hill": ["    cmd    ", "cx", "base_y", "cz", "radius", "peak_h_off", "tex?", "uSc?", "vSc?", "uOf?", "vOf?"], # <--- 新增這一行
-    "import": ["    cmd    ", "filepath", "x?/lat°", "y?/lon°", "rel_z?", "rel_angle°?"], # 檔名後恰兩個數=經緯度形式(需母場景 latlon 錨點)
-    # Add other commands if they exist
-    "gableroof": [
-    "    cmd    ",        # 0
-    "rel_x",              # 1: 相對於軌道原點的X偏移
-    "rel_y",              # 2: 屋簷底部/牆體頂部的Y座標 (相對於軌道原點Y)
-    "rel_z",              # 3: 相對於軌道原點的Z偏移
-    "abs_rx?",            # 4: 繞X軸的絕對旋轉 (俯仰，可選，預設0)
-    "abs_ry",             # 5: 繞Y軸的絕對旋轉 (朝向，必需)
-    "abs_rz?",            # 6: 繞Z軸的絕對旋轉 (側滾，可選，預設0)
-    "base_width",         # 7: 屋頂基底寬度 (沿屋頂局部X軸)
-    "base_length",        # 8: 屋頂基底長度 (沿屋頂局部Z軸，即屋脊方向)
-    "ridge_height_offset",# 9: 屋脊相對於屋簷(rel_y)的高度差
-    # --- 可選參數從索引 10 開始 ---
-    "ridge_x_pos_offset?",# 10: 非對稱屋脊的X偏移 (相對於基底寬度中心，預設0)
-    "eave_overhang_x?",   # 11: X方向的屋簷懸挑 (預設0)
-    "eave_overhang_z?",   # 12: Z方向的屋簷懸挑 (預設0)
-    "texture_atlas?",     # 13: 使用的紋理圖集檔名 (預設 "default_roof_atlas.png")
-    # "alpha_threshold?" # 14: 可選的Alpha測試閾值 (如果想讓用戶指定)
-    ],
-    "flexroof": ["    cmd    ", "rel_x", "rel_y", "rel_z", "abs_rx°?", "abs_ry°", "abs_rz°?", # 定位與旋轉 (abs_rx, abs_rz 可選)
-                 "base_w", "base_l", "top_w", "top_l", "height",                       # 核心幾何
-                 "top_off_x?", "top_off_z?",                                           # 上底偏移 (可選)
-                 "texture_atlas?"],                                                    # 紋理圖集 (可選)    
-}
+# --- 場景指令登錄表 ---
+# 指令名稱 → SceneCommand:參數表 (編輯器的參數提示)、逐行解析函式,物件指令另可附整批轉換規格
+# (連續的同類行整段轉成欄位陣列寫進 ObjectStore,見 _BULK_OBJECT_SPECS)。_parse_scene_content 以指令名稱
+# 查表分派;新指令以 register_scene_command 登錄即可,不必改解析迴圈。各指令的登錄見檔案後段。
+class SceneCommand:
+    """
+    一個場景指令的處理器。
+    params: 參數表 (第一個固定為 "    cmd    ",選填參數以 ? 結尾),即編輯器的 COMMAND_HINTS;
+    parse_line(ctx, parts): 解析單行並加入 ctx.scene;bulk: 整批轉換規格 (None 表示只逐行解析);
+    is_object: 只產生物件、不改變解析狀態 (增量解析與 prefab 依此判斷);track_placeable: 可接在 along 之後。
+    """
+    __slots__ = ("name", "params", "parse_line", "bulk", "is_object", "track_placeable")
+
+    def __init__(self, name, params, parse_line, bulk=None, is_object=False, track_placeable=None):
+        self.name = name
+        self.params = params
+        self.parse_line = parse_line
+        self.bulk = bulk
+        self.is_object = is_object
+        self.track_placeable = is_object if track_placeable is None else track_placeable
+
+SCENE_COMMANDS = {}
+# Used by the editor to display parameter names (與 SCENE_COMMANDS 的參數表同步,由 register_scene_command 填入)
+COMMAND_HINTS = {}
+_OBJECT_COMMANDS = set()
+_TRACK_PLACEABLE_COMMANDS = set()
+
+def register_scene_command(name, parse_line, params, bulk=None, is_object=False, track_placeable=None):
+    """登錄 (或取代) 一個場景指令,回傳其 SceneCommand。"""
+    command = SceneCommand(name.lower(), params, parse_line, bulk, is_object, track_placeable)
+    SCENE_COMMANDS[command.name] = command
+    COMMAND_HINTS[command.name] = command.params
+    _OBJECT_COMMANDS.discard(command.name)
+    _TRACK_PLACEABLE_COMMANDS.discard(command.name)
+    if command.is_object:
+        _OBJECT_COMMANDS.add(command.name)
+    if command.track_placeable:
+        _TRACK_PLACEABLE_COMMANDS.add(command.name)
+    return command
+
+class SceneParseContext:
+    """逐行解析時交給指令處理器的狀態:要加入的場景、所在檔案,以及目前這一行的行號、物件識別碼與指令名稱。"""
+    __slots__ = ("scene", "file_dir", "filename", "imported_files", "is_imported", "load_textures",
+                 "line_num", "line_id", "command")
+
+    def __init__(self, scene, file_dir, filename, imported_files, is_imported, load_textures):
+        self.scene = scene
+        self.file_dir = file_dir
+        self.filename = filename
+        self.imported_files = imported_files
+        self.is_imported = is_imported
+        self.load_textures = load_textures
+        self.line_num = 0
+        self.line_id = None
+        self.command = None
+
+
+# --- 經緯度 ↔ 世界座標 ---
+# 世界軸向 +X=西、+Z=北(由 scene.txt 淡水線實景校準,見 docs/osm_buildings_research.md)
+GEO_METERS_PER_DEG_LAT = 110540.0
+GEO_METERS_PER_DEG_LON_EQUATOR = 111320.0
+GEO_TRANSFORM_CACHE_SIZE = 16
+
+# array 指令的份數上限:打錯的巨大份數 (例如多打幾個 0) 會配置數 GB 的位移陣列與 instance VBO,超過時警告並略過該行
+ARRAY_MAX_COUNT = 100000
+
+class GeoTransform:
+    """
+    單一錨點 (ax, az, lat0, lon0) 的局部 ENU 轉換(等距圓柱近似):每度經緯的公尺數在建構時算好,
+    之後純量與陣列換算共用同一組係數。陣列版接受任意形狀的輸入,逐元素換算後回傳同形狀的 float64 陣列。
+    """
+    __slots__ = ("anchor", "ax", "az", "lat0", "lon0", "meters_per_deg_lat", "meters_per_deg_lon")
+
+    def __init__(self, anchor):
+        self.anchor = tuple(float(v) for v in anchor)
+        self.ax, self.az, self.lat0, self.lon0 = self.anchor
+        self.meters_per_deg_lat = GEO_METERS_PER_DEG_LAT
+        self.meters_per_deg_lon = GEO_METERS_PER_DEG_LON_EQUATOR * float(np.cos(np.radians(self.lat0)))
+
+    def latlon_to_en(self, lat, lon):
+        """(lat, lon) → 相對錨點的 (東, 北) 公尺。"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return (lon - self.lon0) * self.meters_per_deg_lon, (lat - self.lat0) * self.meters_per_deg_lat
+
+    def world_to_latlon(self, wx, wz):
+        """世界座標陣列 → (lat, lon) 陣列。"""
+        wx = np.asarray(wx, dtype=np.float64)
+        wz = np.asarray(wz, dtype=np.float64)
+        return (self.lat0 + (wz - self.az) / self.meters_per_deg_lat,
+                self.lon0 - (wx - self.ax) / self.meters_per_deg_lon)
+
+    def latlon_to_world(self, lat, lon):
+        """(lat, lon) 陣列 → 世界座標 (wx, wz) 陣列;+X=西,所以 wx = ax - 東。"""
+        east, north = self.latlon_to_en(lat, lon)
+        return self.ax - east, self.az + north
+
+_geo_transform_cache = {}
+
+def get_geo_transform(anchor):
+    """取得錨點對應的 GeoTransform(依錨點值快取,同一錨點重複換算不必重算係數);anchor 為 None 時回傳 None。"""
+    if anchor is None: return None
+    key = tuple(float(v) for v in anchor)
+    transform = _geo_transform_cache.get(key)
+    if transform is None:
+        if len(_geo_transform_cache) >= GEO_TRANSFORM_CACHE_SIZE:
+            _geo_transform_cache.pop(next(iter(_geo_transform_cache)))
+        transform = _geo_transform_cache[key] = GeoTransform(key)
+    return transform
 
 class Scene:
     """儲存場景物件"""
+    # 物件列表以欄式 ObjectStore 儲存 (見 scene_objects.py),仍可當 (line_id, tuple) 列表使用;
+    # 指定一般列表時會自動轉換
+    buildings = scene_objects.object_list_property("buildings")
+    cylinders = scene_objects.object_list_property("cylinders")
+    trees = scene_objects.object_list_property("trees")
+    spheres = scene_objects.object_list_property("spheres")
+    hills = scene_objects.object_list_property("hills")
+    gableroofs = scene_objects.object_list_property("gableroofs")
+    flexroofs = scene_objects.object_list_property("flexroofs")
+
     def __init__(self):
         self.track = Track()
         # Store ABSOLUTE world coordinates and rotations
@@ -108,6 +251,13 @@ class Scene:
         self.gableroofs = []
         
         self.flexroofs = [] # 新增 flexroofs 列表
+        # array 指令的實例陣列: [(line_id, scene_objects.InstanceArray), ...]
+        self.instance_arrays = []
+        # along 指令: [(line_id, 軌道距離, 橫向偏移, 物件指令行, 檔案目錄, 顯示檔名, 是否導入檔, 行號), ...]
+        # 整份解析完才由 _resolve_track_placements 一次算出位置,放出的物件接在各物件列表最後;
+        # placed_object_starts 為 {列表名: 放出的物件起始索引},尚未放置時為 None
+        self.track_placements = []
+        self.placed_object_starts = None
 
         self.embedded_editor_settings_str = None
 
@@ -117,27 +267,57 @@ class Scene:
         self.geo_anchor = None
         # 解析期狀態:經緯度 import 上下文中,子場景 map 行的平移量
         self.current_map_offset = (0.0, 0.0)
-
-    # 世界軸向 +X=西、+Z=北(由 scene.txt 淡水線實景校準,見 docs/osm_buildings_research.md)
-    GEO_METERS_PER_DEG_LAT = 110540.0
-    GEO_METERS_PER_DEG_LON_EQUATOR = 111320.0
+        # 解析時讀到(或嘗試讀取)的所有場景檔: {絕對路徑: 內容雜湊 或 None(不存在)},根檔在前;
+        # 編譯快取以此驗證
+        self.source_files = {}
+        # 以 prefab 方式導入的子場景實例:
+        # (檔案絕對路徑, 原點 (x, y, z), 角度 rad, {列表名: (起始索引, 結束索引)})
+        self.import_instances = []
+        # 解析期間用到、尚未載入的紋理檔名 (當作有序集合的 dict)
+        self.pending_texture_files = {}
+        # 解析完成時算好的包圍盒與統計 (SceneStats);解析中或尚未解析為 None
+        self.stats = None
+
+    def iter_objects(self, list_name):
+        """逐一產生該類物件的 (line_id, tuple),含實例陣列展開的每一份 (供小地圖等逐物件處理的地方使用)。"""
+        yield from getattr(self, list_name)
+        for line_id, instance_array in self.instance_arrays:
+            if instance_array.list_name == list_name:
+                yield from instance_array.entries(line_id)
+
+    GEO_METERS_PER_DEG_LAT = GEO_METERS_PER_DEG_LAT
+    GEO_METERS_PER_DEG_LON_EQUATOR = GEO_METERS_PER_DEG_LON_EQUATOR
+
+    def geo_transform(self):
+        """目前錨點的 GeoTransform(快取);沒有錨點時回傳 None。"""
+        return get_geo_transform(self.geo_anchor)
 
     def world_to_latlon(self, wx, wz):
         """世界座標 → (lat, lon);沒有錨點時回傳 None。"""
-        if self.geo_anchor is None: return None
-        ax, az, lat0, lon0 = self.geo_anchor
-        lat = lat0 + (wz - az) / self.GEO_METERS_PER_DEG_LAT
-        lon = lon0 - (wx - ax) / (self.GEO_METERS_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat0)))
+        transform = self.geo_transform()
+        if transform is None: return None
+        lat, lon = transform.world_to_latlon(wx, wz)
         return float(lat), float(lon)
 
     def latlon_to_world(self, lat, lon):
         """(lat, lon) → 世界座標 (wx, wz);沒有錨點時回傳 None。"""
-        if self.geo_anchor is None: return None
-        ax, az, lat0, lon0 = self.geo_anchor
-        wz = az + (lat - lat0) * self.GEO_METERS_PER_DEG_LAT
-        wx = ax - (lon - lon0) * self.GEO_METERS_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat0))
+        transform = self.geo_transform()
+        if transform is None: return None
+        wx, wz = transform.latlon_to_world(lat, lon)
         return float(wx), float(wz)
 
+    def world_to_latlon_array(self, wx, wz):
+        """世界座標陣列 → (lat 陣列, lon 陣列),一次換算整批點;沒有錨點時回傳 None。"""
+        transform = self.geo_transform()
+        if transform is None: return None
+        return transform.world_to_latlon(wx, wz)
+
+    def latlon_to_world_array(self, lat, lon):
+        """(lat 陣列, lon 陣列) → (wx 陣列, wz 陣列),一次換算整批點 (如 GPS 軌跡);沒有錨點時回傳 None。"""
+        transform = self.geo_transform()
+        if transform is None: return None
+        return transform.latlon_to_world(lat, lon)
+
     def clear(self):
         self.track.clear()
         self.buildings = []
@@ -166,8 +346,15 @@ class Scene:
         self.embedded_editor_settings_str = None
         self.gableroofs = []
         self.flexroofs = [] # 清空 flexroofs
+        self.instance_arrays = []
+        self.track_placements = []
+        self.placed_object_starts = None
         self.geo_anchor = None
         self.current_map_offset = (0.0, 0.0)
+        self.source_files = {}
+        self.import_instances = []
+        self.pending_texture_files = {}
+        self.stats = None
 
     def clear_content(self): # 用於清空場景內容，但不一定釋放 OpenGL 資源
         self.track = Track() # 創建一個新的空軌道
@@ -178,6 +365,9 @@ class Scene:
         self.hills = []
         self.gableroofs = []
         self.flexroofs = []
+        self.instance_arrays = []
+        self.track_placements = []
+        self.placed_object_starts = None
         # ... (清空其他列表) ...
         self.map_filename = None
         # ...
@@ -186,6 +376,8 @@ class Scene:
         self.is_render_ready = False
         self.geo_anchor = None
         self.current_map_offset = (0.0, 0.0)
+        self.import_instances = []
+        self.stats = None
 
     def cleanup_resources(self):
         """清理與此場景相關的 OpenGL 資源，主要是軌道緩衝區。"""
@@ -193,7 +385,7 @@ class Scene:
             self.track.clear() # Track.clear() 應負責清理其 VBOs/VAOs
         # 如果 Scene 還管理其他 OpenGL 資源（例如，直接的紋理ID列表），也在此清理
 #         self.is_render_ready = False
-        print(f"Scene resources cleaned up.")
+        scene_diagnostics.debug("Scene resources cleaned up.")
 
 #     def populate_from_lines(self, lines_list, load_textures=True):
 #         """用解析器填充此 Scene 實例的內容。會先清空現有內容。"""
@@ -238,7 +430,7 @@ class Scene:
             elif not hasattr(segment, 'is_buffer_ready'):
                 # 如果 TrackSegment 沒有 is_buffer_ready 屬性，我們無法確定，保守返回 False
                 # 或者，如果 create_all_segment_buffers 總能保證成功，這裡可以假設 True
-                print(f"警告: TrackSegment (來源: {segment.source_line_number})缺少 is_buffer_ready 屬性。")
+                scene_diagnostics.warning(f"TrackSegment (來源: {segment.source_line_number})缺少 is_buffer_ready 屬性。")
                 return False 
         return True # 所有軌道段都準備好了
 #     def prepare_for_render(self):
@@ -268,6 +460,133 @@ class Scene:
 #         # 小地圖烘焙也可以考慮作為 prepare_for_render 的一部分，或者由外部調用
 #         # minimap_renderer.bake_static_map_elements(self)
         
+# --- 場景包圍盒與統計 ---
+# 頂層解析結束時算一次存在 scene.stats,遠裁切面、小地圖烘焙範圍、整類物件的視錐體剔除
+# 與載入進度估計都直接取用,不必各自掃描所有物件。
+class SceneStats:
+    """
+    場景的世界座標包圍盒 (scene_objects.Bounds,空集合為 None) 與數量統計:
+      bounds          整個場景 (物件 + 軌道)
+      type_bounds     {列表名: Bounds},另有 "track" 為軌道
+      import_bounds   {導入檔名: Bounds},依物件行識別碼中的檔名分組 (根檔的物件不列入)
+      object_counts   {列表名: 物件數};import_object_counts 為 {導入檔名: 物件數}
+      vertex_counts   {列表名: 頂點數},只含有 VBO 網格的類型;"track" 為軌道頂點數
+      instance_counts {列表名: 實例陣列展開後的份數} (不計入 object_counts);instance_array_count 為陣列數
+      texture_count   物件與 skydome 引用的不同紋理檔數
+    """
+    def __init__(self):
+        self.bounds = None
+        self.type_bounds = {}
+        self.import_bounds = {}
+        self.object_counts = {}
+        self.import_object_counts = {}
+        self.vertex_counts = {}
+        self.instance_counts = {}
+        self.instance_array_count = 0
+        self.segment_count = 0
+        self.texture_count = 0
+
+    @property
+    def object_count(self):
+        return sum(self.object_counts.values())
+
+    @property
+    def vertex_count(self):
+        return sum(self.vertex_counts.values())
+
+    def summary(self):
+        counts = ", ".join(f"{name} {count}" for name, count in self.object_counts.items() if count)
+        text = f"{self.object_count} 個物件 ({counts or '無'}), {self.segment_count} 段軌道, " \
+               f"{self.vertex_count} 個頂點, {self.texture_count} 個紋理"
+        if self.instance_array_count:
+            text += f", {self.instance_array_count} 組實例陣列 ({sum(self.instance_counts.values())} 份)"
+        if self.bounds is not None:
+            size = self.bounds.size
+            text += f", 範圍 {size[0]:.0f} x {size[1]:.0f} x {size[2]:.0f}"
+        return text
+
+# 各類物件網格的頂點數與尺寸無關,第一次用到時由 renderer 的網格產生函數算出
+_mesh_vertex_counts = None
+
+def _get_mesh_vertex_counts():
+    global _mesh_vertex_counts
+    if _mesh_vertex_counts is None:
+        _mesh_vertex_counts = {
+            "buildings": renderer.generate_cube_mesh_data(1.0, 1.0, 1.0)[1],
+            "cylinders": renderer.generate_cylinder_mesh_data(1.0, 1.0)[1],
+            "trees": renderer.generate_tree_mesh_data(1.0)[1],
+            "spheres": renderer.generate_sphere_mesh_data(1.0)[1],
+            "hills": renderer.generate_hill_mesh_data(0.0, 0.0, 0.0, 1.0, 1.0)[1],
+        }
+    return _mesh_vertex_counts
+
+def compute_scene_stats(scene):
+    """由欄位陣列與軌道中心線算出 SceneStats (不需要 OpenGL)。"""
+    stats = SceneStats()
+    mesh_vertex_counts = _get_mesh_vertex_counts()
+    import_boxes = {} # {導入檔名: [(mins, maxs), ...]}
+    for list_name in _OBJECT_LIST_NAMES:
+        store = getattr(scene, list_name)
+        count = len(store)
+        stats.object_counts[list_name] = count
+        if list_name in mesh_vertex_counts:
+            stats.vertex_counts[list_name] = count * mesh_vertex_counts[list_name]
+        if count == 0:
+            continue
+        mins, maxs = store.object_bounds()
+        stats.type_bounds[list_name] = scene_objects.Bounds.from_boxes(mins, maxs)
+        # 導入檔的物件行識別碼為 "檔名:行號";同一檔案的物件通常連續,依連續區段分組
+        line_ids = store.line_ids
+        run_start = 0
+        run_file = None
+        for index in range(count + 1):
+            line_id = line_ids[index] if index < count else None
+            filename = line_id.rpartition(":")[0] if isinstance(line_id, str) else None
+            if index == count or filename != run_file:
+                if run_file is not None:
+                    import_boxes.setdefault(run_file, []).append((mins[run_start:index], maxs[run_start:index]))
+                run_start, run_file = index, filename
+    for filename, boxes in import_boxes.items():
+        stats.import_bounds[filename] = scene_objects.union_bounds(
+            scene_objects.Bounds.from_boxes(mins, maxs) for mins, maxs in boxes)
+        stats.import_object_counts[filename] = sum(len(mins) for mins, _ in boxes)
+    # 實例陣列:網格只有一份 (頂點數只算一次),包圍盒併入所屬類型與導入檔
+    stats.instance_array_count = len(scene.instance_arrays)
+    for line_id, instance_array in scene.instance_arrays:
+        list_name = instance_array.list_name
+        array_bounds = instance_array.bounds()
+        stats.instance_counts[list_name] = stats.instance_counts.get(list_name, 0) + len(instance_array)
+        if list_name in mesh_vertex_counts:
+            stats.vertex_counts[list_name] = stats.vertex_counts.get(list_name, 0) + mesh_vertex_counts[list_name]
+        stats.type_bounds[list_name] = scene_objects.union_bounds([stats.type_bounds.get(list_name), array_bounds])
+        if isinstance(line_id, str):
+            filename = line_id.rpartition(":")[0]
+            stats.import_bounds[filename] = scene_objects.union_bounds([stats.import_bounds.get(filename), array_bounds])
+
+    segments = scene.track.segments if scene.track else []
+    stats.segment_count = len(segments)
+    stats.vertex_counts["track"] = sum(segment.render_vertex_count() for segment in segments)
+    track_boxes = [box for box in (segment.centerline_bounds() for segment in segments) if box is not None]
+    if track_boxes:
+        stats.type_bounds["track"] = scene_objects.Bounds.from_boxes(
+            np.array([mins for mins, _ in track_boxes]), np.array([maxs for _, maxs in track_boxes]))
+    stats.bounds = scene_objects.union_bounds(stats.type_bounds.values())
+
+    tex_files = set()
+    for list_name in _OBJECT_LIST_NAMES:
+        store = getattr(scene, list_name)
+        if store:
+            tex_files.update(store.used_texture_names())
+    tex_files.update(instance_array.field("tex_file") for _, instance_array in scene.instance_arrays)
+    tex_files.update(info.get('file') for info in _background_infos(scene) if info.get('type') == 'skydome')
+    tex_files.discard(None)
+    stats.texture_count = len(tex_files)
+    return stats
+
+def _finish_scene_stats(scene):
+    scene.stats = compute_scene_stats(scene)
+    scene_diagnostics.debug(f"場景統計: {scene.stats.summary()}")
+
 # --- Global state for scene parsing ---
 scene_file_path = "scene.txt"
 last_modified_time = 0
@@ -276,7 +595,8 @@ current_scene = Scene()
 def _parse_scene_content(lines_list, scene_to_populate: Scene,
                          current_file_directory: str, current_filename_for_display: str,
                          imported_files: set,
-                         is_parsing_imported_file: bool, load_textures=True):
+                         is_parsing_imported_file: bool, load_textures=True,
+                         first_line_number=1):
     """
     Internal function to parse scene commands from a list of strings and populate a Scene object.
     Args:
@@ -286,13 +606,18 @@ def _parse_scene_content(lines_list, scene_to_populate: Scene,
                                 Used to resolve relative paths for 'import'.
         imported_files: A set of absolute filepaths already imported in the current chain, to prevent cycles.
         load_textures: Whether to load textures.
+        first_line_number: Line number of lines_list[0] in its file (used when re-parsing part of a file).
     Returns:
         The populated Scene object (same as scene_to_populate).
     """
     global texture_loader 
 
     if load_textures and texture_loader is None:
-        print("警告：Texture Loader 尚未設定！物件和 Skydome 紋理將不會被載入。")
+        scene_diagnostics.warning("Texture Loader 尚未設定！物件和 Skydome 紋理將不會被載入。")
+
+    # 這個檔案 import 的子場景先 (平行) 建好 prefab,下面逐行解析時依宣告順序合併
+    if len(lines_list) > 1:
+        _prefetch_import_prefabs(lines_list, current_file_directory, imported_files)
 
     # new_scene = Scene() # 不再創建新的，而是填充傳入的 scene_to_populate
 
@@ -336,7 +661,20 @@ def _parse_scene_content(lines_list, scene_to_populate: Scene,
     # --- 結束新增 ---
 
 
-    for line_num_in_file, line_content in enumerate(lines_list, 1): # line_num_in_file 是相對於當前檔案的行號
+    # 連續的同類物件行先整批轉換,迴圈走到區塊開頭時一次加入 (見 _parse_bulk_object_runs)
+    bulk_blocks = _parse_bulk_object_runs(lines_list, first_line_number, current_filename_for_display,
+                                          is_parsing_imported_file)
+    bulk_skip_until = first_line_number
+    ctx = SceneParseContext(scene_to_populate, current_file_directory, current_filename_for_display,
+                            imported_files, is_parsing_imported_file, load_textures)
+
+    for line_num_in_file, line_content in enumerate(lines_list, first_line_number): # line_num_in_file 是相對於當前檔案的行號
+        if line_num_in_file < bulk_skip_until:
+            continue
+        if line_num_in_file in bulk_blocks:
+            bulk_skip_until = _append_bulk_object_block(bulk_blocks[line_num_in_file], scene_to_populate,
+                                                        load_textures)
+            continue
         line = line_content.strip()
         
         # --- 新增：檢查是否是編輯器設定行 ---
@@ -351,9 +689,9 @@ def _parse_scene_content(lines_list, scene_to_populate: Scene,
                     # json_str = base64.b64decode(json_str_base64).decode('utf-8')
                     # scene_to_populate.embedded_editor_settings_str = json_str
                     scene_to_populate.embedded_editor_settings_str = json_str_base64 # 直接存儲
-                    print(f"資訊: 從場景檔案 '{current_filename_for_display}' 提取到內嵌編輯器設定。")
+                    scene_diagnostics.info(f"從場景檔案 '{current_filename_for_display}' 提取到內嵌編輯器設定。")
                 except Exception as e_embed:
-                    print(f"警告: 解析內嵌編輯器設定時出錯 (檔案: {current_filename_for_display} 行 {line_num_in_file}): {e_embed}")
+                    scene_diagnostics.warning(f"解析內嵌編輯器設定時出錯: {e_embed}", current_filename_for_display, line_num_in_file)
             continue # 處理完設定行後，跳過該行的其餘解析
         # --- 結束新增 ---
         
@@ -364,933 +702,915 @@ def _parse_scene_content(lines_list, scene_to_populate: Scene,
         if not parts: continue
         command = parts[0].lower()
 
-        line_identifier_for_object = f"{current_filename_for_display}:{line_num_in_file}" if is_parsing_imported_file else line_num_in_file
-        
+        handler = SCENE_COMMANDS.get(command)
+        if handler is None:
+            scene_diagnostics.warning(f"未知指令 '{command}'", current_filename_for_display, line_num_in_file, command)
+            continue
+        ctx.line_num = line_num_in_file
+        ctx.line_id = f"{current_filename_for_display}:{line_num_in_file}" if is_parsing_imported_file else line_num_in_file
+        ctx.command = command
+
         try:
-            if command == "import":
-                if len(parts) < 2:
-                    print(f"警告: (文件: {current_filename_for_display} 行 {line_num_in_file}) 'import' 指令需要檔名參數。")
-                    continue
-                
-                import_filename_param  = parts[1]
-                ### --- START OF MODIFICATION FOR IMPORT PARAMS ---
-                import_offset_x, import_offset_y, import_offset_z = 0.0, 0.0, 0.0
-                import_offset_angle_deg = 0.0
-
-                # --- 經緯度形式:import 檔名 緯度 經度(檔名後剛好兩個數) ---
-                # 用母場景的 latlon 錨點換算世界座標當子場景原點,不旋轉(北對齊)。
-                import_geo_mode = False
-                import_geo_lat, import_geo_lon = 0.0, 0.0
-                if len(parts) == 4:
-                    try:
-                        g_lat, g_lon = float(parts[2]), float(parts[3])
-                        if -90.0 <= g_lat <= 90.0 and -180.0 <= g_lon <= 180.0:
-                            import_geo_mode = True
-                            import_geo_lat, import_geo_lon = g_lat, g_lon
-                        else:
-                            print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'import' 經緯度超出範圍,改用一般導入(無偏移)。")
-                    except ValueError:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'import' 參數無效,改用一般導入(無偏移)。")
-                if import_geo_mode and scene_to_populate.geo_anchor is None:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'import' 經緯度形式需要母場景先有 latlon 錨點;改用一般導入(無偏移)。")
-                    import_geo_mode = False
-
-                # 預設情況下，如果 import 沒有提供角度，可以考慮繼承父級的角度
-                # 或者，如果希望導入的內容總是從 "世界正前方" 開始（相對於其導入的x,y,z原點），則設為0
-                # 這裡我們暫時設為0，如果 import 未提供角度。
-                # parts[1]是檔名, parts[2]是x, parts[3]是y, parts[4]是z, parts[5]是angle
-                if len(parts) >= 5: # 至少有 x, y, z
-                    try:
-                        import_offset_x = float(parts[2])
-                        import_offset_y = float(parts[3])
-                        import_offset_z = float(parts[4])
-                        if len(parts) >= 6: # 有角度參數
-                            import_offset_angle_deg = float(parts[5])
-                        # else:
-                            # 如果沒有提供角度，可以選擇繼承當前的 relative_origin_angle_rad
-                            # import_offset_angle_deg = math.degrees(scene_to_populate.current_relative_origin_angle_rad)
-                            # 或是繼承 current_parse_angle_rad
-                            # import_offset_angle_deg = math.degrees(scene_to_populate.current_parse_angle_rad)
-                            # 為了簡單起見，如果沒提供，就用預設的 0.0 (或者上次 `start` 的值)
-                            # 我們這裡讓它預設為0，意味著導入的內容如果自己有軌道，會從其局部X=0,Z=0,Y=0點的"正前方"（Z+或X+，取決於角度）開始
-                    except ValueError:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'import' 指令的 x,y,z,angle 參數無效。將使用預設偏移(0,0,0)和角度(0)。")
-                        import_offset_x, import_offset_y, import_offset_z = 0.0, 0.0, 0.0
-                        import_offset_angle_deg = 0.0
-                
-                # --- 解析相對路徑 --- (這部分移到參數解析之後，如果參數無效可能就不需要繼續了)
-                ### --- END OF MODIFICATION FOR IMPORT PARAMS ---
-                # --- 解析相對路徑 ---
-                # 假設 import_filename 是相對於 current_file_directory 的
-                imported_filepath_abs = os.path.abspath(os.path.join(current_file_directory, import_filename_param))
-                
-                if imported_filepath_abs in imported_files:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 循环导入 '{import_filename_param}'。跳过。")
-                    continue
+            handler.parse_line(ctx, parts)
+        except Exception as e:
+             scene_diagnostics.warning(f"處理指令 '{line}' 時發生內部錯誤: {e}", current_filename_for_display, line_num_in_file, command)
+             scene_diagnostics.debug(traceback.format_exc(), current_filename_for_display, line_num_in_file, command)
 
-                if not os.path.exists(imported_filepath_abs):
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) Import 文件 '{import_filename_param}' (at '{imported_filepath_abs}') 不存在。")
-                    continue
+    # --- 排序背景觸發器 ---
+    scene_to_populate.background_triggers.sort(key=lambda item: item[0])
+    return scene_to_populate
 
-                imported_files.add(imported_filepath_abs)
-                print(f"信息: ({current_filename_for_display} 行 {line_num_in_file}) 导入 '{import_filename_param}'...")
+# --- 各指令的逐行處理器 (由 register_scene_command 登錄,見檔案後段的登錄表) ---
+# 處理器收到 SceneParseContext 與切好的 parts;參數有誤時發出警告並直接 return (略過該行)。
+def _parse_import_command(ctx, parts):
+    if len(parts) < 2:
+        scene_diagnostics.warning("'import' 指令需要檔名參數。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    import_filename_param  = parts[1]
+    ### --- START OF MODIFICATION FOR IMPORT PARAMS ---
+    import_offset_x, import_offset_y, import_offset_z = 0.0, 0.0, 0.0
+    import_offset_angle_deg = 0.0
+
+    # --- 經緯度形式:import 檔名 緯度 經度(檔名後剛好兩個數) ---
+    # 用母場景的 latlon 錨點換算世界座標當子場景原點,不旋轉(北對齊)。
+    import_geo_mode = False
+    import_geo_lat, import_geo_lon = 0.0, 0.0
+    if len(parts) == 4:
+        try:
+            g_lat, g_lon = float(parts[2]), float(parts[3])
+            if -90.0 <= g_lat <= 90.0 and -180.0 <= g_lon <= 180.0:
+                import_geo_mode = True
+                import_geo_lat, import_geo_lon = g_lat, g_lon
+            else:
+                scene_diagnostics.warning("'import' 經緯度超出範圍,改用一般導入(無偏移)。", ctx.filename, ctx.line_num, ctx.command)
+        except ValueError:
+            scene_diagnostics.warning("'import' 參數無效,改用一般導入(無偏移)。", ctx.filename, ctx.line_num, ctx.command)
+    if import_geo_mode and ctx.scene.geo_anchor is None:
+        scene_diagnostics.warning("'import' 經緯度形式需要母場景先有 latlon 錨點;改用一般導入(無偏移)。", ctx.filename, ctx.line_num, ctx.command)
+        import_geo_mode = False
+
+    # 預設情況下，如果 import 沒有提供角度，可以考慮繼承父級的角度
+    # 或者，如果希望導入的內容總是從 "世界正前方" 開始（相對於其導入的x,y,z原點），則設為0
+    # 這裡我們暫時設為0，如果 import 未提供角度。
+    # parts[1]是檔名, parts[2]是x, parts[3]是y, parts[4]是z, parts[5]是angle
+    if len(parts) >= 5: # 至少有 x, y, z
+        try:
+            import_offset_x = float(parts[2])
+            import_offset_y = float(parts[3])
+            import_offset_z = float(parts[4])
+            if len(parts) >= 6: # 有角度參數
+                import_offset_angle_deg = float(parts[5])
+            # else:
+                # 如果沒有提供角度，可以選擇繼承當前的 relative_origin_angle_rad
+                # import_offset_angle_deg = math.degrees(ctx.scene.current_relative_origin_angle_rad)
+                # 或是繼承 current_parse_angle_rad
+                # import_offset_angle_deg = math.degrees(ctx.scene.current_parse_angle_rad)
+                # 為了簡單起見，如果沒提供，就用預設的 0.0 (或者上次 `start` 的值)
+                # 我們這裡讓它預設為0，意味著導入的內容如果自己有軌道，會從其局部X=0,Z=0,Y=0點的"正前方"（Z+或X+，取決於角度）開始
+        except ValueError:
+            scene_diagnostics.warning("'import' 指令的 x,y,z,angle 參數無效。將使用預設偏移(0,0,0)和角度(0)。", ctx.filename, ctx.line_num, ctx.command)
+            import_offset_x, import_offset_y, import_offset_z = 0.0, 0.0, 0.0
+            import_offset_angle_deg = 0.0
+
+    # --- 解析相對路徑 --- (這部分移到參數解析之後，如果參數無效可能就不需要繼續了)
+    ### --- END OF MODIFICATION FOR IMPORT PARAMS ---
+    # --- 解析相對路徑 ---
+    # 假設 import_filename 是相對於 ctx.file_dir 的
+    imported_filepath_abs = os.path.abspath(os.path.join(ctx.file_dir, import_filename_param))
+    # 不存在的檔案也記下來:之後補上檔案時編譯快取才會失效
+    ctx.scene.source_files.setdefault(imported_filepath_abs, None)
+
+    if imported_filepath_abs in ctx.imported_files:
+        scene_diagnostics.warning(f"循环导入 '{import_filename_param}'。跳过。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    if not os.path.exists(imported_filepath_abs):
+        scene_diagnostics.warning(f"Import 文件 '{import_filename_param}' (at '{imported_filepath_abs}') 不存在。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    ctx.imported_files.add(imported_filepath_abs)
+    scene_diagnostics.debug(f"导入 '{import_filename_param}'...", ctx.filename, ctx.line_num, ctx.command)
 
     ### --- START OF MODIFICATION FOR IMPORT PARAMS (State Save/Restore for ACCUMULATIVE import) ---
-                # 保存當前的解析狀態 (包括相對原點和軌道解析位置)
-                old_relative_origin_pos = np.copy(scene_to_populate.current_relative_origin_pos)
-                old_relative_origin_angle_rad = scene_to_populate.current_relative_origin_angle_rad
-                old_parse_pos = np.copy(scene_to_populate.current_parse_pos)
-                old_parse_angle_rad = scene_to_populate.current_parse_angle_rad
-                old_last_background_info = scene_to_populate.last_background_info
-                old_map_offset = getattr(scene_to_populate, 'current_map_offset', (0.0, 0.0))
-
-                # --- 計算新的臨時原點 (累加方式) ---
-                # import_offset_x, y, z 被視為在 "old_relative_origin" 座標系下的局部偏移
-                # import_offset_angle_deg 被視為相對於 "old_relative_origin_angle_rad" 的角度增量
-
-                # 父級原點的角度
-                parent_angle_rad = old_relative_origin_angle_rad # 使用導入前的相對原點角度
-
-                cos_parent_angle = math.cos(parent_angle_rad)
-                sin_parent_angle = math.sin(parent_angle_rad)
-
-                if import_geo_mode:
-                    # 經緯度形式:子場景原點 = 錨點換算出的世界座標,
-                    # 角度固定為恆等轉換(π/2,北對齊不旋轉),y=0(貼地)。
-                    geo_wx, geo_wz = scene_to_populate.latlon_to_world(import_geo_lat, import_geo_lon)
-                    new_temp_origin_x, new_temp_origin_y, new_temp_origin_z = geo_wx, 0.0, geo_wz
-                    scene_to_populate.current_relative_origin_pos[:] = [new_temp_origin_x, new_temp_origin_y, new_temp_origin_z]
-                    scene_to_populate.current_relative_origin_angle_rad = math.pi / 2.0
-                    # 子場景內的 map 行套用同樣的平移(見 map 指令處理)
-                    scene_to_populate.current_map_offset = (geo_wx, geo_wz)
-                else:
-                    # 將 import 指令中的局部偏移 (import_offset_x, import_offset_z) 轉換為世界座標系下的偏移量
-                    # 假設 import_offset_x 是側向偏移 (父級局部X), import_offset_z 是向前偏移 (父級局部Z)
-                    # 這與 building, cylinder 等物件的 rel_x, rel_z 語義一致
-                    world_dx_from_parent = import_offset_z * cos_parent_angle + import_offset_x * sin_parent_angle
-                    world_dz_from_parent = import_offset_z * sin_parent_angle - import_offset_x * cos_parent_angle
-                    world_dy_from_parent = import_offset_y # Y 軸偏移通常是直接疊加
-
-                    # 新的臨時相對原點是父級原點加上計算出的世界偏移
-                    new_temp_origin_x = old_relative_origin_pos[0] + world_dx_from_parent
-                    new_temp_origin_y = old_relative_origin_pos[1] + world_dy_from_parent
-                    new_temp_origin_z = old_relative_origin_pos[2] + world_dz_from_parent
-
-                    scene_to_populate.current_relative_origin_pos[:] = [new_temp_origin_x, new_temp_origin_y, new_temp_origin_z]
-
-                    # 新的臨時角度是父級角度加上 import 提供的角度增量
-                    scene_to_populate.current_relative_origin_angle_rad = parent_angle_rad + math.radians(import_offset_angle_deg)
-                
-                # 更新 current_parse_pos 和 angle，使得導入檔案內的軌道指令（如果有的話）
-                # 也會從這個新的臨時原點開始。
-                scene_to_populate.current_parse_pos[:] = scene_to_populate.current_relative_origin_pos
-                scene_to_populate.current_parse_angle_rad = scene_to_populate.current_relative_origin_angle_rad
-                scene_to_populate.last_background_info = None # 導入的檔案應該重新開始背景觸發邏輯
-                
-                print(f"信息: 导入 '{import_filename_param}'，临时原点设为 ({new_temp_origin_x:.1f}, {new_temp_origin_y:.1f}, {new_temp_origin_z:.1f})，角度 {math.degrees(scene_to_populate.current_relative_origin_angle_rad):.1f}° (累加)")
-                ### --- END OF MODIFICATION FOR IMPORT PARAMS (State Save/Restore for ACCUMULATIVE import) ---
-
-                try:
-                    with open(imported_filepath_abs, 'r', encoding='utf-8') as f_import:
-                        imported_lines = f_import.readlines()
-                    
-                    # 遞迴解析導入的檔案內容，傳遞相同的 scene_to_populate 和 updated imported_files
-                    # current_pos 等狀態會由 scene_to_populate 內部維護和更新
-                    _parse_scene_content(imported_lines, scene_to_populate, 
-                                         os.path.dirname(imported_filepath_abs), 
-                        os.path.basename(imported_filepath_abs), imported_files, load_textures)
-                    print(f"信息: 完成导入 '{import_filename_param}'。")
-
-                except Exception as e_import:
-                    print(f"錯誤: (文件: {os.path.basename(current_filename_for_display)} 行 {line_num_in_file}) 导入文件 '{import_filename_param}' 时发生错误: {e_import}")
-
-                ### --- START OF MODIFICATION FOR IMPORT PARAMS (State Restore) ---
-                # 恢復之前的解析狀態
-                scene_to_populate.current_relative_origin_pos[:] = old_relative_origin_pos
-                scene_to_populate.current_relative_origin_angle_rad = old_relative_origin_angle_rad
-                scene_to_populate.current_parse_pos[:] = old_parse_pos
-                scene_to_populate.current_parse_angle_rad = old_parse_angle_rad
-                scene_to_populate.last_background_info = old_last_background_info # 恢復背景觸發器狀態
-                scene_to_populate.current_map_offset = old_map_offset
-                print(f"信息: 导入 '{import_filename_param}' 完成後，恢复原点至 ({old_relative_origin_pos[0]:.1f}, {old_relative_origin_pos[1]:.1f}, {old_relative_origin_pos[2]:.1f}) 角度 {math.degrees(old_relative_origin_angle_rad):.1f}°")
-                ### --- END OF MODIFICATION FOR IMPORT PARAMS (State Restore) ---
-
-                # 從集合中移除，允許其他分支再次導入同一個檔案（如果不是循環的一部分）
-                # 或者，如果一個檔案只應被導入一次，則不移除
-                imported_files.remove(imported_filepath_abs) # 允許非循環的重複導入 (例如 A import C, B import C)
-
-            # --- 其他指令的處理邏輯 (需要調整以使用 scene_to_populate 中的狀態) ---
-            # 例如，對於 "start" 指令:
-            elif command == "start":
-                if len(parts) < 5: print(f"警告: (文件: {os.path.basename(current_file_directory)} 行 {line_num_in_file}) 'start' 參數不足。"); continue
-                try: x, y, z = map(float, parts[1:4]); angle_deg = float(parts[4])
-                except ValueError: print(f"警告: (文件: {os.path.basename(current_file_directory)} 行 {line_num_in_file}) 'start' 參數無效。"); continue
-                angle_rad = math.radians(angle_deg)
-                
-                # --- 更新 Scene 物件的內部狀態 ---
-                scene_to_populate.start_position = np.array([x, y, z], dtype=float)
-                scene_to_populate.start_angle_deg = angle_deg
-                
-                scene_to_populate.current_parse_pos[:] = [x, y, z]
-                scene_to_populate.current_parse_angle_rad = angle_rad
-                scene_to_populate.current_relative_origin_pos[:] = scene_to_populate.current_parse_pos
-                scene_to_populate.current_relative_origin_angle_rad = scene_to_populate.current_parse_angle_rad
-                # --- END 更新 Scene 狀態 ---
-                # start_cmd_found = True # 這個標誌的作用需要重新評估
-
-            # --- 對於 "straight", "curve" 等軌道指令 ---
-            # 它們會讀取 scene_to_populate.current_parse_pos 和 current_parse_angle_rad 作為起點
-            # 並在創建 segment 後，更新 scene_to_populate.current_parse_pos 和 current_parse_angle_rad 為 segment 的末端狀態
-            elif command == "straight" or command == "curve":
-                # 確保 current_parse_pos 等已初始化
-                if not hasattr(scene_to_populate, 'current_parse_pos'):
-                    # 如果之前沒有 start 指令，使用預設值初始化
-                    scene_to_populate.current_parse_pos = np.array([0.0,0.0,0.0], dtype=float)
-                    scene_to_populate.current_parse_angle_rad = 0.0 # 預設朝 X+
-                    scene_to_populate.current_relative_origin_pos = np.copy(scene_to_populate.current_parse_pos)
-                    scene_to_populate.current_relative_origin_angle_rad = scene_to_populate.current_parse_angle_rad
-                    scene_to_populate.last_background_info = None
-                    print(f"提示: (文件: {os.path.basename(current_file_directory)} 行 {line_num_in_file}) 軌道指令前未找到 'start'，將從預設位置開始。")
-
-
-                # --- 背景觸發器邏輯 (使用 scene_to_populate.last_background_info) ---
-                current_track_distance = scene_to_populate.track.total_length
-                if hasattr(scene_to_populate, 'last_background_info') and scene_to_populate.last_background_info is not None:
-                    scene_to_populate.background_triggers.append((current_track_distance, scene_to_populate.last_background_info))
-                    scene_to_populate.last_background_info = None
-
-                # 更新相對原點
-                scene_to_populate.current_relative_origin_pos[:] = scene_to_populate.current_parse_pos
-                scene_to_populate.current_relative_origin_angle_rad = scene_to_populate.current_parse_angle_rad
-                
-                segment = None
-                try:
-                    if command == "straight":
-                        if len(parts) < 2: print(f"警告: (文件: {current_filename_for_display} 行 {line_num_in_file}) 'straight' 參數不足。"); continue
-                        length = float(parts[1])
-                        gradient = float(parts[2]) if len(parts) > 2 else 0.0
-                        segment = StraightTrack(scene_to_populate.current_parse_pos, scene_to_populate.current_parse_angle_rad, length, gradient)
-                        segment.source_line_number = line_num_in_file # 可以考慮傳遞原始檔案名和行號
-                    elif command == "curve":
-                        if len(parts) < 3: print(f"警告: (文件: {current_filename_for_display} 行 {line_num_in_file}) 'curve' 參數不足。"); continue
-                        radius = float(parts[1])
-                        angle_deg = float(parts[2])
-                        gradient = float(parts[3]) if len(parts) > 3 else 0.0
-                        segment = CurveTrack(scene_to_populate.current_parse_pos, scene_to_populate.current_parse_angle_rad, radius, angle_deg, gradient)
-                        segment.source_line_number = line_num_in_file
-                except ValueError:
-                     print(f"警告: (文件: {current_filename_for_display} 行 {line_num_in_file}) '{command}' 參數無效。"); continue
-                
-                if segment:
-                    scene_to_populate.track.add_segment(segment)
-                    scene_to_populate.current_parse_pos = segment.end_pos # 更新 scene 的狀態
-                    scene_to_populate.current_parse_angle_rad = segment.end_angle_rad
-
-            
-            elif command == "vbranch":
-                if not scene_to_populate.track.segments:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch' 指令之前沒有任何常規軌道段。將忽略此指令。")
-                    continue
-                
-                parent_segment = scene_to_populate.track.segments[-1]
-                
-                if len(parts) < 2:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch' 指令需要類型 ('straight' 或 'curve')。")
-                    continue
-
-                branch_type = parts[1].lower()
-                # 初始化 branch_data_dict，包含所有 TrackSegment 和渲染所需的鍵
-                branch_data_dict = {
-                    "type": branch_type,
-                    "points": [],
-                    "orientations": [],
-                    'ballast_vertices': [], 'rail_left_vertices': [], 'rail_right_vertices': [],
-                    'ballast_vao': None, 'rail_left_vao': None, 'rail_right_vao': None,
-                    'ballast_vbo': None, 'rail_left_vbo': None, 'rail_right_vbo': None,
-                    # 特定於類型的參數可以稍後添加
-                }
-
-                # 視覺分岔的起點是父軌道段的末端
-                branch_start_pos = np.copy(parent_segment.end_pos) # 使用父軌道段的末端位置
-                branch_parent_end_angle_rad = parent_segment.end_angle_rad # 父軌道段的末端角度
-
-                if branch_type == "straight":
-                    # vbranch straight <angle_deg_offset> <length> [gradient_permille]
-                    if len(parts) < 4:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch straight' 需要 <angle_deg_offset> 和 <length>。")
-                        continue
-                    try:
-                        angle_offset_deg = float(parts[2])
-                        branch_length = float(parts[3])
-                        gradient_permille = float(parts[4]) if len(parts) > 4 else 0.0
-                        
-                        if branch_length <= 0:
-                            print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch straight' 長度 ({branch_length}) 必須為正。")
-                            continue
-
-                        branch_data_dict["angle_deg_offset"] = angle_offset_deg
-                        branch_data_dict["length"] = branch_length
-                        branch_data_dict["gradient"] = gradient_permille
-                        
-                        branch_actual_start_angle_rad = branch_parent_end_angle_rad + math.radians(angle_offset_deg)
-                        branch_gradient_factor = gradient_permille / 1000.0
-                        
-                        b_fwd_xz_tuple = (math.cos(branch_actual_start_angle_rad), math.sin(branch_actual_start_angle_rad))
-                        b_fwd_xz_arr = np.array(b_fwd_xz_tuple)
-                        b_fwd_horiz_3d = np.array([b_fwd_xz_arr[0], 0, b_fwd_xz_arr[1]])
-                        
-                        # 對於直線 vbranch，其 horizontal_length 就是 branch_length
-                        b_horizontal_length_for_grad_calc = branch_length
-                        
-                        # num_steps_b 的計算可以基於長度，確保平滑度
-                        num_steps_b = max(2, int(branch_length * INTERPOLATION_STEPS / 5)) # 與 StraightTrack 類似
-                        if num_steps_b < 2: num_steps_b = 2
-                        
-                        for i_b in range(num_steps_b):
-                            t_b = i_b / (num_steps_b - 1)
-                            current_horizontal_dist_b = t_b * b_horizontal_length_for_grad_calc
-                            current_vertical_change_b = current_horizontal_dist_b * branch_gradient_factor
-                            
-                            point_pos_b = branch_start_pos + b_fwd_horiz_3d * current_horizontal_dist_b \
-                                       + np.array([0, current_vertical_change_b, 0])
-                            
-                            branch_data_dict["points"].append(point_pos_b)
-                            branch_data_dict["orientations"].append(b_fwd_xz_tuple) # 直線方向不變
-                            
-                    except ValueError:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch straight' 參數無效。")
-                        continue
-
-                elif branch_type == "curve":
-                    # vbranch curve <radius> <angle_deg_sweep> [gradient_permille] [direction_modifier?]
-                    if len(parts) < 4:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 需要 <radius> 和 <angle_deg_sweep>。")
-                        continue
-                    try:
-                        branch_radius = float(parts[2])
-                        branch_sweep_angle_deg = float(parts[3])
-                        
-                        gradient_permille = 0.0
-                        branch_direction_mode = "forward" # 預設 "forward" (相對於父軌道末端切線方向)
-
-                        # 解析可選的 gradient_permille 和 direction_modifier
-                        # gradient 是 parts[4], direction 是 parts[5]
-                        if len(parts) > 4: # 至少有一個可選參數
-                            try:
-                                gradient_permille = float(parts[4])
-                                if len(parts) > 5:
-                                    modifier_candidate = parts[5].lower()
-                                    if modifier_candidate in ["forward", "backward"]:
-                                        branch_direction_mode = modifier_candidate
-                                    elif modifier_candidate: # 不是有效的修飾符
-                                         print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 無效的方向修飾符 '{parts[5]}'")
-                            except ValueError: # parts[4] 不是 float，那麼它必須是 direction_modifier
-                                modifier_candidate = parts[4].lower()
-                                if modifier_candidate in ["forward", "backward"]:
-                                    branch_direction_mode = modifier_candidate
-                                    if len(parts) > 5: # 如果方向在 parts[4]，則 parts[5] 是多餘的
-                                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 在方向修飾符 '{parts[4]}' 後有過多參數。")
-                                elif modifier_candidate: # 不是有效的修飾符
-                                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 無效的可選參數 '{parts[4]}'")
-
-                        if abs(branch_radius) < 1e-3 or branch_radius <= 0: 
-                             print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 半徑 ({branch_radius}) 無效。")
-                             continue
-                        if abs(branch_sweep_angle_deg) < 1e-3 and branch_sweep_angle_deg != 0.0 :
-                             print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 掃過角度過小。")
-                             # continue # 0度曲線可能是特殊情況，暫不跳過
-
-                        branch_data_dict["radius"] = branch_radius
-                        branch_data_dict["angle_deg"] = branch_sweep_angle_deg # 這是掃過的角度
-                        branch_data_dict["gradient"] = gradient_permille
-                        branch_data_dict["direction_mode"] = branch_direction_mode
-                        
-                        branch_angle_rad_sweep = math.radians(branch_sweep_angle_deg)
-                        branch_gradient_factor = gradient_permille / 1000.0
-                        
-                        b_horizontal_length = abs(branch_radius * branch_angle_rad_sweep)
-                        b_turn_dir = 1.0 if branch_angle_rad_sweep > 0 else -1.0 # 決定曲線是左轉還是右轉
-                        
-                        # 確定曲線的初始切線方向
-                        # "forward" 模式：曲線的初始切線方向 = 父軌道段的末端切線方向
-                        # "backward" 模式：曲線的初始切線方向 = 父軌道段末端切線方向 + 180度
-                        b_initial_tangent_rad = branch_parent_end_angle_rad
-                        if branch_direction_mode == "backward":
-                            b_initial_tangent_rad += math.pi 
-
-                        # 計算曲線圓心 (XZ平面)
-                        # 從 branch_start_pos (父段末端)，沿著與 b_initial_tangent_rad 垂直的方向移動 branch_radius 距離
-                        b_perp_angle_to_tangent = b_initial_tangent_rad + b_turn_dir * (math.pi / 2.0)
-                        b_center_offset_xz = np.array([math.cos(b_perp_angle_to_tangent), math.sin(b_perp_angle_to_tangent)]) * branch_radius
-                        b_center_xz = np.array([branch_start_pos[0], branch_start_pos[2]]) + b_center_offset_xz
-                        
-                        # 計算曲線在圓上的起始角度 (用於插值)
-                        # 這是從圓心指向 branch_start_pos 的向量的角度
-                        b_start_angle_on_circle = b_initial_tangent_rad - b_turn_dir * (math.pi / 2.0)
-                        
-                        num_steps_b = max(2, int(abs(branch_sweep_angle_deg) * INTERPOLATION_STEPS / 5)) # 與 CurveTrack 類似
-                        if num_steps_b < 2: num_steps_b = 2
-                                                
-                        for i_b in range(num_steps_b):
-                            t_b = i_b / (num_steps_b - 1)
-                            # 當前點在圓上掃過的實際角度 (相對於 b_start_angle_on_circle)
-                            current_angle_on_circle_b = b_start_angle_on_circle + t_b * branch_angle_rad_sweep
-                            
-                            # 計算當前點的 XZ 坐標 (相對於圓心)
-                            point_offset_xz_b = np.array([math.cos(current_angle_on_circle_b), math.sin(current_angle_on_circle_b)]) * branch_radius
-                            current_pos_xz_b = b_center_xz + point_offset_xz_b # 這是相對於世界原點的 XZ
-                            
-                            # 計算 Y 坐標 (基於坡度)
-                            current_horizontal_arc_len_b = t_b * b_horizontal_length
-                            current_vertical_change_b = current_horizontal_arc_len_b * branch_gradient_factor
-                            current_pos_y_b = branch_start_pos[1] + current_vertical_change_b # 從分岔起點的Y開始計算
-                            
-                            branch_data_dict["points"].append(np.array([current_pos_xz_b[0], current_pos_y_b, current_pos_xz_b[1]]))
-                            
-                            # 計算該點的水平切線方向 (朝前)
-                            tangent_angle_at_current_point_b = current_angle_on_circle_b + b_turn_dir * (math.pi / 2.0)
-                            orientation_vec_xz_b_tuple = (math.cos(tangent_angle_at_current_point_b), math.sin(tangent_angle_at_current_point_b))
-                            branch_data_dict["orientations"].append(orientation_vec_xz_b_tuple)
-
-                    except ValueError:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'vbranch curve' 參數無效。")
-                        continue
-                else:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 無法識別的 'vbranch' 類型: '{branch_type}'。")
-                    continue
-                
-                # 確保生成了足夠的點才添加到父軌道段
-                if branch_data_dict.get("points") and len(branch_data_dict.get("points")) >= 2:
-                    parent_segment.visual_branches.append(branch_data_dict)
-                    # print(f"DEBUG: Added vbranch {branch_type} with {len(branch_data_dict['points'])} points.") # Debug
-                else:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) vbranch '{branch_type}' 未能生成足够的点，不添加到父轨道段。Points: {branch_data_dict.get('points')}")
-
-            elif command == "building":
-                # ... (building 解析邏輯，使用 scene_to_populate.current_relative_origin_pos 等)
-                base_param_count = 9;
-                min_parts = 1 + base_param_count
-                if len(parts) < min_parts:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'building' 參數不足。");
-                    continue
-                try:
-                    rel_x, rel_y, rel_z = map(float, parts[1:4]);
-                    rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]);
-                    w, d, h = map(float, parts[7:10])
-                except ValueError:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'building' 基本參數無效。");
-                    continue
-                tex_file = parts[10] if len(parts) > 10 else "building.png"
-                u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,2,1.0,1.0 # <--- uv_mode 預設為2 (Atlas)
-                try:
-                    u_offset = float(parts[11]) if len(parts) > 11 else 0.0;
-                    v_offset = float(parts[12]) if len(parts) > 12 else 0.0;
-                    tex_angle_deg = float(parts[13]) if len(parts) > 13 else 0.0;
-                    uv_mode = int(parts[14]) if len(parts) > 14 else 2; # uvmode
-                    uscale = float(parts[15]) if len(parts) > 15 else 1.0;
-                    vscale = float(parts[16]) if len(parts) > 16 else 1.0
-                except ValueError: pass
-#                 tex_id = texture_loader.load_texture(tex_file) if load_textures and texture_loader else None
-                # 載入紋理並獲取 alpha 信息
-                gl_texture_id_from_loader = None
-                texture_has_alpha_flag = False
-                if load_textures and texture_loader:
-                    tex_info = texture_loader.load_texture(tex_file)
-                    if tex_info:
-                        gl_texture_id_from_loader = tex_info.get("id")
-                        texture_has_alpha_flag = tex_info.get("has_alpha", False)
-
-                origin_angle = scene_to_populate.current_relative_origin_angle_rad
-                cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
-                world_offset_x = rel_z * cos_a + rel_x * sin_a
-                world_offset_z = rel_z * sin_a - rel_x * cos_a
-                world_x = scene_to_populate.current_relative_origin_pos[0] + world_offset_x
-                world_y = scene_to_populate.current_relative_origin_pos[1] + rel_y
-                world_z = scene_to_populate.current_relative_origin_pos[2] + world_offset_z
-                absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
-                obj_data_tuple = (
-                    "building", # 0
-                    world_x, world_y, world_z, # 1 2 3
-                    rx_deg, absolute_ry_deg, rz_deg, # 4 5 6
-                    w, d, h, # 7 8 9
-#                     tex_id,
-                    u_offset, v_offset, tex_angle_deg, # 10 11 12
-                    uv_mode, uscale, vscale, # 13 14 15
-                    tex_file, # 原始檔名 16
-                    gl_texture_id_from_loader, # OpenGL 紋理 ID 17
-                    texture_has_alpha_flag, # 新增的 Alpha 標誌 18
-                    math.degrees(origin_angle), # <--- 新增：存儲父原點的Y旋轉角度 (度) 19
-                    None,  # 20: vao_id (placeholder)
-                    None,  # 21: vbo_id (placeholder)
-                    0      # 22: vertex_count (placeholder)                                        
-                    )
-                scene_to_populate.buildings.append((line_identifier_for_object, obj_data_tuple))
-
-            elif command == "cylinder":
-                # ... (cylinder 解析邏輯) ...
-                base_param_count = 8; min_parts = 1 + base_param_count
-                if len(parts) < min_parts: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'cylinder' 參數不足。"); continue
-                try: rel_x, rel_y, rel_z = map(float, parts[1:4]); rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]); radius = float(parts[7]); height = float(parts[8])
-                except ValueError: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'cylinder' 基本參數無效。"); continue
-                tex_file = parts[9] if len(parts) > 9 else "metal.png"
-                u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,1,1.0,1.0
-                try: u_offset = float(parts[10]) if len(parts) > 10 else 0.0; v_offset = float(parts[11]) if len(parts) > 11 else 0.0; tex_angle_deg = float(parts[12]) if len(parts) > 12 else 0.0; uv_mode = int(parts[13]) if len(parts) > 13 else 1; uscale = float(parts[14]) if len(parts) > 14 and uv_mode == 0 else 1.0; vscale = float(parts[15]) if len(parts) > 15 and uv_mode == 0 else 1.0
-                except ValueError: pass
-#                 tex_id = texture_loader.load_texture(tex_file).get("id") if load_textures and texture_loader else None
-                # 載入紋理並獲取 alpha 信息
-                gl_texture_id_from_loader = None
-                texture_has_alpha_flag = False
-                if load_textures and texture_loader:
-                    tex_info = texture_loader.load_texture(tex_file)
-                    if tex_info:
-                        gl_texture_id_from_loader = tex_info.get("id")
-                        texture_has_alpha_flag = tex_info.get("has_alpha", False)
-
-                origin_angle = scene_to_populate.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
-                world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
-                world_x = scene_to_populate.current_relative_origin_pos[0] + world_offset_x; world_y = scene_to_populate.current_relative_origin_pos[1] + rel_y; world_z = scene_to_populate.current_relative_origin_pos[2] + world_offset_z
-                absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
-                obj_data_tuple = (
-                    "cylinder", world_x, world_y, world_z,
-                    rx_deg, absolute_ry_deg, rz_deg, radius, height,
-#                     tex_id,
-                    u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale,
-                    tex_file,
-                    gl_texture_id_from_loader, # OpenGL 紋理 ID
-                    texture_has_alpha_flag, # 新增的 Alpha 標誌
-                    math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
-                    )
-                scene_to_populate.cylinders.append((line_identifier_for_object, obj_data_tuple))
-
-            elif command == "tree":
-                # ... (tree 解析邏輯) ...
-                if len(parts) < 5:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'tree' 參數不足。");
-                    continue
-                try:
-                    rel_x, rel_y, rel_z = map(float, parts[1:4]);
-                    height = float(parts[4])
-                except ValueError:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'tree' 基本參數無效。");
-                    continue
-                if height <=0:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'tree' 高度必須為正。");
-                    continue
-                tex_file = parts[5] if len(parts) > 5 else "tree_leaves.png"
-#                 print(f"_parse_scene_content: tree tex_file: {tex_file}")
-                tex_id = texture_loader.load_texture(tex_file).get("id") if load_textures and texture_loader else None
-#                 print(f"_parse_scene_content: tree tex id: {tex_id}")
-                origin_angle = scene_to_populate.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
-                world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
-                world_x = scene_to_populate.current_relative_origin_pos[0] + world_offset_x; world_y = scene_to_populate.current_relative_origin_pos[1] + rel_y; world_z = scene_to_populate.current_relative_origin_pos[2] + world_offset_z
-                obj_data_tuple = (
-                    "tree", world_x, world_y, world_z,
-                    height, tex_id, tex_file,
-                    math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
-                    ) # 保持樹的元組結構
-                scene_to_populate.trees.append((line_identifier_for_object, obj_data_tuple))
-                
-            elif command == "sphere":
-                # ... (sphere 解析邏輯) ...
-                base_param_count = 7; min_parts = 1 + base_param_count
-                if len(parts) < min_parts: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'sphere' 參數不足。"); continue
-                try: rel_x, rel_y, rel_z = map(float, parts[1:4]); rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]); radius = float(parts[7])
-                except ValueError: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'sphere' 基本參數無效。"); continue
-                if radius <=0: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'sphere' 半徑必須為正。"); continue
-                tex_file = parts[8] if len(parts) > 8 else "default_sphere.png"
-                u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,1,1.0,1.0
-                try: u_offset = float(parts[9]) if len(parts) > 9 else 0.0; v_offset = float(parts[10]) if len(parts) > 10 else 0.0; tex_angle_deg = float(parts[11]) if len(parts) > 11 else 0.0; uv_mode = int(parts[12]) if len(parts) > 12 else 1; uscale = float(parts[13]) if len(parts) > 13 and uv_mode == 0 else 1.0; vscale = float(parts[14]) if len(parts) > 14 and uv_mode == 0 else 1.0
-                except ValueError: pass
-                tex_id = texture_loader.load_texture(tex_file).get("id") if load_textures and texture_loader else None
-                origin_angle = scene_to_populate.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
-                world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
-                world_x = scene_to_populate.current_relative_origin_pos[0] + world_offset_x; world_y = scene_to_populate.current_relative_origin_pos[1] + rel_y; world_z = scene_to_populate.current_relative_origin_pos[2] + world_offset_z
-                absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
-                obj_data_tuple = (
-                    "sphere", world_x, world_y, world_z,
-                    rx_deg, absolute_ry_deg, rz_deg,
-                    radius, tex_id, u_offset, v_offset, tex_angle_deg,
-                    uv_mode, uscale, vscale, tex_file,
-                    math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
-                    )
-                scene_to_populate.spheres.append((line_identifier_for_object, obj_data_tuple))
-
-            elif command == "hill":
-                # ... (hill 解析邏輯，使用新的參數)
-                base_param_count = 5;
-                min_parts = 1 + base_param_count
-                if len(parts) < min_parts:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'hill' 參數不足。");
-                    continue
-                try:
-                    rel_cx = float(parts[1])
-                    rel_base_y = float(parts[2]) # parts[2] 是 base_y (相對或絕對偏移)
-                    rel_cz = float(parts[3])
-                    base_radius = float(parts[4]);
-                    peak_height_offset = float(parts[5])
-                    if peak_height_offset <= 0 or base_radius <= 0:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'hill' peak_h_offset 和 radius 必須為正。");
-                        continue
-                except ValueError:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'hill' 基本參數無效。");
-                    continue
+    # 保存當前的解析狀態 (包括相對原點和軌道解析位置)
+    old_relative_origin_pos = np.copy(ctx.scene.current_relative_origin_pos)
+    old_relative_origin_angle_rad = ctx.scene.current_relative_origin_angle_rad
+    old_parse_pos = np.copy(ctx.scene.current_parse_pos)
+    old_parse_angle_rad = ctx.scene.current_parse_angle_rad
+    old_last_background_info = ctx.scene.last_background_info
+    old_map_offset = getattr(ctx.scene, 'current_map_offset', (0.0, 0.0))
+
+    # --- 計算新的臨時原點 (累加方式) ---
+    # import_offset_x, y, z 被視為在 "old_relative_origin" 座標系下的局部偏移
+    # import_offset_angle_deg 被視為相對於 "old_relative_origin_angle_rad" 的角度增量
+
+    # 父級原點的角度
+    parent_angle_rad = old_relative_origin_angle_rad # 使用導入前的相對原點角度
+
+    cos_parent_angle = math.cos(parent_angle_rad)
+    sin_parent_angle = math.sin(parent_angle_rad)
+
+    if import_geo_mode:
+        # 經緯度形式:子場景原點 = 錨點換算出的世界座標,
+        # 角度固定為恆等轉換(π/2,北對齊不旋轉),y=0(貼地)。
+        geo_wx, geo_wz = ctx.scene.latlon_to_world(import_geo_lat, import_geo_lon)
+        new_temp_origin_x, new_temp_origin_y, new_temp_origin_z = geo_wx, 0.0, geo_wz
+        ctx.scene.current_relative_origin_pos[:] = [new_temp_origin_x, new_temp_origin_y, new_temp_origin_z]
+        ctx.scene.current_relative_origin_angle_rad = math.pi / 2.0
+        # 子場景內的 map 行套用同樣的平移(見 map 指令處理)
+        ctx.scene.current_map_offset = (geo_wx, geo_wz)
+    else:
+        # 將 import 指令中的局部偏移 (import_offset_x, import_offset_z) 轉換為世界座標系下的偏移量
+        # 假設 import_offset_x 是側向偏移 (父級局部X), import_offset_z 是向前偏移 (父級局部Z)
+        # 這與 building, cylinder 等物件的 rel_x, rel_z 語義一致
+        world_dx_from_parent = import_offset_z * cos_parent_angle + import_offset_x * sin_parent_angle
+        world_dz_from_parent = import_offset_z * sin_parent_angle - import_offset_x * cos_parent_angle
+        world_dy_from_parent = import_offset_y # Y 軸偏移通常是直接疊加
+
+        # 新的臨時相對原點是父級原點加上計算出的世界偏移
+        new_temp_origin_x = old_relative_origin_pos[0] + world_dx_from_parent
+        new_temp_origin_y = old_relative_origin_pos[1] + world_dy_from_parent
+        new_temp_origin_z = old_relative_origin_pos[2] + world_dz_from_parent
+
+        ctx.scene.current_relative_origin_pos[:] = [new_temp_origin_x, new_temp_origin_y, new_temp_origin_z]
+
+        # 新的臨時角度是父級角度加上 import 提供的角度增量
+        ctx.scene.current_relative_origin_angle_rad = parent_angle_rad + math.radians(import_offset_angle_deg)
+
+    # 更新 current_parse_pos 和 angle，使得導入檔案內的軌道指令（如果有的話）
+    # 也會從這個新的臨時原點開始。
+    ctx.scene.current_parse_pos[:] = ctx.scene.current_relative_origin_pos
+    ctx.scene.current_parse_angle_rad = ctx.scene.current_relative_origin_angle_rad
+    ctx.scene.last_background_info = None # 導入的檔案應該重新開始背景觸發邏輯
+
+    scene_diagnostics.debug(f"导入 '{import_filename_param}'，临时原点设为 ({new_temp_origin_x:.1f}, {new_temp_origin_y:.1f}, {new_temp_origin_z:.1f})，角度 {math.degrees(ctx.scene.current_relative_origin_angle_rad):.1f}° (累加)",
+                            ctx.filename, ctx.line_num, ctx.command)
+    ### --- END OF MODIFICATION FOR IMPORT PARAMS (State Save/Restore for ACCUMULATIVE import) ---
 
-                # --- 將相對座標轉換為世界座標 (類似 building) ---
-                origin_pos = scene_to_populate.current_relative_origin_pos
-                origin_angle_rad = scene_to_populate.current_relative_origin_angle_rad
-                
-                cos_oa = math.cos(origin_angle_rad)
-                sin_oa = math.sin(origin_angle_rad)
-                
-                # 假設 rel_cz 是 "向前" (沿父級朝向)，rel_cx 是 "向右"
-                world_offset_x_hill = rel_cz * cos_oa + rel_cx * sin_oa 
-                world_offset_z_hill = rel_cz * sin_oa - rel_cx * cos_oa
-                
-                world_center_x = origin_pos[0] + world_offset_x_hill
-                # base_y 的處理：是疊加到父級Y，還是父級Y + rel_base_y？
-                # 我們假設 rel_base_y 是疊加到父級Y的偏移，與 building 的 rel_y 邏輯一致
-                world_base_y = origin_pos[1] + rel_base_y 
-                world_center_z = origin_pos[2] + world_offset_z_hill
-                # --- 結束世界座標轉換 ---
-
-
-                # --- MODIFICATION START: Parse new texture offset parameters ---
-                tex_param_start_index = 6 # tex_file (optional) starts at index 6
-                tex_file = parts[tex_param_start_index] if len(parts) > tex_param_start_index and not parts[tex_param_start_index].replace('.', '', 1).replace('-', '', 1).isdigit() else "grass.png"
-                
-                # Determine actual start index for uscale, vscale, uoffset, voffset based on whether tex_file was provided
-                next_numeric_param_idx = tex_param_start_index
-                if tex_file != "grass.png" and len(parts) > tex_param_start_index and parts[tex_param_start_index] == tex_file : # if tex_file was explicitly provided
-                    next_numeric_param_idx = tex_param_start_index + 1
-
-
-                uscale, vscale = 10.0, 10.0
-                u_offset, v_offset = 0.0, 0.0 # Default offsets
-
-                try:
-                    if len(parts) > next_numeric_param_idx:
-                        uscale = float(parts[next_numeric_param_idx])
-                    if len(parts) > next_numeric_param_idx + 1:
-                        vscale = float(parts[next_numeric_param_idx + 1])
-                    if len(parts) > next_numeric_param_idx + 2:
-                        u_offset = float(parts[next_numeric_param_idx + 2])
-                    if len(parts) > next_numeric_param_idx + 3:
-                        v_offset = float(parts[next_numeric_param_idx + 3])
-                except ValueError:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'hill' 紋理縮放/偏移參數解析錯誤。")
-                    # Continue with defaults for scaling/offset
-                # --- MODIFICATION END ---
-
-
-                # 載入紋理並獲取 alpha 信息
-                gl_texture_id_from_loader = None
-                texture_has_alpha_flag = False
-                if load_textures and texture_loader:
-                    tex_info = texture_loader.load_texture(tex_file)
-                    if tex_info:
-                        gl_texture_id_from_loader = tex_info.get("id")
-                        texture_has_alpha_flag = tex_info.get("has_alpha", False)
-
-                hill_data_tuple = (
-                    "hill",
-                    world_center_x, world_base_y, world_center_z,
-                    base_radius, peak_height_offset,
-#                     tex_id,
-                    uscale, vscale,
-                    u_offset, v_offset, # New parameters added here
-                    tex_file,
-                    gl_texture_id_from_loader, # OpenGL 紋理 ID
-                    texture_has_alpha_flag, # 新增的 Alpha 標誌
-                    math.degrees(origin_angle_rad), # <--- 新增：存儲父原點的Y旋轉角度 (度)
-                    None,  # 14: vao_id (placeholder)
-                    None,  # 15: vbo_id (placeholder)
-                    0      # 16: vertex_count (placeholder)                    
-                    )
-#                 print(f"DEBUG PARSER: Packing hill_data_tuple for line '{line_identifier_for_object}':")
-#                 for i, val in enumerate(hill_data_tuple):
-#                     print(f"  Index {i}: Value = {val}, Type = {type(val)}")
-                scene_to_populate.hills.append((line_identifier_for_object, hill_data_tuple))
-
-            elif command == "gableroof":
-                # 預期參數個數：cmd(1) + rel_xyz(3) + abs_ry(1) + base_wl(2) + ridge_h(1) = 8 個是基本必需的
-                # 加上可選的 abs_rx, abs_rz，則為 10 個
-                # 我們將 abs_ry 設為必需，rx, rz 可選
-                num_required_parts_in_cmd = 8 # cmd, rel_xyz, abs_ry, base_w, base_l, ridge_h_off
-                
-                if len(parts) < num_required_parts_in_cmd:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 指令必需參數不足。需要至少 {num_required_parts_in_cmd-1} 個參數，得到 {len(parts)-1} 個。")
-                    continue
-                try:
-                    p_idx = 1
-                    rel_x = float(parts[p_idx]); p_idx += 1
-                    rel_y = float(parts[p_idx]); p_idx += 1
-                    rel_z = float(parts[p_idx]); p_idx += 1
-                    
-                    # 旋轉參數 abs_rx?, abs_ry, abs_rz?
-                    # 為了簡化，我們先假設 abs_ry 是必需的，在 abs_rx 和 abs_rz 之間
-                    # 或者我們按順序解析，如果不存在則用預設值
-                    abs_rx_val = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if abs_rx_val != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()): # 如果提供了rx或看起來像數字
-                        p_idx +=1
-                    
-                    abs_ry_val = float(parts[p_idx]) if len(parts) > p_idx else 0.0 # abs_ry 應該是必需的
-                    p_idx +=1
-                    
-                    abs_rz_val = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if abs_rz_val != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                        p_idx +=1
-
-                    base_w = float(parts[p_idx]); p_idx += 1
-                    base_l = float(parts[p_idx]); p_idx += 1
-                    ridge_h_off = float(parts[p_idx]); p_idx += 1
-
-                    if base_w <= 0 or base_l <= 0 or ridge_h_off < 0: # ridge_h_off 可以為0（平頂）或正
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 尺寸參數 (base_w, base_l) 必須為正，ridge_h_off 必須非負。")
-                        continue
-
-                    # 可選參數
-                    ridge_x_pos_offset = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if ridge_x_pos_offset != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                        p_idx += 1
-                        
-                    eave_overhang_x = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if eave_overhang_x != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                         p_idx += 1
-
-                    eave_overhang_z = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if eave_overhang_z != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                         p_idx += 1
-                         
-                    texture_atlas_file = parts[p_idx] if len(parts) > p_idx else "default_roof_atlas.png"
-                    # p_idx += 1 # 如果後面還有參數
-
-
-                except (ValueError, IndexError) as e_parse:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 參數解析錯誤: {e_parse}")
-                    continue
+    try:
+        prefab = _get_import_prefab(imported_filepath_abs)
+        ctx.scene.source_files[imported_filepath_abs] = prefab.content_hash
+
+        if prefab.is_instanceable:
+            # 只有物件的子場景:直接把快取的局部空間 prefab 轉到目前的臨時原點
+            _instantiate_prefab(prefab, ctx.scene, ctx.imported_files, ctx.load_textures)
+        else:
+            # 遞迴解析導入的檔案內容，傳遞相同的 ctx.scene 和 updated ctx.imported_files
+            # current_pos 等狀態會由 ctx.scene 內部維護和更新
+            _parse_scene_content(prefab.lines, ctx.scene,
+                                 os.path.dirname(imported_filepath_abs),
+                os.path.basename(imported_filepath_abs), ctx.imported_files,
+                                 is_parsing_imported_file=True, load_textures=ctx.load_textures)
+        scene_diagnostics.debug(f"完成导入 '{import_filename_param}'。", ctx.filename, ctx.line_num, ctx.command)
+
+    except Exception as e_import:
+        scene_diagnostics.error(f"导入文件 '{import_filename_param}' 时发生错误: {e_import}", ctx.filename, ctx.line_num, ctx.command)
+
+    ### --- START OF MODIFICATION FOR IMPORT PARAMS (State Restore) ---
+    # 恢復之前的解析狀態
+    ctx.scene.current_relative_origin_pos[:] = old_relative_origin_pos
+    ctx.scene.current_relative_origin_angle_rad = old_relative_origin_angle_rad
+    ctx.scene.current_parse_pos[:] = old_parse_pos
+    ctx.scene.current_parse_angle_rad = old_parse_angle_rad
+    ctx.scene.last_background_info = old_last_background_info # 恢復背景觸發器狀態
+    ctx.scene.current_map_offset = old_map_offset
+    scene_diagnostics.debug(f"导入 '{import_filename_param}' 完成後，恢复原点至 ({old_relative_origin_pos[0]:.1f}, {old_relative_origin_pos[1]:.1f}, {old_relative_origin_pos[2]:.1f}) 角度 {math.degrees(old_relative_origin_angle_rad):.1f}°",
+                        ctx.filename, ctx.line_num, ctx.command)
+    ### --- END OF MODIFICATION FOR IMPORT PARAMS (State Restore) ---
+
+    # 從集合中移除，允許其他分支再次導入同一個檔案（如果不是循環的一部分）
+    # 或者，如果一個檔案只應被導入一次，則不移除
+    ctx.imported_files.remove(imported_filepath_abs) # 允許非循環的重複導入 (例如 A import C, B import C)
+
+def _parse_start_command(ctx, parts):
+    if len(parts) < 5: scene_diagnostics.warning("'start' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+    try: x, y, z = map(float, parts[1:4]); angle_deg = float(parts[4])
+    except ValueError: scene_diagnostics.warning("'start' 參數無效。", ctx.filename, ctx.line_num, ctx.command); return
+    angle_rad = math.radians(angle_deg)
+
+    # --- 更新 Scene 物件的內部狀態 ---
+    ctx.scene.start_position = np.array([x, y, z], dtype=float)
+    ctx.scene.start_angle_deg = angle_deg
+
+    ctx.scene.current_parse_pos[:] = [x, y, z]
+    ctx.scene.current_parse_angle_rad = angle_rad
+    ctx.scene.current_relative_origin_pos[:] = ctx.scene.current_parse_pos
+    ctx.scene.current_relative_origin_angle_rad = ctx.scene.current_parse_angle_rad
+    # --- END 更新 Scene 狀態 ---
+    # start_cmd_found = True # 這個標誌的作用需要重新評估
+
+def _parse_track_segment_command(ctx, parts):
+    # --- "straight", "curve" 軌道指令 ---
+    # 它們會讀取 scene_to_populate.current_parse_pos 和 current_parse_angle_rad 作為起點
+    # 並在創建 segment 後，更新 scene_to_populate.current_parse_pos 和 current_parse_angle_rad 為 segment 的末端狀態
+    # 確保 current_parse_pos 等已初始化
+    if not hasattr(ctx.scene, 'current_parse_pos'):
+        # 如果之前沒有 start 指令，使用預設值初始化
+        ctx.scene.current_parse_pos = np.array([0.0,0.0,0.0], dtype=float)
+        ctx.scene.current_parse_angle_rad = 0.0 # 預設朝 X+
+        ctx.scene.current_relative_origin_pos = np.copy(ctx.scene.current_parse_pos)
+        ctx.scene.current_relative_origin_angle_rad = ctx.scene.current_parse_angle_rad
+        ctx.scene.last_background_info = None
+        scene_diagnostics.info("軌道指令前未找到 'start'，將從預設位置開始。", ctx.filename, ctx.line_num, ctx.command)
+
+
+    # --- 背景觸發器邏輯 (使用 ctx.scene.last_background_info) ---
+    current_track_distance = ctx.scene.track.total_length
+    if hasattr(ctx.scene, 'last_background_info') and ctx.scene.last_background_info is not None:
+        ctx.scene.background_triggers.append((current_track_distance, ctx.scene.last_background_info))
+        ctx.scene.last_background_info = None
+
+    # 更新相對原點
+    ctx.scene.current_relative_origin_pos[:] = ctx.scene.current_parse_pos
+    ctx.scene.current_relative_origin_angle_rad = ctx.scene.current_parse_angle_rad
+
+    segment = None
+    try:
+        if ctx.command == "straight":
+            if len(parts) < 2: scene_diagnostics.warning("'straight' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+            length = float(parts[1])
+            gradient = float(parts[2]) if len(parts) > 2 else 0.0
+            segment = StraightTrack(ctx.scene.current_parse_pos, ctx.scene.current_parse_angle_rad, length, gradient)
+            segment.source_line_number = ctx.line_num # 可以考慮傳遞原始檔案名和行號
+        elif ctx.command == "curve":
+            if len(parts) < 3: scene_diagnostics.warning("'curve' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+            radius = float(parts[1])
+            angle_deg = float(parts[2])
+            gradient = float(parts[3]) if len(parts) > 3 else 0.0
+            segment = CurveTrack(ctx.scene.current_parse_pos, ctx.scene.current_parse_angle_rad, radius, angle_deg, gradient)
+            segment.source_line_number = ctx.line_num
+    except ValueError:
+         scene_diagnostics.warning(f"'{ctx.command}' 參數無效。", ctx.filename, ctx.line_num, ctx.command); return
+
+    if segment:
+        ctx.scene.track.add_segment(segment)
+        ctx.scene.current_parse_pos = np.copy(segment.end_pos) # 更新 scene 的狀態 (複製,避免之後的 start 原地改寫到軌道段)
+        ctx.scene.current_parse_angle_rad = segment.end_angle_rad
+
+def _parse_vbranch_command(ctx, parts):
+    if not ctx.scene.track.segments:
+        scene_diagnostics.warning("'vbranch' 指令之前沒有任何常規軌道段。將忽略此指令。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    parent_segment = ctx.scene.track.segments[-1]
+
+    if len(parts) < 2:
+        scene_diagnostics.warning("'vbranch' 指令需要類型 ('straight' 或 'curve')。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    branch_type = parts[1].lower()
+    # 初始化 branch_data_dict，包含所有 TrackSegment 和渲染所需的鍵
+    branch_data_dict = {
+        "type": branch_type,
+        "points": [],
+        "orientations": [],
+        'ballast_vertices': [], 'rail_left_vertices': [], 'rail_right_vertices': [], 'sleeper_instances': [],
+        # 特定於類型的參數可以稍後添加
+    }
+
+    # 視覺分岔的起點是父軌道段的末端
+    branch_start_pos = np.copy(parent_segment.end_pos) # 使用父軌道段的末端位置
+    branch_parent_end_angle_rad = parent_segment.end_angle_rad # 父軌道段的末端角度
+
+    if branch_type == "straight":
+        # vbranch straight <angle_deg_offset> <length> [gradient_permille]
+        if len(parts) < 4:
+            scene_diagnostics.warning("'vbranch straight' 需要 <angle_deg_offset> 和 <length>。", ctx.filename, ctx.line_num, ctx.command)
+            return
+        try:
+            angle_offset_deg = float(parts[2])
+            branch_length = float(parts[3])
+            gradient_permille = float(parts[4]) if len(parts) > 4 else 0.0
+
+            if branch_length <= 0:
+                scene_diagnostics.warning(f"'vbranch straight' 長度 ({branch_length}) 必須為正。", ctx.filename, ctx.line_num, ctx.command)
+                return
+
+            branch_data_dict["angle_deg_offset"] = angle_offset_deg
+            branch_data_dict["length"] = branch_length
+            branch_data_dict["gradient"] = gradient_permille
+
+            # 與主線直軌道相同的封閉解與取樣 (直線只取兩端點)
+            branch_track = StraightTrack(branch_start_pos, branch_parent_end_angle_rad + math.radians(angle_offset_deg),
+                                         branch_length, gradient_permille)
+            branch_data_dict["points"], branch_data_dict["orientations"] = branch_track.points, branch_track.orientations
+
+        except ValueError:
+            scene_diagnostics.warning("'vbranch straight' 參數無效。", ctx.filename, ctx.line_num, ctx.command)
+            return
+
+    elif branch_type == "curve":
+        # vbranch curve <radius> <angle_deg_sweep> [gradient_permille] [direction_modifier?]
+        if len(parts) < 4:
+            scene_diagnostics.warning("'vbranch curve' 需要 <radius> 和 <angle_deg_sweep>。", ctx.filename, ctx.line_num, ctx.command)
+            return
+        try:
+            branch_radius = float(parts[2])
+            branch_sweep_angle_deg = float(parts[3])
 
-                # 紋理加載 (與 building 類似)
-                gl_texture_id = None
-                texture_has_alpha_flag = False
-                if load_textures and texture_loader:
-                    tex_info = texture_loader.load_texture(texture_atlas_file)
-                    if tex_info:
-                        gl_texture_id = tex_info.get("id")
-                        texture_has_alpha_flag = tex_info.get("has_alpha", False)
-                
-                # 轉換到世界座標 (基準點轉換)
-                origin_pos = scene_to_populate.current_relative_origin_pos
-                origin_angle_rad = scene_to_populate.current_relative_origin_angle_rad
-                
-                cos_oa = math.cos(origin_angle_rad)
-                sin_oa = math.sin(origin_angle_rad)
-                
-                # 假設 rel_x, rel_z 是在父級 XZ 平面內的偏移
-                # Z 軸是父級向前，X 軸是父級向右
-                # 為了與 building 的 rel_z * cos_a + rel_x * sin_a (x) 和 rel_z * sin_a - rel_x * cos_a (z) 保持一致
-                # 這假設 rel_x 是側向偏移，rel_z 是向前偏移
-                world_offset_x = rel_z * cos_oa + rel_x * sin_oa # 如果 rel_x 是側向 (局部X), rel_z 是向前 (局部Z)
-                world_offset_z = rel_z * sin_oa - rel_x * cos_oa 
-                # 或者，如果希望 rel_x, rel_z 的行為與 building 完全一樣：
-                # world_offset_x = rel_z * cos_oa + rel_x * sin_oa 
-                # world_offset_z = rel_z * sin_oa - rel_x * cos_oa
-                # 這取決於你定義 rel_x, rel_z 相對於父朝向的局部座標系。
-                # 我們暫時用與 building 相同的：
-                world_offset_x_std = rel_z * cos_oa + rel_x * sin_oa 
-                world_offset_z_std = rel_z * sin_oa - rel_x * cos_oa
-
-                world_x = origin_pos[0] + world_offset_x_std
-                world_y = origin_pos[1] + rel_y # rel_y 是絕對的Y偏移，疊加到父原點的Y上
-                world_z = origin_pos[2] + world_offset_z_std
-                
-                # 旋轉值直接使用解析出來的 abs_rx_val, abs_ry_val, abs_rz_val
-
-                final_world_ry_deg = math.degrees(origin_angle_rad) + abs_ry_val
-                final_world_ry_from_abs_ry = math.degrees(origin_angle_rad) + abs_ry_val
-
-                world_rx_to_render = abs_rx_val
-                world_ry_to_render = final_world_ry_from_abs_ry # 結合了父軌道和自身的Y旋轉
-                world_rz_to_render = abs_rz_val
-                absolute_ry_deg = math.degrees(-origin_angle_rad) + abs_ry_val - 90
-                gableroof_data_tuple = (
-                    "gableroof",
-                    # 定位與世界旋轉 (6)
-                    world_x, world_y, world_z, 
-                    abs_rx_val, absolute_ry_deg, abs_rz_val,
-                    # 核心幾何參數 (4)
-                    base_w, base_l, ridge_h_off, # eave_h 暫時不用，讓 rel_y 直接定義屋簷Y
-                    # 形狀調整參數 (3)
-                    ridge_x_pos_offset, eave_overhang_x, eave_overhang_z,
-                    # 紋理信息 (3)
-                    gl_texture_id, texture_has_alpha_flag, texture_atlas_file,
-                    math.degrees(origin_angle_rad) # <--- 新增：存儲父原點的Y旋轉角度 (度)
-                )
-                scene_to_populate.gableroofs.append((line_identifier_for_object, gableroof_data_tuple))
-
-            elif command == "flexroof":
-                # 參數順序: rel_x rel_y rel_z abs_rx° abs_ry° abs_rz° base_w base_l top_w top_l height [top_off_x] [top_off_z] [texture_atlas]
-                num_required_params = 11 # cmd + 6定位旋轉 + 5核心幾何
-                if len(parts) < 1 + num_required_params: # parts[0] 是指令本身
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 指令必需參數不足。需要至少 {num_required_params} 個參數，得到 {len(parts)-1} 個。")
-                    continue
-                
-                try:
-                    p_idx = 1
-                    rel_x = float(parts[p_idx]); p_idx += 1
-                    rel_y = float(parts[p_idx]); p_idx += 1
-                    rel_z = float(parts[p_idx]); p_idx += 1
-                    
-                    # 旋轉參數 (abs_rx 可選, abs_ry 必需, abs_rz 可選)
-                    abs_rx_deg = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if abs_rx_deg != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                        p_idx +=1
-                    
-                    if len(parts) <= p_idx: raise ValueError("缺少必需的 abs_ry° 參數")
-                    abs_ry_deg = float(parts[p_idx]); p_idx += 1 # abs_ry 是必需的
-                    
-                    abs_rz_deg = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if abs_rz_deg != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                        p_idx +=1
-
-                    # 核心幾何參數
-                    if len(parts) <= p_idx + 4: raise ValueError("缺少核心幾何參數 (base_w, base_l, top_w, top_l, height)")
-                    base_w = float(parts[p_idx]); p_idx += 1
-                    base_l = float(parts[p_idx]); p_idx += 1
-                    top_w = float(parts[p_idx]); p_idx += 1
-                    top_l = float(parts[p_idx]); p_idx += 1
-                    height_val = float(parts[p_idx]); p_idx += 1
-
-                    if base_w <= 0 or base_l <= 0 or top_w < 0 or top_l < 0 or height_val <= 0:
-                        print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 尺寸參數無效 (base_w/l > 0, top_w/l >= 0, height > 0)。")
-                        continue
-
-                    # 可選的上底偏移參數
-                    top_off_x = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if top_off_x != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                         p_idx += 1
-                    
-                    top_off_z = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
-                    if top_off_z != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
-                         p_idx += 1
-                    
-                    # 可選的紋理圖集
-                    texture_atlas_file = parts[p_idx] if len(parts) > p_idx else "default_flexroof_atlas.png" # 或者您選擇的預設名稱
-                    # p_idx += 1 # 如果後面還有參數
-
-                except (ValueError, IndexError) as e_parse:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) '{command}' 參數解析錯誤: {e_parse}")
-                    continue
+            gradient_permille = 0.0
+            branch_direction_mode = "forward" # 預設 "forward" (相對於父軌道末端切線方向)
 
-                # 紋理加載
-                gl_texture_id = None
-                texture_has_alpha_flag = False
-                if load_textures and texture_loader:
-                    tex_info = texture_loader.load_texture(texture_atlas_file)
-                    if tex_info:
-                        gl_texture_id = tex_info.get("id")
-                        texture_has_alpha_flag = tex_info.get("has_alpha", False)
-                
-                # 轉換到世界座標
-                origin_pos = scene_to_populate.current_relative_origin_pos
-                origin_angle_rad = scene_to_populate.current_relative_origin_angle_rad
-                
-                cos_oa = math.cos(origin_angle_rad)
-                sin_oa = math.sin(origin_angle_rad)
-                
-                world_offset_x = rel_z * cos_oa + rel_x * sin_oa 
-                world_offset_z = rel_z * sin_oa - rel_x * cos_oa
-
-                world_x = origin_pos[0] + world_offset_x
-                world_y = origin_pos[1] + rel_y 
-                world_z = origin_pos[2] + world_offset_z
-                
-                # 旋轉值直接使用解析出來的 abs_rx_deg, abs_ry_deg, abs_rz_deg
-                # 但 Y 軸旋轉需要疊加父原點的旋轉
-                final_world_ry_deg = math.degrees(-origin_angle_rad) + abs_ry_deg - 90# Yaw 疊加
-
-                flexroof_data_tuple = (
-                    "flexroof", # 物件類型標識
-                    # 定位與世界旋轉 (6)
-                    world_x, world_y, world_z, 
-                    abs_rx_deg, final_world_ry_deg, abs_rz_deg, # 使用疊加後的Y旋轉
-                    # 核心幾何參數 (5)
-                    base_w, base_l, top_w, top_l, height_val,
-                    # 上底偏移參數 (2)
-                    top_off_x, top_off_z,
-                    # 紋理信息 (3)
-                    gl_texture_id, texture_has_alpha_flag, texture_atlas_file,
-                    # 父原點的Y旋轉角度 (用於可能的調試或小地圖特殊繪製)
-                    math.degrees(origin_angle_rad) 
-                )
-                scene_to_populate.flexroofs.append((line_identifier_for_object, flexroof_data_tuple))
-
-            elif command == "skybox":
-                # ... (skybox 解析邏輯) ...
-                if len(parts) < 2: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'skybox' 需要 base_name。"); continue
-                base_name = parts[1]
-                current_info = {'type': 'skybox', 'base_name': base_name}
-                if scene_to_populate.initial_background_info is None: scene_to_populate.initial_background_info = current_info
-                scene_to_populate.last_background_info = current_info
-
-            elif command == "skydome":
-                # ... (skydome 解析邏輯) ...
-                if len(parts) < 2: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'skydome' 需要 texture_file。"); continue
-                texture_file = parts[1]
-                tex_id = None
-                if load_textures and texture_loader: tex_id = texture_loader.load_texture(texture_file).get("id")
-                current_info = {'type': 'skydome', 'file': texture_file, 'id': tex_id}
-                if scene_to_populate.initial_background_info is None: scene_to_populate.initial_background_info = current_info
-                scene_to_populate.last_background_info = current_info
-                
-            elif command == "map":
-                # ... (map 解析邏輯) ...
-                if len(parts) < 5: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'map' 參數不足。"); continue
-                filename = parts[1]
-                try: center_x, center_z, scale_val = map(float, parts[2:5])
-                except ValueError: print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'map' 參數無效。"); continue
-                # 第一張 map 生效,後續忽略——母場景底圖優先於 import 進來的子場景底圖
-                if scene_to_populate.map_filename is not None:
-                    print(f"資訊: ({current_filename_for_display} 行 {line_num_in_file}) 場景已有底圖 '{scene_to_populate.map_filename}',忽略此 'map' 行(第一張生效)。")
-                    continue
-                # 經緯度 import 上下文中,子場景的 map 中心套用嵌入平移
-                map_off_x, map_off_z = getattr(scene_to_populate, 'current_map_offset', (0.0, 0.0))
-                scene_to_populate.map_filename = filename
-                scene_to_populate.map_world_center_x = center_x + map_off_x
-                scene_to_populate.map_world_center_z = center_z + map_off_z
-                scene_to_populate.map_world_scale = scale_val
-
-            elif command == "latlon":
-                # 經緯度錨點:把「目前相對原點位置」綁定到給定經緯度。
-                # 一個場景只取第一個;建築庫等內嵌場景檔可以完全不用此指令。
-                if len(parts) < 3:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'latlon' 參數不足(需要 緯度 經度)。"); continue
+            # 解析可選的 gradient_permille 和 direction_modifier
+            # gradient 是 parts[4], direction 是 parts[5]
+            if len(parts) > 4: # 至少有一個可選參數
                 try:
-                    lat_v, lon_v = float(parts[1]), float(parts[2])
-                except ValueError:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'latlon' 經緯度無效。"); continue
-                if not (-90.0 <= lat_v <= 90.0 and -180.0 <= lon_v <= 180.0):
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 'latlon' 經緯度超出範圍。"); continue
-                if scene_to_populate.geo_anchor is not None:
-                    print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 場景已有經緯度錨點,忽略此 'latlon'。")
-                else:
-                    # 錨定「軌道目前端點」(current_parse_pos):
-                    # 鋪軌到哪裡寫 latlon,就表示該端點對應這組經緯度
-                    anchor_wx = float(scene_to_populate.current_parse_pos[0])
-                    anchor_wz = float(scene_to_populate.current_parse_pos[2])
-                    scene_to_populate.geo_anchor = (anchor_wx, anchor_wz, lat_v, lon_v)
-                    print(f"資訊: 經緯度錨點設定: 世界 ({anchor_wx:.1f}, {anchor_wz:.1f}) ↔ ({lat_v:.6f}, {lon_v:.6f})")
+                    gradient_permille = float(parts[4])
+                    if len(parts) > 5:
+                        modifier_candidate = parts[5].lower()
+                        if modifier_candidate in ["forward", "backward"]:
+                            branch_direction_mode = modifier_candidate
+                        elif modifier_candidate: # 不是有效的修飾符
+                             scene_diagnostics.warning(f"'vbranch curve' 無效的方向修飾符 '{parts[5]}'", ctx.filename, ctx.line_num, ctx.command)
+                except ValueError: # parts[4] 不是 float，那麼它必須是 direction_modifier
+                    modifier_candidate = parts[4].lower()
+                    if modifier_candidate in ["forward", "backward"]:
+                        branch_direction_mode = modifier_candidate
+                        if len(parts) > 5: # 如果方向在 parts[4]，則 parts[5] 是多餘的
+                            scene_diagnostics.warning(f"'vbranch curve' 在方向修飾符 '{parts[4]}' 後有過多參數。", ctx.filename, ctx.line_num, ctx.command)
+                    elif modifier_candidate: # 不是有效的修飾符
+                        scene_diagnostics.warning(f"'vbranch curve' 無效的可選參數 '{parts[4]}'", ctx.filename, ctx.line_num, ctx.command)
+
+            if abs(branch_radius) < 1e-3 or branch_radius <= 0:
+                 scene_diagnostics.warning(f"'vbranch curve' 半徑 ({branch_radius}) 無效。", ctx.filename, ctx.line_num, ctx.command)
+                 return
+            if abs(branch_sweep_angle_deg) < 1e-3 and branch_sweep_angle_deg != 0.0 :
+                 scene_diagnostics.warning("'vbranch curve' 掃過角度過小。", ctx.filename, ctx.line_num, ctx.command)
+                 # return # 0度曲線可能是特殊情況，暫不跳過
+
+            branch_data_dict["radius"] = branch_radius
+            branch_data_dict["angle_deg"] = branch_sweep_angle_deg # 這是掃過的角度
+            branch_data_dict["gradient"] = gradient_permille
+            branch_data_dict["direction_mode"] = branch_direction_mode
+
+            # 確定曲線的初始切線方向
+            # "forward" 模式：曲線的初始切線方向 = 父軌道段的末端切線方向
+            # "backward" 模式：曲線的初始切線方向 = 父軌道段末端切線方向 + 180度
+            b_initial_tangent_rad = branch_parent_end_angle_rad
+            if branch_direction_mode == "backward":
+                b_initial_tangent_rad += math.pi
+
+            # 與主線彎道相同的封閉解與依弦高誤差的取樣 (圓心在初始切線的轉向側,掃過角度正負決定左右轉)
+            branch_track = CurveTrack(branch_start_pos, b_initial_tangent_rad, branch_radius, branch_sweep_angle_deg, gradient_permille)
+            branch_data_dict["points"], branch_data_dict["orientations"] = branch_track.points, branch_track.orientations
+
+        except ValueError:
+            scene_diagnostics.warning("'vbranch curve' 參數無效。", ctx.filename, ctx.line_num, ctx.command)
+            return
+    else:
+        scene_diagnostics.warning(f"無法識別的 'vbranch' 類型: '{branch_type}'。", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    # 確保生成了足夠的點才添加到父軌道段
+    branch_points = branch_data_dict.get("points")
+    if branch_points is not None and len(branch_points) >= 2:
+        # 與主線相同,點列與朝向存成連續的 (N, 3) / (N, 2) 陣列
+        branch_data_dict["points"] = np.asarray(branch_data_dict["points"], dtype=float).reshape(-1, 3)
+        branch_data_dict["orientations"] = np.asarray(branch_data_dict["orientations"], dtype=float).reshape(-1, 2)
+        parent_segment.visual_branches.append(branch_data_dict)
+        # print(f"DEBUG: Added vbranch {branch_type} with {len(branch_data_dict['points'])} points.") # Debug
+    else:
+        scene_diagnostics.warning(f"vbranch '{branch_type}' 未能生成足够的点，不添加到父轨道段。Points: {branch_data_dict.get('points')}", ctx.filename, ctx.line_num, ctx.command)
+
+def _parse_building_command(ctx, parts):
+    # ... (building 解析邏輯，使用 ctx.scene.current_relative_origin_pos 等)
+    base_param_count = 9;
+    min_parts = 1 + base_param_count
+    if len(parts) < min_parts:
+        scene_diagnostics.warning("'building' 參數不足。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    try:
+        rel_x, rel_y, rel_z = map(float, parts[1:4]);
+        rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]);
+        w, d, h = map(float, parts[7:10])
+    except ValueError:
+        scene_diagnostics.warning("'building' 基本參數無效。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    tex_file = parts[10] if len(parts) > 10 else "building.png"
+    u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,2,1.0,1.0 # <--- uv_mode 預設為2 (Atlas)
+    try:
+        u_offset = float(parts[11]) if len(parts) > 11 else 0.0;
+        v_offset = float(parts[12]) if len(parts) > 12 else 0.0;
+        tex_angle_deg = float(parts[13]) if len(parts) > 13 else 0.0;
+        uv_mode = int(parts[14]) if len(parts) > 14 else 2; # uvmode
+        uscale = float(parts[15]) if len(parts) > 15 else 1.0;
+        vscale = float(parts[16]) if len(parts) > 16 else 1.0
+    except ValueError: pass
+    #                 tex_id = texture_loader.load_texture(tex_file) if ctx.load_textures and texture_loader else None
+    # 只記錄紋理檔名,整個解析結束後再批次載入 (見 _load_pending_textures)
+    gl_texture_id_from_loader = None
+    texture_has_alpha_flag = False
+    _request_texture(ctx.scene, tex_file, ctx.load_textures)
+
+    origin_angle = ctx.scene.current_relative_origin_angle_rad
+    cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    world_offset_x = rel_z * cos_a + rel_x * sin_a
+    world_offset_z = rel_z * sin_a - rel_x * cos_a
+    world_x = ctx.scene.current_relative_origin_pos[0] + world_offset_x
+    world_y = ctx.scene.current_relative_origin_pos[1] + rel_y
+    world_z = ctx.scene.current_relative_origin_pos[2] + world_offset_z
+    absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
+    obj_data_tuple = (
+        "building", # 0
+        world_x, world_y, world_z, # 1 2 3
+        rx_deg, absolute_ry_deg, rz_deg, # 4 5 6
+        w, d, h, # 7 8 9
+    #                     tex_id,
+        u_offset, v_offset, tex_angle_deg, # 10 11 12
+        uv_mode, uscale, vscale, # 13 14 15
+        tex_file, # 原始檔名 16
+        gl_texture_id_from_loader, # OpenGL 紋理 ID 17
+        texture_has_alpha_flag, # 新增的 Alpha 標誌 18
+        math.degrees(origin_angle), # <--- 新增：存儲父原點的Y旋轉角度 (度) 19
+        None,  # 20: vao_id (placeholder)
+        None,  # 21: vbo_id (placeholder)
+        0      # 22: vertex_count (placeholder)
+        )
+    ctx.scene.buildings.append((ctx.line_id, obj_data_tuple))
+
+def _parse_cylinder_command(ctx, parts):
+    # ... (cylinder 解析邏輯) ...
+    base_param_count = 8; min_parts = 1 + base_param_count
+    if len(parts) < min_parts: scene_diagnostics.warning("'cylinder' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+    try: rel_x, rel_y, rel_z = map(float, parts[1:4]); rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]); radius = float(parts[7]); height = float(parts[8])
+    except ValueError: scene_diagnostics.warning("'cylinder' 基本參數無效。", ctx.filename, ctx.line_num, ctx.command); return
+    tex_file = parts[9] if len(parts) > 9 else "metal.png"
+    u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,1,1.0,1.0
+    try: u_offset = float(parts[10]) if len(parts) > 10 else 0.0; v_offset = float(parts[11]) if len(parts) > 11 else 0.0; tex_angle_deg = float(parts[12]) if len(parts) > 12 else 0.0; uv_mode = int(parts[13]) if len(parts) > 13 else 1; uscale = float(parts[14]) if len(parts) > 14 and uv_mode == 0 else 1.0; vscale = float(parts[15]) if len(parts) > 15 and uv_mode == 0 else 1.0
+    except ValueError: pass
+    #                 tex_id = texture_loader.load_texture(tex_file).get("id") if ctx.load_textures and texture_loader else None
+    # 只記錄紋理檔名,整個解析結束後再批次載入 (見 _load_pending_textures)
+    gl_texture_id_from_loader = None
+    texture_has_alpha_flag = False
+    _request_texture(ctx.scene, tex_file, ctx.load_textures)
+
+    origin_angle = ctx.scene.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
+    world_x = ctx.scene.current_relative_origin_pos[0] + world_offset_x; world_y = ctx.scene.current_relative_origin_pos[1] + rel_y; world_z = ctx.scene.current_relative_origin_pos[2] + world_offset_z
+    absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
+    obj_data_tuple = (
+        "cylinder", world_x, world_y, world_z,
+        rx_deg, absolute_ry_deg, rz_deg, radius, height,
+    #                     tex_id,
+        u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale,
+        tex_file,
+        gl_texture_id_from_loader, # OpenGL 紋理 ID
+        texture_has_alpha_flag, # 新增的 Alpha 標誌
+        math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
+        )
+    ctx.scene.cylinders.append((ctx.line_id, obj_data_tuple))
+
+def _parse_tree_command(ctx, parts):
+    # ... (tree 解析邏輯) ...
+    if len(parts) < 5:
+        scene_diagnostics.warning("'tree' 參數不足。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    try:
+        rel_x, rel_y, rel_z = map(float, parts[1:4]);
+        height = float(parts[4])
+    except ValueError:
+        scene_diagnostics.warning("'tree' 基本參數無效。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    if height <=0:
+        scene_diagnostics.warning("'tree' 高度必須為正。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    tex_file = parts[5] if len(parts) > 5 else "tree_leaves.png"
+    #                 print(f"_parse_scene_content: tree tex_file: {tex_file}")
+    tex_id = None # 紋理 ID 在解析結束後批次填入
+    _request_texture(ctx.scene, tex_file, ctx.load_textures)
+    origin_angle = ctx.scene.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
+    world_x = ctx.scene.current_relative_origin_pos[0] + world_offset_x; world_y = ctx.scene.current_relative_origin_pos[1] + rel_y; world_z = ctx.scene.current_relative_origin_pos[2] + world_offset_z
+    obj_data_tuple = (
+        "tree", world_x, world_y, world_z,
+        height, tex_id, tex_file,
+        math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
+        ) # 保持樹的元組結構
+    ctx.scene.trees.append((ctx.line_id, obj_data_tuple))
+
+def _parse_sphere_command(ctx, parts):
+    # ... (sphere 解析邏輯) ...
+    base_param_count = 7; min_parts = 1 + base_param_count
+    if len(parts) < min_parts: scene_diagnostics.warning("'sphere' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+    try: rel_x, rel_y, rel_z = map(float, parts[1:4]); rx_deg, rel_ry_deg, rz_deg = map(float, parts[4:7]); radius = float(parts[7])
+    except ValueError: scene_diagnostics.warning("'sphere' 基本參數無效。", ctx.filename, ctx.line_num, ctx.command); return
+    if radius <=0: scene_diagnostics.warning("'sphere' 半徑必須為正。", ctx.filename, ctx.line_num, ctx.command); return
+    tex_file = parts[8] if len(parts) > 8 else "default_sphere.png"
+    u_offset, v_offset, tex_angle_deg, uv_mode, uscale, vscale = 0.0,0.0,0.0,1,1.0,1.0
+    try: u_offset = float(parts[9]) if len(parts) > 9 else 0.0; v_offset = float(parts[10]) if len(parts) > 10 else 0.0; tex_angle_deg = float(parts[11]) if len(parts) > 11 else 0.0; uv_mode = int(parts[12]) if len(parts) > 12 else 1; uscale = float(parts[13]) if len(parts) > 13 and uv_mode == 0 else 1.0; vscale = float(parts[14]) if len(parts) > 14 and uv_mode == 0 else 1.0
+    except ValueError: pass
+    tex_id = None # 紋理 ID 在解析結束後批次填入
+    _request_texture(ctx.scene, tex_file, ctx.load_textures)
+    origin_angle = ctx.scene.current_relative_origin_angle_rad; cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    world_offset_x = rel_z * cos_a + rel_x * sin_a; world_offset_z = rel_z * sin_a - rel_x * cos_a
+    world_x = ctx.scene.current_relative_origin_pos[0] + world_offset_x; world_y = ctx.scene.current_relative_origin_pos[1] + rel_y; world_z = ctx.scene.current_relative_origin_pos[2] + world_offset_z
+    absolute_ry_deg = math.degrees(-origin_angle) + rel_ry_deg - 90
+    obj_data_tuple = (
+        "sphere", world_x, world_y, world_z,
+        rx_deg, absolute_ry_deg, rz_deg,
+        radius, tex_id, u_offset, v_offset, tex_angle_deg,
+        uv_mode, uscale, vscale, tex_file,
+        math.degrees(origin_angle) # <--- 新增：存儲父原點的Y旋轉角度 (度)
+        )
+    ctx.scene.spheres.append((ctx.line_id, obj_data_tuple))
+
+def _parse_array_command(ctx, parts):
+    # array <數量> <dx> <dy> <dz> <物件指令與參數...>:物件本身的 rel_x/rel_y/rel_z 為第 0 份的位置,
+    # 之後每份再沿 (dx, dy, dz) (同一相對座標系) 位移一次;整組存成一個實例陣列,一次 instanced 繪製
+    if len(parts) < 6:
+        scene_diagnostics.warning("'array' 參數不足 (需要 數量 dx dy dz 與物件指令)。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    object_command = parts[5].lower()
+    if object_command not in scene_objects.INSTANCE_ARRAY_TYPES:
+        scene_diagnostics.warning(f"'array' 不支援物件指令 '{parts[5]}' (可用: {', '.join(scene_objects.INSTANCE_ARRAY_TYPES)})。",
+                                  ctx.filename, ctx.line_num, ctx.command)
+        return
+    try:
+        count = int(parts[1])
+        step_x, step_y, step_z = map(float, parts[2:5])
+    except ValueError:
+        scene_diagnostics.warning("'array' 數量或間距參數無效。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    if count < 1:
+        scene_diagnostics.warning("'array' 數量必須至少為 1。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    if count > ARRAY_MAX_COUNT:
+        scene_diagnostics.warning(f"'array' 數量 {count} 超過上限 {ARRAY_MAX_COUNT} (scene_parser.ARRAY_MAX_COUNT),略過此行。",
+                                  ctx.filename, ctx.line_num, ctx.command)
+        return
+    # 第 0 份照一般物件指令解析 (參數檢查與警告也相同),解析到暫時的場景再取出
+    list_name = scene_objects.INSTANCE_ARRAY_TYPES[object_command]
+    template_scene = Scene()
+    template_scene.current_relative_origin_pos = ctx.scene.current_relative_origin_pos
+    template_scene.current_relative_origin_angle_rad = ctx.scene.current_relative_origin_angle_rad
+    _parse_scene_content([" ".join(parts[5:])], template_scene, ctx.file_dir,
+                         ctx.filename, ctx.imported_files, ctx.is_imported,
+                         load_textures=False, first_line_number=ctx.line_num)
+    templates = getattr(template_scene, list_name)
+    if not templates:
+        return
+    template = templates[0][1]
+    origin_angle = ctx.scene.current_relative_origin_angle_rad
+    cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    world_step = np.array([step_z * cos_a + step_x * sin_a, step_y, step_z * sin_a - step_x * cos_a])
+    offsets = np.arange(count, dtype=np.float64)[:, None] * world_step
+    instance_array = scene_objects.InstanceArray(list_name, template, offsets)
+    _request_texture(ctx.scene, instance_array.field("tex_file"), ctx.load_textures)
+    ctx.scene.instance_arrays.append((ctx.line_id, instance_array))
+
+def _parse_along_command(ctx, parts):
+    # along <軌道距離> <橫向偏移> <物件指令與參數...>:以軌道上該距離處 (橫向偏移與 rel_x 同向) 為相對原點放置物件;
+    # 這裡只記錄,整份解析完後才對軌道的累積長度陣列一次算出全部位置 (見 _resolve_track_placements)
+    if len(parts) < 4:
+        scene_diagnostics.warning("'along' 參數不足 (需要 距離 橫向偏移 與物件指令)。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    if parts[3].lower() not in _TRACK_PLACEABLE_COMMANDS:
+        scene_diagnostics.warning(f"'along' 不支援指令 '{parts[3]}' (可用: {', '.join(sorted(_TRACK_PLACEABLE_COMMANDS))})。",
+                                  ctx.filename, ctx.line_num, ctx.command)
+        return
+    try:
+        track_distance, lateral_offset = float(parts[1]), float(parts[2])
+    except ValueError:
+        scene_diagnostics.warning("'along' 距離或橫向偏移參數無效。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    ctx.scene.track_placements.append(
+        (ctx.line_id, track_distance, lateral_offset, " ".join(parts[3:]),
+         ctx.file_dir, ctx.filename, ctx.is_imported, ctx.line_num))
+
+def _parse_hill_command(ctx, parts):
+    # ... (hill 解析邏輯，使用新的參數)
+    base_param_count = 5;
+    min_parts = 1 + base_param_count
+    if len(parts) < min_parts:
+        scene_diagnostics.warning("'hill' 參數不足。", ctx.filename, ctx.line_num, ctx.command);
+        return
+    try:
+        rel_cx = float(parts[1])
+        rel_base_y = float(parts[2]) # parts[2] 是 base_y (相對或絕對偏移)
+        rel_cz = float(parts[3])
+        base_radius = float(parts[4]);
+        peak_height_offset = float(parts[5])
+        if peak_height_offset <= 0 or base_radius <= 0:
+            scene_diagnostics.warning("'hill' peak_h_offset 和 radius 必須為正。", ctx.filename, ctx.line_num, ctx.command);
+            return
+    except ValueError:
+        scene_diagnostics.warning("'hill' 基本參數無效。", ctx.filename, ctx.line_num, ctx.command);
+        return
+
+    # --- 將相對座標轉換為世界座標 (類似 building) ---
+    origin_pos = ctx.scene.current_relative_origin_pos
+    origin_angle_rad = ctx.scene.current_relative_origin_angle_rad
+
+    cos_oa = math.cos(origin_angle_rad)
+    sin_oa = math.sin(origin_angle_rad)
+
+    # 假設 rel_cz 是 "向前" (沿父級朝向)，rel_cx 是 "向右"
+    world_offset_x_hill = rel_cz * cos_oa + rel_cx * sin_oa
+    world_offset_z_hill = rel_cz * sin_oa - rel_cx * cos_oa
+
+    world_center_x = origin_pos[0] + world_offset_x_hill
+    # base_y 的處理：是疊加到父級Y，還是父級Y + rel_base_y？
+    # 我們假設 rel_base_y 是疊加到父級Y的偏移，與 building 的 rel_y 邏輯一致
+    world_base_y = origin_pos[1] + rel_base_y
+    world_center_z = origin_pos[2] + world_offset_z_hill
+    # --- 結束世界座標轉換 ---
+
+
+    # --- MODIFICATION START: Parse new texture offset parameters ---
+    tex_param_start_index = 6 # tex_file (optional) starts at index 6
+    tex_file = parts[tex_param_start_index] if len(parts) > tex_param_start_index and not parts[tex_param_start_index].replace('.', '', 1).replace('-', '', 1).isdigit() else "grass.png"
+
+    # Determine actual start index for uscale, vscale, uoffset, voffset based on whether tex_file was provided
+    next_numeric_param_idx = tex_param_start_index
+    if tex_file != "grass.png" and len(parts) > tex_param_start_index and parts[tex_param_start_index] == tex_file : # if tex_file was explicitly provided
+        next_numeric_param_idx = tex_param_start_index + 1
+
+
+    uscale, vscale = 10.0, 10.0
+    u_offset, v_offset = 0.0, 0.0 # Default offsets
 
-            else:
-                print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 未知指令 '{command}'")
+    try:
+        if len(parts) > next_numeric_param_idx:
+            uscale = float(parts[next_numeric_param_idx])
+        if len(parts) > next_numeric_param_idx + 1:
+            vscale = float(parts[next_numeric_param_idx + 1])
+        if len(parts) > next_numeric_param_idx + 2:
+            u_offset = float(parts[next_numeric_param_idx + 2])
+        if len(parts) > next_numeric_param_idx + 3:
+            v_offset = float(parts[next_numeric_param_idx + 3])
+    except ValueError:
+        scene_diagnostics.warning("'hill' 紋理縮放/偏移參數解析錯誤。", ctx.filename, ctx.line_num, ctx.command)
+        # Continue with defaults for scaling/offset
+    # --- MODIFICATION END ---
+
+
+    # 只記錄紋理檔名,整個解析結束後再批次載入 (見 _load_pending_textures)
+    gl_texture_id_from_loader = None
+    texture_has_alpha_flag = False
+    _request_texture(ctx.scene, tex_file, ctx.load_textures)
+
+    hill_data_tuple = (
+        "hill",
+        world_center_x, world_base_y, world_center_z,
+        base_radius, peak_height_offset,
+    #                     tex_id,
+        uscale, vscale,
+        u_offset, v_offset, # New parameters added here
+        tex_file,
+        gl_texture_id_from_loader, # OpenGL 紋理 ID
+        texture_has_alpha_flag, # 新增的 Alpha 標誌
+        math.degrees(origin_angle_rad), # <--- 新增：存儲父原點的Y旋轉角度 (度)
+        None,  # 14: vao_id (placeholder)
+        None,  # 15: vbo_id (placeholder)
+        0      # 16: vertex_count (placeholder)
+        )
+    #                 print(f"DEBUG PARSER: Packing hill_data_tuple for line '{ctx.line_id}':")
+    #                 for i, val in enumerate(hill_data_tuple):
+    #                     print(f"  Index {i}: Value = {val}, Type = {type(val)}")
+    ctx.scene.hills.append((ctx.line_id, hill_data_tuple))
+
+def _parse_gableroof_command(ctx, parts):
+    # 預期參數個數：cmd(1) + rel_xyz(3) + abs_ry(1) + base_wl(2) + ridge_h(1) = 8 個是基本必需的
+    # 加上可選的 abs_rx, abs_rz，則為 10 個
+    # 我們將 abs_ry 設為必需，rx, rz 可選
+    num_required_parts_in_cmd = 8 # cmd, rel_xyz, abs_ry, base_w, base_l, ridge_h_off
+
+    if len(parts) < num_required_parts_in_cmd:
+        scene_diagnostics.warning(f"'{ctx.command}' 指令必需參數不足。需要至少 {num_required_parts_in_cmd-1} 個參數，得到 {len(parts)-1} 個。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    try:
+        p_idx = 1
+        rel_x = float(parts[p_idx]); p_idx += 1
+        rel_y = float(parts[p_idx]); p_idx += 1
+        rel_z = float(parts[p_idx]); p_idx += 1
+
+        # 旋轉參數 abs_rx?, abs_ry, abs_rz?
+        # 為了簡化，我們先假設 abs_ry 是必需的，在 abs_rx 和 abs_rz 之間
+        # 或者我們按順序解析，如果不存在則用預設值
+        abs_rx_val = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if abs_rx_val != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()): # 如果提供了rx或看起來像數字
+            p_idx +=1
+
+        abs_ry_val = float(parts[p_idx]) if len(parts) > p_idx else 0.0 # abs_ry 應該是必需的
+        p_idx +=1
+
+        abs_rz_val = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if abs_rz_val != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+            p_idx +=1
+
+        base_w = float(parts[p_idx]); p_idx += 1
+        base_l = float(parts[p_idx]); p_idx += 1
+        ridge_h_off = float(parts[p_idx]); p_idx += 1
+
+        if base_w <= 0 or base_l <= 0 or ridge_h_off < 0: # ridge_h_off 可以為0（平頂）或正
+            scene_diagnostics.warning(f"'{ctx.command}' 尺寸參數 (base_w, base_l) 必須為正，ridge_h_off 必須非負。", ctx.filename, ctx.line_num, ctx.command)
+            return
+
+        # 可選參數
+        ridge_x_pos_offset = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if ridge_x_pos_offset != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+            p_idx += 1
+
+        eave_overhang_x = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if eave_overhang_x != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+             p_idx += 1
+
+        eave_overhang_z = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if eave_overhang_z != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+             p_idx += 1
+
+        texture_atlas_file = parts[p_idx] if len(parts) > p_idx else "default_roof_atlas.png"
+        # p_idx += 1 # 如果後面還有參數
+
+
+    except (ValueError, IndexError) as e_parse:
+        scene_diagnostics.warning(f"'{ctx.command}' 參數解析錯誤: {e_parse}", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    # 只記錄紋理檔名,整個解析結束後再批次載入 (見 _load_pending_textures)
+    gl_texture_id = None
+    texture_has_alpha_flag = False
+    _request_texture(ctx.scene, texture_atlas_file, ctx.load_textures)
+
+    # 轉換到世界座標 (基準點轉換)
+    origin_pos = ctx.scene.current_relative_origin_pos
+    origin_angle_rad = ctx.scene.current_relative_origin_angle_rad
+
+    cos_oa = math.cos(origin_angle_rad)
+    sin_oa = math.sin(origin_angle_rad)
+
+    # rel_z 沿父原點朝向向前、rel_x 為側向偏移 (與 building 相同)
+    world_x = origin_pos[0] + rel_z * cos_oa + rel_x * sin_oa
+    world_y = origin_pos[1] + rel_y # rel_y 是絕對的Y偏移，疊加到父原點的Y上
+    world_z = origin_pos[2] + rel_z * sin_oa - rel_x * cos_oa
+
+    # 旋轉值直接使用解析出來的 abs_rx_val, abs_ry_val, abs_rz_val
+    absolute_ry_deg = math.degrees(-origin_angle_rad) + abs_ry_val - 90
+    gableroof_data_tuple = (
+        "gableroof",
+        # 定位與世界旋轉 (6)
+        world_x, world_y, world_z,
+        abs_rx_val, absolute_ry_deg, abs_rz_val,
+        # 核心幾何參數 (4)
+        base_w, base_l, ridge_h_off, # eave_h 暫時不用，讓 rel_y 直接定義屋簷Y
+        # 形狀調整參數 (3)
+        ridge_x_pos_offset, eave_overhang_x, eave_overhang_z,
+        # 紋理信息 (3)
+        gl_texture_id, texture_has_alpha_flag, texture_atlas_file,
+        math.degrees(origin_angle_rad) # <--- 新增：存儲父原點的Y旋轉角度 (度)
+    )
+    ctx.scene.gableroofs.append((ctx.line_id, gableroof_data_tuple))
 
-        except Exception as e:
-             print(f"警告: ({current_filename_for_display} 行 {line_num_in_file}) 處理指令 '{line}' 時發生內部錯誤: {e}")
-             import traceback
-             traceback.print_exc()
+def _parse_flexroof_command(ctx, parts):
+    # 參數順序: rel_x rel_y rel_z abs_rx° abs_ry° abs_rz° base_w base_l top_w top_l height [top_off_x] [top_off_z] [texture_atlas]
+    num_required_params = 11 # cmd + 6定位旋轉 + 5核心幾何
+    if len(parts) < 1 + num_required_params: # parts[0] 是指令本身
+        scene_diagnostics.warning(f"'{ctx.command}' 指令必需參數不足。需要至少 {num_required_params} 個參數，得到 {len(parts)-1} 個。", ctx.filename, ctx.line_num, ctx.command)
+        return
 
-    # --- 排序背景觸發器 ---
-    scene_to_populate.background_triggers.sort(key=lambda item: item[0])
-    return scene_to_populate
+    try:
+        p_idx = 1
+        rel_x = float(parts[p_idx]); p_idx += 1
+        rel_y = float(parts[p_idx]); p_idx += 1
+        rel_z = float(parts[p_idx]); p_idx += 1
+
+        # 旋轉參數 (abs_rx 可選, abs_ry 必需, abs_rz 可選)
+        abs_rx_deg = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if abs_rx_deg != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+            p_idx +=1
+
+        if len(parts) <= p_idx: raise ValueError("缺少必需的 abs_ry° 參數")
+        abs_ry_deg = float(parts[p_idx]); p_idx += 1 # abs_ry 是必需的
+
+        abs_rz_deg = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if abs_rz_deg != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+            p_idx +=1
+
+        # 核心幾何參數
+        if len(parts) <= p_idx + 4: raise ValueError("缺少核心幾何參數 (base_w, base_l, top_w, top_l, height)")
+        base_w = float(parts[p_idx]); p_idx += 1
+        base_l = float(parts[p_idx]); p_idx += 1
+        top_w = float(parts[p_idx]); p_idx += 1
+        top_l = float(parts[p_idx]); p_idx += 1
+        height_val = float(parts[p_idx]); p_idx += 1
+
+        if base_w <= 0 or base_l <= 0 or top_w < 0 or top_l < 0 or height_val <= 0:
+            scene_diagnostics.warning(f"'{ctx.command}' 尺寸參數無效 (base_w/l > 0, top_w/l >= 0, height > 0)。", ctx.filename, ctx.line_num, ctx.command)
+            return
+
+        # 可選的上底偏移參數
+        top_off_x = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if top_off_x != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+             p_idx += 1
+
+        top_off_z = float(parts[p_idx]) if len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+        if top_off_z != 0.0 or (len(parts) > p_idx and parts[p_idx].replace('.', '', 1).replace('-', '', 1).isdigit()):
+             p_idx += 1
+
+        # 可選的紋理圖集
+        texture_atlas_file = parts[p_idx] if len(parts) > p_idx else "default_flexroof_atlas.png" # 或者您選擇的預設名稱
+        # p_idx += 1 # 如果後面還有參數
+
+    except (ValueError, IndexError) as e_parse:
+        scene_diagnostics.warning(f"'{ctx.command}' 參數解析錯誤: {e_parse}", ctx.filename, ctx.line_num, ctx.command)
+        return
+
+    # 只記錄紋理檔名,整個解析結束後再批次載入 (見 _load_pending_textures)
+    gl_texture_id = None
+    texture_has_alpha_flag = False
+    _request_texture(ctx.scene, texture_atlas_file, ctx.load_textures)
+
+    # 轉換到世界座標
+    origin_pos = ctx.scene.current_relative_origin_pos
+    origin_angle_rad = ctx.scene.current_relative_origin_angle_rad
+
+    cos_oa = math.cos(origin_angle_rad)
+    sin_oa = math.sin(origin_angle_rad)
+
+    world_offset_x = rel_z * cos_oa + rel_x * sin_oa
+    world_offset_z = rel_z * sin_oa - rel_x * cos_oa
+
+    world_x = origin_pos[0] + world_offset_x
+    world_y = origin_pos[1] + rel_y
+    world_z = origin_pos[2] + world_offset_z
+
+    # 旋轉值直接使用解析出來的 abs_rx_deg, abs_ry_deg, abs_rz_deg
+    # 但 Y 軸旋轉需要疊加父原點的旋轉
+    final_world_ry_deg = math.degrees(-origin_angle_rad) + abs_ry_deg - 90# Yaw 疊加
+
+    flexroof_data_tuple = (
+        "flexroof", # 物件類型標識
+        # 定位與世界旋轉 (6)
+        world_x, world_y, world_z,
+        abs_rx_deg, final_world_ry_deg, abs_rz_deg, # 使用疊加後的Y旋轉
+        # 核心幾何參數 (5)
+        base_w, base_l, top_w, top_l, height_val,
+        # 上底偏移參數 (2)
+        top_off_x, top_off_z,
+        # 紋理信息 (3)
+        gl_texture_id, texture_has_alpha_flag, texture_atlas_file,
+        # 父原點的Y旋轉角度 (用於可能的調試或小地圖特殊繪製)
+        math.degrees(origin_angle_rad)
+    )
+    ctx.scene.flexroofs.append((ctx.line_id, flexroof_data_tuple))
+
+def _parse_skybox_command(ctx, parts):
+    # ... (skybox 解析邏輯) ...
+    if len(parts) < 2: scene_diagnostics.warning("'skybox' 需要 base_name。", ctx.filename, ctx.line_num, ctx.command); return
+    base_name = parts[1]
+    current_info = {'type': 'skybox', 'base_name': base_name}
+    if ctx.scene.initial_background_info is None: ctx.scene.initial_background_info = current_info
+    ctx.scene.last_background_info = current_info
+
+def _parse_skydome_command(ctx, parts):
+    # ... (skydome 解析邏輯) ...
+    if len(parts) < 2: scene_diagnostics.warning("'skydome' 需要 texture_file。", ctx.filename, ctx.line_num, ctx.command); return
+    texture_file = parts[1]
+    tex_id = None # 紋理 ID 在解析結束後批次填入
+    _request_texture(ctx.scene, texture_file, ctx.load_textures)
+    current_info = {'type': 'skydome', 'file': texture_file, 'id': tex_id}
+    if ctx.scene.initial_background_info is None: ctx.scene.initial_background_info = current_info
+    ctx.scene.last_background_info = current_info
+
+def _parse_map_command(ctx, parts):
+    # ... (map 解析邏輯) ...
+    if len(parts) < 5: scene_diagnostics.warning("'map' 參數不足。", ctx.filename, ctx.line_num, ctx.command); return
+    filename = parts[1]
+    try: center_x, center_z, scale_val = map(float, parts[2:5])
+    except ValueError: scene_diagnostics.warning("'map' 參數無效。", ctx.filename, ctx.line_num, ctx.command); return
+    # 第一張 map 生效,後續忽略——母場景底圖優先於 import 進來的子場景底圖
+    if ctx.scene.map_filename is not None:
+        scene_diagnostics.info(f"場景已有底圖 '{ctx.scene.map_filename}',忽略此 'map' 行(第一張生效)。", ctx.filename, ctx.line_num, ctx.command)
+        return
+    # 經緯度 import 上下文中,子場景的 map 中心套用嵌入平移
+    map_off_x, map_off_z = getattr(ctx.scene, 'current_map_offset', (0.0, 0.0))
+    ctx.scene.map_filename = filename
+    ctx.scene.map_world_center_x = center_x + map_off_x
+    ctx.scene.map_world_center_z = center_z + map_off_z
+    ctx.scene.map_world_scale = scale_val
+
+def _parse_latlon_command(ctx, parts):
+    # 經緯度錨點:把「目前相對原點位置」綁定到給定經緯度。
+    # 一個場景只取第一個;建築庫等內嵌場景檔可以完全不用此指令。
+    if len(parts) < 3:
+        scene_diagnostics.warning("'latlon' 參數不足(需要 緯度 經度)。", ctx.filename, ctx.line_num, ctx.command); return
+    try:
+        lat_v, lon_v = float(parts[1]), float(parts[2])
+    except ValueError:
+        scene_diagnostics.warning("'latlon' 經緯度無效。", ctx.filename, ctx.line_num, ctx.command); return
+    if not (-90.0 <= lat_v <= 90.0 and -180.0 <= lon_v <= 180.0):
+        scene_diagnostics.warning("'latlon' 經緯度超出範圍。", ctx.filename, ctx.line_num, ctx.command); return
+    if ctx.scene.geo_anchor is not None:
+        scene_diagnostics.warning("場景已有經緯度錨點,忽略此 'latlon'。", ctx.filename, ctx.line_num, ctx.command)
+    else:
+        # 錨定「軌道目前端點」(current_parse_pos):
+        # 鋪軌到哪裡寫 latlon,就表示該端點對應這組經緯度
+        anchor_wx = float(ctx.scene.current_parse_pos[0])
+        anchor_wz = float(ctx.scene.current_parse_pos[2])
+        ctx.scene.geo_anchor = (anchor_wx, anchor_wz, lat_v, lon_v)
+        scene_diagnostics.info(f"經緯度錨點設定: 世界 ({anchor_wx:.1f}, {anchor_wz:.1f}) ↔ ({lat_v:.6f}, {lon_v:.6f})",
+                               ctx.filename, ctx.line_num, ctx.command)
 
 # --- 修改 parse_scene_from_lines 和 parse_scene_file ---
 def parse_scene_from_lines(lines_list, base_dir_for_import: str, 
@@ -1343,40 +1663,1450 @@ def parse_scene_from_lines(lines_list, base_dir_for_import: str,
         is_parsing_imported_file=False, # <--- 關鍵：標記這是根文件/非導入上下文
         load_textures=load_textures
     )
+    # 5. 放置 along 物件,再批次載入解析期間記錄的紋理
+    _resolve_track_placements(populated_scene, load_textures)
+    _load_pending_textures(populated_scene)
+    _finish_scene_stats(populated_scene)
     
     return populated_scene
 
-def parse_scene_file(filepath_to_parse, initial_scene: Scene = None, load_textures=True):
+# --- 串流解析 ---
+# 場景檔逐塊讀取與解析,原文解析完就丟棄;物件直接進 Scene 的欄式儲存,
+# 峰值記憶體只和場景物件本身有關,不隨檔案行數成長。
+STREAM_CHUNK_LINES = 4096
+
+def _iter_line_chunks(file_obj, chunk_lines=None):
+    """從已開啟的文字檔逐塊讀出行列表 (每塊最多 chunk_lines 行)。"""
+    chunk_lines = chunk_lines or STREAM_CHUNK_LINES
+    chunk = []
+    for raw_line in file_obj:
+        chunk.append(raw_line)
+        if len(chunk) >= chunk_lines:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_parse_scene_file(filepath_to_parse, initial_scene: Scene = None, load_textures=True,
+                          chunk_lines=None):
+    """
+    串流解析場景檔的生成器。
+    每解析完一塊 yield (scene, {列表名: (起始索引, 結束索引)}, 已讀位元組, 檔案位元組),
+    範圍是這一塊 (含其 import) 新增的物件;最後再 yield 一次 (scene, {}, 檔案位元組, 檔案位元組),
+    此時紋理已載入、scene.stats 已算好、場景完整。檔案不存在時拋出 FileNotFoundError。
+    """
+    scene_obj = initial_scene if initial_scene is not None else Scene()
+    filepath_abs = os.path.abspath(filepath_to_parse)
+    base_dir = os.path.dirname(filepath_to_parse)
+    filename_for_display = os.path.basename(filepath_to_parse)
+    total_bytes = os.path.getsize(filepath_to_parse)
+    with open(filepath_to_parse, 'r', encoding="utf-8") as f:
+        scene_obj.source_files = {filepath_abs: None} # 根檔在前,內容雜湊讀完才知道
+        if not hasattr(scene_obj, 'current_parse_pos'):
+            scene_obj.current_parse_pos = np.copy(scene_obj.start_position)
+            scene_obj.current_parse_angle_rad = math.radians(scene_obj.start_angle_deg)
+            scene_obj.current_relative_origin_pos = np.copy(scene_obj.current_parse_pos)
+            scene_obj.current_relative_origin_angle_rad = scene_obj.current_parse_angle_rad
+            scene_obj.last_background_info = scene_obj.initial_background_info
+        imported_files_set = set() # 整個根檔共用,循環導入偵測跨塊有效
+        hasher = hashlib.blake2b(digest_size=16)
+        bytes_read = 0
+        first_line_number = 1
+        for chunk in _iter_line_chunks(f, chunk_lines):
+            chunk_bytes = "".join(chunk).encode("utf-8")
+            hasher.update(chunk_bytes)
+            bytes_read += len(chunk_bytes)
+            lengths_before = {name: len(getattr(scene_obj, name)) for name in _OBJECT_LIST_NAMES}
+            _parse_scene_content(chunk, scene_obj, base_dir, filename_for_display, imported_files_set,
+                                 is_parsing_imported_file=False, load_textures=load_textures,
+                                 first_line_number=first_line_number)
+            first_line_number += len(chunk)
+            added = {}
+            for name, start in lengths_before.items():
+                end = len(getattr(scene_obj, name))
+                if end != start:
+                    added[name] = (start, end)
+            yield scene_obj, added, min(bytes_read, total_bytes), total_bytes
+    scene_obj.source_files[filepath_abs] = hasher.hexdigest()
+    _resolve_track_placements(scene_obj, load_textures)
+    _load_pending_textures(scene_obj)
+    _finish_scene_stats(scene_obj)
+    yield scene_obj, {}, total_bytes, total_bytes
+
+def parse_scene_file(filepath_to_parse, initial_scene: Scene = None, load_textures=True,
+                     progress_callback=None):
     """
-    Parses the scene definition from a file.
+    Parses the scene definition from a file (streamed in chunks, see iter_parse_scene_file).
     Args:
         filepath_to_parse: Path to the scene definition file.
         initial_scene: An optional Scene object to populate. If None, a new one is created.
         load_textures: Whether to load textures.
+        progress_callback: Optional progress_callback(bytes_done, bytes_total), called after each chunk.
     Returns:
         A Scene object, or None if file not found.
     """
-    print(f"從檔案 '{filepath_to_parse}' 開始解析場景...")
+    scene_diagnostics.info(f"從檔案 '{filepath_to_parse}' 開始解析場景...")
     try:
-        with open(filepath_to_parse, 'r', encoding="utf-8") as f:
-            lines = f.readlines()
-        # 傳遞檔案所在目錄作為 import 的基礎目錄
-        return parse_scene_from_lines(lines, os.path.dirname(filepath_to_parse), 
-            os.path.basename(filepath_to_parse),
-                                      initial_scene, load_textures)
+        scene_obj = None
+        for scene_obj, _added, bytes_done, bytes_total in iter_parse_scene_file(
+                filepath_to_parse, initial_scene, load_textures):
+            if progress_callback:
+                progress_callback(bytes_done, bytes_total)
+        return scene_obj
     except FileNotFoundError:
-        print(f"錯誤: 場景檔案 '{filepath_to_parse}' 不存在。")
+        scene_diagnostics.error(f"場景檔案 '{filepath_to_parse}' 不存在。")
         return None # 或返回空的 Scene？取決於調用者的期望
     except Exception as e:
-        print(f"讀取或解析場景檔案 '{filepath_to_parse}' 時發生未知錯誤: {e}")
+        scene_diagnostics.error(f"讀取或解析場景檔案 '{filepath_to_parse}' 時發生未知錯誤: {e}")
         return initial_scene if initial_scene is not None else Scene() # 返回傳入的或新的空場景
 
+# --- 導入子場景的 prefab 快取 ---
+# 車站檔等只有物件的子場景,以 (路徑, mtime) 為鍵只解析一次成局部空間的 prefab
+# (原點 (0,0,0)、角度 π/2 即恆等轉換);每個 import 只是一個帶原點與角度的實例,
+# 用一次向量化運算轉到世界座標。含軌道/start/import 的檔案仍走原本的遞迴解析。
+_PREFAB_BLOCKING_COMMANDS = {"start", "straight", "curve", "vbranch", "import"}
+_prefab_cache = {} # {絕對路徑: ((mtime_ns, size), ScenePrefab)}
+
+class ScenePrefab:
+    """一個導入檔解析一次後的結果。"""
+    def __init__(self, filepath_abs, lines, content_hash):
+        self.filepath_abs = filepath_abs
+        self.lines = lines # 只有需要完整遞迴解析 (不可實例化) 的檔案才保留原文
+        self.content_hash = content_hash
+        self.is_instanceable = False
+        # {列表名: 局部空間的 ObjectStore}
+        self.objects = {}
+        # 局部空間的實例陣列 [(行識別碼, InstanceArray)]
+        self.instance_arrays = []
+        # 非物件指令 (map/latlon/skybox/skydome...):實例化時以實例的解析狀態逐行重播
+        self.scene_lines = []
+        # 解析物件行時的診斷訊息 (scene_diagnostics.capture);每次實例化時重新送出
+        self.diagnostics = []
+
+def _build_prefab(filepath_abs):
+    """逐塊讀取導入檔並解析成局部空間 prefab;遇到軌道/start/import 指令時改為保留全文供遞迴解析。"""
+    prefab = ScenePrefab(filepath_abs, None, None)
+    hasher = hashlib.blake2b(digest_size=16)
+    local_scene = Scene()
+    local_scene.current_relative_origin_pos = np.zeros(3)
+    local_scene.current_relative_origin_angle_rad = math.pi / 2.0 # 恆等轉換
+    first_line_number = 1
+    with open(filepath_abs, 'r', encoding='utf-8') as f_import:
+        for chunk in _iter_line_chunks(f_import):
+            hasher.update("".join(chunk).encode("utf-8"))
+            object_only_lines = []
+            for line_num, raw_line in enumerate(chunk, first_line_number):
+                stripped = raw_line.strip()
+                command = stripped.split()[0].lower() if stripped and not stripped.startswith('#') else None
+                if command is None or command in _OBJECT_COMMANDS:
+                    object_only_lines.append(raw_line)
+                    continue
+                if command in _PREFAB_BLOCKING_COMMANDS:
+                    # 需要完整遞迴解析
+                    f_import.seek(0)
+                    prefab.lines = f_import.readlines()
+                    prefab.content_hash = _hash_scene_text(prefab.lines)
+                    return prefab
+                prefab.scene_lines.append((line_num, raw_line))
+                object_only_lines.append("\n") # 保留行號
+            with scene_diagnostics.capture() as chunk_diagnostics:
+                _parse_scene_content(object_only_lines, local_scene, os.path.dirname(filepath_abs),
+                                     os.path.basename(filepath_abs), set(),
+                                     is_parsing_imported_file=True, load_textures=False,
+                                     first_line_number=first_line_number)
+            prefab.diagnostics.extend(chunk_diagnostics)
+            first_line_number += len(chunk)
+    prefab.content_hash = hasher.hexdigest()
+    for list_name in _OBJECT_LIST_NAMES:
+        local_store = getattr(local_scene, list_name)
+        if local_store:
+            prefab.objects[list_name] = local_store
+    prefab.instance_arrays = local_scene.instance_arrays
+    prefab.is_instanceable = True
+    return prefab
+
+def _get_import_prefab(filepath_abs):
+    """取得導入檔的 prefab;檔案的 mtime/大小沒變就沿用快取。"""
+    stat = os.stat(filepath_abs)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    cached = _prefab_cache.get(filepath_abs)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    prefab = _build_prefab(filepath_abs)
+    _prefab_cache[filepath_abs] = (stat_key, prefab)
+    return prefab
+
+def clear_prefab_cache():
+    _prefab_cache.clear()
+
+# --- 導入檔平行解析 ---
+# prefab 是只依檔案內容而定的局部空間結果,彼此獨立;一個檔案的所有 import 目標可先在
+# 行程池中同時建好放進 _prefab_cache,之後 import 指令仍依宣告順序逐一實例化
+# (背景觸發器、file:line 識別碼、map 偏移都沿用原本的合併路徑)。
+PARALLEL_IMPORT_PARSING = True
+PARALLEL_IMPORT_MIN_BYTES = 512 * 1024 # 待解析的導入檔合計小於此大小時,行程啟動成本不划算,直接在本行程解析
+PARALLEL_IMPORT_WORKERS = None # None: 依 CPU 核心數
+_import_pool = None
+
+def _get_import_pool(worker_count):
+    global _import_pool
+    if _import_pool is None:
+        # spawn:不繼承主行程的 OpenGL/Qt 執行緒狀態;池子保留給之後的重載重複使用
+        _import_pool = ProcessPoolExecutor(max_workers=worker_count,
+                                           mp_context=multiprocessing.get_context("spawn"))
+    return _import_pool
+
+def shutdown_import_pool():
+    global _import_pool
+    if _import_pool is not None:
+        _import_pool.shutdown(wait=False, cancel_futures=True)
+        _import_pool = None
+
+def _build_prefab_job(filepath_abs):
+    """行程池工作:回傳 (路徑, stat 鍵, prefab);stat 在讀檔前取得,檔案之後變動時快取會失效。"""
+    stat = os.stat(filepath_abs)
+    return filepath_abs, (stat.st_mtime_ns, stat.st_size), _build_prefab(filepath_abs)
+
+def _import_targets(lines_list, current_file_directory):
+    targets = []
+    for raw_line in lines_list:
+        parts = raw_line.split()
+        if len(parts) >= 2 and parts[0].lower() == "import":
+            targets.append(os.path.abspath(os.path.join(current_file_directory, parts[1])))
+    return targets
+
+def _prefetch_import_prefabs(lines_list, current_file_directory, imported_files):
+    """把 lines_list 中 import 的檔案 (以及這些檔案再 import 的檔案) 的 prefab 平行建好。"""
+    if not PARALLEL_IMPORT_PARSING:
+        return
+    worker_count = PARALLEL_IMPORT_WORKERS or os.cpu_count() or 1
+    if worker_count < 2:
+        return
+    targets = _import_targets(lines_list, current_file_directory)
+    seen = set(imported_files)
+    while targets:
+        stale = {}
+        for filepath_abs in targets:
+            if filepath_abs in seen: continue
+            seen.add(filepath_abs)
+            try:
+                stat = os.stat(filepath_abs)
+            except OSError:
+                continue
+            cached = _prefab_cache.get(filepath_abs)
+            if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+                stale[filepath_abs] = stat.st_size
+        if len(stale) < 2 or sum(stale.values()) < PARALLEL_IMPORT_MIN_BYTES:
+            return # 剩下的在 import 時依需要逐一建立
+        try:
+            results = list(_get_import_pool(worker_count).map(_build_prefab_job, stale))
+        except Exception as e:
+            scene_diagnostics.warning(f"平行解析導入檔失敗,改為逐一解析: {e}")
+            shutdown_import_pool()
+            return
+        targets = []
+        for filepath_abs, stat_key, prefab in results:
+            _prefab_cache[filepath_abs] = (stat_key, prefab)
+            if not prefab.is_instanceable:
+                # 含軌道等指令的檔案會在本行程遞迴解析,它的 import 也先準備好
+                targets.extend(_import_targets(prefab.lines, os.path.dirname(filepath_abs)))
+
+def _instantiate_prefab(prefab, scene_to_populate, imported_files, load_textures):
+    """以目前的相對原點/角度把 prefab 的物件轉到世界座標並加入場景。"""
+    origin_pos = scene_to_populate.current_relative_origin_pos
+    origin_angle_rad = scene_to_populate.current_relative_origin_angle_rad
+    cos_a = math.cos(origin_angle_rad); sin_a = math.sin(origin_angle_rad)
+    parent_ry_deg = float(math.degrees(origin_angle_rad))
+    # 局部 Y 旋轉 = rel_ry - 180;世界 Y 旋轉 = -deg(角度) + rel_ry - 90
+    ry_delta_deg = 90.0 - parent_ry_deg
+
+    instance_ranges = {}
+    for list_name, local_store in prefab.objects.items():
+        local_x = local_store.column("x"); local_y = local_store.column("y"); local_z = local_store.column("z")
+        world_store = local_store.copy()
+        world_store.column("x")[:] = origin_pos[0] + local_z * cos_a + local_x * sin_a
+        world_store.column("y")[:] = origin_pos[1] + local_y
+        world_store.column("z")[:] = origin_pos[2] + local_z * sin_a - local_x * cos_a
+        if world_store.has_field("ry"):
+            world_store.column("ry")[:] = local_store.column("ry") + ry_delta_deg
+        world_store.column("parent_ry")[:] = parent_ry_deg
+        for tex_file in world_store.texture_names:
+            _request_texture(scene_to_populate, tex_file, load_textures)
+        world_store.mark_modified()
+
+        target_store = getattr(scene_to_populate, list_name)
+        start_index = len(target_store)
+        target_store.extend_store(world_store)
+        instance_ranges[list_name] = (start_index, len(target_store))
+
+    if prefab.instance_arrays:
+        start_index = len(scene_to_populate.instance_arrays)
+        for line_id, local_array in prefab.instance_arrays:
+            local_x, local_y, local_z = local_array.origin
+            new_values = {
+                "x": float(origin_pos[0] + local_z * cos_a + local_x * sin_a),
+                "y": float(origin_pos[1] + local_y),
+                "z": float(origin_pos[2] + local_z * sin_a - local_x * cos_a),
+                "parent_ry": parent_ry_deg,
+            }
+            if local_array.has_field("ry"):
+                new_values["ry"] = local_array.field("ry") + ry_delta_deg
+            local_offsets = local_array.offsets
+            world_offsets = np.column_stack((local_offsets[:, 2] * cos_a + local_offsets[:, 0] * sin_a,
+                                             local_offsets[:, 1],
+                                             local_offsets[:, 2] * sin_a - local_offsets[:, 0] * cos_a))
+            world_array = scene_objects.InstanceArray(local_array.list_name,
+                                                      local_array.with_fields(**new_values).template,
+                                                      world_offsets)
+            _request_texture(scene_to_populate, world_array.field("tex_file"), load_textures)
+            scene_to_populate.instance_arrays.append((line_id, world_array))
+        instance_ranges["instance_arrays"] = (start_index, len(scene_to_populate.instance_arrays))
+
+    scene_to_populate.import_instances.append(
+        (prefab.filepath_abs, tuple(float(v) for v in origin_pos), float(origin_angle_rad), instance_ranges))
+    # prefab 只解析一次 (可能在子行程),它的訊息在每次實例化時送出,如同逐行解析
+    scene_diagnostics.replay(prefab.diagnostics)
+
+    # 非物件指令以實例的解析狀態重播 (訊息與行號同一般解析)
+    for line_num, raw_line in prefab.scene_lines:
+        _parse_scene_content([raw_line], scene_to_populate, os.path.dirname(prefab.filepath_abs),
+                             os.path.basename(prefab.filepath_abs), imported_files,
+                             is_parsing_imported_file=True, load_textures=load_textures,
+                             first_line_number=line_num)
+
+# --- 編輯器用:增量解析 ---
+# 物件指令只產生物件、不改變解析狀態,修改這類行只需重新解析該行;
+# 其餘指令 (start/straight/curve/vbranch/import/skybox/skydome/map/latlon) 會影響之後的行,
+# 修改時從該行往下重算相對原點鏈。物件指令集合 _OBJECT_COMMANDS 由 register_scene_command 維護。
+_OBJECT_LIST_NAMES = ("buildings", "cylinders", "trees", "spheres", "hills", "gableroofs", "flexroofs")
+# along 放出的物件所在的列表 (along 可接 hill 以外的物件指令,含 array)
+_PLACED_LIST_NAMES = _OBJECT_LIST_NAMES + ("instance_arrays",)
+# 增量解析逐行追蹤的列表:物件列表、實例陣列與 along 記錄
+_PARSED_LIST_NAMES = _PLACED_LIST_NAMES + ("track_placements",)
+
+def _is_object_or_inert_line(line):
+    """空行、註解(含內嵌編輯器設定)與物件指令行不影響後續行的解析狀態。"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith('#'):
+        return True
+    command = stripped.split()[0].lower()
+    return command in _OBJECT_COMMANDS or command == "along"
+
+# --- 連續物件行的批次解析 ---
+# 大型場景多半是一長串同一種物件指令 (數百行 building)。解析一個檔案前先找出這些連續段,
+# 每一欄用一次 map(float/int, ...) 整批轉換,相對原點轉換也以陣列計算,再整段寫進 ObjectStore;
+# 逐行解析會警告或只部分套用的列 (參數不足/無效、高度或半徑非正) 不進批次,留給逐行解析處理。
+BULK_OBJECT_PARSING = True
+BULK_OBJECT_MIN_RUN = 8 # 連續少於此行數的同類物件仍逐行解析
+
+_EDITOR_SETTINGS_LINE_PREFIX = "#EDITOR_SCENE_SETTINGS_JSON:"
+
+# 指令 → 必要浮點參數 (依序為第 1 個起的 token)、其後的紋理 token 與預設紋理、
+# 紋理之後的選填參數 (欄位, 轉換, 預設值)、組回 tuple 的長度與固定欄位值
+_BULK_OBJECT_SPECS = {
+    "building": {
+        "list": "buildings",
+        "required": ("x", "y", "z", "rx", "ry", "rz", "w", "d", "h"),
+        "default_tex": "building.png",
+        "optional": (("u_offset", float, 0.0), ("v_offset", float, 0.0), ("tex_angle", float, 0.0),
+                     ("uv_mode", int, 2), ("uscale", float, 1.0), ("vscale", float, 1.0)),
+        "scale_needs_uv0": False,
+        "positive": None,
+        "row_length": len(scene_objects.BUILDING_FIELDS),
+        "fixed": {"vertex_count": 0},
+    },
+    "cylinder": {
+        "list": "cylinders",
+        "required": ("x", "y", "z", "rx", "ry", "rz", "radius", "h"),
+        "default_tex": "metal.png",
+        "optional": (("u_offset", float, 0.0), ("v_offset", float, 0.0), ("tex_angle", float, 0.0),
+                     ("uv_mode", int, 1), ("uscale", float, 1.0), ("vscale", float, 1.0)),
+        "scale_needs_uv0": True, # uscale/vscale 只在 uv_mode 0 時讀取
+        "positive": None,
+        "row_length": scene_objects.CYLINDER_FIELDS["parent_ry"] + 1,
+        "fixed": {},
+    },
+    "tree": {
+        "list": "trees",
+        "required": ("x", "y", "z", "h"),
+        "default_tex": "tree_leaves.png",
+        "optional": (),
+        "scale_needs_uv0": False,
+        "positive": "h",
+        "row_length": scene_objects.TREE_FIELDS["parent_ry"] + 1,
+        "fixed": {},
+    },
+    "sphere": {
+        "list": "spheres",
+        "required": ("x", "y", "z", "rx", "ry", "rz", "radius"),
+        "default_tex": "default_sphere.png",
+        "optional": (("u_offset", float, 0.0), ("v_offset", float, 0.0), ("tex_angle", float, 0.0),
+                     ("uv_mode", int, 1), ("uscale", float, 1.0), ("vscale", float, 1.0)),
+        "scale_needs_uv0": True,
+        "positive": "radius",
+        "row_length": scene_objects.SPHERE_FIELDS["parent_ry"] + 1,
+        "fixed": {},
+    },
+}
+
+def _convert_tokens(tokens, convert, fill):
+    """整欄字串一次轉成陣列;有無效值時逐一重試,回傳 (陣列, 無效位置列表),無效處填 fill。"""
+    dtype = np.int64 if convert is int else np.float64
+    try:
+        return np.fromiter(map(convert, tokens), dtype=dtype, count=len(tokens)), []
+    except (ValueError, OverflowError):
+        pass
+    values = np.full(len(tokens), fill, dtype=dtype)
+    bad = []
+    for k, token in enumerate(tokens):
+        try:
+            values[k] = convert(token)
+        except (ValueError, OverflowError):
+            bad.append(k)
+    return values, bad
+
+def _convert_bulk_run(command, rows):
+    """
+    把一段連續的同類物件行 [(行號, parts)] 轉成欄位陣列 (局部座標)。
+    回傳 (欄位 {名稱: 陣列}, 紋理檔名列表, 可批次處理的布林陣列)。
+    """
+    spec = SCENE_COMMANDS[command].bulk
+    required = spec["required"]
+    optional = spec["optional"]
+    tex_token = len(required) + 1
+    max_tokens = tex_token + 1 + len(optional)
+    count = len(rows)
+    columns = {name: np.zeros(count) for name in required}
+    for name, convert, _default in optional:
+        columns[name] = np.zeros(count, dtype=np.int64 if convert is int else np.float64)
+    tex_files = [None] * count
+    ok = np.ones(count, dtype=bool)
+
+    # 依 token 數分組,組內每一欄的 token 都存在 (通常整段只有一組)
+    parts_list = [parts for _line_num, parts in rows]
+    lengths = np.minimum(np.fromiter(map(len, parts_list), dtype=np.int64, count=count), max_tokens)
+    for length in np.unique(lengths).tolist():
+        members = np.flatnonzero(lengths == length)
+        whole_run = len(members) == count
+        target = slice(None) if whole_run else members
+        if length < tex_token:
+            ok[members] = False # 參數不足
+            continue
+        token_columns = list(zip(*(parts_list if whole_run else [parts_list[k] for k in members.tolist()])))
+        for token_index, name in enumerate(required, 1):
+            values, bad = _convert_tokens(token_columns[token_index], float, 0.0)
+            columns[name][target] = values
+            ok[members[bad]] = False
+        group_tex = token_columns[tex_token] if length > tex_token else [spec["default_tex"]] * len(members)
+        if whole_run:
+            tex_files = list(group_tex)
+        else:
+            for k, tex_file in zip(members.tolist(), group_tex):
+                tex_files[k] = tex_file
+        for offset, (name, convert, default) in enumerate(optional):
+            token_index = tex_token + 1 + offset
+            if token_index >= length:
+                columns[name][target] = default
+                continue
+            tokens = token_columns[token_index]
+            if spec["scale_needs_uv0"] and name in ("uscale", "vscale"):
+                reads = np.flatnonzero(columns["uv_mode"][members] == 0)
+                columns[name][target] = default
+                values, bad = _convert_tokens([tokens[j] for j in reads.tolist()], convert, default)
+                columns[name][members[reads]] = values
+                ok[members[reads[bad]]] = False
+            else:
+                values, bad = _convert_tokens(tokens, convert, default)
+                columns[name][target] = values
+                ok[members[bad]] = False
+    if spec["positive"]:
+        ok &= ~(columns[spec["positive"]] <= 0)
+    return columns, tex_files, ok
+
+def _parse_bulk_object_runs(lines_list, first_line_number, filename_for_display, is_parsing_imported_file):
+    """
+    找出 lines_list 中連續的同類物件行 (中間可夾空行與註解) 並整批轉換。
+    回傳 {區塊第一行行號: 區塊};區塊只含可批次處理的列,遇到須逐行處理的列就切開。
+    """
+    blocks = {}
+    if not BULK_OBJECT_PARSING or len(lines_list) < BULK_OBJECT_MIN_RUN:
+        return blocks
+
+    def close_run(command, run_lines):
+        if command is None or len(run_lines) < BULK_OBJECT_MIN_RUN:
+            return
+        rows = [(line_num, raw_line.split()) for line_num, raw_line in run_lines]
+        columns, tex_files, ok = _convert_bulk_run(command, rows)
+        # 依無效列切成數個區塊
+        ok_list = ok.tolist()
+        start = None
+        for k in range(len(rows) + 1):
+            if k < len(rows) and ok_list[k]:
+                if start is None:
+                    start = k
+                continue
+            if start is not None:
+                line_numbers = [line_num for line_num, _parts in rows[start:k]]
+                if is_parsing_imported_file:
+                    line_ids = [f"{filename_for_display}:{line_num}" for line_num in line_numbers]
+                else:
+                    line_ids = line_numbers
+                blocks[line_numbers[0]] = {
+                    "command": command,
+                    "end_line": line_numbers[-1] + 1,
+                    "line_ids": line_ids,
+                    "columns": {name: values[start:k] for name, values in columns.items()},
+                    "tex_files": tex_files[start:k],
+                }
+                start = None
+
+    # 先只取第一個 token 找連續段,夠長的段才整行切開
+    run_command, run_lines = None, []
+    for line_num, raw_line in enumerate(lines_list, first_line_number):
+        head = raw_line.split(None, 1)
+        if not head:
+            continue
+        head = head[0]
+        if head[0] == '#' and not head.startswith(_EDITOR_SETTINGS_LINE_PREFIX):
+            continue
+        command = head.lower()
+        if command != run_command:
+            close_run(run_command, run_lines)
+            handler = SCENE_COMMANDS.get(command)
+            run_command = command if handler is not None and handler.bulk is not None else None
+            run_lines = []
+        if run_command is not None:
+            run_lines.append((line_num, raw_line))
+    close_run(run_command, run_lines)
+    return blocks
+
+def _append_bulk_object_block(block, scene_to_populate, load_textures):
+    """把 _parse_bulk_object_runs 的一個區塊依目前相對原點轉成世界座標並加入場景,回傳區塊結束行號。"""
+    spec = SCENE_COMMANDS[block["command"]].bulk
+    values = dict(block["columns"])
+    origin_angle = scene_to_populate.current_relative_origin_angle_rad
+    cos_a = math.cos(origin_angle); sin_a = math.sin(origin_angle)
+    origin_pos = scene_to_populate.current_relative_origin_pos
+    rel_x, rel_y, rel_z = values["x"], values["y"], values["z"]
+    values["x"] = origin_pos[0] + (rel_z * cos_a + rel_x * sin_a)
+    values["y"] = origin_pos[1] + rel_y
+    values["z"] = origin_pos[2] + (rel_z * sin_a - rel_x * cos_a)
+    if "ry" in values:
+        values["ry"] = math.degrees(-origin_angle) + values["ry"] - 90
+    values["parent_ry"] = math.degrees(origin_angle)
+    values["tex_file"] = block["tex_files"]
+    values.update(spec["fixed"])
+    for tex_file in dict.fromkeys(block["tex_files"]):
+        _request_texture(scene_to_populate, tex_file, load_textures)
+    getattr(scene_to_populate, spec["list"]).append_columns(block["line_ids"], spec["row_length"], **values)
+    return block["end_line"]
+
+# --- 指令登錄 (順序即編輯器參數提示表的順序) ---
+register_scene_command("map", _parse_map_command, ["    cmd    ", "file", "cx", "cz", "scale"])
+register_scene_command("latlon", _parse_latlon_command, ["    cmd    ", "lat°", "lon°"])
+register_scene_command("start", _parse_start_command, ["    cmd    ", "x", "y", "z", "angle°"])
+register_scene_command("skybox", _parse_skybox_command, ["    cmd    ", "base_name"])
+register_scene_command("skydome", _parse_skydome_command, ["    cmd    ", "texture_file"])
+register_scene_command("straight", _parse_track_segment_command, ["    cmd    ", "length", "grad‰"])
+register_scene_command("curve", _parse_track_segment_command, ["    cmd    ", "radius", "angle°", "grad‰"])
+register_scene_command("vbranch", _parse_vbranch_command,
+                       ["    cmd    ", "type(straight/curve)", "p1(angle°/radius)", "p2(length/angle°)", "grad‰?", "dir(fwd/bwd)?"])
+register_scene_command("building", _parse_building_command,
+                       ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "w", "d", "h", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
+                       bulk=_BULK_OBJECT_SPECS["building"], is_object=True)
+register_scene_command("cylinder", _parse_cylinder_command,
+                       ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "rad", "h", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
+                       bulk=_BULK_OBJECT_SPECS["cylinder"], is_object=True)
+register_scene_command("tree", _parse_tree_command, ["    cmd    ", "rel_x", "rel_y", "rel_z", "height", "tex?"],
+                       bulk=_BULK_OBJECT_SPECS["tree"], is_object=True)
+register_scene_command("sphere", _parse_sphere_command,
+                       ["    cmd    ", "rel_x", "rel_y", "rel_z", "rx°", "rel_ry°", "rz°", "radius", "tex?", "uOf?", "vOf?", "tAng°?", "uvMd?", "uSc?", "vSc?"],
+                       bulk=_BULK_OBJECT_SPECS["sphere"], is_object=True)
+# 之後接 building/cylinder/sphere/tree 的參數
+register_scene_command("array", _parse_array_command, ["    cmd    ", "count", "dx", "dy", "dz", "object_cmd", "obj_params..."],
+                       is_object=True)
+# 以軌道距離處為相對原點放置物件;along 記錄在整份解析完才展開,不算一般物件指令
+register_scene_command("along", _parse_along_command, ["    cmd    ", "dist", "lateral", "object_cmd", "obj_params..."])
+register_scene_command("hill", _parse_hill_command,
+                       ["    cmd    ", "cx", "base_y", "cz", "radius", "peak_h_off", "tex?", "uSc?", "vSc?", "uOf?", "vOf?"],
+                       is_object=True, track_placeable=False)
+# 檔名後恰兩個數=經緯度形式(需母場景 latlon 錨點)
+register_scene_command("import", _parse_import_command, ["    cmd    ", "filepath", "x?/lat°", "y?/lon°", "rel_z?", "rel_angle°?"])
+register_scene_command("gableroof", _parse_gableroof_command, [
+    "    cmd    ",        # 0
+    "rel_x",              # 1: 相對於軌道原點的X偏移
+    "rel_y",              # 2: 屋簷底部/牆體頂部的Y座標 (相對於軌道原點Y)
+    "rel_z",              # 3: 相對於軌道原點的Z偏移
+    "abs_rx?",            # 4: 繞X軸的絕對旋轉 (俯仰，可選，預設0)
+    "abs_ry",             # 5: 繞Y軸的絕對旋轉 (朝向，必需)
+    "abs_rz?",            # 6: 繞Z軸的絕對旋轉 (側滾，可選，預設0)
+    "base_width",         # 7: 屋頂基底寬度 (沿屋頂局部X軸)
+    "base_length",        # 8: 屋頂基底長度 (沿屋頂局部Z軸，即屋脊方向)
+    "ridge_height_offset",# 9: 屋脊相對於屋簷(rel_y)的高度差
+    # --- 可選參數從索引 10 開始 ---
+    "ridge_x_pos_offset?",# 10: 非對稱屋脊的X偏移 (相對於基底寬度中心，預設0)
+    "eave_overhang_x?",   # 11: X方向的屋簷懸挑 (預設0)
+    "eave_overhang_z?",   # 12: Z方向的屋簷懸挑 (預設0)
+    "texture_atlas?",     # 13: 使用的紋理圖集檔名 (預設 "default_roof_atlas.png")
+    # "alpha_threshold?" # 14: 可選的Alpha測試閾值 (如果想讓用戶指定)
+    ], is_object=True)
+register_scene_command("flexroof", _parse_flexroof_command,
+                       ["    cmd    ", "rel_x", "rel_y", "rel_z", "abs_rx°?", "abs_ry°", "abs_rz°?", # 定位與旋轉 (abs_rx, abs_rz 可選)
+                        "base_w", "base_l", "top_w", "top_l", "height",                       # 核心幾何
+                        "top_off_x?", "top_off_z?",                                           # 上底偏移 (可選)
+                        "texture_atlas?"],                                                    # 紋理圖集 (可選)
+                       is_object=True)
+
+class IncrementalParseResult:
+    """IncrementalSceneParser.update 的結果:場景本身與這次被換掉/新增的部分。"""
+    def __init__(self, scene, full_reparse):
+        self.scene = scene
+        self.full_reparse = full_reparse
+        self.removed_objects = {name: [] for name in _PARSED_LIST_NAMES}   # 不再使用的舊 (line_id, tuple)
+        self.added_objects = {name: [] for name in _PARSED_LIST_NAMES}     # 新產生條目在列表中的索引
+        self.removed_segments = []   # 已移出軌道的舊軌道段 (需要釋放緩衝區)
+        self.changed_segments = []   # 新增或分岔有變動的軌道段 (需要建立緩衝區)
+        self.reparsed_line_count = 0
+
+INCREMENTAL_PROGRESS_LINES = 1024 # 逐行重新解析時,每隔多少行回報一次進度
+
+class IncrementalSceneParser:
+    """
+    保留上一次解析每一行之前的解析狀態與每一行產生的物件範圍,
+    下一次只重新解析有變動的行:
+      - 物件行(或空行/註解)被修改:只重新解析該行,替換它原本的物件。
+      - 其他指令行被修改、或有插入/刪除行:從第一個變動行往下重新解析。
+    """
+    def __init__(self):
+        self.scene = None
+        self._progress_callback = None
+        self.reset()
+
+    def reset(self):
+        """
+        丟棄逐行記錄,下一次 update 會完整解析 (例如紋理快取被清除後);
+        目前的場景保留到那時,才能在結果中列為被移除的舊條目。
+        """
+        self._lines = []
+        self._context = None
+        self._snapshots = []     # _snapshots[i]: 第 i 行(0 起算)解析前的狀態;多一筆記錄最後一行之後
+        self._line_outputs = []  # _line_outputs[i]: {list_name: (start, end)} 第 i 行產生的物件範圍
+        self._line_diagnostics = [] # _line_diagnostics[i]: 解析第 i 行 (含它 import 的檔案) 時的診斷訊息
+
+    @property
+    def diagnostics(self):
+        """目前整個檔案的診斷訊息 (依行順序);沒有重新解析的行沿用上次的訊息。"""
+        return [record for line_records in self._line_diagnostics for record in line_records]
+
+    def update(self, lines_list, base_dir_for_import, filename_for_display, load_textures=True,
+               progress_callback=None):
+        """progress_callback(已解析行數, 待解析行數):需要逐行重新解析大量行時定期呼叫。"""
+        self._progress_callback = progress_callback
+        try:
+            result = self._update(list(lines_list), base_dir_for_import, filename_for_display, load_textures)
+        finally:
+            self._progress_callback = None
+        if self.scene.placed_object_starts is None:
+            self._place_track_objects(result, load_textures)
+        _load_pending_textures(self.scene)
+        if result.full_reparse or result.reparsed_line_count:
+            self.scene.stats = compute_scene_stats(self.scene)
+        return result
+
+    def _update(self, lines_list, base_dir_for_import, filename_for_display, load_textures):
+        context = (base_dir_for_import, filename_for_display, load_textures)
+        if self.scene is None or context != self._context:
+            return self._full_parse(lines_list, context)
+
+        old_lines = self._lines
+        result = IncrementalParseResult(self.scene, full_reparse=False)
+        if old_lines == lines_list:
+            return result
+        # along 放出的物件接在列表最後、依賴整條軌道,有任何變動就先拿掉,update 結束前重新放置
+        self._remove_placed_objects(result)
+        if len(old_lines) == len(lines_list):
+            changed = [i for i, (a, b) in enumerate(zip(old_lines, lines_list)) if a != b]
+            if all(_is_object_or_inert_line(old_lines[i]) and _is_object_or_inert_line(lines_list[i]) for i in changed):
+                for i in changed:
+                    self._reparse_object_line(i, lines_list[i], result)
+                self._lines = lines_list
+                self._restore_snapshot(self._snapshots[-1], result, parse_state_only=True)
+                return result
+            first_changed = changed[0]
+        else:
+            first_changed = 0
+            for a, b in zip(old_lines, lines_list):
+                if a != b: break
+                first_changed += 1
+
+        self._lines = lines_list
+        self._reparse_from(first_changed, result)
+        return result
+
+    # --- 內部 ---
+    def _remove_placed_objects(self, result):
+        scene = self.scene
+        for name, start in (scene.placed_object_starts or {}).items():
+            object_list = getattr(scene, name)
+            if start < len(object_list):
+                result.removed_objects[name].extend(object_list[start:])
+                del object_list[start:]
+        scene.placed_object_starts = None
+
+    def _place_track_objects(self, result, load_textures):
+        scene = self.scene
+        _resolve_track_placements(scene, load_textures)
+        for name, start in scene.placed_object_starts.items():
+            result.added_objects[name].extend(range(start, len(getattr(scene, name))))
+
+    def _full_parse(self, lines_list, context):
+        old_scene = self.scene
+        base_dir, filename, load_textures = context
+        scene = Scene()
+        self.scene, self._context, self._lines = scene, context, lines_list
+        self._snapshots, self._line_outputs, self._line_diagnostics = [], [], []
+        result = IncrementalParseResult(scene, full_reparse=True)
+        if old_scene is not None:
+            for name in _PARSED_LIST_NAMES:
+                result.removed_objects[name] = list(getattr(old_scene, name))
+            result.removed_segments = list(old_scene.track.segments)
+        self._parse_lines_from(0, result)
+        return result
+
+    def _parse_line(self, index, line):
+        """解析一行並回傳這一行的診斷訊息 (同時照常送出)。"""
+        base_dir, filename, load_textures = self._context
+        with scene_diagnostics.capture() as line_diagnostics:
+            _parse_scene_content([line], self.scene, base_dir, filename, set(),
+                                 is_parsing_imported_file=False, load_textures=load_textures,
+                                 first_line_number=index + 1)
+        scene_diagnostics.replay(line_diagnostics)
+        return line_diagnostics
+
+    def _parse_lines_from(self, start_index, result):
+        scene = self.scene
+        progress_callback = self._progress_callback
+        total_lines = len(self._lines) - start_index
+        for index in range(start_index, len(self._lines)):
+            if progress_callback and (index - start_index) % INCREMENTAL_PROGRESS_LINES == 0:
+                progress_callback(index - start_index, total_lines)
+            self._snapshots.append(self._take_snapshot())
+            lengths_before = [len(getattr(scene, name)) for name in _PARSED_LIST_NAMES]
+            segments = scene.track.segments
+            segments_before = len(segments)
+            branches_before = len(segments[-1].visual_branches) if segments else 0
+            self._line_diagnostics.append(self._parse_line(index, self._lines[index]))
+            outputs = {}
+            for name, start in zip(_PARSED_LIST_NAMES, lengths_before):
+                end = len(getattr(scene, name))
+                if end != start:
+                    outputs[name] = (start, end)
+                    result.added_objects[name].extend(range(start, end))
+            self._line_outputs.append(outputs)
+            if len(segments) == segments_before:
+                # vbranch 行:分岔掛到既有的最後一段,該段要重建緩衝區
+                if segments and len(segments[-1].visual_branches) != branches_before and \
+                   (not result.changed_segments or result.changed_segments[-1] is not segments[-1]):
+                    result.changed_segments.append(segments[-1])
+            else:
+                result.changed_segments.extend(segments[segments_before:])
+        self._snapshots.append(self._take_snapshot())
+        result.reparsed_line_count += total_lines
+        if progress_callback:
+            progress_callback(total_lines, total_lines)
+
+    def _reparse_from(self, start_index, result):
+        self._restore_snapshot(self._snapshots[start_index], result)
+        del self._snapshots[start_index:]
+        del self._line_outputs[start_index:]
+        del self._line_diagnostics[start_index:]
+        self._parse_lines_from(start_index, result)
+
+    def _reparse_object_line(self, index, new_line, result):
+        scene = self.scene
+        self._restore_snapshot(self._snapshots[index], result, parse_state_only=True)
+        # 這一行先解析到空的暫存列表,再一次接回原位置;不搬動其他行的物件
+        object_lists = {name: getattr(scene, name) for name in _PARSED_LIST_NAMES}
+        for name in _PARSED_LIST_NAMES:
+            setattr(scene, name, [])
+        try:
+            self._line_diagnostics[index] = self._parse_line(index, new_line)
+        finally:
+            line_entries = {name: getattr(scene, name) for name in _PARSED_LIST_NAMES}
+            for name, object_list in object_lists.items():
+                setattr(scene, name, object_list)
+        result.reparsed_line_count += 1
+
+        old_outputs = self._line_outputs[index]
+        new_outputs = {}
+        for name in _PARSED_LIST_NAMES:
+            object_list = object_lists[name]
+            new_entries = list(line_entries[name])
+            old_start, old_end = old_outputs.get(name, (None, None))
+            if old_start is None:
+                if not new_entries: continue
+                # 這一行原本沒有此類物件:插在前面各行產生的同類物件之後
+                old_start = old_end = self._snapshots[index][-1][name]
+            if old_end > old_start:
+                result.removed_objects[name].extend(object_list[old_start:old_end])
+            object_list[old_start:old_end] = new_entries
+            if new_entries:
+                new_outputs[name] = (old_start, old_start + len(new_entries))
+            # 已記錄的新增索引也要跟著位移
+            delta = len(new_entries) - (old_end - old_start)
+            added = [i for i in result.added_objects[name] if not old_start <= i < old_end]
+            result.added_objects[name] = [i + delta if i >= old_end else i for i in added]
+            result.added_objects[name].extend(range(old_start, old_start + len(new_entries)))
+            if delta:
+                self._shift_object_ranges(name, index, old_end, delta)
+        self._line_outputs[index] = new_outputs
+
+    def _shift_object_ranges(self, list_name, index, from_position, delta):
+        for outputs in self._line_outputs[index + 1:]:
+            if list_name in outputs:
+                start, end = outputs[list_name]
+                outputs[list_name] = (start + delta, end + delta)
+        for snapshot in self._snapshots[index + 1:]:
+            list_lengths = snapshot[-1]
+            if list_lengths[list_name] >= from_position:
+                list_lengths[list_name] += delta
+
+    def _take_snapshot(self):
+        scene = self.scene
+        segments = scene.track.segments
+        return (
+            np.copy(scene.current_parse_pos), scene.current_parse_angle_rad,
+            np.copy(scene.current_relative_origin_pos), scene.current_relative_origin_angle_rad,
+            scene.last_background_info, scene.current_map_offset,
+            np.copy(scene.start_position), scene.start_angle_deg,
+            scene.initial_background_info, scene.geo_anchor,
+            (scene.map_filename, scene.map_world_center_x, scene.map_world_center_z, scene.map_world_scale),
+            len(segments),
+            len(segments[-1].visual_branches) if segments else 0,
+            len(scene.background_triggers), len(scene.source_files), len(scene.import_instances),
+            {name: len(getattr(scene, name)) for name in _PARSED_LIST_NAMES},
+        )
+
+    def _restore_snapshot(self, snapshot, result, parse_state_only=False):
+        scene = self.scene
+        (parse_pos, parse_angle, origin_pos, origin_angle, last_bg, map_offset,
+         start_pos, start_angle_deg, initial_bg, geo_anchor, map_info,
+         n_segments, n_branches, n_triggers, n_sources, n_instances, list_lengths) = snapshot
+        scene.current_parse_pos = np.copy(parse_pos)
+        scene.current_parse_angle_rad = parse_angle
+        scene.current_relative_origin_pos = np.copy(origin_pos)
+        scene.current_relative_origin_angle_rad = origin_angle
+        scene.last_background_info = last_bg
+        scene.current_map_offset = map_offset
+        if parse_state_only:
+            return
+        scene.start_position = np.copy(start_pos)
+        scene.start_angle_deg = start_angle_deg
+        scene.initial_background_info = initial_bg
+        scene.geo_anchor = geo_anchor
+        (scene.map_filename, scene.map_world_center_x,
+         scene.map_world_center_z, scene.map_world_scale) = map_info
+
+        segments = scene.track.segments
+        result.removed_segments.extend(scene.track.truncate(n_segments))
+        if segments and len(segments[-1].visual_branches) != n_branches:
+            # vbranch 掛在最後一段上;被重算的 vbranch 行要先拿掉,之後整段重建緩衝區
+            segments[-1].cleanup_buffers()
+            del segments[-1].visual_branches[n_branches:]
+            result.changed_segments.append(segments[-1])
+        del scene.background_triggers[n_triggers:]
+        for source_path in list(scene.source_files)[n_sources:]:
+            del scene.source_files[source_path]
+        del scene.import_instances[n_instances:]
+        for name in _PARSED_LIST_NAMES:
+            object_list = getattr(scene, name)
+            if list_lengths[name] < len(object_list):
+                result.removed_objects[name].extend(object_list[list_lengths[name]:])
+                del object_list[list_lengths[name]:]
+            result.added_objects[name] = [i for i in result.added_objects[name] if i < list_lengths[name]]
+
+
+# --- 場景差異 ---
+# 重新載入時比對新舊兩個 Scene,讓內容或網格沒變的物件/軌道段沿用舊場景的 GL 緩衝區,
+# 重載成本只跟改動的多寡有關。物件以行識別碼 + 內容鍵 (scene_objects.content_key_getter) 配對。
+class ObjectListDiff:
+    """
+    一類物件的差異;索引分別指向舊/新場景中的列表位置:
+      unchanged  (舊, 新) 內容完全相同 (同一行,或行被移動但內容相同)
+      moved      (舊, 新) 網格相同,只有位置/旋轉/紋理參數不同:沿用緩衝區,繪製時套用新參數
+      changed    (舊, 新) 同一行但網格參數不同:需要重建緩衝區
+      added      新場景才有的物件索引
+      removed    舊場景才有的物件索引
+    """
+    def __init__(self):
+        self.unchanged = []
+        self.moved = []
+        self.changed = []
+        self.added = []
+        self.removed = []
+
+    def reusable_pairs(self):
+        """可以沿用舊緩衝區的 (舊, 新) 配對。"""
+        return self.unchanged + self.moved
+
+    def __bool__(self):
+        return bool(self.moved or self.changed or self.added or self.removed)
+
+class SceneDiff:
+    """
+    diff_scenes 的結果:objects 為 {列表名: ObjectListDiff};
+    軌道段以幾何鍵 (TrackSegment.geometry_key) 配對,reused_segments 為 (舊, 新) 索引,
+    其餘新段列在 added_segments、舊段列在 removed_segments。
+    """
+    def __init__(self, old_scene, new_scene):
+        self.old_scene = old_scene
+        self.new_scene = new_scene
+        self.objects = {}
+        self.reused_segments = []
+        self.added_segments = []
+        self.removed_segments = []
+
+    def summary(self):
+        parts = []
+        for name, object_diff in self.objects.items():
+            if object_diff:
+                parts.append(f"{name} +{len(object_diff.added)} -{len(object_diff.removed)} "
+                             f"~{len(object_diff.changed)} 移動 {len(object_diff.moved)}")
+        parts.append(f"軌道 +{len(self.added_segments)} -{len(self.removed_segments)} "
+                     f"沿用 {len(self.reused_segments)}")
+        return ", ".join(parts)
+
+    def share_buffers(self):
+        """
+        把可沿用的舊物件/軌道段的 GL 緩衝區 ID 填進新場景 (舊場景仍持有,換上新場景前照常繪製)。
+        之後只需為還沒有緩衝區的物件與軌道段建立緩衝區。
+        """
+        for name, object_diff in self.objects.items():
+            old_entries, new_entries = getattr(self.old_scene, name), getattr(self.new_scene, name)
+            for old_index, new_index in object_diff.reusable_pairs():
+                shared_entry = entry_with_buffers_from(new_entries[new_index], old_entries[old_index], name)
+                if shared_entry is not None:
+                    new_entries[new_index] = shared_entry
+        old_segments, new_segments = self.old_scene.track.segments, self.new_scene.track.segments
+        for old_index, new_index in self.reused_segments:
+            if old_segments[old_index].is_buffer_ready:
+                new_segments[new_index].share_buffers_from(old_segments[old_index])
+
+    def release_shared_buffers(self):
+        """
+        新場景換上後呼叫:舊場景放掉已交給新場景的緩衝區 ID,
+        之後照常釋放舊場景時只會刪掉沒被沿用的緩衝區。
+        """
+        for name, object_diff in self.objects.items():
+            old_entries = getattr(self.old_scene, name)
+            for old_index, _new_index in object_diff.reusable_pairs():
+                old_entries[old_index] = entry_without_buffers(old_entries[old_index], name)
+        old_segments = self.old_scene.track.segments
+        for old_index, _new_index in self.reused_segments:
+            if old_segments[old_index].is_buffer_ready: # share_buffers 只沿用已就緒的段
+                old_segments[old_index].forget_buffers()
+
+def _gl_buffer_indices(list_name):
+    """VAO/VBO/頂點數在物件 tuple 中的索引;沒有 VBO 網格的類型回傳 None。"""
+    obj_type = scene_objects.OBJECT_LIST_TYPES[list_name]
+    if obj_type not in scene_objects.MESH_FIELDS:
+        return None
+    field_index = scene_objects.FIELD_INDEX[obj_type]
+    return [field_index[field] for field in scene_objects.GL_BUFFER_FIELDS]
+
+def entry_with_buffers_from(new_entry, old_entry, list_name):
+    """new_entry 換上 old_entry 的 VAO/VBO/頂點數 (兩者網格須相同);舊條目沒有緩衝區時回傳 None。"""
+    gl_indices = _gl_buffer_indices(list_name)
+    old_data = old_entry[1]
+    if gl_indices is None or len(old_data) <= gl_indices[0] or old_data[gl_indices[0]] is None:
+        return None
+    line_id, new_data = new_entry
+    new_data = list(new_data) + list(old_data[len(new_data):])
+    for index in gl_indices:
+        new_data[index] = old_data[index]
+    return (line_id, tuple(new_data))
+
+def entry_without_buffers(entry, list_name):
+    """把條目的 VAO/VBO ID 清掉 (不刪除 GL 物件),用於緩衝區已交給別的條目時。"""
+    gl_indices = _gl_buffer_indices(list_name)
+    line_id, data = entry
+    if gl_indices is None or len(data) <= gl_indices[0] or data[gl_indices[0]] is None:
+        return entry
+    data = list(data)
+    vao_index, vbo_index, vertex_count_index = gl_indices
+    data[vao_index] = data[vbo_index] = None
+    data[vertex_count_index] = 0
+    return (line_id, tuple(data))
+
+def _pop_unmatched(buckets, key, matched):
+    """從 buckets[key] (反序的舊索引列表) 取出第一個還沒配對的舊索引;沒有時回傳 None。"""
+    candidates = buckets.get(key)
+    while candidates:
+        old_index = candidates.pop()
+        if not matched[old_index]:
+            return old_index
+    return None
+
+def _bucket_indices(keys, matched):
+    """{鍵: [舊索引...]},每個列表反序存放,pop() 時依原順序取出。"""
+    buckets = {}
+    for old_index in range(len(keys) - 1, -1, -1):
+        if not matched[old_index]:
+            buckets.setdefault(keys[old_index], []).append(old_index)
+    return buckets
+
+def diff_object_lists(old_entries, new_entries, list_name):
+    """
+    比對同一類物件的兩個 (line_id, tuple) 列表 (list_name 如 "buildings"),回傳 ObjectListDiff。
+    依序配對:同一行且內容相同 → 內容相同 (行號變了) → 同一行 (網格相同算移動,否則為變更)
+    → 網格相同的其餘物件 (算移動,可沿用緩衝區);剩下的為新增/移除。
+    """
+    obj_type = scene_objects.OBJECT_LIST_TYPES[list_name]
+    content_key = scene_objects.content_key_getter(obj_type)
+    has_mesh = obj_type in scene_objects.MESH_FIELDS
+    mesh_key = scene_objects.mesh_key_getter(obj_type) if has_mesh else content_key
+    diff = ObjectListDiff()
+    old_line_ids = [line_id for line_id, _data in old_entries]
+    old_contents = [content_key(data) for _line_id, data in old_entries]
+    new_line_ids = [line_id for line_id, _data in new_entries]
+    new_contents = [content_key(data) for _line_id, data in new_entries]
+    matched = [False] * len(old_entries)
+    pending = list(range(len(new_entries)))
+
+    def match(old_keys, new_key_of, on_match):
+        buckets = _bucket_indices(old_keys, matched)
+        still_pending = []
+        for new_index in pending:
+            old_index = _pop_unmatched(buckets, new_key_of(new_index), matched)
+            if old_index is None:
+                still_pending.append(new_index)
+            else:
+                matched[old_index] = True
+                on_match(old_index, new_index)
+        return still_pending
+
+    # 1. 同一行且內容相同;2. 行號變了 (例如上方插入/刪除行) 但內容相同
+    pending = match(list(zip(old_line_ids, old_contents)), lambda i: (new_line_ids[i], new_contents[i]),
+                    lambda old_index, new_index: diff.unchanged.append((old_index, new_index)))
+    pending = match(old_contents, lambda i: new_contents[i],
+                    lambda old_index, new_index: diff.unchanged.append((old_index, new_index)))
+    # 3. 同一行但內容不同:網格參數相同只算移動
+    old_meshes = [mesh_key(data) for _line_id, data in old_entries]
+    new_meshes = [mesh_key(data) for _line_id, data in new_entries]
+
+    def on_same_line(old_index, new_index):
+        if old_meshes[old_index] == new_meshes[new_index]:
+            diff.moved.append((old_index, new_index))
+        else:
+            diff.changed.append((old_index, new_index))
+    pending = match(old_line_ids, lambda i: new_line_ids[i], on_same_line)
+    # 4. 其餘網格相同的物件 (不同行) 也可沿用緩衝區
+    if has_mesh:
+        pending = match(old_meshes, lambda i: new_meshes[i],
+                        lambda old_index, new_index: diff.moved.append((old_index, new_index)))
+    diff.added = pending
+    diff.removed = [old_index for old_index, is_matched in enumerate(matched) if not is_matched]
+    return diff
+
+def diff_scenes(old_scene, new_scene):
+    """
+    比對兩個 Scene,回傳 SceneDiff。只比較解析出的參數 (不看 GL ID),不需要 OpenGL;
+    物件依 ObjectListDiff 的規則分類,軌道段幾何完全相同時才沿用。
+    """
+    diff = SceneDiff(old_scene, new_scene)
+    for name in _OBJECT_LIST_NAMES:
+        diff.objects[name] = diff_object_lists(getattr(old_scene, name), getattr(new_scene, name), name)
+    old_segments = old_scene.track.segments if old_scene.track else []
+    new_segments = new_scene.track.segments if new_scene.track else []
+    old_keys = [segment.geometry_key() for segment in old_segments]
+    matched = [False] * len(old_segments)
+    buckets = _bucket_indices(old_keys, matched)
+    for new_index, segment in enumerate(new_segments):
+        old_index = _pop_unmatched(buckets, segment.geometry_key(), matched)
+        if old_index is None:
+            diff.added_segments.append(new_index)
+        else:
+            matched[old_index] = True
+            diff.reused_segments.append((old_index, new_index))
+    diff.removed_segments = [old_index for old_index, is_matched in enumerate(matched) if not is_matched]
+    return diff
+
+
+# --- 編譯場景快取 ---
+# load_scene 解析完後把 Scene(去掉 GL 資源 ID)序列化到場景檔旁的 .scene_cache/,
+# 以根檔與所有 import 檔的內容雜湊當鍵;下次載入時雜湊全部相符就直接還原,不再逐行解析。
+SCENE_CACHE_ENABLED = True
+SCENE_CACHE_DIR_NAME = ".scene_cache"
+SCENE_CACHE_FORMAT_VERSION = 5
+# 解析器程式碼變動時快取同樣要失效
+_SCENE_CACHE_CODE_FILES = ("scene_parser.py", "scene_objects.py", "track.py")
+_scene_cache_code_fingerprint = None
+
+def _hash_scene_text(lines):
+    """場景檔內容(行列表)的雜湊,解析時與驗證快取時用同一種算法。"""
+    return hashlib.blake2b("".join(lines).encode("utf-8"), digest_size=16).hexdigest()
+
+def _hash_scene_file(filepath):
+    """讀檔並回傳內容雜湊;檔案不存在或無法讀取時回傳 None。"""
+    try:
+        with open(filepath, 'r', encoding="utf-8") as f:
+            return _hash_scene_text(f.readlines())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def _get_scene_cache_code_fingerprint():
+    global _scene_cache_code_fingerprint
+    if _scene_cache_code_fingerprint is None:
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(str(SCENE_CACHE_FORMAT_VERSION).encode())
+        code_dir = os.path.dirname(os.path.abspath(__file__))
+        for code_filename in _SCENE_CACHE_CODE_FILES:
+            try:
+                with open(os.path.join(code_dir, code_filename), 'rb') as f:
+                    hasher.update(f.read())
+            except OSError:
+                hasher.update(code_filename.encode())
+        _scene_cache_code_fingerprint = hasher.hexdigest()
+    return _scene_cache_code_fingerprint
+
+def _scene_cache_path(scene_filepath):
+    scene_filepath = os.path.abspath(scene_filepath)
+    return os.path.join(os.path.dirname(scene_filepath), SCENE_CACHE_DIR_NAME,
+                        os.path.basename(scene_filepath) + ".cache")
+
+def _background_infos(scene):
+    infos = [scene.initial_background_info] + [info for _, info in scene.background_triggers]
+    return [info for info in infos if info]
+
+def _assign_store_textures(store, resolve, only_files=None):
+    """用 resolve(tex_file) -> (gl_id, has_alpha) 重填 ObjectStore 的紋理欄位 (每個檔名只解析一次)。
+    給 only_files 時只填這些檔名中還沒有紋理 ID 的列。"""
+    tex_names = store.texture_names
+    tex_codes = store.column("tex_file") # -1 (沒有檔名) 對應到最後補上的 (None, False)
+    if only_files is None:
+        resolved = [resolve(tex_file) for tex_file in tex_names]
+        rows = slice(None)
+    else:
+        resolved = [resolve(tex_file) if tex_file in only_files else (None, False) for tex_file in tex_names]
+        wanted_codes = [code for code, tex_file in enumerate(tex_names) if tex_file in only_files]
+        rows = np.nonzero(np.isin(tex_codes, wanted_codes) & (store.column("gl_tex") < 0))[0]
+        if len(rows) == 0:
+            return
+    gl_ids = np.array([-1 if tex_id is None else tex_id for tex_id, _ in resolved] + [-1], dtype=np.int64)
+    new_values = {"gl_tex": gl_ids[tex_codes[rows]]}
+    if store.has_field("has_alpha"):
+        alpha_flags = np.array([1 if has_alpha else 0 for _, has_alpha in resolved] + [0], dtype=np.int64)
+        new_values["has_alpha"] = alpha_flags[tex_codes[rows]]
+    store.set_fields(rows, **new_values)
+
+def _assign_array_textures(scene, resolve, only_files=None):
+    """同 _assign_store_textures,對象是 scene.instance_arrays (換成填好紋理的新 InstanceArray,不改動原物件)。"""
+    assigned = []
+    for line_id, instance_array in scene.instance_arrays:
+        tex_file = instance_array.field("tex_file")
+        if only_files is None or (tex_file in only_files and instance_array.field("gl_tex") is None):
+            tex_id, has_alpha = resolve(tex_file) if tex_file else (None, False)
+            new_values = {"gl_tex": tex_id}
+            if instance_array.has_field("has_alpha"):
+                new_values["has_alpha"] = bool(has_alpha)
+            instance_array = instance_array.with_fields(**new_values)
+        assigned.append((line_id, instance_array))
+    scene.instance_arrays = assigned
+
+def _iter_assign_object_textures(scene, resolve):
+    """_assign_object_textures 的分段版本:每填完一類物件 yield 一次。"""
+    for list_name in _OBJECT_LIST_NAMES:
+        store = getattr(scene, list_name).copy() # 不改動可能共用的原 store
+        if store:
+            _assign_store_textures(store, resolve)
+        setattr(scene, list_name, store)
+        yield
+    _assign_array_textures(scene, resolve)
+    for info in _background_infos(scene):
+        if info.get('type') == 'skydome':
+            info['id'] = resolve(info.get('file'))[0]
+
+def _assign_object_textures(scene, resolve):
+    """用 resolve(tex_file) -> (gl_id, has_alpha) 重填場景所有物件與 skydome 的紋理欄位。"""
+    for _ in _iter_assign_object_textures(scene, resolve):
+        pass
+
+def _texture_resolver(cache=None):
+    """
+    回傳 resolve(tex_file) -> (gl_id, has_alpha),經由 texture_loader 的快取取得紋理。
+    給 cache (紋理資訊 dict) 時只查這個 dict,不會再載入任何紋理。
+    """
+    def resolve(tex_file):
+        if cache is not None:
+            tex_info = cache.get(tex_file) if tex_file else None
+        else:
+            tex_info = texture_loader.load_texture(tex_file) if tex_file else None
+        if not tex_info:
+            return None, False
+        return tex_info.get("id"), tex_info.get("has_alpha", False)
+    return resolve
+
+def _scene_texture_files(scene):
+    """場景物件與 skydome 用到的所有紋理檔名 (保持順序、已去重)。"""
+    tex_files = {}
+    for list_name in _OBJECT_LIST_NAMES:
+        tex_files.update(dict.fromkeys(getattr(scene, list_name).texture_names))
+    tex_files.update(dict.fromkeys(instance_array.field("tex_file") for _, instance_array in scene.instance_arrays))
+    tex_files.update(dict.fromkeys(info.get('file') for info in _background_infos(scene) if info.get('type') == 'skydome'))
+    tex_files.pop(None, None)
+    return list(tex_files)
+
+def _resolve_scene_textures(scene):
+    """依物件記錄的紋理檔名重新載入紋理 ID(需要 OpenGL 上下文)。"""
+    if texture_loader is None:
+        return
+    texture_loader.preload_textures(_scene_texture_files(scene))
+    _assign_object_textures(scene, _texture_resolver())
+
+def _copy_scene_for_cache(scene):
+    """淺複製 Scene 並清掉 GL 資源 ID,不動到正在使用的場景。"""
+    cached_scene = copy.copy(scene)
+    # 背景資訊 dict 在 initial_background_info 與觸發器之間共用,複製時保留共用關係
+    copied_infos = {}
+    def copy_info(info):
+        if info is None: return None
+        if id(info) not in copied_infos:
+            copied_infos[id(info)] = dict(info)
+        return copied_infos[id(info)]
+    cached_scene.initial_background_info = copy_info(scene.initial_background_info)
+    cached_scene.background_triggers = [(dist, copy_info(info)) for dist, info in scene.background_triggers]
+    cached_scene.last_background_info = None
+    _assign_object_textures(cached_scene, lambda tex_file: (None, False))
+    cached_scene.instance_arrays = [(line_id, instance_array.without_buffers())
+                                    for line_id, instance_array in cached_scene.instance_arrays]
+    if scene.track.mesh is not None:
+        scene_diagnostics.warning("場景軌道已建立 GL 緩衝區,略過寫入編譯快取。")
+        return None
+    return cached_scene
+
+def _save_compiled_scene(scene_filepath, scene):
+    cache_path = _scene_cache_path(scene_filepath)
+    try:
+        cached_scene = _copy_scene_for_cache(scene)
+        if cached_scene is None:
+            return
+        payload = {
+            "code": _get_scene_cache_code_fingerprint(),
+            "sources": dict(scene.source_files),
+            "scene": cached_scene,
+        }
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        scene_diagnostics.info(f"已寫入編譯場景快取 '{cache_path}' ({len(scene.source_files)} 個來源檔)。")
+    except Exception as e:
+        scene_diagnostics.warning(f"寫入編譯場景快取 '{cache_path}' 失敗: {e}")
+
+def _load_compiled_scene(scene_filepath):
+    """根檔與所有 import 檔的內容雜湊都相符時回傳快取的 Scene(紋理 ID 尚未載入),否則回傳 None。"""
+    cache_path = _scene_cache_path(scene_filepath)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        scene_diagnostics.warning(f"讀取編譯場景快取 '{cache_path}' 失敗,改為完整解析: {e}")
+        return None
+    if not isinstance(payload, dict) or payload.get("code") != _get_scene_cache_code_fingerprint():
+        return None
+    sources = payload.get("sources") or {}
+    if next(iter(sources), None) != os.path.abspath(scene_filepath):
+        return None
+    for source_path, content_hash in sources.items():
+        if _hash_scene_file(source_path) != content_hash:
+            scene_diagnostics.info(f"'{os.path.basename(source_path)}' 已變更,編譯場景快取失效。")
+            return None
+    return payload.get("scene")
+
+# --- 場景來源檔監看 ---
+# 載入成功後監看根檔與它 import 的所有檔案 (scene.source_files);load_scene 不強制重載時
+# 以監看器回報的變動檔案決定是否重載,只有被改到的子場景 prefab 需要重新解析。
+SCENE_WATCH_ENABLED = True
+_scene_watcher = None
+last_changed_files = set() # 最近一次自動重載是由哪些檔案 (絕對路徑) 的變動觸發
+
+def _watch_scene_sources(scene_filepath, scene):
+    global _scene_watcher
+    if not SCENE_WATCH_ENABLED:
+        return
+    if _scene_watcher is None:
+        _scene_watcher = scene_watcher.SceneFileWatcher()
+        scene_diagnostics.info(f"場景檔監看方式: {_scene_watcher.backend}")
+    sources = [os.path.abspath(scene_filepath)]
+    if scene is not None:
+        sources.extend(scene.source_files)
+    _scene_watcher.watch(sources)
+
+def stop_scene_watcher():
+    """關閉場景檔監看 (程式結束時呼叫)。"""
+    global _scene_watcher
+    if _scene_watcher is not None:
+        _scene_watcher.close()
+        _scene_watcher = None
+
+def _poll_scene_changes(target_filepath, current_mod_time):
+    """回傳 target_filepath 場景自上次載入後變動的來源檔集合 (空集合表示沒有變動)。"""
+    if _scene_watcher is not None and _scene_watcher.is_watching(target_filepath):
+        return _scene_watcher.poll()
+    # 沒有監看器 (已停用或尚未載入成功):退回只比對根檔的修改時間
+    return {os.path.abspath(target_filepath)} if current_mod_time != last_modified_time else set()
+
+def _forget_changed_files(changed_files):
+    """記下觸發重載的變動檔案;只有變動的子場景需要重新解析,其餘導入檔沿用 prefab 快取。"""
+    global last_changed_files
+    last_changed_files = changed_files
+    if changed_files:
+        scene_diagnostics.info(f"變動的場景檔: {', '.join(sorted(os.path.basename(path) for path in changed_files))}")
+        for changed_path in changed_files:
+            _prefab_cache.pop(changed_path, None)
+
+def _new_scene_for_parsing():
+    """建立一個新的 Scene 來填充,解析位置/角度從預設起點開始。"""
+    # 用新的 Scene 物件,確保之前的 current_scene (如果解析失敗) 不會被部分修改
+    new_scene = Scene()
+    new_scene.current_parse_pos = np.copy(new_scene.start_position)
+    new_scene.current_parse_angle_rad = math.radians(new_scene.start_angle_deg)
+    new_scene.current_relative_origin_pos = np.copy(new_scene.current_parse_pos)
+    new_scene.current_relative_origin_angle_rad = new_scene.current_parse_angle_rad
+    new_scene.last_background_info = None
+    return new_scene
+
+# --- 背景載入 ---
+# 主程式 (main.py) 重載場景時不能讓畫面停住:解析 (或讀編譯快取) 與圖片解碼都在工作執行緒做,
+# 完全不碰 OpenGL;GL 工作 (上傳紋理、填紋理 ID) 由主執行緒分段執行,每段都很短,
+# 最後 commit() 在同一幀把新場景換上。在那之前 current_scene 與紋理快取都維持舊場景的狀態。
+class SceneLoadJob:
+    """一次背景場景載入;由 start_scene_load 建立,建立後工作執行緒就開始解析。"""
+
+    def __init__(self, target_filepath, force_reload, changed_files, mod_time):
+        self.filepath = target_filepath
+        self.force_reload = force_reload
+        self.changed_files = changed_files
+        self.scene = None   # 解析成功後的新場景 (紋理 ID 在 iter_gl_steps 之後才齊全)
+        self.error = None   # 工作執行緒中發生的例外
+        self.progress = (0, 0) # (已讀位元組, 總位元組)
+        self.gl_progress = (0, 0) # (主執行緒已完成的 GL 步驟, 依 scene.stats 估計的總步驟)
+        self.diff = None       # 新場景與目前場景的 SceneDiff (工作執行緒算出),沒變的物件/軌道段沿用舊緩衝區
+        self._old_scene = current_scene
+        self._mod_time = mod_time
+        self._decoded_textures = {}
+        # 強制重載要重新讀取所有圖檔:新紋理先上傳到這個暫存快取,commit() 時才取代舊快取
+        self._staged_textures = {} if force_reload else None
+        self._thread = threading.Thread(target=self._run, name="scene-load", daemon=True)
+        self._thread.start()
+
+    def done(self):
+        """工作執行緒是否已結束 (成功與否看 scene / error)。"""
+        return not self._thread.is_alive()
+
+    def _report_progress(self, bytes_done, bytes_total):
+        self.progress = (bytes_done, bytes_total)
+
+    def _run(self):
+        try:
+            scene = _load_compiled_scene(self.filepath) if SCENE_CACHE_ENABLED else None
+            if scene is not None:
+                scene_diagnostics.info(f"使用編譯場景快取載入 '{self.filepath}'。")
+            else:
+                # load_textures=False:只記錄紋理檔名,紋理 ID 由主執行緒在 iter_gl_steps 中填入
+                scene = parse_scene_file(self.filepath, initial_scene=_new_scene_for_parsing(),
+                                         load_textures=False, progress_callback=self._report_progress)
+                if scene and SCENE_CACHE_ENABLED:
+                    _save_compiled_scene(self.filepath, scene)
+            if scene and self._old_scene is not None:
+                self.diff = diff_scenes(self._old_scene, scene)
+                scene_diagnostics.debug(f"與目前場景的差異: {self.diff.summary()}")
+            if scene and texture_loader:
+                self._decoded_textures = texture_loader.decode_textures(_scene_texture_files(scene),
+                                                                        skip_cached=not self.force_reload)
+            self.scene = scene
+        except Exception as e:
+            scene_diagnostics.error(f"背景載入場景 '{self.filepath}' 時發生錯誤: {e}")
+            scene_diagnostics.debug(traceback.format_exc())
+            self.error = e
+
+    def iter_gl_steps(self):
+        """
+        (主執行緒) 先讓新場景共用舊場景可沿用的緩衝區,再上傳新場景的紋理並填入紋理 ID,
+        每完成一小步 yield 一次,呼叫端可以依每幀的時間預算分幾幀做完。須在 done() 且 scene 不為 None 後呼叫。
+        """
+        if self.diff is not None:
+            self.diff.share_buffers()
+            yield
+        if texture_loader is None:
+            return
+        for filename, decoded in self._decoded_textures.items():
+            yield from texture_loader.iter_upload_decoded_texture(filename, decoded, cache=self._staged_textures)
+            yield
+        self._decoded_textures = {}
+        if self._staged_textures is not None:
+            resolve = _texture_resolver(self._staged_textures)
+        else:
+            resolve = _texture_resolver(texture_loader.texture_cache)
+        yield from _iter_assign_object_textures(self.scene, resolve)
+
+    def commit(self):
+        """
+        (主執行緒) 把新場景換成 current_scene;強制重載時同時換上新的紋理快取並清掉天空盒快取。
+        舊場景的物件/軌道緩衝區由呼叫端釋放 (沿用到新場景的會先從舊場景拿掉)。回傳新場景,失敗時回傳 None。
+        """
+        global current_scene, scene_file_path, last_modified_time
+        if self.scene is None:
+            scene_diagnostics.error(f"場景檔案 '{self.filepath}' 載入失敗。保留原場景。")
+            return None
+        if self._staged_textures is not None:
+            texture_loader.replace_texture_cache(self._staged_textures)
+            self._staged_textures = None
+            renderer.clear_skybox_texture_cache()
+        current_scene = self.scene
+        scene_file_path = self.filepath
+        last_modified_time = self._mod_time
+        if self.diff is not None:
+            self.diff.release_shared_buffers() # 舊場景之後由呼叫端釋放,不能刪掉新場景共用的緩衝區
+            self.diff = None
+        self._old_scene = None
+        _watch_scene_sources(self.filepath, self.scene)
+        scene_diagnostics.info("場景已成功載入/重新載入。")
+        return self.scene
+
+def start_scene_load(force_reload=False, specific_filepath=None):
+    """
+    load_scene 的非阻塞版本:需要 (重新) 載入時回傳在背景執行的 SceneLoadJob,否則回傳 None。
+    檔案不存在時只印出錯誤並回傳 None,目前的場景保持不變。
+    """
+    target_filepath = specific_filepath if specific_filepath is not None else scene_file_path
+    if specific_filepath is not None:
+        force_reload = True
+    if not os.path.exists(target_filepath):
+        scene_diagnostics.error(f"場景檔案 '{target_filepath}' 未找到。")
+        return None
+    current_mod_time = os.path.getmtime(target_filepath)
+    changed_files = set()
+    if not force_reload and target_filepath == scene_file_path:
+        changed_files = _poll_scene_changes(target_filepath, current_mod_time)
+    if not (force_reload or changed_files):
+        return None
+    scene_diagnostics.info(f"偵測到場景檔案變更或強制重新載入 '{target_filepath}',於背景載入...")
+    _forget_changed_files(changed_files)
+    return SceneLoadJob(target_filepath, force_reload, changed_files, current_mod_time)
+
 # --- 修改 load_scene (主入口函數) ---
-def load_scene(force_reload=False, specific_filepath=None):
+def load_scene(force_reload=False, specific_filepath=None, progress_callback=None):
     """
     Loads or reloads the scene file if modified.
     If specific_filepath is provided, it loads that file directly.
     Otherwise, it uses the global scene_file_path.
+    progress_callback(bytes_done, bytes_total) is passed to parse_scene_file.
+    Without force_reload, the root file and all imported files are checked for changes
+    (see scene_watcher); _poll_scene_changes records the changed files in last_changed_files.
     """
     global last_modified_time, current_scene, scene_file_path
 
@@ -1392,30 +3122,34 @@ def load_scene(force_reload=False, specific_filepath=None):
         if not os.path.exists(target_filepath):
             # 如果目標檔案不存在，並且它是全域 scene_file_path，則清理 current_scene
             if target_filepath == scene_file_path:
-                print(f"錯誤: 場景檔案 '{target_filepath}' 在檢查更新時未找到。清理當前場景。")
+                scene_diagnostics.error(f"場景檔案 '{target_filepath}' 在檢查更新時未找到。清理當前場景。")
                 if current_scene: current_scene.clear()
                 if texture_loader: texture_loader.clear_texture_cache()
                 last_modified_time = 0
                 return True # 表示場景已更改 (變為空)
             else: # 如果是 specific_filepath 且不存在，則直接返回 False
-                print(f"錯誤: 指定的場景檔案 '{target_filepath}' 未找到。")
+                scene_diagnostics.error(f"指定的場景檔案 '{target_filepath}' 未找到。")
                 return False
 
 
         current_mod_time = os.path.getmtime(target_filepath)
-        # 只有當使用全域 scene_file_path 且未強制重載時，才比較修改時間
-        needs_reload = force_reload or \
-                       (target_filepath == scene_file_path and current_mod_time != last_modified_time)
+        # 只有當使用全域 scene_file_path 且未強制重載時，才檢查根檔與導入檔的變動
+        changed_files = set()
+        if not force_reload and target_filepath == scene_file_path:
+            changed_files = _poll_scene_changes(target_filepath, current_mod_time)
+        needs_reload = force_reload or bool(changed_files)
 
         if needs_reload:
-            print(f"偵測到場景檔案變更或強制重新載入 '{target_filepath}'...")
+            scene_diagnostics.info(f"偵測到場景檔案變更或強制重新載入 '{target_filepath}'...")
+            _forget_changed_files(changed_files)
 
             if current_scene and current_scene.track:
                  current_scene.track.clear()
                  
             # --- MODIFICATION: Clear both texture caches ---
-            if texture_loader:
-                print("場景重載：清除普通紋理快取...")
+            # 自動重載只代表場景文字檔變了,紋理沿用;強制重載 (R 鍵/選單) 才重新讀取圖檔
+            if texture_loader and not changed_files:
+                scene_diagnostics.debug("場景重載：清除普通紋理快取...")
                 texture_loader.clear_texture_cache()
             
             # 確保 renderer 模組被正確引用
@@ -1425,8 +3159,8 @@ def load_scene(force_reload=False, specific_filepath=None):
             # 或者，如果擔心循環導入，可以考慮將天空盒快取清理的職責放到 renderer 模組內部的一個函式中，
             # 然後 scene_parser 調用該函式。
             # 這裡假設 renderer 可以被直接訪問：
-            if 'renderer' in sys.modules and hasattr(renderer, 'skybox_texture_cache'):
-                print("場景重載：清除天空盒紋理快取...")
+            if not changed_files and 'renderer' in sys.modules and hasattr(renderer, 'skybox_texture_cache'):
+                scene_diagnostics.debug("場景重載：清除天空盒紋理快取...")
                 # 清理天空盒紋理需要 OpenGL 上下文，調用 load_scene 的地方（main.py）有上下文
                 for tex_id_sky in renderer.skybox_texture_cache.values():
                     try:
@@ -1436,33 +3170,35 @@ def load_scene(force_reload=False, specific_filepath=None):
                         if glIsTexture(tex_id_sky): 
                             glDeleteTextures(1, [tex_id_sky])
                     except Exception as e_sky_cleanup:
-                        print(f"警告：清理天空盒紋理 {tex_id_sky} 時出錯：{e_sky_cleanup}")
+                        scene_diagnostics.warning(f"清理天空盒紋理 {tex_id_sky} 時出錯：{e_sky_cleanup}")
                 renderer.skybox_texture_cache.clear()
             # --- END OF MODIFICATION ---
             
-            # --- 創建一個新的 Scene 物件來填充 ---
-            # 這樣可以確保之前的 current_scene (如果解析失敗) 不會被部分修改
-            new_parsed_scene = Scene() 
-            # 將 start_position 和 start_angle_deg 的預設值設定好
-            # （或者 Scene 的 __init__ 已經做了）
-            new_parsed_scene.current_parse_pos = np.copy(new_parsed_scene.start_position)
-            new_parsed_scene.current_parse_angle_rad = math.radians(new_parsed_scene.start_angle_deg)
-            new_parsed_scene.current_relative_origin_pos = np.copy(new_parsed_scene.current_parse_pos)
-            new_parsed_scene.current_relative_origin_angle_rad = new_parsed_scene.current_parse_angle_rad
-            new_parsed_scene.last_background_info = None
-
+            # --- 先嘗試編譯快取:根檔與所有 import 檔內容都沒變就不必重新解析 ---
+            populated_scene = _load_compiled_scene(target_filepath) if SCENE_CACHE_ENABLED else None
+            if populated_scene is not None:
+                _resolve_scene_textures(populated_scene)
+                scene_diagnostics.info(f"使用編譯場景快取載入 '{target_filepath}'。")
+            else:
+                # --- 創建一個新的 Scene 物件來填充 ---
+                # 這樣可以確保之前的 current_scene (如果解析失敗) 不會被部分修改
+                new_parsed_scene = _new_scene_for_parsing()
 
-            # 使用 parse_scene_file 來處理，它內部會調用新的 parse_scene_from_lines
-            populated_scene = parse_scene_file(target_filepath, initial_scene=new_parsed_scene, load_textures=True)
+                # 使用 parse_scene_file 來處理，它內部會調用新的 parse_scene_from_lines
+                populated_scene = parse_scene_file(target_filepath, initial_scene=new_parsed_scene, load_textures=True,
+                                                   progress_callback=progress_callback)
+                if populated_scene and SCENE_CACHE_ENABLED:
+                    _save_compiled_scene(target_filepath, populated_scene)
 
             if populated_scene: # parse_scene_file 在找不到檔案時返回 None
                 current_scene = populated_scene # 替換全域場景物件
                 if target_filepath == scene_file_path: # 只有當載入的是全域路徑時才更新時間戳
                     last_modified_time = current_mod_time
-                print("場景已成功載入/重新載入。")
+                    _watch_scene_sources(target_filepath, populated_scene)
+                scene_diagnostics.info("場景已成功載入/重新載入。")
                 return True 
             else:
-                print(f"場景檔案 '{target_filepath}' 載入失敗。可能保留舊場景或變為空場景。")
+                scene_diagnostics.error(f"場景檔案 '{target_filepath}' 載入失敗。可能保留舊場景或變為空場景。")
                 # 如果 parse_scene_file 返回 None (因 FileNotFoundError)，我們不應清除 current_scene
                 # 但如果它返回了一個空的 Scene (因其他解析錯誤)，current_scene 會被替換
                 # 這裡的邏輯需要確保 current_scene 在失敗時的狀態是合理的
@@ -1473,19 +3209,25 @@ def load_scene(force_reload=False, specific_filepath=None):
 
     except FileNotFoundError: # 這個 catch 應該在上面 target_filepath 檢查時處理
         # 保留以防萬一，但理論上不應該執行到這裡
-        print(f"錯誤: 場景檔案 '{target_filepath}' 未找到 (例外捕獲)。")
+        scene_diagnostics.error(f"場景檔案 '{target_filepath}' 未找到 (例外捕獲)。")
         if current_scene: current_scene.clear()
         last_modified_time = 0
         return True 
 
     except Exception as e:
-        print(f"檢查場景檔案更新時發生錯誤: {e}")
-        import traceback
-        traceback.print_exc() 
+        scene_diagnostics.error(f"檢查場景檔案更新時發生錯誤: {e}")
+        scene_diagnostics.debug(traceback.format_exc())
         return False
 
 # --- get_current_scene (unchanged) ---
 def get_current_scene():
     """獲取當前載入的場景"""
     global current_scene
-    return current_scene
\ No newline at end of file
+    return current_scene
+def set_current_scene(scene, filepath):
+    """換上不是由場景檔解析出的場景 (例如場景包);沒有來源檔可監看,不會自動重載。"""
+    global current_scene, scene_file_path, last_modified_time
+    current_scene = scene
+    scene_file_path = filepath
+    last_modified_time = os.path.getmtime(filepath) if os.path.exists(filepath) else 0
+    return scene
@@ -0,0 +1,198 @@
+# scene_watcher.py
+"""
+場景來源檔監看:根場景檔與它 (遞迴) import 的所有子場景檔。
+
+Linux 上用 inotify 監看這些檔案所在的目錄 (編輯器常以「寫暫存檔再改名」的方式存檔,
+監看目錄才收得到),其他平台或 inotify 不可用時改為定期 stat 輪詢。
+每個檔案以 (mtime_ns, 大小) 為簽章確認真的有變動;連續存檔時等到 debounce 秒內
+不再有新變動才一次回報,回報的是確切變動的檔案集合 (含被刪除或新出現的檔案)。
+"""
+import os
+import sys
+import time
+import struct
+import ctypes
+import ctypes.util
+
+import scene_diagnostics
+
+DEFAULT_DEBOUNCE = 0.3       # 秒:最後一次變動後等這麼久才回報
+DEFAULT_POLL_INTERVAL = 1.0  # 秒:輪詢模式下多久 stat 一次所有檔案
+
+# inotify 事件旗標 (linux/inotify.h)
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+def file_signature(filepath):
+    """檔案的 (mtime_ns, 大小);不存在或無法讀取時回傳 None。"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class _InotifyDirectories:
+    """用 inotify 監看一組目錄,回報其中有事件的檔案路徑。"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._wd_dirs = {} # {watch descriptor: 目錄}
+        self._dir_wds = {} # {目錄: watch descriptor}
+
+    def set_directories(self, directories):
+        """只保留 directories 這些目錄的監看;回傳無法監看的目錄。"""
+        failed = set()
+        for directory in list(self._dir_wds):
+            if directory not in directories:
+                self._libc.inotify_rm_watch(self._fd, self._dir_wds.pop(directory))
+        for directory in directories:
+            if directory in self._dir_wds:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                failed.add(directory)
+                continue
+            self._dir_wds[directory] = wd
+            self._wd_dirs[wd] = directory
+        return failed
+
+    def read_events(self):
+        """讀出所有待處理事件,回傳 (有事件的檔案路徑集合, 是否需要全部重新檢查)。"""
+        paths = set()
+        rescan_all = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & _IN_Q_OVERFLOW:
+                    rescan_all = True # 事件佇列溢出,不知道漏了哪些
+                    continue
+                directory = self._wd_dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                    # 目錄本身被刪除或搬走:該目錄的監看失效,裡面的檔案都要重新檢查
+                    if mask & _IN_IGNORED:
+                        del self._wd_dirs[wd]
+                        self._dir_wds.pop(directory, None)
+                    rescan_all = True
+                    continue
+                if name:
+                    paths.add(os.path.join(directory, os.fsdecode(name)))
+        return paths, rescan_all
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._wd_dirs.clear()
+        self._dir_wds.clear()
+
+
+class SceneFileWatcher:
+    """
+    監看一組場景來源檔。watch() 設定要監看的檔案 (通常是 [根檔] + scene.source_files),
+    poll() 回傳自上次回報以來確定有變動、且已經 debounce 秒沒再變動的檔案 (絕對路徑集合)。
+    """
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._signatures = {}  # {絕對路徑: 最後確認的簽章}
+        self._pending = set()  # 已確認變動、尚未回報的檔案
+        self._last_change_time = 0.0
+        self._last_scan_time = 0.0
+        self._inotify = None
+        self._unwatched_dirs = set() # inotify 無法監看的目錄,裡面的檔案改用輪詢
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _InotifyDirectories()
+            except (OSError, AttributeError) as e:
+                scene_diagnostics.warning(f"無法使用 inotify 監看場景檔 ({e}),改用輪詢。")
+
+    @property
+    def backend(self):
+        return "inotify" if self._inotify is not None else "poll"
+
+    @property
+    def watched_files(self):
+        return set(self._signatures)
+
+    def is_watching(self, filepath):
+        return os.path.abspath(filepath) in self._signatures
+
+    def watch(self, filepaths):
+        """改為監看 filepaths;已在監看中的檔案保留原簽章,尚未回報的變動不會遺失。"""
+        paths = {os.path.abspath(path) for path in filepaths}
+        self._signatures = {path: self._signatures[path] if path in self._signatures else file_signature(path)
+                            for path in paths}
+        self._pending &= paths
+        if self._inotify is not None:
+            self._unwatched_dirs = self._inotify.set_directories({os.path.dirname(path) for path in paths})
+
+    def poll(self):
+        """回傳已穩定的變動檔案集合 (可能為空);不會阻塞。"""
+        now = time.monotonic()
+        candidates = set()
+        if self._inotify is not None:
+            event_paths, rescan_all = self._inotify.read_events()
+            if rescan_all:
+                candidates = set(self._signatures)
+            else:
+                candidates = event_paths & self._signatures.keys()
+            if self._unwatched_dirs and now - self._last_scan_time >= self.poll_interval:
+                candidates.update(path for path in self._signatures
+                                  if os.path.dirname(path) in self._unwatched_dirs)
+                self._last_scan_time = now
+        elif now - self._last_scan_time >= self.poll_interval:
+            candidates = set(self._signatures)
+            self._last_scan_time = now
+
+        for path in candidates:
+            signature = file_signature(path)
+            if signature != self._signatures[path]:
+                self._signatures[path] = signature
+                self._pending.add(path)
+                self._last_change_time = now
+
+        if self._pending and now - self._last_change_time >= self.debounce:
+            changed, self._pending = self._pending, set()
+            return changed
+        return set()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._signatures.clear()
+        self._pending.clear()
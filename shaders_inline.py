@@ -85,6 +85,7 @@ TREE_VERTEX_SHADER_SOURCE = """
 #version 330 core
 layout (location = 0) in vec3 aPos;
 layout (location = 1) in vec2 aTexCoords;
+layout (location = 2) in vec3 aInstanceOffset; // array 實例的世界座標位移 (只在 u_instanced 時讀取)
 
 out vec3 FragPos_world;
 out vec2 TexCoords_frag;
@@ -92,12 +93,14 @@ out vec2 TexCoords_frag;
 uniform mat4 model;
 uniform mat4 view;
 uniform mat4 projection;
+uniform bool u_instanced; // 只有 array 實例的 instanced 繪製設為 true (見 renderer._draw_instance_arrays)
 
 void main()
 {
-    FragPos_world = vec3(model * vec4(aPos, 1.0));
+    vec4 worldPos = model * vec4(aPos, 1.0) + vec4(u_instanced ? aInstanceOffset : vec3(0.0), 0.0);
+    FragPos_world = vec3(worldPos);
     TexCoords_frag = aTexCoords;
-    gl_Position = projection * view * model * vec4(aPos, 1.0);
+    gl_Position = projection * view * worldPos;
 }
 """
 
@@ -155,6 +158,7 @@ CYLINDER_VERTEX_SHADER_SOURCE = """
 layout (location = 0) in vec3 aPos;
 layout (location = 1) in vec3 aNormal;
 layout (location = 2) in vec2 aTexCoords;
+layout (location = 3) in vec3 aInstanceOffset; // array 實例的世界座標位移 (只在 u_instanced 時讀取)
 
 out vec3 FragPos_world;
 out vec3 Normal_world;
@@ -163,13 +167,15 @@ out vec2 TexCoords_frag;
 uniform mat4 model;
 uniform mat4 view;
 uniform mat4 projection;
+uniform bool u_instanced; // 只有 array 實例的 instanced 繪製設為 true (見 renderer._draw_instance_arrays)
 
 uniform vec2 u_tex_offset;
 uniform vec2 u_tex_scale;
 
 void main()
 {
-    FragPos_world = vec3(model * vec4(aPos, 1.0));
+    vec4 worldPos = model * vec4(aPos, 1.0) + vec4(u_instanced ? aInstanceOffset : vec3(0.0), 0.0);
+    FragPos_world = vec3(worldPos);
     Normal_world = normalize(mat3(transpose(inverse(model))) * aNormal);
     
     // Apply scale and offset
@@ -178,7 +184,7 @@ void main()
     if (abs(final_scale.y) < 0.0001) final_scale.y = 0.0001;
     TexCoords_frag = (aTexCoords * final_scale) + u_tex_offset;
 
-    gl_Position = projection * view * model * vec4(aPos, 1.0);
+    gl_Position = projection * view * worldPos;
 }
 """
 
@@ -241,6 +247,7 @@ BUILDING_VERTEX_SHADER_SOURCE = """
 layout (location = 0) in vec3 aPos;         // Model space position
 layout (location = 1) in vec3 aNormal;      // Model space normal
 layout (location = 2) in vec2 aTexCoords_atlas_input; // Atlas UV coordinates
+layout (location = 3) in vec3 aInstanceOffset; // array 實例的世界座標位移 (只在 u_instanced 時讀取)
 
 out vec3 FragPos_world;
 out vec3 Normal_world;
@@ -249,6 +256,7 @@ out vec2 TexCoords_transformed_atlas;
 uniform mat4 model;
 uniform mat4 view;
 uniform mat4 projection;
+uniform bool u_instanced; // 只有 array 實例的 instanced 繪製設為 true (見 renderer._draw_instance_arrays)
 
 // *** 修改/新增 Uniforms ***
 uniform vec2 u_tex_offset;        // 平移 (u_offset, v_offset)
@@ -258,7 +266,8 @@ uniform vec2 u_tex_scale;         // 縮放/重複 (uscale, vscale)
 
 void main()
 {
-    FragPos_world = vec3(model * vec4(aPos, 1.0));
+    vec4 worldPos = model * vec4(aPos, 1.0) + vec4(u_instanced ? aInstanceOffset : vec3(0.0), 0.0);
+    FragPos_world = vec3(worldPos);
     Normal_world = normalize(mat3(transpose(inverse(model))) * aNormal);
     
     vec2 transformed_uv = aTexCoords_atlas_input; // 從VBO讀取的原始圖集UV開始
@@ -297,7 +306,7 @@ void main()
     transformed_uv += u_tex_offset;
     
     TexCoords_transformed_atlas = transformed_uv; // 傳遞給片段著色器
-    gl_Position = projection * view * model * vec4(aPos, 1.0);
+    gl_Position = projection * view * worldPos;
 }
 """
 
@@ -356,3 +365,61 @@ void main()
     FragColor = vec4(final_rgb, base_alpha);
 }
 """
+
+TRACK_VERTEX_SHADER_SOURCE = """
+#version 330 core
+layout (location = 0) in vec3 aPos;              // 道碴/鋼軌:世界座標;枕木:區域座標 (橫向, 高度, 沿線)
+layout (location = 1) in vec3 aNormal;           // 道碴沒有法向量陣列,由 glVertexAttrib 設為朝上
+layout (location = 2) in vec3 aInstancePos;      // 枕木實例:中心線上的位置
+layout (location = 3) in vec2 aInstanceForward;  // 枕木實例:水平朝向 (forward_x, forward_z)
+
+out vec3 FragPos_world;
+out vec3 Normal_world;
+
+uniform mat4 view;
+uniform mat4 projection;
+uniform bool u_instanced;
+
+void main()
+{
+    vec3 worldPos = aPos;
+    vec3 normal = aNormal;
+    if (u_instanced) {
+        vec3 forward = vec3(aInstanceForward.x, 0.0, aInstanceForward.y);
+        vec3 side = vec3(-aInstanceForward.y, 0.0, aInstanceForward.x);
+        worldPos = aInstancePos + side * aPos.x + vec3(0.0, aPos.y, 0.0) + forward * aPos.z;
+        normal = side * aNormal.x + vec3(0.0, aNormal.y, 0.0) + forward * aNormal.z;
+    }
+    FragPos_world = worldPos;
+    Normal_world = normal;
+    gl_Position = projection * view * vec4(worldPos, 1.0);
+}
+"""
+
+TRACK_FRAGMENT_SHADER_SOURCE = """
+#version 330 core
+out vec4 FragColor;
+
+in vec3 FragPos_world;
+in vec3 Normal_world;
+
+uniform vec3 u_color;
+uniform vec3 lightPos_worldspace;
+uniform vec3 lightColor;
+uniform vec3 viewPos_worldspace;
+uniform float u_ambient_strength;
+uniform float u_specular_strength;
+uniform float u_shininess;
+
+void main()
+{
+    vec3 norm = normalize(Normal_world);
+    vec3 lightDir = normalize(lightPos_worldspace - FragPos_world);
+    float diff = max(dot(norm, lightDir), 0.0);
+    vec3 viewDir = normalize(viewPos_worldspace - FragPos_world);
+    vec3 reflectDir = reflect(-lightDir, norm);
+    float spec = pow(max(dot(viewDir, reflectDir), 0.0), u_shininess);
+    vec3 lighting_effect = u_ambient_strength * lightColor + diff * lightColor + u_specular_strength * spec * lightColor;
+    FragColor = vec4(lighting_effect * u_color, 1.0);
+}
+"""
@@ -3,6 +3,9 @@ import pygame
 from OpenGL.GL import *
 import os
 import time # 用於時間戳
+import numpy as np
+import scene_diagnostics
+from concurrent.futures import ThreadPoolExecutor
 # QGLContext 只有下方註解掉的除錯碼會用到，缺少 PyQt5 時不應阻止程式啟動
 try:
     from PyQt5.QtOpenGL import QGLContext
@@ -45,89 +48,196 @@ def load_texture(filename):
         return {"id": None, "has_alpha": False} # 返回帶預設值的字典
 
     try:
-        surface = pygame.image.load(filepath)
-#         print(f"surface: {surface}")
-        # --- 簡化的 Alpha 通道檢測 ---
-        # 只要 Surface 報告有 per-pixel alpha，就認為它可能使用了 Alpha。
-        # pygame.SRCALPHA 標誌表示 Surface 每個像素都有自己的 alpha 值。
-        # surface.convert_alpha() 會確保 surface 有 per-pixel alpha。
-        # 我們可以先 convert_alpha() 然後再檢查 flags，或者直接檢查原始 surface 的 flags。
-        # 為了更可靠地判斷是否 *真的* 有 alpha 通道被使用，
-        # convert_alpha() 是個好方法，它會添加 alpha 如果沒有，或者優化現有的。
-        
-        # 先嘗試 convert_alpha()，它會返回一個帶有最佳 alpha 格式的新 surface
-        # 如果原始圖像就沒有任何透明信息，convert_alpha() 後的 alpha 通道可能都是 255
-        # 但對於我們的“自動檢測”，如果它能被 convert_alpha() 並且結果有 SRCALPHA 標誌，
-        # 我們可以初步認為它“意圖”使用 alpha。
-        
-        temp_surface_for_alpha_check = surface.convert_alpha() # 確保有 Alpha 能力
-        has_significant_alpha = bool(temp_surface_for_alpha_check.get_flags() & pygame.SRCALPHA)
-        
-        # 一個更嚴格（但可能錯誤排除某些情況）的檢查是看原始 surface
-        # has_significant_alpha = bool(surface.get_flags() & pygame.SRCALPHA)
-        # print(f"DEBUG: Texture '{filename}', original flags: {surface.get_flags()}, SRCALPHA: {pygame.SRCALPHA}, has_significant_alpha based on original: {has_significant_alpha}")
-
-        # 如果想更精確判斷 Alpha 是否真的被“使用”（即存在非255的值），
-        # 需要遍歷像素，這在加載時會有開銷。
-        # 實驗階段，上述基於 convert_alpha() 後的 SRCALPHA 標誌是一個合理的起點。
-        # if has_significant_alpha:
-        #     is_alpha_actually_used = False
-        #     for y in range(temp_surface_for_alpha_check.get_height()):
-        #         for x in range(temp_surface_for_alpha_check.get_width()):
-        #             if temp_surface_for_alpha_check.get_at((x,y))[3] < 255:
-        #                 is_alpha_actually_used = True
-        #                 break
-        #         if is_alpha_actually_used:
-        #             break
-        #     has_significant_alpha = is_alpha_actually_used # 更新為更精確的判斷
-        #     if not has_significant_alpha:
-        #          print(f"DEBUG: Texture '{filename}' has SRCALPHA flag after convert_alpha, but all alpha values are 255.")
-
-
-        # -------------------------
-        
-        # 有些圖片可能需要轉換格式以包含 Alpha 通道
-        texture_data = pygame.image.tostring(surface, "RGBA", True) # 使用 RGBA 以支援透明度
+        return _upload_texture(filename, *_decode_texture_file(filepath))
+    except Exception as e:
+        scene_diagnostics.warning(f"載入紋理 '{filepath}' 時發生錯誤: {e}", filename)
+        return {"id": None, "has_alpha": False} # 確保返回一致的結構
 
-        texture_id = glGenTextures(1)
-        
-        # --- 新增：在存入快取前檢查 ID 是否已存在於快取中 (用於不同的檔名) ---
-#         for existing_filename, existing_info in texture_cache.items():
-#             if existing_info and existing_info.get("id") == texture_id:
-#                 print(f"CRITICAL WARNING LOADER [{timestamp:.3f}]: For new file '{filename}', glGenTextures returned ID {texture_id}, "
-#                       f"which is ALREADY IN CACHE for a DIFFERENT file '{existing_filename}' with info {existing_info}!")
-#                 # 這裡可以選擇是拋出錯誤、返回 None，還是繼續（可能導致問題）
-#                 # 為了調試，我們先打印警告，然後繼續，看看後續會發生什麼
-        # --------------------------------------------------------------------
-        
-        
-        
-        glBindTexture(GL_TEXTURE_2D, texture_id)
+def _decode_texture_file(filepath):
+    """解碼圖片檔,回傳 (surface, RGBA 位元組);不碰 OpenGL,可在背景執行緒執行。"""
+    surface = pygame.image.load(filepath)
+    # 有些圖片可能需要轉換格式以包含 Alpha 通道
+    texture_data = pygame.image.tostring(surface, "RGBA", True) # 使用 RGBA 以支援透明度
+    return surface, texture_data
+
+# 分段上傳時每一步最多送出的像素位元組數 (大圖會分成多個橫條)
+TEXTURE_UPLOAD_STEP_BYTES = 4 * 1024 * 1024
+
+def _upload_texture(filename, surface, texture_data, cache=None):
+    """把解碼好的圖片上傳成 OpenGL 紋理並存入快取 (需在 GL 執行緒呼叫);cache 預設為 texture_cache。"""
+    steps = _iter_upload_texture(filename, surface, texture_data, cache)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as finished:
+            return finished.value
+
+def surface_has_alpha(surface):
+    """圖片的像素格式是否帶 Alpha (見 _iter_upload_texture 的說明);需要已設定顯示模式。"""
+    width, height = surface.get_size()
+    alpha_probe = surface.subsurface((0, 0, 1, 1)) if width and height else surface
+    temp_surface_for_alpha_check = alpha_probe.convert_alpha() # 確保有 Alpha 能力
+    return bool(temp_surface_for_alpha_check.get_flags() & pygame.SRCALPHA)
+
+def _iter_upload_texture(filename, surface, texture_data, cache=None, step_bytes=None):
+    """
+    _upload_texture 的分段版本:給 step_bytes 時大圖先配置紋理,再分成多個橫條以
+    glTexSubImage2D 上傳,每條之後 yield 一次。產生器的回傳值是紋理資訊 dict。
+    """
+    # --- 簡化的 Alpha 通道檢測 ---
+    # 只要 Surface 報告有 per-pixel alpha，就認為它可能使用了 Alpha。
+    # pygame.SRCALPHA 標誌表示 Surface 每個像素都有自己的 alpha 值。
+    # convert_alpha() 會返回一個帶有最佳 alpha 格式的新 surface (需要顯示模式，所以留在主執行緒)；
+    # 如果它能被 convert_alpha() 並且結果有 SRCALPHA 標誌，我們可以初步認為它“意圖”使用 alpha。
+    # 更精確的判斷需要逐像素檢查 alpha 是否有非 255 的值，載入時開銷較大，暫不採用。
+    # 結果的標誌只取決於像素格式，所以只轉換 1x1 的子 surface，大圖不必整張轉換。
+    width, height = surface.get_size()
+    has_significant_alpha = surface_has_alpha(surface)
+
+    texture_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture_id)
 
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
 
-        # 建立紋理及其 mipmaps
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, surface.get_width(), surface.get_height(),
+    # 建立紋理及其 mipmaps
+    row_bytes = width * 4
+    if step_bytes is None or row_bytes * height <= step_bytes:
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
-        glGenerateMipmap(GL_TEXTURE_2D) # 自動生成 Mipmap
+    else:
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height,
+                     0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        rows_per_step = max(1, step_bytes // row_bytes)
+        for row in range(0, height, rows_per_step):
+            rows = min(rows_per_step, height - row)
+            glBindTexture(GL_TEXTURE_2D, texture_id) # 兩步之間的繪製可能改變了綁定
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, row, width, rows, GL_RGBA, GL_UNSIGNED_BYTE,
+                            texture_data[row * row_bytes:(row + rows) * row_bytes])
+            glBindTexture(GL_TEXTURE_2D, 0)
+            yield
+        glBindTexture(GL_TEXTURE_2D, texture_id)
+    glGenerateMipmap(GL_TEXTURE_2D) # 自動生成 Mipmap
 
-        glBindTexture(GL_TEXTURE_2D, 0) # 解除綁定
+    glBindTexture(GL_TEXTURE_2D, 0) # 解除綁定
 
-        texture_info = {"id": texture_id, "has_alpha": has_significant_alpha}
-        texture_cache[filename] = texture_info
-        
-#         print(f"紋理載入檢查無快取後 {texture_cache}")
-    
-        print(f"紋理已載入: {filename} (ID: {texture_id})")
-        return texture_info
+    texture_info = {"id": texture_id, "has_alpha": has_significant_alpha}
+    (texture_cache if cache is None else cache)[filename] = texture_info
+    scene_diagnostics.debug(f"紋理已載入: {filename} (ID: {texture_id})")
+    return texture_info
+
+# --- 預先產生的 Mipmap (場景包) ---
+def build_mipmap_levels(width, height, texture_data):
+    """
+    由 RGBA 位元組在 CPU 上產生完整的 mipmap 鏈 (每層 2x2 平均,尺寸規則與 glGenerateMipmap 相同),
+    回傳 [(寬, 高, (高, 寬, 4) uint8 陣列), ...],第 0 層即原圖。
+    """
+    pixels = np.frombuffer(texture_data, dtype=np.uint8).reshape(height, width, 4)
+    levels = [(width, height, pixels)]
+    while width > 1 or height > 1:
+        new_width, new_height = max(1, width // 2), max(1, height // 2)
+        summed = pixels.astype(np.uint16)
+        summed = summed[0:new_height * 2:2] + summed[1:new_height * 2:2] if height > 1 else summed * 2
+        summed = summed[:, 0:new_width * 2:2] + summed[:, 1:new_width * 2:2] if width > 1 else summed * 2
+        pixels = ((summed + 2) // 4).astype(np.uint8)
+        width, height = new_width, new_height
+        levels.append((width, height, pixels))
+    return levels
+
+def upload_texture_levels(filename, levels, has_alpha, cache=None):
+    """
+    上傳 build_mipmap_levels 產生的各層 (例如場景包 mmap 出來的陣列) 並存入快取,
+    不解碼圖檔也不呼叫 glGenerateMipmap。回傳紋理資訊 dict。
+    """
+    texture_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture_id)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+    for level, (width, height, pixels) in enumerate(levels):
+        glTexImage2D(GL_TEXTURE_2D, level, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+    glBindTexture(GL_TEXTURE_2D, 0)
+
+    texture_info = {"id": texture_id, "has_alpha": has_alpha}
+    (texture_cache if cache is None else cache)[filename] = texture_info
+    scene_diagnostics.debug(f"紋理已載入 (預先產生 mipmap): {filename} (ID: {texture_id})")
+    return texture_info
+
+def _decode_texture_file_safe(filepath):
+    try:
+        return _decode_texture_file(filepath), None
     except Exception as e:
-        print(f"載入紋理 '{filepath}' 時發生錯誤: {e}")
-        return {"id": None, "has_alpha": False} # 確保返回一致的結構
+        return None, e
 
-    print()
+# 背景解碼的執行緒數上限 (pygame.image.load 解碼時會釋放 GIL)
+TEXTURE_DECODE_WORKERS = 8
+
+def decode_textures(filenames, skip_cached=True):
+    """
+    在執行緒池中平行解碼多個紋理檔 (去重、略過不存在的檔案;skip_cached 時也略過已快取的),
+    回傳 {filename: (解碼結果, 例外)}。不碰 OpenGL,可在背景執行緒呼叫。
+    """
+    filepaths = {}
+    for filename in dict.fromkeys(filenames):
+        if not filename or (skip_cached and filename in texture_cache): continue
+        filepath = os.path.join("textures", filename)
+        if os.path.exists(filepath):
+            filepaths[filename] = filepath
+    if not filepaths:
+        return {}
+    worker_count = min(TEXTURE_DECODE_WORKERS, len(filepaths), os.cpu_count() or 1)
+    if worker_count > 1:
+        with ThreadPoolExecutor(max_workers=worker_count) as pool:
+            decoded = list(pool.map(_decode_texture_file_safe, filepaths.values()))
+    else:
+        decoded = [_decode_texture_file_safe(filepath) for filepath in filepaths.values()]
+    return dict(zip(filepaths, decoded))
+
+def upload_decoded_texture(filename, decoded, cache=None):
+    """上傳 decode_textures 的一筆結果 (需在 GL 執行緒呼叫);失敗時印出錯誤並回傳 None。"""
+    steps = iter_upload_decoded_texture(filename, decoded, cache, step_bytes=None)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as finished:
+            return finished.value
+
+def iter_upload_decoded_texture(filename, decoded, cache=None, step_bytes=TEXTURE_UPLOAD_STEP_BYTES):
+    """upload_decoded_texture 的分段版本 (見 _iter_upload_texture),讓大圖的上傳可以分散到多幀。"""
+    image, error = decoded
+    try:
+        if error is not None:
+            raise error
+        return (yield from _iter_upload_texture(filename, *image, cache=cache, step_bytes=step_bytes))
+    except Exception as e:
+        scene_diagnostics.warning(f"載入紋理 '{os.path.join('textures', filename)}' 時發生錯誤: {e}", filename)
+        return None
+
+def preload_textures(filenames):
+    """
+    批次載入多個紋理:在執行緒池中平行解碼圖片 (見 decode_textures),
+    再於呼叫端 (GL) 執行緒一次上傳全部。之後的 load_texture 都會直接命中快取。
+    """
+    for filename, decoded in decode_textures(filenames).items():
+        upload_decoded_texture(filename, decoded)
+
+def replace_texture_cache(new_cache):
+    """
+    以 new_cache 取代紋理快取並釋放舊快取的 OpenGL 紋理 (新快取仍在用的除外)。
+    背景重載把新場景的紋理先上傳到另一個 dict,換上新場景的那一幀才呼叫這裡,
+    舊場景在此之前都還能照常繪製。
+    """
+    global texture_cache
+    old_cache, texture_cache = texture_cache, new_cache
+    kept_ids = {texture_info.get("id") for texture_info in new_cache.values() if texture_info is not None}
+    for texture_info in old_cache.values():
+        if texture_info is None or texture_info.get("id") in kept_ids: continue
+        if glIsTexture(texture_info.get("id")):
+            glDeleteTextures(1, [texture_info.get("id")])
 
 def clear_texture_cache():
 #     timestamp = time.time()
@@ -135,7 +245,7 @@ def clear_texture_cache():
     """清除紋理快取"""
     global texture_cache
     # 可以在這裡添加 glDeleteTextures 釋放 OpenGL 資源
-    print("清除紋理快取...")
+    scene_diagnostics.debug("清除紋理快取...")
     for texture_info in texture_cache.values():
         if texture_info is not None and glIsTexture(texture_info.get("id")):
              glDeleteTextures(1, [texture_info.get("id")])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""編輯器增量解析 (IncrementalSceneParser) 的計時檢查。
+
+產生一份有大量 building 行的合成場景,比較:
+  - 整份重新解析 (parse_scene_from_lines)
+  - 增量解析器只修改中間一行物件的 update
+修改一行應該遠比整份解析快;否則編輯器每按一次鍵都等於重載整個場景。
+
+用法範例:
+    python tools/incremental_parse_bench.py
+    python tools/incremental_parse_bench.py --objects 50000 --edits 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scene_diagnostics
+import scene_parser
+
+SCENE_NAME = "bench_scene.txt"
+
+
+def make_scene_lines(object_count, seed=0):
+    rng = random.Random(seed)
+    lines = ["start 0 0 0 0\n", "straight 500 0\n"]
+    for _ in range(object_count):
+        lines.append(f"building {rng.uniform(-500, 500):.1f} 0 {rng.uniform(0, 5000):.1f} 0 "
+                     f"{rng.uniform(0, 360):.1f} 0 {rng.uniform(5, 30):.1f} {rng.uniform(5, 30):.1f} "
+                     f"{rng.uniform(3, 60):.1f}\n")
+    return lines
+
+
+def edited_line(line, rng):
+    parts = line.split()
+    parts[9] = f"{float(parts[9]) + rng.uniform(1, 5):.1f}" # 改高度
+    return " ".join(parts) + "\n"
+
+
+def run(object_count, edit_count, base_dir):
+    lines = make_scene_lines(object_count)
+
+    t0 = time.perf_counter()
+    scene_parser.parse_scene_from_lines(lines, base_dir, SCENE_NAME, None, load_textures=False)
+    full_time = time.perf_counter() - t0
+
+    parser = scene_parser.IncrementalSceneParser()
+    parser.update(lines, base_dir, SCENE_NAME, load_textures=False)
+    rng = random.Random(1)
+    edit_times = []
+    for _ in range(edit_count):
+        index = rng.randrange(2, len(lines))
+        lines = list(lines)
+        lines[index] = edited_line(lines[index], rng)
+        t0 = time.perf_counter()
+        result = parser.update(lines, base_dir, SCENE_NAME, load_textures=False)
+        edit_times.append(time.perf_counter() - t0)
+        if result.full_reparse or result.reparsed_line_count != 1:
+            print(f"錯誤: 修改第 {index + 1} 行應只重新解析該行 "
+                  f"(full_reparse={result.full_reparse}, 重新解析 {result.reparsed_line_count} 行)")
+            return 1
+    edit_time = sorted(edit_times)[len(edit_times) // 2]
+
+    print(f"{object_count} 個物件:整份解析 {full_time * 1000:.1f} ms,"
+          f"修改一行 (中位數,{edit_count} 次) {edit_time * 1000:.2f} ms")
+    if edit_time >= full_time:
+        print("錯誤: 修改一行沒有比整份解析快")
+        return 1
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="比較增量解析修改一行與整份解析的耗時")
+    ap.add_argument("--objects", type=int, nargs="+", default=[5000, 50000],
+                    help="場景的 building 數量 (可給多個,預設 5000 50000)")
+    ap.add_argument("--edits", type=int, default=10, help="每個場景修改幾次 (預設 10)")
+    args = ap.parse_args()
+
+    scene_diagnostics.set_quiet()
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    status = 0
+    for object_count in args.objects:
+        status |= run(object_count, args.edits, base_dir)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
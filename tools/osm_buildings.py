@@ -39,9 +39,14 @@ METERS_PER_DEG_LON_EQUATOR = 111320.0
 
 # --- 經緯度 → 局部公尺(等距圓柱近似,10km 內誤差 < 0.1%) ---
 def latlon_to_en(lat, lon, lat0, lon0):
-    east = (lon - lon0) * math.cos(math.radians(lat0)) * METERS_PER_DEG_LON_EQUATOR
-    north = (lat - lat0) * METERS_PER_DEG_LAT
-    return east, north
+    return latlon_to_en_batch((lat,), (lon,), lat0, lon0)[0]
+
+
+def latlon_to_en_batch(lats, lons, lat0, lon0):
+    """latlon_to_en 的整批版:同一原點的係數只算一次,回傳 [(east, north), ...]。"""
+    lon_scale = math.cos(math.radians(lat0)) * METERS_PER_DEG_LON_EQUATOR
+    return [((lon - lon0) * lon_scale, (lat - lat0) * METERS_PER_DEG_LAT)
+            for lat, lon in zip(lats, lons)]
 
 
 def polygon_area(points):
@@ -187,13 +192,16 @@ def buildings_from_overpass(data, lat0, lon0, min_area, level_height, default_le
     results = []
     skipped_small = 0
     height_sources = {"height": 0, "levels": 0, "default": 0}
-    for el in data.get("elements", []):
-        if el.get("type") != "way":
-            continue
-        geom = el.get("geometry")
-        if not geom or len(geom) < 3:
-            continue
-        pts = [latlon_to_en(g["lat"], g["lon"], lat0, lon0) for g in geom]
+    ways = [el for el in data.get("elements", [])
+            if el.get("type") == "way" and el.get("geometry") and len(el["geometry"]) >= 3]
+    # 所有 way 的頂點攤平後一次換算,再依各 way 的頂點數切回
+    all_pts = latlon_to_en_batch([g["lat"] for el in ways for g in el["geometry"]],
+                                 [g["lon"] for el in ways for g in el["geometry"]], lat0, lon0)
+    start = 0
+    for el in ways:
+        end = start + len(el["geometry"])
+        pts = all_pts[start:end]
+        start = end
         # 閉合 way 首尾重複,去掉尾點避免影響凸包
         if len(pts) > 1 and pts[0] == pts[-1]:
             pts = pts[:-1]
@@ -279,6 +287,9 @@ def selftest():
     e, n = latlon_to_en(25.0, 121.501, 25.0, 121.5)
     expect_e = math.cos(math.radians(25.0)) * 111.320
     check("經度→東向", abs(e - expect_e) < 0.01, f"e={e:.2f}m (預期 {expect_e:.2f})")
+    batch = latlon_to_en_batch([25.001, 25.0], [121.5, 121.501], 25.0, 121.5)
+    check("整批換算一致", batch == [latlon_to_en(25.001, 121.5, 25.0, 121.5),
+                                    latlon_to_en(25.0, 121.501, 25.0, 121.5)])
 
     # 6. 高度 fallback 順序
     check("height 標籤", parse_building_height({"height": "12.5 m"}, 3, 3) == (12.5, "height"))
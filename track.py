@@ -1,13 +1,154 @@
 # track.py
 # import math
 import numpy as math
+import bisect
+import hashlib
+import itertools
 import numpy as np
+from scipy.spatial import cKDTree
 from OpenGL.GL import * # 需要引入 OpenGL 函數
+import scene_diagnostics
 
-INTERPOLATION_STEPS = 5 # 每單位角度或長度的內插步數 (影響平滑度和效能)
+TRACK_MESH_MAX_ERROR = 0.02 # 彎道網格取樣的最大弦高誤差 (公尺);直線只取兩端點 (坡度固定,兩點即精確)
+TRACK_MESH_MAX_STEP_DEG = 10.0 # 彎道相鄰取樣點的最大轉角 (小半徑彎道仍保持圓滑)
 TRACK_WIDTH = 1.5       # 軌道寬度
 BALLAST_WIDTH = 2.5     # 道碴寬度
 BALLAST_HEIGHT = 0.1    # 道碴高度
+SLEEPER_SPACING = 0.6   # 枕木間距 (公尺,各段內平均分配)
+SLEEPER_LENGTH = 2.4    # 枕木長度 (橫跨軌道)
+SLEEPER_WIDTH = 0.25    # 枕木寬度 (沿軌道方向)
+SLEEPER_HEIGHT = 0.05   # 枕木高出道碴頂面的高度;鋼軌底部放在枕木頂面
+# 鋼軌斷面 (橫向偏移, 高度),從一側軌底沿軌腰、軌頭繞到另一側軌底 (逆時針,底面不畫)
+RAIL_PROFILE = ((0.065, 0.0), (0.065, 0.012), (0.01, 0.03), (0.01, 0.11), (0.035, 0.115), (0.035, 0.15),
+                (-0.035, 0.15), (-0.035, 0.115), (-0.01, 0.11), (-0.01, 0.03), (-0.065, 0.012), (-0.065, 0.0))
+RAIL_HEIGHT = max(height for _offset, height in RAIL_PROFILE)
+TRACK_STREAM_AHEAD = 3000.0  # 串流模式只為電車前方這段距離 (公尺) 內的軌道段生成並上傳網格
+TRACK_STREAM_BEHIND = 1000.0 # 與後方這段距離內的軌道段
+TRACK_STREAM_RADIUS = 1000.0 # 另外保留水平距離電車這麼近的段 (平行的回程線、長的視覺分岔);應大於 main 的 FAR_CLIP_MAX
+TRACK_STREAM_MARGIN = 500.0  # 每次串流前後 (與半徑) 各多備的距離;電車走完這段才需要再串流 (也避免在邊界反覆生成/釋放)
+TRACK_INDEX_SPACING = 2.0 # 最近點索引的取樣邊最大長度 (公尺);查詢投影到取樣邊上,彎道誤差約 間距²/(8·半徑)
+
+# 一段軌道 (與每個視覺分岔) 的渲染資料;幾何相同的新舊段可直接共用,GL 緩衝區由整條軌道的 TrackMesh 統一建立。
+# 道碴為位置 (x, y, z) 的三角形;鋼軌為 (位置, 法向量) 交錯的三角形;枕木為每根一列 (x, y, z, forward_x, forward_z) 的實例
+_RENDER_BUFFER_KEYS = ('ballast_vertices', 'rail_left_vertices', 'rail_right_vertices', 'sleeper_instances')
+_MESH_VERTEX_KEYS = _RENDER_BUFFER_KEYS[:3]
+_render_generations = itertools.count(1) # 每次段的渲染頂點就緒時取一個新編號,Track 據此判斷合併網格要不要重建
+
+def _rail_profile_faces():
+    """RAIL_PROFILE 相鄰兩點構成的各面:(起點, 終點, 外法向量) 陣列,法向量為 (橫向, 高度)。"""
+    profile = np.asarray(RAIL_PROFILE, dtype=np.float64)
+    edges = profile[1:] - profile[:-1]
+    normals = np.column_stack((edges[:, 1], -edges[:, 0])) # 逆時針走向的外側 = 走向順時針轉 90°
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    return profile[:-1], profile[1:], normals
+
+_RAIL_FACE_STARTS, _RAIL_FACE_ENDS, _RAIL_FACE_NORMALS = _rail_profile_faces()
+
+def _extrude_rail(points, left, base_height):
+    """
+    沿中心線 (N, 3) 與橫向單位向量 left (N, 3) 擠出鋼軌斷面 → (位置, 法向量) 交錯的扁平 float32 三角形頂點。
+    每兩點之間、斷面每個面兩個三角形;法向量沿橫向與垂直方向組合,同一面平直著色。
+    """
+    up = np.array([0.0, 1.0, 0.0])
+    def ring(profile_points):
+        # (N, F, 3):每個點、每個面的一個斷面頂點
+        return (points[:, None, :] + left[:, None, :] * profile_points[None, :, 0, None] +
+                up * (base_height + profile_points[None, :, 1, None]))
+    starts, ends = ring(_RAIL_FACE_STARTS), ring(_RAIL_FACE_ENDS)
+    normals = left[:, None, :] * _RAIL_FACE_NORMALS[None, :, 0, None] + up * _RAIL_FACE_NORMALS[None, :, 1, None]
+    positions = np.stack((starts[:-1], ends[:-1], starts[1:], starts[1:], ends[:-1], ends[1:]), axis=2)
+    face_normals = np.stack((normals[:-1], normals[:-1], normals[1:], normals[1:], normals[:-1], normals[1:]), axis=2)
+    return np.concatenate((positions, face_normals), axis=3).astype(np.float32).ravel()
+
+def _polyline_sleeper_instances(points, forwards):
+    """沿中心線每 SLEEPER_SPACING 左右 (各段內平均分配) 放一根枕木 → (M, 5) float32 的 (x, y, z, forward_x, forward_z)。"""
+    cumulative = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(points[:, 0]), np.diff(points[:, 2])))))
+    length = cumulative[-1]
+    if length <= 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    count = max(1, int(round(length / SLEEPER_SPACING)))
+    distances = (np.arange(count) + 0.5) * (length / count)
+    instances = np.empty((count, 5))
+    for axis in range(3):
+        instances[:, axis] = np.interp(distances, cumulative, points[:, axis])
+    for axis in range(2):
+        instances[:, 3 + axis] = np.interp(distances, cumulative, forwards[:, axis])
+    instances[:, 3:] /= np.linalg.norm(instances[:, 3:], axis=1)[:, None]
+    return instances.astype(np.float32)
+
+def _polyline_render_vertices(points, orientations):
+    """
+    中心線點列 (N, 3) 與水平朝向 (N, 2) → (道碴, 左軌, 右軌, 枕木實例),整段一次以陣列運算算出。
+    道碴頂面每兩點之間兩個三角形 (bl1, br1, bl2) (bl2, br1, br2);鋼軌為 RAIL_PROFILE 擠出的三角形網格,
+    軌底放在枕木頂面上。
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    forwards = np.asarray(orientations, dtype=np.float64).reshape(-1, 2)
+    right = np.zeros_like(points) # 右向量 (-forward_z, 0, forward_x)
+    right[:, 0] = -forwards[:, 1]
+    right[:, 2] = forwards[:, 0]
+
+    ballast_left = points + right * (BALLAST_WIDTH / 2.0)
+    ballast_right = points - right * (BALLAST_WIDTH / 2.0)
+    ballast_left[:, 1] += BALLAST_HEIGHT
+    ballast_right[:, 1] += BALLAST_HEIGHT
+    triangles = np.stack((ballast_left[:-1], ballast_right[:-1], ballast_left[1:],
+                          ballast_left[1:], ballast_right[:-1], ballast_right[1:]), axis=1)
+    rail_base = BALLAST_HEIGHT + SLEEPER_HEIGHT
+    return (triangles.astype(np.float32).ravel(),
+            _extrude_rail(points + right * (TRACK_WIDTH / 2.0), right, rail_base),
+            _extrude_rail(points - right * (TRACK_WIDTH / 2.0), right, rail_base),
+            _polyline_sleeper_instances(points, forwards))
+
+def sleeper_mesh_vertices():
+    """
+    一根枕木的網格 (頂面與四個側面,底面埋在道碴裡不畫):(位置, 法向量) 交錯的扁平 float32 三角形頂點。
+    區域座標 (橫向, 高度, 沿線),由著色器依每根枕木的實例位置與朝向轉到世界座標。
+    """
+    half_length, half_width = SLEEPER_LENGTH / 2.0, SLEEPER_WIDTH / 2.0
+    bottom, top = BALLAST_HEIGHT, BALLAST_HEIGHT + SLEEPER_HEIGHT
+    faces = (
+        (((-half_length, top, -half_width), (half_length, top, -half_width),
+          (half_length, top, half_width), (-half_length, top, half_width)), (0.0, 1.0, 0.0)),
+        (((-half_length, bottom, half_width), (half_length, bottom, half_width),
+          (half_length, top, half_width), (-half_length, top, half_width)), (0.0, 0.0, 1.0)),
+        (((half_length, bottom, -half_width), (-half_length, bottom, -half_width),
+          (-half_length, top, -half_width), (half_length, top, -half_width)), (0.0, 0.0, -1.0)),
+        (((half_length, bottom, half_width), (half_length, bottom, -half_width),
+          (half_length, top, -half_width), (half_length, top, half_width)), (1.0, 0.0, 0.0)),
+        (((-half_length, bottom, -half_width), (-half_length, bottom, half_width),
+          (-half_length, top, half_width), (-half_length, top, -half_width)), (-1.0, 0.0, 0.0)),
+    )
+    vertices = []
+    for corners, normal in faces:
+        for corner_index in (0, 1, 2, 0, 2, 3):
+            vertices.extend(corners[corner_index])
+            vertices.extend(normal)
+    return np.array(vertices, dtype=np.float32)
+
+# 段的解析參數 (每段一列,見 TrackSegment.analytic_params):
+# 起點 x/y/z、起始水平角、水平轉角 (直線為 0)、半徑、水平長度、行駛長度、坡度、圓心 x/z
+_PARAM_COUNT = 11
+
+def _evaluate_segments(params, distances_on_segment):
+    """
+    以封閉解求各段上距離處的位置與朝向:params (N, _PARAM_COUNT) 與距離 (N,) → (位置 (N, 3), 朝向 (N, 2))。
+    距離限制在 [0, 段長];長度為 0 的段回傳起點與起始朝向。直線沿起始方向前進,彎道繞圓心轉,高度依水平距離乘坡度。
+    """
+    (start_x, start_y, start_z, start_angle, sweep, radius,
+     horizontal_length, length, gradient, center_x, center_z) = np.asarray(params, dtype=float).T
+    distances = np.clip(np.asarray(distances_on_segment, dtype=float), 0.0, length)
+    fraction = np.where(length > 0, distances / np.where(length > 0, length, 1.0), 0.0)
+    heading = start_angle + fraction * sweep
+    horizontal = fraction * horizontal_length
+    curve = sweep != 0
+    circle_angle = heading - np.sign(sweep) * (math.pi / 2.0) # 圓心指向該點的角度
+    positions = np.empty((len(distances), 3))
+    positions[:, 0] = np.where(curve, center_x + radius * math.cos(circle_angle), start_x + math.cos(start_angle) * horizontal)
+    positions[:, 1] = start_y + horizontal * gradient
+    positions[:, 2] = np.where(curve, center_z + radius * math.sin(circle_angle), start_z + math.sin(start_angle) * horizontal)
+    forwards = np.column_stack((math.cos(heading), math.sin(heading)))
+    return positions, forwards
 
 class TrackSegment:
     """軌道區段基類"""
@@ -24,22 +165,15 @@ class TrackSegment:
         
         self.end_pos = np.copy(self.start_pos)
         self.end_angle_rad = self.start_angle_rad
-        self.points = [] # 中心線上的內插點 [(x, y, z), ...]
-        self.orientations = [] # 每個點的朝向向量 [(forward_x, forward_z), ...]
+        self.points = np.zeros((0, 3)) # 中心線上的內插點 (N, 3) 陣列
+        self.orientations = np.zeros((0, 2)) # 每個點的水平朝向向量 (forward_x, forward_z),(N, 2) 陣列
         
         # --- 新增：用於 VBO 的數據 ---
         self.ballast_vertices = [] # 稍後轉換為 NumPy 數組
         self.rail_left_vertices = []
         self.rail_right_vertices = []
+        self.sleeper_instances = []
 
-        # --- 新增：VBO 和 VAO ID ---
-        self.ballast_vbo = None
-        self.rail_left_vbo = None
-        self.rail_right_vbo = None
-        self.ballast_vao = None
-        self.rail_left_vao = None
-        self.rail_right_vao = None
-        # ---------------------------
         self.source_line_number = -1 # 初始化為無效值
 
         # --- START OF MODIFICATION ---
@@ -48,315 +182,52 @@ class TrackSegment:
                                   # 例如: {'type': 'straight', 'angle_deg': 30, 'length': 50, 'gradient': 0,
                                   #        'points': [], 'orientations': [],
                                   #        'ballast_vertices': [], 'rail_left_vertices': [], 'rail_right_vertices': [],
-                                  #        'ballast_vao': None, 'rail_left_vao': None, 'rail_right_vao': None,
-                                  #        'ballast_vbo': None, 'rail_left_vbo': None, 'rail_right_vbo': None}
+                                  #        'sleeper_instances': []}
         # --- END OF MODIFICATION ---
         # --- 新增 is_buffer_ready 標誌 ---
         self.is_buffer_ready = False 
         # ----------------------------------
+        self.render_generation = 0 # setup_buffers 時更新;見 _render_generations
 
     def _generate_render_vertices(self):
         """
-        根據 self.points 和 self.orientations 生成繪製用的頂點。
+        根據 self.points 和 self.orientations 生成繪製用的頂點 (含各視覺分岔)。
         這個方法應該在 points 和 orientations 計算完成後被調用。
         """
-        if not self.points or len(self.points) < 2:
+        if len(self.points) < 2:
             return
 
-        self.ballast_vertices = []
-        self.rail_left_vertices = []
-        self.rail_right_vertices = []
+        (self.ballast_vertices, self.rail_left_vertices, self.rail_right_vertices,
+         self.sleeper_instances) = _polyline_render_vertices(self.points, self.orientations)
 
-        half_track_width = TRACK_WIDTH / 2.0
-        half_ballast_width = BALLAST_WIDTH / 2.0
-        rail_height_offset = BALLAST_HEIGHT + 0.05
-
-        # --- 生成道碴頂面頂點 (使用 GL_TRIANGLES) ---
-        # GL_TRIANGLE_STRIP 跨段組合比較麻煩，先用 GL_TRIANGLES 簡化
-        for i in range(len(self.points) - 1):
-            p1 = self.points[i]
-            o1_xz = self.orientations[i]
-            # --- MODIFICATION: Ensure o1_xz is a numpy array for vector operations ---
-            o1_xz_arr = np.asarray(o1_xz)
-            r1_xz = np.array([-o1_xz_arr[1], 0, o1_xz_arr[0]]) # Right vector at p1
-            # --- END OF MODIFICATION ---
-
-            p2 = self.points[i+1]
-            o2_xz = self.orientations[i+1]
-            # --- MODIFICATION: Ensure o2_xz is a numpy array for vector operations ---
-            o2_xz_arr = np.asarray(o2_xz)
-            r2_xz = np.array([-o2_xz_arr[1], 0, o2_xz_arr[0]]) # Right vector at p2
-            # --- END OF MODIFICATION ---
-
-            # 計算四個角點 (道碴頂面)
-            bl1 = p1 + r1_xz * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-            br1 = p1 - r1_xz * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-            bl2 = p2 + r2_xz * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-            br2 = p2 - r2_xz * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-
-            # 第一個三角形 (bl1, br1, bl2)
-            self.ballast_vertices.extend(bl1.tolist())
-            self.ballast_vertices.extend(br1.tolist())
-            self.ballast_vertices.extend(bl2.tolist())
-            # 第二個三角形 (bl2, br1, br2)
-            self.ballast_vertices.extend(bl2.tolist())
-            self.ballast_vertices.extend(br1.tolist())
-            self.ballast_vertices.extend(br2.tolist())
-
-        # --- 生成軌道頂點 (使用 GL_LINE_STRIP) ---
-        for i in range(len(self.points)):
-            pos = self.points[i]
-            orient_xz = self.orientations[i]
-            # --- MODIFICATION: Ensure orient_xz is a numpy array for vector operations ---
-            orient_xz_arr = np.asarray(orient_xz)
-            right_vec_xz = np.array([-orient_xz_arr[1], 0, orient_xz_arr[0]])
-            # --- END OF MODIFICATION ---
-
-            p_rail_left = pos + right_vec_xz * half_track_width + np.array([0, rail_height_offset, 0])
-            p_rail_right = pos - right_vec_xz * half_track_width + np.array([0, rail_height_offset, 0])
-
-            self.rail_left_vertices.extend(p_rail_left.tolist())
-            self.rail_right_vertices.extend(p_rail_right.tolist())
-        # --- START OF MODIFICATION ---
-        # 生成視覺分岔的頂點數據
+        # 生成視覺分岔的頂點數據 (points/orientations 由 scene_parser 解析 vbranch 時算好)
         for branch_def in self.visual_branches:
-            # 在添加 visual_branch 的定義時，scene_parser 會將解析後的參數放入 branch_def
-            # 現在我們需要根據這些參數計算該分岔的 points 和 orientations
-            # 這些計算應該在 self.end_pos 和 self.end_angle_rad 確定後進行
-            # 為簡化，我們假設 branch_def 中已經預先填充了 'points' 和 'orientations'
-            # 或者在這裡動態計算它們
-
-            # 重置/初始化當前 branch 的頂點列表
-            branch_def['ballast_vertices'] = []
-            branch_def['rail_left_vertices'] = []
-            branch_def['rail_right_vertices'] = []
-
-            if not branch_def.get('points') or len(branch_def['points']) < 2:
-                print(f"Warning: Visual branch has insufficient points. Skipping vertex generation for this branch.")
+            branch_points = branch_def.get('points')
+            if branch_points is None or len(branch_points) < 2:
+                branch_def['ballast_vertices'] = []
+                branch_def['rail_left_vertices'] = []
+                branch_def['rail_right_vertices'] = []
+                branch_def['sleeper_instances'] = []
+                scene_diagnostics.warning("Visual branch has insufficient points. Skipping vertex generation for this branch.",
+                                          line=self.source_line_number, command="vbranch")
                 continue
-
-            # 使用與主軌道類似的邏輯生成分岔的頂點
-            branch_points = branch_def['points']
-            branch_orientations = branch_def['orientations']
-
-            # 生成分岔道碴頂點
-            for i in range(len(branch_points) - 1):
-                p1_b = branch_points[i]
-                o1_xz_b = np.asarray(branch_orientations[i]) # 確保是 numpy array
-                r1_xz_b = np.array([-o1_xz_b[1], 0, o1_xz_b[0]])
-
-                p2_b = branch_points[i+1]
-                o2_xz_b = np.asarray(branch_orientations[i+1]) # 確保是 numpy array
-                r2_xz_b = np.array([-o2_xz_b[1], 0, o2_xz_b[0]])
-
-                bl1_b = p1_b + r1_xz_b * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-                br1_b = p1_b - r1_xz_b * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-                bl2_b = p2_b + r2_xz_b * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-                br2_b = p2_b - r2_xz_b * half_ballast_width + np.array([0, BALLAST_HEIGHT, 0])
-
-                branch_def['ballast_vertices'].extend(bl1_b.tolist())
-                branch_def['ballast_vertices'].extend(br1_b.tolist())
-                branch_def['ballast_vertices'].extend(bl2_b.tolist())
-                branch_def['ballast_vertices'].extend(bl2_b.tolist())
-                branch_def['ballast_vertices'].extend(br1_b.tolist())
-                branch_def['ballast_vertices'].extend(br2_b.tolist())
-
-            # 生成分岔軌道頂點
-            for i in range(len(branch_points)):
-                pos_b = branch_points[i]
-                orient_xz_b = np.asarray(branch_orientations[i]) # 確保是 numpy array
-                right_vec_xz_b = np.array([-orient_xz_b[1], 0, orient_xz_b[0]])
-
-                p_rail_left_b = pos_b + right_vec_xz_b * half_track_width + np.array([0, rail_height_offset, 0])
-                p_rail_right_b = pos_b - right_vec_xz_b * half_track_width + np.array([0, rail_height_offset, 0])
-
-                branch_def['rail_left_vertices'].extend(p_rail_left_b.tolist())
-                branch_def['rail_right_vertices'].extend(p_rail_right_b.tolist())
-        # --- END OF MODIFICATION ---
+            (branch_def['ballast_vertices'], branch_def['rail_left_vertices'], branch_def['rail_right_vertices'],
+             branch_def['sleeper_instances']) = _polyline_render_vertices(branch_points, branch_def['orientations'])
 
     def setup_buffers(self):
-        # --- 修改：在 setup_buffers 的開頭假設緩衝區尚未就緒 ---
-        # self.is_buffer_ready = False # 實際上應該在 cleanup_buffers 中設為 False，這裡確保初始值
-        # 更好的地方是在 create_gl_buffers 調用 cleanup_buffers 後，在 setup_buffers 成功後才設為 True
-        
-        """創建並上傳 VBO/VAO 數據"""
-        if not self.ballast_vertices: # 確保頂點已生成
-             # --- MODIFICATION: Changed print to a more informative warning ---
-             print(f"Warning: Main track vertices not generated for segment (source line: {self.source_line_number}). Skipping main buffer setup.")
-             # We might still want to set up branch buffers if they exist.
-             # --- END OF MODIFICATION ---
-             # return # Don't return early, branches might still need setup
-
-        main_buffers_ok = True # 用於追蹤主軌道緩衝區是否都成功創建
-
-        # 清理舊的緩衝區 (如果存在) - 這裡只清理主軌道的，分岔的單獨處理或在總清理時處理
-        # --- MODIFICATION: Moved specific cleanup to a more general cleanup_buffers call ---
-        # self.cleanup_buffers() # Calling this here might be too soon if branches are not yet processed
-        # It's better to call cleanup_buffers once before any setup.
-        # --- END OF MODIFICATION ---
-
-        error = glGetError()
-        if error != GL_NO_ERROR: print(f"GL Error {error} at start of setup_buffers for segment line {self.source_line_number}")
-        # --- Ballast VBO/VAO ---
-        if self.ballast_vertices:
-            ballast_data = np.array(self.ballast_vertices, dtype=np.float32)
-            # --- START OF MODIFICATION: Cleanup specific buffer before regenerating ---
-            if self.ballast_vbo: glDeleteBuffers(1, [self.ballast_vbo]); self.ballast_vbo = None
-            if self.ballast_vao: glDeleteVertexArrays(1, [self.ballast_vao]); self.ballast_vao = None
-            # --- END OF MODIFICATION ---
-            self.ballast_vbo = glGenBuffers(1)
-            glBindBuffer(GL_ARRAY_BUFFER, self.ballast_vbo)
-            glBufferData(GL_ARRAY_BUFFER, ballast_data.nbytes, ballast_data, GL_STATIC_DRAW)
-
-            self.ballast_vao = glGenVertexArrays(1)
-            
-            error = glGetError() # Check before Gen
-            if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (ballast) for line {self.source_line_number}")
-            
-            glBindVertexArray(self.ballast_vao)
-            glBindBuffer(GL_ARRAY_BUFFER, self.ballast_vbo)
-            # 位置屬性 (location=0)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-            glEnableVertexAttribArray(0)
-            # 可以添加法線屬性等，如果需要光照
-            # glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * sizeof(GLfloat), ctypes.c_void_p(3 * sizeof(GLfloat))) # 假設數據是 [vx,vy,vz, nx,ny,nz, ...]
-            # glEnableVertexAttribArray(1)
-            glBindVertexArray(0) # 解綁 VAO
-            glBindBuffer(GL_ARRAY_BUFFER, 0) # 解綁 VBO
-        else:
-            main_buffers_ok = False # 如果道碴頂點不存在，主緩衝區不完整
-
-        # --- Left Rail VBO/VAO ---
-        if self.rail_left_vertices:
-            rail_left_data = np.array(self.rail_left_vertices, dtype=np.float32)
-            # --- START OF MODIFICATION: Cleanup specific buffer before regenerating ---
-            if self.rail_left_vbo: glDeleteBuffers(1, [self.rail_left_vbo]); self.rail_left_vbo = None
-            if self.rail_left_vao: glDeleteVertexArrays(1, [self.rail_left_vao]); self.rail_left_vao = None
-            # --- END OF MODIFICATION ---
-            self.rail_left_vbo = glGenBuffers(1)
-            glBindBuffer(GL_ARRAY_BUFFER, self.rail_left_vbo)
-            glBufferData(GL_ARRAY_BUFFER, rail_left_data.nbytes, rail_left_data, GL_STATIC_DRAW)
-
-            error = glGetError() # Check before Gen
-            if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (rail_left_vao) for line {self.source_line_number}")
-
-            self.rail_left_vao = glGenVertexArrays(1)
-            glBindVertexArray(self.rail_left_vao)
-            glBindBuffer(GL_ARRAY_BUFFER, self.rail_left_vbo)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-            glEnableVertexAttribArray(0)
-            glBindVertexArray(0)
-            glBindBuffer(GL_ARRAY_BUFFER, 0)
-        else:
-            main_buffers_ok = False
-
-        # --- Right Rail VBO/VAO ---
-        if self.rail_right_vertices:
-            rail_right_data = np.array(self.rail_right_vertices, dtype=np.float32)
-            # --- START OF MODIFICATION: Cleanup specific buffer before regenerating ---
-            if self.rail_right_vbo: glDeleteBuffers(1, [self.rail_right_vbo]); self.rail_right_vbo = None
-            if self.rail_right_vao: glDeleteVertexArrays(1, [self.rail_right_vao]); self.rail_right_vao = None
-            # --- END OF MODIFICATION ---
-            self.rail_right_vbo = glGenBuffers(1)
-            glBindBuffer(GL_ARRAY_BUFFER, self.rail_right_vbo)
-            glBufferData(GL_ARRAY_BUFFER, rail_right_data.nbytes, rail_right_data, GL_STATIC_DRAW)
-
-            error = glGetError() # Check before Gen
-            if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (rail_right_vao) for line {self.source_line_number}")
-
-            self.rail_right_vao = glGenVertexArrays(1)
-            glBindVertexArray(self.rail_right_vao)
-            glBindBuffer(GL_ARRAY_BUFFER, self.rail_right_vbo)
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-            glEnableVertexAttribArray(0)
-            glBindVertexArray(0)
-            glBindBuffer(GL_ARRAY_BUFFER, 0)
-        else:
-            main_buffers_ok = False
-
-        # --- START OF MODIFICATION ---
-        # 為每個視覺分岔創建 VBO/VAO
-        all_branch_buffers_ok = True
-        for branch_def in self.visual_branches:
-            branch_buffers_this_one_ok = True
-            # Ballast for branch
-            if branch_def.get('ballast_vertices'):
-                b_ballast_data = np.array(branch_def['ballast_vertices'], dtype=np.float32)
-                if branch_def.get('ballast_vbo'): glDeleteBuffers(1, [branch_def['ballast_vbo']])
-                if branch_def.get('ballast_vao'): glDeleteVertexArrays(1, [branch_def['ballast_vao']])
-                branch_def['ballast_vbo'] = glGenBuffers(1)
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['ballast_vbo'])
-                glBufferData(GL_ARRAY_BUFFER, b_ballast_data.nbytes, b_ballast_data, GL_STATIC_DRAW)
-                
-                error = glGetError() # Check before Gen
-                if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (branch_def ballast_vao) for line {self.source_line_number}")
-                
-                branch_def['ballast_vao'] = glGenVertexArrays(1)
-                glBindVertexArray(branch_def['ballast_vao'])
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['ballast_vbo'])
-                glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-                glEnableVertexAttribArray(0)
-                glBindVertexArray(0); glBindBuffer(GL_ARRAY_BUFFER, 0)
-            else: # 如果分岔應該有道碴但沒有，則標記此分岔緩衝區不完整
-                if branch_def.get('type'): # 假設所有已定義類型的分岔都應該有道碴
-                    branch_buffers_this_one_ok = False
-
-            # Left Rail for branch
-            if branch_def.get('rail_left_vertices'):
-                b_rail_l_data = np.array(branch_def['rail_left_vertices'], dtype=np.float32)
-                if branch_def.get('rail_left_vbo'): glDeleteBuffers(1, [branch_def['rail_left_vbo']])
-                if branch_def.get('rail_left_vao'): glDeleteVertexArrays(1, [branch_def['rail_left_vao']])
-                branch_def['rail_left_vbo'] = glGenBuffers(1)
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['rail_left_vbo'])
-                glBufferData(GL_ARRAY_BUFFER, b_rail_l_data.nbytes, b_rail_l_data, GL_STATIC_DRAW)
-
-                error = glGetError() # Check before Gen
-                if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (branch_def rail_left_vao) for line {self.source_line_number}")
-
-                branch_def['rail_left_vao'] = glGenVertexArrays(1)
-                glBindVertexArray(branch_def['rail_left_vao'])
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['rail_left_vbo'])
-                glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-                glEnableVertexAttribArray(0)
-                glBindVertexArray(0); glBindBuffer(GL_ARRAY_BUFFER, 0)
-            else:
-                if branch_def.get('type'):
-                    branch_buffers_this_one_ok = False
-
-            # Right Rail for branch
-            if branch_def.get('rail_right_vertices'):
-                b_rail_r_data = np.array(branch_def['rail_right_vertices'], dtype=np.float32)
-                if branch_def.get('rail_right_vbo'): glDeleteBuffers(1, [branch_def['rail_right_vbo']])
-                if branch_def.get('rail_right_vao'): glDeleteVertexArrays(1, [branch_def['rail_right_vao']])
-                branch_def['rail_right_vbo'] = glGenBuffers(1)
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['rail_right_vbo'])
-                glBufferData(GL_ARRAY_BUFFER, b_rail_r_data.nbytes, b_rail_r_data, GL_STATIC_DRAW)
-
-                error = glGetError() # Check before Gen
-                if error != GL_NO_ERROR: print(f"GL Error {error} before glGenVertexArrays (branch_def rail_right_vao) for line {self.source_line_number}")
-
-                branch_def['rail_right_vao'] = glGenVertexArrays(1)
-                glBindVertexArray(branch_def['rail_right_vao'])
-                glBindBuffer(GL_ARRAY_BUFFER, branch_def['rail_right_vbo'])
-                glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
-                glEnableVertexAttribArray(0)
-                glBindVertexArray(0); glBindBuffer(GL_ARRAY_BUFFER, 0)
-            else:
-                if branch_def.get('type'):
-                    branch_buffers_this_one_ok = False
-        # --- END OF MODIFICATION ---
-            if not branch_buffers_this_one_ok:
-                all_branch_buffers_ok = False # 如果任何一個分岔的緩衝區不完整
-
-#         print(f"main_buffers_ok:{main_buffers_ok}  all_branch_buffers_ok:{all_branch_buffers_ok}")
-        # --- 修改：在所有緩衝區（主軌道和所有分岔）成功創建後，設置 is_buffer_ready ---
-        if main_buffers_ok and all_branch_buffers_ok:
-            self.is_buffer_ready = True
-        else:
-            self.is_buffer_ready = False
-            # print(f"Segment line {self.source_line_number}: Buffers not fully set up (main_ok={main_buffers_ok}, branches_ok={all_branch_buffers_ok}). is_buffer_ready = False")
-
-#         print(f"緩衝區已創建: Ballast VAO={self.ballast_vao}, Rail Left VAO={self.rail_left_vao}, Rail Right VAO={self.rail_right_vao}")
+        """
+        確認主線與各視覺分岔的渲染頂點都已生成,標記本段可併入軌道的合併網格。
+        本段不建立自己的 GL 緩衝區:道碴與鋼軌由 Track.ensure_mesh 整條軌道各上傳成一個緩衝區。
+        """
+        if not len(self.ballast_vertices): # 確保頂點已生成
+             scene_diagnostics.warning("Main track vertices not generated for segment. Skipping main buffer setup.",
+                                       line=self.source_line_number)
+        main_buffers_ok = all(len(getattr(self, key)) for key in _MESH_VERTEX_KEYS)
+        # 已定義類型的分岔都應該有道碴與兩條鋼軌;任一分岔不完整則整段不繪製
+        all_branch_buffers_ok = all(len(branch_def.get(key, ())) for branch_def in self.visual_branches
+                                    if branch_def.get('type') for key in _MESH_VERTEX_KEYS)
+        self.is_buffer_ready = main_buffers_ok and all_branch_buffers_ok
+        self.render_generation = next(_render_generations)
 
     def create_gl_buffers(self):
         # --- START OF MODIFICATION: Calculate visual branch points BEFORE generating vertices for them ---
@@ -389,90 +260,96 @@ class TrackSegment:
         self.setup_buffers() # This will now also set up buffers for visual_branches
         
     def cleanup_buffers(self):
-        # --- 修改：在 cleanup_buffers 的開頭將 is_buffer_ready 設為 False ---
+        """標記本段不再繪製 (下次 Track.ensure_mesh 會把它從合併網格中拿掉);本段沒有自己的 GL 緩衝區。"""
         self.is_buffer_ready = False
-        # ----------------------------------------------------------------
-        """刪除 OpenGL 緩衝區"""
-        # 清理主軌道緩衝區
-        if self.ballast_vao: glDeleteVertexArrays(1, [self.ballast_vao]); self.ballast_vao = None
-        if self.rail_left_vao: glDeleteVertexArrays(1, [self.rail_left_vao]); self.rail_left_vao = None
-        if self.rail_right_vao: glDeleteVertexArrays(1, [self.rail_right_vao]); self.rail_right_vao = None
-        if self.ballast_vbo: glDeleteBuffers(1, [self.ballast_vbo]); self.ballast_vbo = None
-        if self.rail_left_vbo: glDeleteBuffers(1, [self.rail_left_vbo]); self.rail_left_vbo = None
-        if self.rail_right_vbo: glDeleteBuffers(1, [self.rail_right_vbo]); self.rail_right_vbo = None
-        # self.ballast_vao, self.rail_left_vao, self.rail_right_vao = None, None, None # Redundant after setting to None above
-        # self.ballast_vbo, self.rail_left_vbo, self.rail_right_vbo = None, None, None # Redundant
 
-        # --- START OF MODIFICATION ---
-        # 清理所有視覺分岔的緩衝區
-        for branch_def in self.visual_branches:
-            if branch_def.get('ballast_vao'): glDeleteVertexArrays(1, [branch_def['ballast_vao']]); branch_def['ballast_vao'] = None
-            if branch_def.get('rail_left_vao'): glDeleteVertexArrays(1, [branch_def['rail_left_vao']]); branch_def['rail_left_vao'] = None
-            if branch_def.get('rail_right_vao'): glDeleteVertexArrays(1, [branch_def['rail_right_vao']]); branch_def['rail_right_vao'] = None
-            if branch_def.get('ballast_vbo'): glDeleteBuffers(1, [branch_def['ballast_vbo']]); branch_def['ballast_vbo'] = None
-            if branch_def.get('rail_left_vbo'): glDeleteBuffers(1, [branch_def['rail_left_vbo']]); branch_def['rail_left_vbo'] = None
-            if branch_def.get('rail_right_vbo'): glDeleteBuffers(1, [branch_def['rail_right_vbo']]); branch_def['rail_right_vbo'] = None
-        # --- END OF MODIFICATION ---
+    def geometry_key(self):
+        """中心線點列與朝向 (含視覺分岔) 的雜湊;兩段的鍵相同時 _generate_render_vertices 產生的網格也相同。"""
+        digest = hashlib.blake2b(digest_size=16)
+        sources = [(self.points, self.orientations)] + \
+                  [(branch_def.get('points'), branch_def.get('orientations')) for branch_def in self.visual_branches]
+        for points, orientations in sources:
+            for values in (points, orientations):
+                digest.update(np.asarray(values if values is not None else (), dtype=np.float64).tobytes())
+                digest.update(b"|")
+        return digest.digest()
+
+    def share_buffers_from(self, other):
+        """沿用 other (geometry_key 相同的舊段) 的渲染頂點,不必重新生成。"""
+        for key in _RENDER_BUFFER_KEYS:
+            setattr(self, key, getattr(other, key))
+        for branch_def, other_branch_def in zip(self.visual_branches, other.visual_branches):
+            for key in _RENDER_BUFFER_KEYS:
+                branch_def[key] = other_branch_def.get(key)
+        self.is_buffer_ready = other.is_buffer_ready
+        self.render_generation = other.render_generation
+
+    def forget_buffers(self):
+        """舊段的頂點已交給新場景的軌道段;舊段不再繪製。"""
+        self.is_buffer_ready = False
 
-    def get_position_orientation(self, distance_on_segment):
-        """根據在該段上的距離，獲取位置和朝向"""
-        # --- MODIFICATION: Ensure self.points is a numpy array for vectorized operations if possible ---
-        # However, interpolation logic below handles list of numpy arrays correctly.
-        # Just ensure points added to self.points are numpy arrays.
-        # --- END OF MODIFICATION ---
-        if not self.points or self.length == 0:
-            # --- MODIFICATION: Ensure orientations are also handled if points are missing ---
-            start_orientation_xz = np.asarray(self.orientations[0] if self.orientations else (math.cos(self.start_angle_rad), math.sin(self.start_angle_rad)))
-            return self.start_pos, (start_orientation_xz[0], start_orientation_xz[1])
-            # --- END OF MODIFICATION ---
-
-        # 計算索引 (確保在範圍內)
-        # 根據 *實際* 段長度計算比例
-        ratio = distance_on_segment / self.length        
-        index = int(ratio * (len(self.points) - 1))
-        index = max(0, min(index, len(self.points) - 2)) # 確保至少有下一個點
-
-        # 計算在兩個內插點之間的比例 t
-        # --- MODIFICATION: Handle potential division by zero if len(self.points) == 1 ---
-        num_point_segments = len(self.points) - 1
-        if num_point_segments <= 0: # Should not happen if len(self.points) >= 2
-            t = 0.0
-            # --- MODIFICATION: Ensure orientations are also handled ---
-            current_orientation_xz = np.asarray(self.orientations[index] if self.orientations and index < len(self.orientations) else (math.cos(self.start_angle_rad), math.sin(self.start_angle_rad)))
-            return self.points[index], (current_orientation_xz[0], current_orientation_xz[1])
-            # --- END OF MODIFICATION ---
-        else:
-            segment_len_per_point = self.length / num_point_segments
-            t = (distance_on_segment - index * segment_len_per_point) / segment_len_per_point
-        # --- END OF MODIFICATION ---
-        t = max(0.0, min(1.0, t)) # 限制 t 在 0 到 1 之間
-
-        # 線性內插 3D 位置
-        pos1 = self.points[index]
-        pos2 = self.points[index + 1]
-        interpolated_pos = pos1 + t * (pos2 - pos1) # Numpy 會自動處理 3D 插值
-
-        # 線性內插朝向 (簡單方法，對劇烈轉彎可能不完美，但適用於本例)
-        # 可以考慮用球面線性內插 (Slerp) 獲取更平滑的旋轉
-        # --- MODIFICATION: Ensure orientations list is valid and accessed correctly ---
-        if index < len(self.orientations) and (index + 1) < len(self.orientations):
-            orient1_arr = np.asarray(self.orientations[index])
-            orient2_arr = np.asarray(self.orientations[index + 1])
-            interpolated_orient_arr = orient1_arr + t * (orient2_arr - orient1_arr)
-        elif self.orientations: # Fallback to the first or last known orientation
-            interpolated_orient_arr = np.asarray(self.orientations[index if index < len(self.orientations) else -1])
-        else: # Ultimate fallback
-            interpolated_orient_arr = np.array([math.cos(self.start_angle_rad), math.sin(self.start_angle_rad)])
-
-        norm = np.linalg.norm(interpolated_orient_arr)
-        if norm > 1e-6: # 避免除以零
-             interpolated_orient_arr /= norm # 重新標準化
-        # --- END OF MODIFICATION ---
+    def release_render_vertices(self):
+        """丟掉主線與各視覺分岔的渲染頂點 (串流時移出視窗的段);之後要繪製須再 create_gl_buffers。"""
+        for holder in [vars(self)] + self.visual_branches:
+            for key in _RENDER_BUFFER_KEYS:
+                holder[key] = []
+        self.is_buffer_ready = False
 
-        # 朝向向量 (forward_x, forward_z)
-        forward_vector_xz  = (interpolated_orient_arr[0], interpolated_orient_arr[1])
+    def _polylines(self):
+        """主線與各視覺分岔的中心線點列 (點數不足 2 的不產生頂點,略過)。"""
+        polylines = [self.points] + [branch_def.get('points') for branch_def in self.visual_branches]
+        return [points for points in polylines if points is not None and len(points) >= 2]
+
+    def render_vertex_count(self):
+        """_generate_render_vertices 會產生的網格頂點數 (每段間隔 6 個道碴頂點、兩條鋼軌斷面每面各 6 個),不必實際生成。"""
+        per_interval = 6 + 2 * 6 * len(_RAIL_FACE_NORMALS)
+        return sum(per_interval * (len(points) - 1) for points in self._polylines())
+
+    def centerline_bounds(self):
+        """中心線 (含視覺分岔) 的軸對齊範圍 (mins, maxs),已加上道碴寬度與鋼軌高度;沒有點時回傳 None。"""
+        polylines = self._polylines()
+        if not polylines:
+            return None
+        points = np.concatenate([np.asarray(points, dtype=float).reshape(-1, 3) for points in polylines])
+        half_width = max(BALLAST_WIDTH, SLEEPER_LENGTH) / 2.0
+        margin = np.array([half_width, 0.0, half_width])
+        mins = points.min(axis=0) - margin
+        maxs = points.max(axis=0) + margin
+        maxs[1] += BALLAST_HEIGHT + SLEEPER_HEIGHT + RAIL_HEIGHT # 鋼軌頂面
+        return mins, maxs
+
+    def analytic_params(self):
+        """本段的解析參數列 (見 _evaluate_segments);基類視為直線。"""
+        return (self.start_pos[0], self.start_pos[1], self.start_pos[2], self.start_angle_rad, 0.0, 0.0,
+                self.horizontal_length, self.length, self.gradient_factor, 0.0, 0.0)
+
+    def sample_distances(self):
+        """網格取樣點的段上距離:直線只取兩端;彎道依曲率取樣,弦高誤差不超過 TRACK_MESH_MAX_ERROR。"""
+        return np.array([0.0, self.length])
+
+    def sample_points(self):
+        """依 sample_distances 以封閉解產生中心線點列與朝向 (繪製、小地圖與包圍盒用)。"""
+        distances = self.sample_distances()
+        params = np.tile(np.asarray(self.analytic_params(), dtype=float), (len(distances), 1))
+        self.points, self.orientations = _evaluate_segments(params, distances)
 
-        return interpolated_pos, forward_vector_xz
+    def get_position_orientation(self, distance_on_segment):
+        """根據在該段上的距離，以封閉解獲取位置和朝向 (不經取樣點內插)"""
+        # 逐幀呼叫的熱路徑:與 _evaluate_segments 相同的公式,以純量計算避免建立小陣列
+        (start_x, start_y, start_z, start_angle, sweep, radius,
+         horizontal_length, length, gradient, center_x, center_z) = self.analytic_params()
+        if length > 0:
+            fraction = min(max(float(distance_on_segment), 0.0), length) / length
+        else:
+            fraction = 0.0
+        heading = start_angle + fraction * sweep
+        horizontal = fraction * horizontal_length
+        if sweep != 0:
+            circle_angle = heading - (math.pi / 2.0 if sweep > 0 else -math.pi / 2.0)
+            x, z = center_x + radius * math.cos(circle_angle), center_z + radius * math.sin(circle_angle)
+        else:
+            x, z = start_x + math.cos(start_angle) * horizontal, start_z + math.sin(start_angle) * horizontal
+        return np.array([x, start_y + horizontal * gradient, z]), (math.cos(heading), math.sin(heading))
 
 class StraightTrack(TrackSegment):
     """直軌道 (增加坡度支持)"""
@@ -496,21 +373,8 @@ class StraightTrack(TrackSegment):
                       + np.array([0, vertical_change, 0])
         self.end_angle_rad = start_angle_rad_xz # 水平角度不變
 
-        # 計算內插點 (包含 Y 坐標)
-        # --- MODIFICATION: points and orientations lists are initialized in base class, append to them ---
-        # self.points = []
-        # self.orientations = []
-        # --- END OF MODIFICATION ---
-        num_steps = max(2, int(self.horizontal_length * INTERPOLATION_STEPS / 5))
-        if num_steps < 2: num_steps = 2
-        for i in range(num_steps):
-            t = i / (num_steps - 1)
-            current_horizontal_dist = t * self.horizontal_length
-            current_vertical_change = current_horizontal_dist * self.gradient_factor
-            point_pos = self.start_pos + forward_vector_horizontal_3d * current_horizontal_dist \
-                       + np.array([0, current_vertical_change, 0])
-            self.points.append(point_pos)
-            self.orientations.append(forward_vector_xz_tuple) # 水平方向
+        # 中心線取樣點 (直線只需兩端點)
+        self.sample_points()
 
         # --- REMOVED REDUNDANT CALCULATION BLOCK ---
         # The points and orientations are now calculated correctly in the block above.
@@ -581,37 +445,8 @@ class CurveTrack(TrackSegment):
         end_pos_y = self.start_pos[1] + vertical_change
         self.end_pos = np.array([end_pos_xz[0], end_pos_y, end_pos_xz[1]])
 
-        # 計算內插點
-        # --- MODIFICATION: points and orientations lists are initialized in base class, append to them ---
-        # self.points = []
-        # self.orientations = []
-        # --- END OF MODIFICATION ---
-        num_steps = max(2, int(abs(angle_deg) * INTERPOLATION_STEPS / 5))
-        if num_steps < 2: num_steps = 2
-        # --- MODIFICATION: Ensure start_angle_rad_xz is used for start_angle_offset consistently ---
-        start_angle_offset = start_angle_rad_xz - turn_direction * math.pi / 2.0
-        # --- END OF MODIFICATION ---
-
-        for i in range(num_steps):
-            t = i / (num_steps - 1)
-            current_angle = start_angle_offset + t * self.angle_rad
-
-            # 計算水平位置 (XZ平面)
-            point_offset_xz = np.array([math.cos(current_angle), math.sin(current_angle)]) * self.radius
-            current_pos_xz = self.center_xz + point_offset_xz
-
-            # 計算 Y 坐標
-            current_horizontal_arc_len = t * self.horizontal_length
-            current_vertical_change = current_horizontal_arc_len * self.gradient_factor
-            current_pos_y = self.start_pos[1] + current_vertical_change
-
-            # 合成 3D 點
-            self.points.append(np.array([current_pos_xz[0], current_pos_y, current_pos_xz[1]]))
-
-            # 計算該點的水平切線方向 (朝前)
-            tangent_angle = current_angle + turn_direction * math.pi / 2.0
-            orientation_vec_xz_tuple = np.array([math.cos(tangent_angle), math.sin(tangent_angle)])
-            self.orientations.append(orientation_vec_xz_tuple)
+        # 中心線取樣點 (依曲率決定點數)
+        self.sample_points()
 
         # --- REMOVED REDUNDANT CALCULATION BLOCK ---
         # The points and orientations are now calculated correctly in the block above.
@@ -660,56 +495,521 @@ class CurveTrack(TrackSegment):
 #         # --- 創建 VBO/VAO ---
 # #         self.setup_buffers() # 在初始化時就創建好
 
+    def analytic_params(self):
+        center_x, center_z = self.center_xz
+        return (self.start_pos[0], self.start_pos[1], self.start_pos[2], self.start_angle_rad, self.angle_rad,
+                self.radius, self.horizontal_length, self.length, self.gradient_factor, center_x, center_z)
+
+    def sample_distances(self):
+        sweep = abs(self.angle_rad)
+        if self.length <= 0 or sweep == 0:
+            return np.array([0.0, self.length])
+        # 弦高 R(1 - cos(Δ/2)) <= 容許誤差 → 每步轉角 Δ <= 2 acos(1 - 誤差/R),且不超過 TRACK_MESH_MAX_STEP_DEG
+        max_step = math.radians(TRACK_MESH_MAX_STEP_DEG)
+        if self.radius > TRACK_MESH_MAX_ERROR:
+            max_step = min(max_step, 2.0 * math.arccos(1.0 - TRACK_MESH_MAX_ERROR / self.radius))
+        steps = max(1, int(math.ceil(sweep / max_step)))
+        return np.arange(steps + 1) / steps * self.length
+
+class TrackProjection:
+    """
+    TrackIndex.query 的結果,每個查詢點一列 (皆為長度 N 的陣列):
+    distance 沿線距離 (主線為整條軌道的累積距離,視覺分岔為從分岔起點算起的距離)、segment 段索引、
+    branch 視覺分岔索引 (主線為 -1)、lateral 橫向偏移 (正值在左軌那一側)、
+    separation 與最近點的水平距離、points 最近點 (N, 3)。軌道沒有點時 segment 為 -1、距離為 inf。
+    """
+    __slots__ = ('distance', 'segment', 'branch', 'lateral', 'separation', 'points')
+
+    def __init__(self, distance, segment, branch, lateral, separation, points):
+        self.distance = distance
+        self.segment = segment
+        self.branch = branch
+        self.lateral = lateral
+        self.separation = separation
+        self.points = points
+
+class TrackIndex:
+    """
+    軌道中心線與視覺分岔的最近點空間索引:各折線取樣成邊長不超過 TRACK_INDEX_SPACING 的點,以 cKDTree (水平 x/z) 索引。
+    查詢先找最近取樣點 (距離 r),最近的邊必有一端點在 r + 間距/2 之內,再把這些端點前後的邊都投影一次取最近者。
+    由 Track.spatial_index() 建立並快取。
+    """
+
+    def __init__(self, track):
+        xyz, along, segment_ids, branch_ids, polyline_ids = [], [], [], [], []
+        starts, _ends = track._segment_lookup()
+        polyline = 0
+        for index, segment in enumerate(track.segments):
+            distances = np.append(np.arange(0.0, segment.length, TRACK_INDEX_SPACING), segment.length)
+            params = np.tile(np.asarray(segment.analytic_params(), dtype=float), (len(distances), 1))
+            polylines = [(_evaluate_segments(params, distances)[0], starts[index] + distances, -1)]
+            for branch_index, branch_def in enumerate(segment.visual_branches):
+                points = branch_def.get('points')
+                if points is None or len(points) == 0:
+                    continue
+                points = np.asarray(points, dtype=float).reshape(-1, 3)
+                # 分岔折線補點到同樣的間距 (保留原頂點)
+                cumulative = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(points[:, 0]), np.diff(points[:, 2])))))
+                distances = np.union1d(np.arange(0.0, cumulative[-1], TRACK_INDEX_SPACING), cumulative)
+                resampled = np.column_stack([np.interp(distances, cumulative, points[:, axis]) for axis in range(3)])
+                polylines.append((resampled, distances, branch_index))
+            for points, distances, branch_index in polylines:
+                xyz.append(points)
+                along.append(distances)
+                segment_ids.append(np.full(len(points), index, dtype=np.int32))
+                branch_ids.append(np.full(len(points), branch_index, dtype=np.int32))
+                polyline_ids.append(np.full(len(points), polyline, dtype=np.int32))
+                polyline += 1
+        if xyz:
+            self.points = np.concatenate(xyz)
+            self.along = np.concatenate(along)
+            self.segment = np.concatenate(segment_ids)
+            self.branch = np.concatenate(branch_ids)
+            polyline_ids = np.concatenate(polyline_ids)
+            # 第 k 點到第 k+1 點是否為同一條折線上的邊
+            self.has_next = np.append(polyline_ids[1:] == polyline_ids[:-1], False)
+            self.tree = cKDTree(self.points[:, [0, 2]])
+        else:
+            self.points = np.zeros((0, 3))
+            self.tree = None
+
+    def query(self, positions):
+        """
+        positions:(N, 2) 的 (x, z) 或 (N, 3) 的 (x, y, z) 世界座標 (只看水平位置) → TrackProjection。
+        一次查詢整批點 (例如所有建物中心依離軌道的距離分類)。
+        """
+        positions = np.asarray(positions, dtype=float)
+        positions = positions.reshape(-1, positions.shape[-1] if positions.ndim else 2)
+        queries = positions[:, [0, 2]] if positions.shape[1] >= 3 else positions[:, :2]
+        count = len(queries)
+        if self.tree is None:
+            return TrackProjection(np.full(count, np.inf), np.full(count, -1, dtype=np.int32),
+                                   np.full(count, -1, dtype=np.int32), np.zeros(count), np.full(count, np.inf),
+                                   np.zeros((count, 3)))
+        nearest_distance, _ = self.tree.query(queries)
+        candidates = self.tree.query_ball_point(queries, nearest_distance + TRACK_INDEX_SPACING / 2.0 + 1e-9)
+        sizes = np.fromiter(map(len, candidates), dtype=np.intp, count=count)
+        vertices = np.fromiter(itertools.chain.from_iterable(candidates), dtype=np.intp, count=int(sizes.sum()))
+        owners = np.repeat(np.arange(count), sizes)
+
+        # 候選邊:每個候選點往後一條、往前一條;不在同一折線上的以該點本身 (零長度邊) 代替
+        previous = np.maximum(vertices - 1, 0)
+        has_previous = (vertices > 0) & self.has_next[previous]
+        edge_start = np.concatenate((vertices, np.where(has_previous, previous, vertices)))
+        edge_end = np.concatenate((np.where(self.has_next[vertices], vertices + 1, vertices), vertices))
+        owners = np.concatenate((owners, owners))
+
+        start_xz = self.points[edge_start][:, [0, 2]]
+        edge_xz = self.points[edge_end][:, [0, 2]] - start_xz
+        offset_xz = queries[owners] - start_xz
+        edge_length_sq = np.einsum('nj,nj->n', edge_xz, edge_xz)
+        t = np.where(edge_length_sq > 0,
+                     np.einsum('nj,nj->n', offset_xz, edge_xz) / np.where(edge_length_sq > 0, edge_length_sq, 1.0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        gap = offset_xz - edge_xz * t[:, None]
+        gap_sq = np.einsum('nj,nj->n', gap, gap)
+        # 每個查詢點取 gap 最小的候選邊 (依 查詢點, gap 排序後取每組第一個)
+        order = np.lexsort((gap_sq, owners))
+        best = order[np.searchsorted(owners[order], np.arange(count))]
+        start, end, t, edge, gap = edge_start[best], edge_end[best], t[best], edge_xz[best], gap[best]
+
+        points = self.points[start] + (self.points[end] - self.points[start]) * t[:, None]
+        distance = self.along[start] + (self.along[end] - self.along[start]) * t
+        edge_length = np.hypot(edge[:, 0], edge[:, 1])
+        # 左向量 (-forward_z, forward_x),與 _polyline_render_vertices 的左軌同側
+        lateral = np.where(edge_length > 0, (gap[:, 1] * edge[:, 0] - gap[:, 0] * edge[:, 1]) /
+                           np.where(edge_length > 0, edge_length, 1.0), 0.0)
+        return TrackProjection(distance, self.segment[start], self.branch[start], lateral,
+                               np.hypot(gap[:, 0], gap[:, 1]), points)
+
+class TrackMesh:
+    """
+    整條軌道 (含各視覺分岔) 合併成的 GL 緩衝區:道碴三角形一個、所有鋼軌斷面網格一個,各以一次繪製呼叫畫完;
+    枕木是一份共用網格加上所有枕木的實例 (位置與朝向),一次 instanced 繪製。
+    保留每段的範圍 (道碴/鋼軌頂點、枕木實例),只畫部分段 (剔除、高亮) 時依範圍挑出。
+    """
+
+    def __init__(self, segments):
+        chunks = {'ballast': [], 'rail': [], 'sleeper': []}
+        # 每段 (起點, 數量);道碴與鋼軌以頂點計,枕木以實例計
+        self.ballast_ranges = np.zeros((len(segments), 2), dtype=np.int32)
+        self.rail_ranges = np.zeros((len(segments), 2), dtype=np.int32)
+        self.sleeper_ranges = np.zeros((len(segments), 2), dtype=np.int32)
+        layouts = (('ballast', self.ballast_ranges, ('ballast_vertices',), 3),
+                   ('rail', self.rail_ranges, ('rail_left_vertices', 'rail_right_vertices'), 6),
+                   ('sleeper', self.sleeper_ranges, ('sleeper_instances',), 5))
+        offsets = dict.fromkeys(chunks, 0)
+        for index, segment in enumerate(segments):
+            holders = [vars(segment)] + segment.visual_branches if segment.is_buffer_ready else []
+            for name, ranges, keys, stride in layouts:
+                ranges[index, 0] = offsets[name]
+                for holder in holders:
+                    for key in keys:
+                        values = np.asarray(holder.get(key, ()), dtype=np.float32).ravel()
+                        chunks[name].append(values)
+                        offsets[name] += len(values) // stride
+                ranges[index, 1] = offsets[name] - ranges[index, 0]
+        self.ballast_vertex_count = offsets['ballast']
+        self.rail_vertex_count = offsets['rail']
+        self.sleeper_count = offsets['sleeper']
+        self.ballast_vao, self.ballast_vbo = self._upload(chunks['ballast'], (3,))
+        self.rail_vao, self.rail_vbo = self._upload(chunks['rail'], (3, 3))
+        sleeper_mesh = sleeper_mesh_vertices()
+        self.sleeper_vao, self.sleeper_vbo = self._upload([sleeper_mesh], (3, 3))
+        self.sleeper_vertex_count = len(sleeper_mesh) // 6
+        self.sleeper_instance_vbo = None
+        if self.sleeper_vao and self.sleeper_count:
+            instances = np.concatenate(chunks['sleeper'])
+            self.sleeper_instance_vbo = glGenBuffers(1)
+            glBindVertexArray(self.sleeper_vao)
+            glBindBuffer(GL_ARRAY_BUFFER, self.sleeper_instance_vbo)
+            glBufferData(GL_ARRAY_BUFFER, instances.nbytes, instances, GL_STATIC_DRAW)
+            self.bind_sleeper_instances(0)
+            glEnableVertexAttribArray(2)
+            glEnableVertexAttribArray(3)
+            glVertexAttribDivisor(2, 1)
+            glVertexAttribDivisor(3, 1)
+            glBindVertexArray(0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.generations = None # 由 Track.ensure_mesh 設定
+
+    @staticmethod
+    def _upload(chunks, layout):
+        """
+        把頂點串成一個 VBO 並建立對應的 VAO;layout 為各屬性的分量數 (location 0 起:位置、法向量)。
+        沒有頂點時回傳 (None, None)。
+        """
+        data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        if not len(data):
+            return None, None
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        vao = glGenVertexArrays(1)
+        glBindVertexArray(vao)
+        stride = sum(layout) * sizeof(GLfloat)
+        offset = 0
+        for location, size in enumerate(layout):
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * sizeof(GLfloat)))
+            glEnableVertexAttribArray(location)
+            offset += size
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        return vao, vbo
+
+    def bind_sleeper_instances(self, first_instance):
+        """
+        (sleeper_vao 已綁定時) 讓實例屬性從第 first_instance 根枕木開始:location 2 為位置、3 為朝向。
+        只畫部分段時每段連續範圍各呼叫一次,不需要 GL 4.2 的 base instance。
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.sleeper_instance_vbo)
+        stride = 5 * sizeof(GLfloat)
+        base = first_instance * stride
+        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(base))
+        glVertexAttribPointer(3, 2, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(base + 3 * sizeof(GLfloat)))
+
+    @staticmethod
+    def _runs(ranges, segment_indices):
+        """指定段的 (起點, 數量) 合併成連續的區段 (相鄰段的範圍首尾相接),略過空的段。"""
+        selected = ranges[np.unique(np.asarray(segment_indices, dtype=np.intp))]
+        selected = selected[selected[:, 1] > 0]
+        if not len(selected):
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        ends = selected[:, 0] + selected[:, 1]
+        breaks = np.flatnonzero(selected[1:, 0] != ends[:-1]) + 1
+        run_starts = np.concatenate(([0], breaks))
+        run_ends = np.concatenate((breaks, [len(selected)])) - 1
+        firsts = selected[run_starts, 0]
+        return firsts, ends[run_ends] - firsts
+
+    def ballast_ranges_for(self, segment_indices):
+        """指定段的道碴 (firsts, counts) 陣列 (相鄰段合併)。"""
+        return self._runs(self.ballast_ranges, segment_indices)
+
+    def rail_ranges_for(self, segment_indices):
+        """指定段 (含其視覺分岔) 鋼軌的 (firsts, counts) 陣列 (相鄰段合併)。"""
+        return self._runs(self.rail_ranges, segment_indices)
+
+    def sleeper_ranges_for(self, segment_indices):
+        """指定段枕木實例的 (firsts, counts) 陣列 (相鄰段合併)。"""
+        return self._runs(self.sleeper_ranges, segment_indices)
+
+    def delete(self):
+        """刪除 GL 緩衝區 (要在 GL 執行緒呼叫)。"""
+        for vao in (self.ballast_vao, self.rail_vao, self.sleeper_vao):
+            if vao: glDeleteVertexArrays(1, [vao])
+        for vbo in (self.ballast_vbo, self.rail_vbo, self.sleeper_vbo, self.sleeper_instance_vbo):
+            if vbo: glDeleteBuffers(1, [vbo])
+        self.ballast_vao = self.ballast_vbo = self.rail_vao = self.rail_vbo = None
+        self.sleeper_vao = self.sleeper_vbo = self.sleeper_instance_vbo = None
+
 class Track:
     """管理整個軌道"""
+    # 距離查詢用的各段累積起點/終點 (與 segments 同長,段數不符時重建) 與上次命中的段索引;
+    # 設成類別預設值,舊快取/場景包裡沒有這些屬性的 Track 也能直接使用
+    _segment_starts = ()
+    _segment_ends = ()
+    _segment_params = ()
+    _cursor = 0
+    mesh = None # 合併網格 (TrackMesh),由 ensure_mesh 在 GL 執行緒建立
+    _spatial_index = None
+    _spatial_index_key = None
+    _streamed = None # 上次串流後保留頂點的段索引 (frozenset);None 表示還沒串流過
+    _stream_bounds = None # 各段 (含視覺分岔) 的水平範圍 (N, 4):x 最小、z 最小、x 最大、z 最大
+
     def __init__(self):
         self.segments = []
         self.total_length = 0.0
+        self._segment_starts = []
+        self._segment_ends = []
+        self._segment_params = ()
+        self._cursor = 0
 
     def add_segment(self, segment):
         self.segments.append(segment)
         self.total_length += segment.length
+        self._streamed = self._stream_bounds = None
+
+    def truncate(self, segment_count):
+        """只保留前 segment_count 段 (不釋放被移除段的緩衝區),回傳被移除的段。"""
+        removed = self.segments[segment_count:]
+        del self.segments[segment_count:]
+        self.total_length = 0.0
+        for segment in self.segments:
+            self.total_length += segment.length
+        self._segment_ends = []
+        self._streamed = self._stream_bounds = None
+        return removed
+
+    def _segment_lookup(self):
+        """(各段累積起點, 各段累積終點+容錯) 列表;與 get_position_orientation 逐段累加的距離完全相同。"""
+        if len(self._segment_ends) != len(self.segments):
+            starts, ends = [], []
+            running = 0.0
+            for segment in self.segments:
+                starts.append(running)
+                running += segment.length
+                ends.append(running + 1e-6) # 加一點容錯
+            self._segment_starts, self._segment_ends = starts, ends
+            self._segment_params = ()
+            self._cursor = 0
+        return self._segment_starts, self._segment_ends
+
+    def segment_index_at(self, distance_on_track):
+        """
+        距離所在的段索引 (第一個 累積終點+容錯 >= 距離 的段);超出總長時回傳 len(segments)。
+        先檢查上次命中的段與下一段 (電車單調前進時幾乎都命中),否則以 bisect 在累積終點上二分搜尋。
+        """
+        starts, ends = self._segment_lookup()
+        cursor = self._cursor
+        for index in (cursor, cursor + 1):
+            if index < len(ends) and distance_on_track <= ends[index] and \
+               (index == 0 or distance_on_track > ends[index - 1]):
+                self._cursor = index
+                return index
+        index = bisect.bisect_left(ends, distance_on_track)
+        if index < len(ends):
+            self._cursor = index
+        return index
+
+    def segments_in_range(self, start, end, looping=False):
+        """
+        與沿線距離區間 [start, end] 重疊的段索引 (遞增)。
+        looping 時區間超出 [0, 總長] 的部分繞回另一端;區間不短於總長時回傳所有段。
+        """
+        starts, ends = self._segment_lookup()
+        if not self.segments or end < start:
+            return []
+        total = self.total_length
+        if looping and total > 0:
+            if end - start >= total:
+                return list(range(len(self.segments)))
+            start, end = start % total, start % total + (end - start)
+            if end > total:
+                wrapped = set(self.segments_in_range(start, total)) | set(self.segments_in_range(0.0, end - total))
+                return sorted(wrapped)
+        first = bisect.bisect_left(ends, start)         # 第一個終點 >= start 的段
+        stop = bisect.bisect_right(starts, end)         # 起點 <= end 的段之後
+        return list(range(first, max(first, stop)))
+
+    def _stream_window(self, distance, looping, margin):
+        """
+        電車在 distance 時要保留的段索引:沿線後方 TRACK_STREAM_BEHIND 到前方 TRACK_STREAM_AHEAD 的段,
+        加上水平範圍在電車 TRACK_STREAM_RADIUS 內的段 (距離與半徑都再加 margin)。
+        """
+        along = self.segments_in_range(distance - TRACK_STREAM_BEHIND - margin,
+                                       distance + TRACK_STREAM_AHEAD + margin, looping)
+        if self._stream_bounds is None or len(self._stream_bounds) != len(self.segments):
+            bounds = np.full((len(self.segments), 4), np.inf)
+            bounds[:, 2:] = -np.inf # 沒有點的段永遠不在半徑內
+            for index, segment in enumerate(self.segments):
+                segment_bounds = segment.centerline_bounds()
+                if segment_bounds is not None:
+                    bounds[index] = (segment_bounds[0][0], segment_bounds[0][2], segment_bounds[1][0], segment_bounds[1][2])
+            self._stream_bounds = bounds
+        if looping and self.total_length > 0:
+            distance %= self.total_length
+        position, _forward = self.get_position_orientation(max(distance, 0.0))
+        bounds = self._stream_bounds
+        dx = np.maximum(np.maximum(bounds[:, 0] - position[0], position[0] - bounds[:, 2]), 0.0)
+        dz = np.maximum(np.maximum(bounds[:, 1] - position[2], position[2] - bounds[:, 3]), 0.0)
+        near = np.flatnonzero(dx * dx + dz * dz <= (TRACK_STREAM_RADIUS + margin) ** 2)
+        return sorted(set(along).union(near.tolist()))
+
+    def needs_stream(self, distance, looping=False):
+        """上次串流保留的段是否已不涵蓋電車在 distance 時的視窗 (不含 margin)。"""
+        if self._streamed is None:
+            return bool(self.segments)
+        return not self._streamed.issuperset(self._stream_window(distance, looping, 0.0))
+
+    def iter_stream_segment_buffers(self, distance, looping=False):
+        """
+        只為電車附近 (見 _stream_window,各再多 TRACK_STREAM_MARGIN) 的段生成頂點,
+        每段 yield 一次;最後一步釋放視窗外的段、重建合併網格。
+        頂點生成期間不改動 is_buffer_ready,繪製中的合併網格到最後一步才換掉 (可以分幀進行)。
+        """
+        wanted = frozenset(self._stream_window(distance, looping, TRACK_STREAM_MARGIN))
+        pending = [index for index in sorted(wanted) if not self.segments[index].is_buffer_ready]
+        for index in pending:
+            self.segments[index]._generate_render_vertices()
+            yield
+        evicted = 0
+        for index, segment in enumerate(self.segments):
+            if index not in wanted and (segment.is_buffer_ready or len(segment.ballast_vertices)):
+                segment.release_render_vertices()
+                evicted += 1
+        for index in pending:
+            self.segments[index].setup_buffers()
+        self._streamed = wanted
+        self.ensure_mesh()
+        scene_diagnostics.debug(f"軌道串流 ({distance:.0f} m):保留 {len(wanted)}/{len(self.segments)} 段,"
+                                f"新生成 {len(pending)} 段,釋放 {evicted} 段。")
+        yield
+
+    def stream_around(self, distance, looping=False):
+        """(GL 執行緒) 需要時一次做完 iter_stream_segment_buffers;有串流時回傳 True。"""
+        if not self.needs_stream(distance, looping):
+            return False
+        for _ in self.iter_stream_segment_buffers(distance, looping):
+            pass
+        return True
+
+    def spatial_index(self):
+        """最近點空間索引 (TrackIndex);段或視覺分岔變了才重建。"""
+        key = tuple((segment, len(segment.visual_branches)) for segment in self.segments)
+        if self._spatial_index is None or self._spatial_index_key != key:
+            self._spatial_index = TrackIndex(self)
+            self._spatial_index_key = key
+        return self._spatial_index
+
+    def project_points(self, positions):
+        """整批世界座標到軌道的最近點 (見 TrackIndex.query),回傳 TrackProjection。"""
+        return self.spatial_index().query(positions)
+
+    def nearest_point(self, x, z):
+        """單點查詢:(沿線距離, 段索引, 橫向偏移, 水平距離);視覺分岔上的點沿線距離從分岔起點算起。"""
+        projection = self.project_points([(x, z)])
+        return (float(projection.distance[0]), int(projection.segment[0]),
+                float(projection.lateral[0]), float(projection.separation[0]))
 
     def create_all_segment_buffers(self):
         """Creates OpenGL buffers for all segments in the track."""
-        print(f"Creating GL buffers for {len(self.segments)} track segments...")
+        for _ in self.iter_create_segment_buffers():
+            pass
+
+    def iter_create_segment_buffers(self):
+        """Like create_all_segment_buffers, but yields after each segment so the work can be spread over frames."""
+        scene_diagnostics.debug(f"Creating GL buffers for {len(self.segments)} track segments...")
+        self._streamed = None # 整條軌道都會有頂點;之後再串流時重新決定要釋放的段
         for i, segment in enumerate(self.segments):
             # print(f"  Processing segment {i+1}/{len(self.segments)} ({type(segment).__name__})")
             if hasattr(segment, 'create_gl_buffers') and callable(segment.create_gl_buffers):
                 segment.create_gl_buffers() # Call the method to create buffers
             else:
-                print(f"  Warning: Segment {type(segment)} has no create_gl_buffers method.")
+                scene_diagnostics.warning(f"Segment {type(segment)} has no create_gl_buffers method.")
+            yield
+        self.ensure_mesh()
+        yield
+
+    def ensure_mesh(self):
+        """
+        (GL 執行緒) 回傳最新的合併網格;段數、段物件或任一段的渲染頂點變了 (render_generation 不同) 才重建並重新上傳。
+        沒有就緒的段時回傳 None。
+        """
+        generations = tuple(segment.render_generation if segment.is_buffer_ready else 0 for segment in self.segments)
+        if self.mesh is not None and self.mesh.generations == generations:
+            return self.mesh
+        self.delete_mesh()
+        if any(generations):
+            self.mesh = TrackMesh(self.segments)
+            self.mesh.generations = generations
+        return self.mesh
+
+    def delete_mesh(self):
+        """(GL 執行緒) 刪除合併網格的 GL 緩衝區。"""
+        if self.mesh is not None:
+            self.mesh.delete()
+            self.mesh = None
 
     def clear(self):
         # 在清除段之前，先清理它們的 OpenGL 資源
         for segment in self.segments:
             segment.cleanup_buffers()
+        self.delete_mesh()
         self.segments = []
         self.total_length = 0.0
+        self._segment_ends = []
+        self._streamed = self._stream_bounds = None
 
     def get_position_orientation(self, distance_on_track):
-        """根據在總軌道上的距離獲取位置和朝向"""
+        """根據在總軌道上的距離獲取位置和朝向 (累積長度二分搜尋 + 上次段索引,與段數無關)"""
         if self.total_length == 0:
             return np.array([0.0, 0.0, 0.0]), (1.0, 0.0) # 預設位置和朝向
 
-        current_dist = 0.0
-        for segment in self.segments:
-            if distance_on_track <= current_dist + segment.length + 1e-6: # 加一點容錯
-                distance_on_segment = distance_on_track - current_dist
-                return segment.get_position_orientation(distance_on_segment)
-            current_dist += segment.length
+        index = self.segment_index_at(distance_on_track)
+        if index < len(self.segments):
+            distance_on_segment = distance_on_track - self._segment_starts[index]
+            return self.segments[index].get_position_orientation(distance_on_segment)
 
         # 如果距離超出總長度 (理論上循環時不應到達這裡，除非不循環)
         # 返回最後一段的末端
         # --- MODIFICATION: Ensure last_segment.orientations is accessed safely ---
         last_segment = self.segments[-1]
-        if last_segment.orientations:
+        if len(last_segment.orientations):
             end_forward_xz_tuple = last_segment.orientations[-1] # Get the last orientation tuple
         else: # Fallback if orientations list is empty for some reason
             end_forward_xz_tuple = (math.cos(last_segment.end_angle_rad), math.sin(last_segment.end_angle_rad))
         return last_segment.end_pos, end_forward_xz_tuple
         # --- END OF MODIFICATION ---
-    
+
+    def positions_orientations_at(self, distances_on_track):
+        """
+        get_position_orientation 的批次版本:distances (N,) → (位置 (N, 3), 朝向 (N, 2) 的 (forward_x, forward_z))。
+        以與逐一查詢相同的累積長度表 searchsorted 一次找出所在的段,再以各段的解析參數一次求出封閉解。
+        """
+        distances = np.asarray(distances_on_track, dtype=float).reshape(-1)
+        count = len(distances)
+        if self.total_length == 0 or not self.segments:
+            return np.zeros((count, 3)), np.tile([1.0, 0.0], (count, 1))
+
+        starts, ends = self._segment_lookup()
+        if len(self._segment_params) != len(self.segments):
+            self._segment_params = np.array([segment.analytic_params() for segment in self.segments],
+                                            dtype=float).reshape(-1, _PARAM_COUNT)
+        # 第一個 (累積終點 + 容錯) >= 距離的段;超出總長的取最後一段的末端
+        seg_index = np.searchsorted(np.asarray(ends, dtype=float), distances, side='left')
+        beyond = seg_index >= len(self.segments)
+        seg_index = np.minimum(seg_index, len(self.segments) - 1)
+        distance_on_segment = distances - np.asarray(starts, dtype=float)[seg_index]
+        positions, forwards = _evaluate_segments(self._segment_params[seg_index], distance_on_segment)
+
+        if beyond.any():
+            last_segment = self.segments[-1]
+            positions[beyond] = last_segment.end_pos
+            forwards[beyond] = (np.asarray(last_segment.orientations[-1], dtype=float) if len(last_segment.orientations) else
+                                (math.cos(last_segment.end_angle_rad), math.sin(last_segment.end_angle_rad)))
+        return positions, forwards
+
 #     def __del__(self):
 #         # 可選：確保在 Track 對象被垃圾回收時清理緩衝區
 #         self.clear()
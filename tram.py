@@ -1,5 +1,6 @@
 # tram.py
 import numpy as np
+import scene_diagnostics
 
 
 class Tram:
@@ -100,7 +101,7 @@ class Tram:
 
     def toggle_looping(self):
         self.looping = not self.looping
-        print(f"軌道循環: {'啟用' if self.looping else '禁用'}")
+        scene_diagnostics.info(f"軌道循環: {'啟用' if self.looping else '禁用'}")
 
     def get_speed_kmh(self):
         """獲取以 km/h 為單位的速度"""